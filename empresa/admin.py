@@ -1,27 +1,150 @@
 # empresa/admin.py
 
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
 from .models import (
-    Cliente, 
-    Maquinaria, 
-    Movimiento, 
-    Proyecto, 
-    TipoLicencia, 
+    Cliente,
+    Maquinaria,
+    Movimiento,
+    Proyecto,
+    TipoLicencia,
     Empleado,
-    Supervisor,       
-    InformeDiario,    
+    Supervisor,
+    InformeDiario,
     Postura,
-    Viaje,  
+    Viaje,
+    ProduccionEquipo,
+    ConsumidorCambios,
+    ConjuntoRecibido,
 )
 
+
+# --- PAGINACIÓN CON CONTEO ESTIMADO ---
+# En las tablas grandes, el COUNT(*) de cada página del changelist recorre
+# toda la tabla. Sin filtros, el total se estima con las estadísticas de
+# SQLite (sqlite_stat1, que se llenan con ANALYZE) o, si no hay, con el
+# rango de ids. Con filtros se cuenta de verdad, porque suele ser poco.
+
+CONTEO_EXACTO_HASTA = 10000
+
+
+def filas_estimadas(modelo, using='default'):
+    """Cantidad aproximada de filas de la tabla del modelo, o None si no se puede estimar."""
+    conexion = connections[using]
+    if conexion.vendor != 'sqlite':
+        return None
+    tabla = modelo._meta.db_table
+    with conexion.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+        if cursor.fetchone():
+            # El primer número de cualquier fila de la tabla es su cantidad de filas
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [tabla])
+            fila = cursor.fetchone()
+            if fila:
+                return int(fila[0].split()[0])
+        # Los ids son AUTOINCREMENT: el rango sobrestima solo por los borrados
+        cursor.execute(f'SELECT MAX(id) - MIN(id) + 1 FROM "{tabla}"')
+        return cursor.fetchone()[0] or 0
+
+
+class ConteoEstimadoPaginator(Paginator):
+    @cached_property
+    def count(self):
+        consulta = self.object_list
+        if not consulta.query.where:
+            estimado = filas_estimadas(consulta.model, consulta.db)
+            if estimado is not None and estimado > CONTEO_EXACTO_HASTA:
+                return estimado
+        return super().count
+
+
+class TablaGrandeAdmin(admin.ModelAdmin):
+    paginator = ConteoEstimadoPaginator
+    # Evita el segundo COUNT(*) sin filtros que muestra "(N en total)"
+    show_full_result_count = False
+
+
+# --- MAESTROS ---
+# search_fields es lo que usan los widgets de autocompletar de los otros admins.
+
+@admin.register(Empleado)
+class EmpleadoAdmin(admin.ModelAdmin):
+    list_display = ('codigo_trabajador', 'nombre_completo', 'rut', 'cargo', 'tipo_contrato', 'fecha_vencimiento_licencia')
+    list_filter = ('cargo', 'tipo_contrato')
+    search_fields = ('codigo_trabajador', 'nombre_completo', 'rut')
+
+
+@admin.register(Maquinaria)
+class MaquinariaAdmin(admin.ModelAdmin):
+    list_display = ('codigo_eq', 'tipo', 'marca', 'modelo')
+    list_filter = ('tipo',)
+    search_fields = ('codigo_eq', 'marca', 'modelo')
+
+
+@admin.register(InformeDiario)
+class InformeDiarioAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'turno', 'lider_tirreno', 'jefe_mandante')
+    list_select_related = ('lider_tirreno', 'jefe_mandante')
+    list_filter = ('turno',)
+    date_hierarchy = 'fecha'
+
+
+# --- REGISTROS DE OPERACIÓN ---
+
+@admin.register(Movimiento)
+class MovimientoAdmin(TablaGrandeAdmin):
+    list_display = ('id', 'fecha', 'turno', 'empleado', 'maquinaria', 'proyecto', 'horometro_inicial', 'horometro_final',
+                    'horas_trabajadas', 'litros_por_hora', 'variacion_nivel_combustible')
+    list_select_related = ('empleado', 'maquinaria')
+    # Columnas generadas por la base de datos (indexadas, ordenables en la lista)
+    readonly_fields = ('horas_trabajadas', 'litros_por_hora', 'variacion_nivel_combustible')
+    # proyecto y fecha están indexados (ver Movimiento.Meta.indexes)
+    list_filter = ('proyecto', 'turno')
+    date_hierarchy = 'fecha'
+    autocomplete_fields = ('empleado', 'maquinaria')
+
+
+@admin.register(Viaje)
+class ViajeAdmin(TablaGrandeAdmin):
+    list_display = ('id', 'movimiento', 'postura', 'cantidad')
+    # Los __str__ de movimiento y postura leen empleado e informe
+    list_select_related = ('movimiento__empleado', 'postura__informe')
+    raw_id_fields = ('movimiento', 'postura')
+
+
+@admin.register(Postura)
+class PosturaAdmin(admin.ModelAdmin):
+    list_display = ('informe', 'numero_postura', 'tipo_actividad', 'origen', 'destino', 'material')
+    list_select_related = ('informe',)
+    list_filter = ('tipo_actividad',)
+    date_hierarchy = 'informe__fecha'
+    raw_id_fields = ('informe',)
+
+
+@admin.register(ProduccionEquipo)
+class ProduccionEquipoAdmin(admin.ModelAdmin):
+    list_display = ('informe', 'maquinaria')
+    list_select_related = ('informe', 'maquinaria')
+    date_hierarchy = 'informe__fecha'
+    raw_id_fields = ('informe',)
+    autocomplete_fields = ('maquinaria',)
+
+
 # Registramos los modelos para que aparezcan en el admin
 admin.site.register(Cliente)
-admin.site.register(Maquinaria)
-admin.site.register(Movimiento)
 admin.site.register(Proyecto)
 admin.site.register(TipoLicencia)
-admin.site.register(Empleado)
-admin.site.register(Supervisor)     
-admin.site.register(InformeDiario)  
-admin.site.register(Postura)
-admin.site.register(Viaje) # Añade esta línea al final   
\ No newline at end of file
+admin.site.register(Supervisor)
+# Un consumidor que dejó de leer frena la compactación del registro de cambios: se borra desde aquí
+admin.site.register(ConsumidorCambios)
+
+
+@admin.register(ConjuntoRecibido)
+class ConjuntoRecibidoAdmin(admin.ModelAdmin):
+    # En la central: qué conjuntos llegaron de cada sitio y con qué conflictos
+    list_display = ('nodo', 'secuencia', 'eventos', 'aplicados', 'recibido_en')
+    list_filter = ('nodo',)
+    readonly_fields = ('uuid', 'nodo', 'secuencia', 'eventos', 'aplicados', 'conflictos', 'recibido_en')
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def _asegurar_triggers(using, **kwargs):
+    from django.db import connections
+    from . import busqueda, cambios, replica, sincronizacion
+    if using == replica.alias():
+        # La réplica es de solo lectura: sus triggers vienen en la copia
+        return
+    busqueda.asegurar_indice(connections[using])
+    sincronizacion.asegurar_triggers(connections[using])
+    cambios.asegurar_triggers(connections[using])
 
 
 class EmpresaConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "empresa"
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        # Las migraciones que reconstruyen tablas en SQLite eliminan los triggers del índice
+        # de búsqueda, de la sincronización de datos maestros y del registro de cambios
+        post_migrate.connect(_asegurar_triggers, sender=self)
@@ -0,0 +1,361 @@
+# empresa/archivo.py
+
+"""
+Archivo histórico de movimientos y viajes.
+
+Los años cerrados (terminados hace más de ARCHIVO_ANTIGUEDAD_DIAS) se sacan
+de las tablas vivas y se guardan en un archivo por año, comprimido con gzip
+y en formato columnar: por cada tabla, una lista de valores por columna,
+con los movimientos ordenados por fecha e id. Así el archivo comprime bien
+y un rango de fechas se ubica con búsqueda binaria sobre la columna fecha.
+
+El manifiesto (manifiesto.json, en el mismo directorio) indica qué años
+están archivados, con el nombre del archivo, la cantidad de filas y su
+SHA-256. La suma se verifica cada vez que se lee un archivo.
+
+Las lecturas de rangos (informes de producción en HTML y PDF, reporte
+diario, utilización, jornada, cubo de viajes, analítica de combustible)
+combinan las dos capas con `filas_archivadas` y `movimientos_archivados`.
+Si un id está en ambas (por ejemplo, si un archivado se interrumpió antes
+de borrar las filas vivas), manda la fila viva.
+
+Los agregados ya calculados (UtilizacionDiaria) se conservan al archivar;
+el ranking de productividad solo lee filas vivas, se invalida y rechaza
+las fechas cuyas ventanas llegan a un año archivado.
+Las filas se borran con SQL directo para no disparar los signals por fila.
+Los movimientos archivados salen del índice de búsqueda; sus hallazgos de
+auditoría de horómetros se eliminan. En el registro de cambios (cambios.py)
+las filas archivadas y restauradas quedan marcadas como tales, no como
+bajas y altas.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cambios, productividad
+from .models import Empleado, Maquinaria, Movimiento, Postura, Viaje
+
+VERSION_FORMATO = 1
+MANIFIESTO = 'manifiesto.json'
+
+
+def directorio():
+    return Path(getattr(settings, 'ARCHIVO_MOVIMIENTOS_DIR', settings.BASE_DIR / 'archivo'))
+
+
+def antiguedad_minima():
+    return timedelta(days=getattr(settings, 'ARCHIVO_ANTIGUEDAD_DIAS', 365))
+
+
+def _columnas(modelo):
+    return [campo.attname for campo in modelo._meta.concrete_fields]
+
+
+# --- MANIFIESTO ---
+
+def leer_manifiesto():
+    ruta = directorio() / MANIFIESTO
+    if not ruta.exists():
+        return {'version': VERSION_FORMATO, 'anios': {}}
+    with open(ruta, encoding='utf-8') as archivo:
+        return json.load(archivo)
+
+
+def _guardar_manifiesto(manifiesto):
+    ruta = directorio() / MANIFIESTO
+    temporal = ruta.with_suffix('.tmp')
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, indent=2, ensure_ascii=False)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+
+
+def anios_archivados():
+    """{año: entrada del manifiesto} de los años archivados."""
+    return {int(anio): entrada for anio, entrada in leer_manifiesto()['anios'].items()}
+
+
+def anios_archivables():
+    """Años cerrados que todavía tienen movimientos en las tablas vivas."""
+    limite = timezone.localdate() - antiguedad_minima()
+    fechas = Movimiento.objects.filter(fecha__lt=date(limite.year, 1, 1)).dates('fecha', 'year')
+    return [fecha.year for fecha in fechas if date(fecha.year, 12, 31) < limite]
+
+
+# --- FORMATO DEL ARCHIVO ---
+
+def _a_json(valor):
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _tabla(modelo, filas):
+    columnas = _columnas(modelo)
+    return {'columnas': columnas, 'valores': [[_a_json(v) for v in columna] for columna in zip(*filas)] or [[] for _ in columnas]}
+
+
+def _filas(tabla):
+    return list(zip(*tabla['valores']))
+
+
+def _suma(contenido):
+    return hashlib.sha256(contenido).hexdigest()
+
+
+@lru_cache(maxsize=4)
+def _decodificar(ruta, suma):
+    with open(ruta, 'rb') as archivo:
+        contenido = archivo.read()
+    if _suma(contenido) != suma:
+        raise ValueError(f"La suma SHA-256 de {ruta} no coincide con el manifiesto.")
+    return json.loads(gzip.decompress(contenido))
+
+
+def cargar(anio):
+    """Devuelve el contenido del año archivado, verificando su suma."""
+    entrada = anios_archivados()[anio]
+    return _decodificar(str(directorio() / entrada['archivo']), entrada['sha256'])
+
+
+def _escribir(anio, movimientos, viajes):
+    """Escribe el archivo del año y devuelve la entrada para el manifiesto."""
+    datos = {
+        'version': VERSION_FORMATO,
+        'anio': anio,
+        'movimientos': _tabla(Movimiento, movimientos),
+        'viajes': _tabla(Viaje, viajes),
+    }
+    contenido = gzip.compress(json.dumps(datos, separators=(',', ':')).encode('utf-8'), compresslevel=9)
+    suma = _suma(contenido)
+    # El nombre lleva la suma: nunca se sobrescribe un archivo que el manifiesto aún apunta
+    nombre = f'movimientos_{anio}_{suma[:12]}.json.gz'
+    ruta = directorio() / nombre
+    with open(ruta, 'wb') as archivo:
+        archivo.write(contenido)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    fechas = [fila[_columnas(Movimiento).index('fecha')] for fila in movimientos]
+    return {
+        'archivo': nombre,
+        'sha256': suma,
+        'bytes': len(contenido),
+        'movimientos': len(movimientos),
+        'viajes': len(viajes),
+        'fecha_desde': _a_json(min(fechas)) if fechas else None,
+        'fecha_hasta': _a_json(max(fechas)) if fechas else None,
+        'archivado_en': timezone.now().isoformat(),
+    }
+
+
+# --- LECTURA TRANSPARENTE ---
+
+def _a_python(campo):
+    # Las columnas generadas convierten con el tipo de su expresión
+    return (campo.output_field if campo.generated else campo).to_python
+
+
+def _convertir(modelo, columnas, fila):
+    campos = {campo.attname: campo for campo in modelo._meta.concrete_fields}
+    return {columna: _a_python(campos[columna])(valor) for columna, valor in zip(columnas, fila)}
+
+
+def filas_archivadas(fecha_desde, fecha_hasta, columnas, turnos=None, excluir_ids=()):
+    """
+    Tuplas con las `columnas` pedidas (ya convertidas a tipos de Python) de
+    los movimientos archivados entre dos fechas, incluidas. Solo se
+    decodifican las columnas pedidas y el tramo de fechas del rango.
+    """
+    campos = {campo.attname: campo for campo in Movimiento._meta.concrete_fields}
+    filas = []
+    for anio in sorted(anios_archivados()):
+        if not fecha_desde.year <= anio <= fecha_hasta.year:
+            continue
+        tabla = cargar(anio)['movimientos']
+        valores = dict(zip(tabla['columnas'], tabla['valores']))
+        inicio = bisect_left(valores['fecha'], fecha_desde.isoformat())
+        fin = bisect_right(valores['fecha'], fecha_hasta.isoformat())
+        seleccion = [i for i in range(inicio, fin) if valores['id'][i] not in excluir_ids]
+        if turnos is not None:
+            seleccion = [i for i in seleccion if valores['turno'][i] in turnos]
+        convertidas = []
+        for columna in columnas:
+            if columna not in valores:
+                # Columna generada agregada después de archivar el año
+                convertidas.append([None] * len(seleccion))
+                continue
+            a_python = _a_python(campos[columna])
+            origen = valores[columna]
+            convertidas.append([a_python(origen[i]) for i in seleccion])
+        filas.extend(zip(*convertidas))
+    return filas
+
+
+def movimientos_archivados(fecha_desde, fecha_hasta, turnos=None, excluir_ids=(), relacionados=False):
+    """
+    Movimientos archivados entre dos fechas (incluidas), como instancias de
+    Movimiento de solo lectura. Con `relacionados` se cargan empleado y
+    maquinaria en dos consultas, como un select_related.
+    """
+    columnas = _columnas(Movimiento)
+    movimientos = []
+    for fila in filas_archivadas(fecha_desde, fecha_hasta, columnas, turnos, excluir_ids):
+        movimiento = Movimiento(**dict(zip(columnas, fila)))
+        movimiento._state.adding = False
+        movimientos.append(movimiento)
+
+    if relacionados and movimientos:
+        empleados = Empleado.objects.in_bulk({m.empleado_id for m in movimientos if m.empleado_id})
+        maquinarias = Maquinaria.objects.in_bulk({m.maquinaria_id for m in movimientos if m.maquinaria_id})
+        for movimiento in movimientos:
+            # Se deja el objeto en la caché de la relación sin tocar el id guardado
+            Movimiento.empleado.field.set_cached_value(movimiento, empleados.get(movimiento.empleado_id))
+            Movimiento.maquinaria.field.set_cached_value(movimiento, maquinarias.get(movimiento.maquinaria_id))
+    return movimientos
+
+
+def viajes_archivados(fecha_desde, fecha_hasta, excluir_ids=()):
+    """
+    Tuplas (id, postura_id, maquinaria_id, cantidad) de los viajes
+    archivados cuyos movimientos caen entre las dos fechas, incluidas.
+    """
+    viajes = []
+    desde, hasta = fecha_desde.isoformat(), fecha_hasta.isoformat()
+    for anio in sorted(anios_archivados()):
+        if not fecha_desde.year <= anio <= fecha_hasta.year:
+            continue
+        contenido = cargar(anio)
+        movimientos = dict(zip(contenido['movimientos']['columnas'], contenido['movimientos']['valores']))
+        inicio = bisect_left(movimientos['fecha'], desde)
+        fin = bisect_right(movimientos['fecha'], hasta)
+        maquinas = dict(zip(movimientos['id'][inicio:fin], movimientos['maquinaria_id'][inicio:fin]))
+        tabla = dict(zip(contenido['viajes']['columnas'], contenido['viajes']['valores']))
+        for id_, movimiento_id, postura_id, cantidad in zip(tabla['id'], tabla['movimiento_id'], tabla['postura_id'], tabla['cantidad']):
+            if movimiento_id in maquinas and id_ not in excluir_ids:
+                viajes.append((id_, postura_id, maquinas[movimiento_id], cantidad))
+    return viajes
+
+
+def rango_archivado(fecha_desde, fecha_hasta):
+    """True si algún año del rango está archivado (evita leer el disco si no)."""
+    return any(fecha_desde.year <= anio <= fecha_hasta.year for anio in anios_archivados())
+
+
+# --- ARCHIVAR Y RESTAURAR ---
+
+def _borrar_vivos(ids):
+    with connection.cursor() as cursor:
+        for i in range(0, len(ids), 500):
+            tramo = ids[i:i + 500]
+            marcas = ', '.join(['%s'] * len(tramo))
+            cursor.execute(
+                f"DELETE FROM empresa_hallazgohorometro WHERE movimiento_id IN ({marcas}) OR movimiento_anterior_id IN ({marcas})",
+                tramo + tramo,
+            )
+            cursor.execute(f"DELETE FROM empresa_viaje WHERE movimiento_id IN ({marcas})", tramo)
+            cursor.execute(f"DELETE FROM empresa_movimiento WHERE id IN ({marcas})", tramo)
+
+
+def archivar(anio):
+    """
+    Archiva los movimientos vivos del año (y sus viajes). Si el año ya
+    tenía archivo, se reescribe combinado con las filas nuevas. Devuelve la
+    entrada del manifiesto.
+    """
+    if date(anio, 12, 31) >= timezone.localdate() - antiguedad_minima():
+        raise ValueError(f"El año {anio} todavía no es un período cerrado.")
+    directorio().mkdir(parents=True, exist_ok=True)
+
+    vivos = list(Movimiento.objects.filter(fecha__year=anio).order_by('fecha', 'id').values_list(*_columnas(Movimiento)))
+    ids_vivos = [fila[0] for fila in vivos]
+    viajes = list(Viaje.objects.filter(movimiento__fecha__year=anio).order_by('id').values_list(*_columnas(Viaje)))
+
+    anterior = anios_archivados().get(anio)
+    if anterior:
+        contenido = cargar(anio)
+        repetidos = set(ids_vivos)
+        indice_fecha = _columnas(Movimiento).index('fecha')
+        vivos = sorted(
+            [tuple(_convertir(Movimiento, contenido['movimientos']['columnas'], f).values())
+             for f in _filas(contenido['movimientos']) if f[0] not in repetidos] + vivos,
+            key=lambda fila: (fila[indice_fecha], fila[0]),
+        )
+        viajes = [f for f in _filas(contenido['viajes']) if f[1] not in repetidos] + viajes
+
+    entrada = _escribir(anio, vivos, viajes)
+    # Primero el manifiesto y después el borrado: si algo falla entre ambos
+    # las filas quedan repetidas (y manda la viva), nunca perdidas.
+    manifiesto = leer_manifiesto()
+    manifiesto['anios'][str(anio)] = entrada
+    _guardar_manifiesto(manifiesto)
+    with transaction.atomic(), cambios.marcar_eventos('A'):
+        _borrar_vivos(ids_vivos)
+    productividad.invalidar()
+    if anterior and anterior['archivo'] != entrada['archivo']:
+        (directorio() / anterior['archivo']).unlink(missing_ok=True)
+    return entrada
+
+
+def restaurar(anio):
+    """
+    Devuelve a las tablas vivas los movimientos y viajes archivados del año
+    y elimina su archivo. Los equipos o empleados borrados desde entonces
+    quedan en blanco; los viajes de posturas que ya no existen se
+    descartan. Devuelve (movimientos, viajes, viajes_descartados).
+    """
+    entrada = anios_archivados()[anio]
+    contenido = cargar(anio)
+    columnas = contenido['movimientos']['columnas']
+    movimientos = [Movimiento(**_convertir(Movimiento, columnas, fila)) for fila in _filas(contenido['movimientos'])]
+    viajes = [Viaje(**_convertir(Viaje, contenido['viajes']['columnas'], fila)) for fila in _filas(contenido['viajes'])]
+
+    empleados = set(Empleado.objects.filter(id__in={m.empleado_id for m in movimientos}).values_list('id', flat=True))
+    maquinarias = set(Maquinaria.objects.filter(id__in={m.maquinaria_id for m in movimientos}).values_list('id', flat=True))
+    posturas = set(Postura.objects.filter(id__in={v.postura_id for v in viajes}).values_list('id', flat=True))
+    for movimiento in movimientos:
+        if movimiento.empleado_id not in empleados:
+            movimiento.empleado_id = None
+        if movimiento.maquinaria_id not in maquinarias:
+            movimiento.maquinaria_id = None
+    validos = [viaje for viaje in viajes if viaje.postura_id in posturas]
+
+    with transaction.atomic(), cambios.marcar_eventos('R'):
+        # ignore_conflicts: un id que siguió vivo (archivado interrumpido) no se duplica
+        Movimiento.objects.bulk_create(movimientos, batch_size=2000, ignore_conflicts=True)
+        Viaje.objects.bulk_create(validos, batch_size=2000, ignore_conflicts=True)
+    productividad.invalidar()
+    # Igual que al archivar: un corte aquí deja filas repetidas, no perdidas
+    manifiesto = leer_manifiesto()
+    del manifiesto['anios'][str(anio)]
+    _guardar_manifiesto(manifiesto)
+    (directorio() / entrada['archivo']).unlink(missing_ok=True)
+    return len(movimientos), len(validos), len(viajes) - len(validos)
+
+
+def verificar():
+    """Revisa la suma y el conteo de cada año archivado. Devuelve [(año, error o None)]."""
+    resultados = []
+    for anio, entrada in sorted(anios_archivados().items()):
+        try:
+            contenido = cargar(anio)
+            filas = len(contenido['movimientos']['valores'][0]) if contenido['movimientos']['valores'] else 0
+            if filas != entrada['movimientos']:
+                raise ValueError(f"El archivo tiene {filas} movimientos y el manifiesto indica {entrada['movimientos']}.")
+            resultados.append((anio, None))
+        except (OSError, ValueError) as exc:
+            resultados.append((anio, str(exc)))
+    return resultados
@@ -0,0 +1,153 @@
+# empresa/auditoria.py
+
+"""
+Auditoría de continuidad de horómetros de toda la flota.
+
+Las lecturas de cada equipo se ordenan una sola vez (en la base de datos,
+por equipo, fecha y horómetro inicial) y se recorren en una pasada lineal
+comparando cada movimiento con el anterior del mismo equipo, así que el
+costo total es O(n log n). Se detecta:
+
+- lectura_invalida: horómetro final menor o igual al inicial.
+- sin_lectura_final: falta el horómetro final y no es el último registro.
+- retroceso: el horómetro inicial es menor que el inicial anterior.
+- superposicion: empieza antes de que termine el movimiento anterior.
+- brecha: quedan minutos sin registrar entre un movimiento y el siguiente.
+- salto_improbable: la brecha es mayor que el tiempo de calendario
+  transcurrido, lo que no puede ser trabajo real.
+
+Los hallazgos se guardan en HallazgoHorometro. La revisión incremental
+solo vuelve a auditar los equipos con movimientos creados, modificados o
+borrados desde la ejecución anterior.
+"""
+
+from itertools import groupby
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import AuditoriaHorometro, HallazgoHorometro, Movimiento
+
+TOLERANCIA_BRECHA_MINUTOS = 5
+MINUTOS_POR_DIA = 24 * 60
+TAMANO_LOTE = 5000
+
+
+def _lecturas(maquinaria_ids=None):
+    consulta = Movimiento.objects.filter(maquinaria__isnull=False)
+    if maquinaria_ids is not None:
+        consulta = consulta.filter(maquinaria_id__in=maquinaria_ids)
+    return consulta.order_by('maquinaria_id', 'fecha', 'horometro_inicial', 'id').values_list(
+        'id', 'maquinaria_id', 'fecha', 'horometro_inicial', 'horometro_final'
+    ).iterator(chunk_size=TAMANO_LOTE)
+
+
+def revisar_secuencia(maquinaria_id, lecturas):
+    """
+    Revisa las lecturas de un equipo, ya ordenadas, y devuelve los
+    HallazgoHorometro sin guardar. `lecturas` son tuplas
+    (id, maquinaria_id, fecha, horometro_inicial, horometro_final).
+    """
+    hallazgos = []
+
+    def hallazgo(tipo, actual, anterior=None, diferencia=None):
+        hallazgos.append(HallazgoHorometro(
+            maquinaria_id=maquinaria_id, movimiento_id=actual[0],
+            movimiento_anterior_id=anterior[0] if anterior else None,
+            tipo=tipo, diferencia_minutos=diferencia, fecha=actual[2],
+        ))
+
+    anterior = None
+    for actual in lecturas:
+        _, _, fecha, inicial, final = actual
+        if final is not None and final <= inicial:
+            hallazgo('lectura_invalida', actual, diferencia=final - inicial)
+        if anterior is not None:
+            _, _, fecha_anterior, inicial_anterior, final_anterior = anterior
+            if final_anterior is None:
+                hallazgo('sin_lectura_final', anterior)
+                # Sin lectura final solo se puede comparar contra el inicio anterior
+                if inicial < inicial_anterior:
+                    hallazgo('retroceso', actual, anterior, inicial - inicial_anterior)
+            elif inicial < inicial_anterior:
+                hallazgo('retroceso', actual, anterior, inicial - inicial_anterior)
+            elif inicial < final_anterior:
+                hallazgo('superposicion', actual, anterior, inicial - final_anterior)
+            elif inicial - final_anterior > TOLERANCIA_BRECHA_MINUTOS:
+                brecha = inicial - final_anterior
+                # Entre dos fechas el equipo no puede haber trabajado más que el tiempo de calendario
+                dias = (fecha - fecha_anterior).days + 1
+                tipo = 'salto_improbable' if brecha > dias * MINUTOS_POR_DIA else 'brecha'
+                hallazgo(tipo, actual, anterior, brecha)
+        anterior = actual
+    return hallazgos
+
+
+def _conteos():
+    return {
+        str(fila['maquinaria_id']): fila['total']
+        for fila in Movimiento.objects.filter(maquinaria__isnull=False)
+        .values('maquinaria_id').annotate(total=Count('id')).order_by()
+    }
+
+
+def maquinas_con_cambios(ultima):
+    """Equipos con movimientos nuevos, modificados o borrados desde la auditoría `ultima`."""
+    cambiadas = set(
+        Movimiento.objects.filter(actualizado_en__gte=ultima.iniciada_en, maquinaria__isnull=False)
+        .values_list('maquinaria_id', flat=True).distinct().order_by()
+    )
+    conteos = _conteos()
+    # Un borrado no deja actualizado_en: se detecta porque cambia el total del equipo
+    for maquinaria_id in set(conteos) | set(ultima.conteos):
+        if conteos.get(maquinaria_id) != ultima.conteos.get(maquinaria_id):
+            cambiadas.add(int(maquinaria_id))
+    return cambiadas, conteos
+
+
+def auditar(incremental=False):
+    """
+    Ejecuta la auditoría y devuelve el AuditoriaHorometro creado. La primera
+    ejecución es siempre completa.
+    """
+    iniciada_en = timezone.now()
+    ultima = AuditoriaHorometro.objects.filter(terminada_en__isnull=False).first() if incremental else None
+    if ultima is not None:
+        maquinas, conteos = maquinas_con_cambios(ultima)
+        modo = 'incremental'
+    else:
+        maquinas, conteos = None, _conteos()
+        modo = 'completa'
+
+    auditoria = AuditoriaHorometro(iniciada_en=iniciada_en, modo=modo, conteos=conteos)
+    if maquinas == set():
+        auditoria.terminada_en = timezone.now()
+        auditoria.save()
+        return auditoria
+
+    with transaction.atomic():
+        anteriores = HallazgoHorometro.objects.all()
+        if maquinas is not None:
+            anteriores = anteriores.filter(maquinaria_id__in=maquinas)
+        anteriores.delete()
+
+        pendientes, revisadas, movimientos, total = [], 0, 0, 0
+        for maquinaria_id, lecturas in groupby(_lecturas(maquinas), key=lambda fila: fila[1]):
+            lecturas = list(lecturas)
+            revisadas += 1
+            movimientos += len(lecturas)
+            pendientes.extend(revisar_secuencia(maquinaria_id, lecturas))
+            if len(pendientes) >= TAMANO_LOTE:
+                HallazgoHorometro.objects.bulk_create(pendientes)
+                total += len(pendientes)
+                pendientes = []
+        HallazgoHorometro.objects.bulk_create(pendientes)
+        total += len(pendientes)
+
+        auditoria.maquinas_revisadas = revisadas
+        auditoria.movimientos_revisados = movimientos
+        auditoria.hallazgos = total
+        auditoria.terminada_en = timezone.now()
+        auditoria.save()
+    return auditoria
@@ -0,0 +1,222 @@
+# empresa/busqueda.py
+
+"""
+Índice de búsqueda de texto completo (SQLite FTS5) sobre las observaciones
+y descripciones de Movimiento y ProduccionEquipo.
+
+El índice vive en la tabla virtual `empresa_busqueda` y se mantiene con
+triggers de SQLite, así que también se actualiza con bulk_create, update()
+y escrituras fuera del ORM. Como SQLite borra los triggers cuando una
+migración reconstruye la tabla, `asegurar_indice` se ejecuta después de
+cada `migrate` (ver EmpresaConfig.ready) y los vuelve a crear.
+
+El rowid de cada documento se deriva del id del objeto (id*2 para
+movimientos, id*2+1 para producción), de modo que actualizar o borrar
+un documento es una búsqueda por clave y no un recorrido del índice.
+
+En el modo fragmentado cada base indexa sus propios movimientos (la
+producción queda en la principal): `buscar` consulta todas las bases a la
+vez y combina los resultados. La relevancia bm25 se calcula en cada base
+con sus propias estadísticas, así que el orden entre minas es aproximado.
+"""
+
+from collections import Counter
+
+from django.db import connection
+from django.utils.html import escape
+
+from . import fragmentos
+
+TABLA = 'empresa_busqueda'
+
+# Marcadores que no aparecen en texto normal; se reemplazan por <mark> después de escapar el HTML
+_INICIO_MARCA, _FIN_MARCA = '\x02', '\x03'
+
+_CREAR_TABLA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA} USING fts5(
+    observaciones, descripcion,
+    origen UNINDEXED, objeto_id UNINDEXED, fecha UNINDEXED, maquinaria_id UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+_INSERTAR_MOVIMIENTO = f"""
+    INSERT INTO {TABLA} (rowid, observaciones, descripcion, origen, objeto_id, fecha, maquinaria_id)
+    SELECT new.id * 2, COALESCE(new.observaciones, ''), COALESCE(new.descripcion_trabajo_especial, ''),
+           'movimiento', new.id, new.fecha, new.maquinaria_id
+    WHERE COALESCE(new.observaciones, '') != '' OR COALESCE(new.descripcion_trabajo_especial, '') != '';
+"""
+
+_INSERTAR_PRODUCCION = f"""
+    INSERT INTO {TABLA} (rowid, observaciones, descripcion, origen, objeto_id, fecha, maquinaria_id)
+    SELECT new.id * 2 + 1, new.observaciones, '', 'produccion', new.id,
+           (SELECT fecha FROM empresa_informediario WHERE id = new.informe_id), new.maquinaria_id
+    WHERE COALESCE(new.observaciones, '') != '';
+"""
+
+_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_movimiento_ai AFTER INSERT ON empresa_movimiento BEGIN
+        {_INSERTAR_MOVIMIENTO}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_movimiento_au AFTER UPDATE ON empresa_movimiento BEGIN
+        DELETE FROM {TABLA} WHERE rowid = old.id * 2;
+        {_INSERTAR_MOVIMIENTO}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_movimiento_ad AFTER DELETE ON empresa_movimiento BEGIN
+        DELETE FROM {TABLA} WHERE rowid = old.id * 2;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_produccion_ai AFTER INSERT ON empresa_produccionequipo BEGIN
+        {_INSERTAR_PRODUCCION}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_produccion_au AFTER UPDATE ON empresa_produccionequipo BEGIN
+        DELETE FROM {TABLA} WHERE rowid = old.id * 2 + 1;
+        {_INSERTAR_PRODUCCION}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_produccion_ad AFTER DELETE ON empresa_produccionequipo BEGIN
+        DELETE FROM {TABLA} WHERE rowid = old.id * 2 + 1;
+    END""",
+]
+
+
+def disponible(conexion=connection):
+    return conexion.vendor == 'sqlite'
+
+
+def reconstruir_indice(conexion=connection):
+    """Vacía el índice y lo vuelve a llenar desde las tablas de origen."""
+    with conexion.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA}")
+        cursor.execute(f"""
+            INSERT INTO {TABLA} (rowid, observaciones, descripcion, origen, objeto_id, fecha, maquinaria_id)
+            SELECT id * 2, COALESCE(observaciones, ''), COALESCE(descripcion_trabajo_especial, ''),
+                   'movimiento', id, fecha, maquinaria_id
+            FROM empresa_movimiento
+            WHERE COALESCE(observaciones, '') != '' OR COALESCE(descripcion_trabajo_especial, '') != ''
+        """)
+        cursor.execute(f"""
+            INSERT INTO {TABLA} (rowid, observaciones, descripcion, origen, objeto_id, fecha, maquinaria_id)
+            SELECT p.id * 2 + 1, p.observaciones, '', 'produccion', p.id, i.fecha, p.maquinaria_id
+            FROM empresa_produccionequipo p LEFT JOIN empresa_informediario i ON i.id = p.informe_id
+            WHERE COALESCE(p.observaciones, '') != ''
+        """)
+        cursor.execute(f"INSERT INTO {TABLA} ({TABLA}) VALUES ('optimize')")
+
+
+def asegurar_indice(conexion=connection):
+    """
+    Crea la tabla virtual y los triggers si no existen. Si la tabla es nueva,
+    se llena con los datos existentes.
+    """
+    if not disponible(conexion):
+        return
+    tablas = conexion.introspection.table_names()
+    if 'empresa_movimiento' not in tablas or 'empresa_produccionequipo' not in tablas:
+        return
+    nueva = TABLA not in tablas
+    with conexion.cursor() as cursor:
+        cursor.execute(_CREAR_TABLA)
+        for trigger in _TRIGGERS:
+            cursor.execute(trigger)
+    if nueva:
+        reconstruir_indice(conexion)
+
+
+def construir_consulta(texto):
+    """
+    Convierte lo que escribe el usuario en una consulta FTS5 segura: cada
+    palabra se cita (así los caracteres especiales no rompen la sintaxis) y
+    se busca por prefijo, de modo que "neum" encuentra "neumático".
+    """
+    terminos = [t.replace('"', '""') for t in texto.split()]
+    return ' '.join(f'"{t}"*' for t in terminos if t)
+
+
+def _resaltar(fragmento):
+    return escape(fragmento).replace(_INICIO_MARCA, '<mark>').replace(_FIN_MARCA, '</mark>')
+
+
+def _buscar_en_base(where, parametros, limite):
+    """Resultados y facetas del índice de la base actual."""
+    with fragmentos.conexion().cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {TABLA}.origen, {TABLA}.objeto_id, {TABLA}.fecha, {TABLA}.maquinaria_id,
+                   highlight({TABLA}, 0, %s, %s), highlight({TABLA}, 1, %s, %s), bm25({TABLA})
+            FROM {TABLA} WHERE {where}
+            ORDER BY bm25({TABLA}) LIMIT %s
+        """, [_INICIO_MARCA, _FIN_MARCA, _INICIO_MARCA, _FIN_MARCA] + parametros + [limite])
+        resultados = [
+            {
+                'tipo': origen,
+                'id': objeto_id,
+                'fecha': fecha,
+                'maquinaria_id': maquinaria,
+                'observaciones': _resaltar(observaciones),
+                'descripcion': _resaltar(descripcion),
+                'relevancia': round(-rango, 4),
+            }
+            for origen, objeto_id, fecha, maquinaria, observaciones, descripcion, rango in cursor.fetchall()
+        ]
+
+        cursor.execute(f"""
+            SELECT {TABLA}.fecha, COUNT(*) FROM {TABLA} WHERE {where}
+            GROUP BY {TABLA}.fecha ORDER BY {TABLA}.fecha DESC
+        """, parametros)
+        facetas_fecha = [{'fecha': fecha, 'total': total} for fecha, total in cursor.fetchall()]
+
+        cursor.execute(f"""
+            SELECT {TABLA}.maquinaria_id, m.codigo_eq, COUNT(*) FROM {TABLA}
+            LEFT JOIN empresa_maquinaria m ON m.id = {TABLA}.maquinaria_id
+            WHERE {where} GROUP BY {TABLA}.maquinaria_id, m.codigo_eq ORDER BY COUNT(*) DESC
+        """, parametros)
+        facetas_maquinaria = [
+            {'id': maquinaria, 'codigo_eq': codigo, 'total': total}
+            for maquinaria, codigo, total in cursor.fetchall()
+        ]
+    return resultados, facetas_fecha, facetas_maquinaria
+
+
+def buscar(texto, fecha_desde=None, fecha_hasta=None, maquinaria_id=None, limite=50):
+    """
+    Busca en el índice y devuelve un dict con los resultados ordenados por
+    relevancia (bm25) con el texto resaltado, y las facetas por fecha y
+    por máquina calculadas sobre todas las coincidencias.
+    """
+    consulta = construir_consulta(texto)
+    if not consulta:
+        return {'resultados': [], 'total': 0, 'facetas': {'fechas': [], 'maquinarias': []}}
+
+    condiciones = [f"{TABLA} MATCH %s"]
+    parametros = [consulta]
+    if fecha_desde:
+        condiciones.append(f"{TABLA}.fecha >= %s")
+        parametros.append(fecha_desde.isoformat())
+    if fecha_hasta:
+        condiciones.append(f"{TABLA}.fecha <= %s")
+        parametros.append(fecha_hasta.isoformat())
+    if maquinaria_id:
+        condiciones.append(f"{TABLA}.maquinaria_id = %s")
+        parametros.append(int(maquinaria_id))
+    where = " AND ".join(condiciones)
+
+    partes = list(fragmentos.en_paralelo(_buscar_en_base, where, parametros, limite).values())
+    if len(partes) == 1:
+        resultados, facetas_fecha, facetas_maquinaria = partes[0]
+    else:
+        resultados = sorted((r for parte, _, _ in partes for r in parte), key=lambda r: -r['relevancia'])[:limite]
+        por_fecha, por_maquinaria = Counter(), Counter()
+        for _, fechas, maquinarias in partes:
+            por_fecha.update({f['fecha']: f['total'] for f in fechas})
+            por_maquinaria.update({(m['id'], m['codigo_eq']): m['total'] for m in maquinarias})
+        facetas_fecha = [{'fecha': fecha, 'total': total} for fecha, total in sorted(
+            por_fecha.items(), key=lambda item: (item[0] is not None, item[0] or ''), reverse=True,
+        )]
+        facetas_maquinaria = [
+            {'id': maquinaria, 'codigo_eq': codigo, 'total': total}
+            for (maquinaria, codigo), total in por_maquinaria.most_common()
+        ]
+
+    return {
+        'resultados': resultados,
+        'total': sum(f['total'] for f in facetas_fecha),
+        'facetas': {'fechas': facetas_fecha, 'maquinarias': facetas_maquinaria},
+    }
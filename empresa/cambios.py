@@ -0,0 +1,153 @@
+# empresa/cambios.py
+
+"""
+Captura de cambios (CDC) de movimientos, viajes, producción, posturas e
+informes para consumidores externos, como el almacén de BI.
+
+Cada alta, modificación o baja agrega una fila a EventoCambio con la fila
+completa en JSON. La escriben triggers de SQLite dentro de la misma
+sentencia que el cambio: una importación o la grilla de viajes escriben
+sus eventos en el mismo lote, sin viajes extra a la base de datos, y si
+la transacción se revierte los eventos se revierten con ella. Los ids son
+AUTOINCREMENT y SQLite confirma las escrituras de a una, así que un
+lector nunca ve un id mayor antes que uno menor: leer en orden desde el
+último id procesado no pierde ni repite eventos.
+
+Cada consumidor confirma hasta dónde procesó (ConsumidorCambios), con
+`consumir_cambios` o con un POST autenticado con CAMBIOS_TOKEN (el feed
+por GET no cambia nada); los eventos que ya confirmaron todos se pueden
+compactar (borrar). Archivar y
+restaurar años marcan sus eventos como 'A' y 'R' para que no se lean como
+bajas y altas. Igual que el índice de búsqueda, los triggers se vuelven a
+crear después de cada `migrate` (ver EmpresaConfig.ready); los cambios
+que hacen las migraciones de datos mismas no se registran.
+"""
+
+import hmac
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Max, Min
+
+from .models import (
+    CampoCodificado, ConsumidorCambios, EventoCambio, InformeDiario, Movimiento, Postura, ProduccionEquipo, Viaje,
+)
+
+TABLA = EventoCambio._meta.db_table
+MODELOS = {clase._meta.model_name: clase for clase in (Movimiento, Viaje, ProduccionEquipo, Postura, InformeDiario)}
+
+# Eventos por lectura del feed
+LIMITE = getattr(settings, 'CAMBIOS_LIMITE', 1000)
+
+
+def _fila(clase, alias):
+    """json_object(...) con las columnas de la fila `alias` (new u old)."""
+    partes = []
+    for campo in clase._meta.concrete_fields:
+        valor = f'{alias}.{campo.column}'
+        if isinstance(campo, models.JSONField):
+            valor = f'json({valor})'
+        partes.append(f"'{campo.attname}', {valor}")
+    return f"json_object({', '.join(partes)})"
+
+
+def _triggers():
+    triggers = []
+    for modelo, clase in MODELOS.items():
+        tabla = clase._meta.db_table
+        for sufijo, momento, operacion, alias in (
+            ('ai', 'INSERT', 'I', 'new'), ('au', 'UPDATE', 'U', 'new'), ('ad', 'DELETE', 'D', 'old'),
+        ):
+            triggers.append(f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_{modelo}_{sufijo} AFTER {momento} ON {tabla} BEGIN
+                INSERT INTO {TABLA} (modelo, objeto_id, operacion, datos, registrado_en)
+                VALUES ('{modelo}', {alias}.id, '{operacion}', {_fila(clase, alias)}, strftime('%Y-%m-%d %H:%M:%f', 'now'));
+            END""")
+    return triggers
+
+
+def disponible(conexion=connection):
+    return conexion.vendor == 'sqlite'
+
+
+def asegurar_triggers(conexion=connection):
+    """Crea los triggers que faltan, si las tablas ya existen."""
+    if not disponible(conexion):
+        return
+    tablas = set(conexion.introspection.table_names())
+    if not {TABLA} | {clase._meta.db_table for clase in MODELOS.values()} <= tablas:
+        return
+    with conexion.cursor() as cursor:
+        for trigger in _triggers():
+            cursor.execute(trigger)
+
+
+@contextmanager
+def marcar_eventos(operacion):
+    """
+    Cambia a `operacion` la marca de los eventos escritos dentro del bloque.
+    Debe usarse dentro de la misma transacción: como SQLite tiene un solo
+    escritor, los ids nuevos son todos de esta transacción.
+    """
+    ultimo = EventoCambio.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+    yield
+    EventoCambio.objects.filter(id__gt=ultimo).update(operacion=operacion)
+
+
+def _decodificadores(clase):
+    # En las filas del trigger las opciones codificadas vienen como código
+    return {
+        campo.attname: campo.valores for campo in clase._meta.concrete_fields if isinstance(campo, CampoCodificado)
+    }
+
+
+_DECODIFICADORES = {modelo: _decodificadores(clase) for modelo, clase in MODELOS.items()}
+
+
+def eventos_desde(cursor, limite=LIMITE):
+    """Hasta `limite` eventos posteriores a `cursor`, en orden, como diccionarios."""
+    eventos = []
+    for id_, modelo, objeto_id, operacion, datos, registrado_en in (
+        EventoCambio.objects.filter(id__gt=cursor).order_by('id')
+        .values_list('id', 'modelo', 'objeto_id', 'operacion', 'datos', 'registrado_en')[:limite]
+    ):
+        if datos:
+            for columna, valores in _DECODIFICADORES[modelo].items():
+                if datos.get(columna) is not None:
+                    datos[columna] = valores[datos[columna]]
+        eventos.append({
+            'id': id_, 'modelo': modelo, 'objeto_id': objeto_id, 'operacion': operacion,
+            'registrado_en': registrado_en.isoformat(), 'datos': datos,
+        })
+    return eventos
+
+
+def confirmar(consumidor, cursor):
+    """
+    Registra que `consumidor` procesó todo hasta `cursor`. El cursor
+    guardado nunca retrocede ni pasa del último evento escrito: confirmar
+    eventos que todavía no existen haría que `compactar` los borrara sin
+    que nadie los leyera.
+    """
+    ultimo = EventoCambio.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+    cursor = min(cursor, ultimo)
+    ConsumidorCambios.objects.get_or_create(nombre=consumidor)
+    ConsumidorCambios.objects.filter(nombre=consumidor, cursor__lt=cursor).update(cursor=cursor)
+
+
+def token_valido(token):
+    """Compara el token recibido con CAMBIOS_TOKEN; sin token configurado nadie puede confirmar."""
+    esperado = getattr(settings, 'CAMBIOS_TOKEN', '')
+    return bool(esperado) and hmac.compare_digest(token.encode('utf-8'), esperado.encode('utf-8'))
+
+
+def compactar():
+    """
+    Borra los eventos que ya confirmaron todos los consumidores. Sin
+    consumidores registrados no se borra nada. Devuelve cuántos se borraron.
+    """
+    hasta = ConsumidorCambios.objects.aggregate(hasta=Min('cursor'))['hasta']
+    if not hasta:
+        return 0
+    borrados, _ = EventoCambio.objects.filter(id__lte=hasta).delete()
+    return borrados
@@ -0,0 +1,35 @@
+# empresa/checks.py
+
+"""
+Verificaciones de configuración que Django corre con `check`, `runserver`
+y `migrate`.
+"""
+
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+
+from . import fragmentos
+
+
+@register()
+def registro_de_cambios_y_fragmentos(app_configs, **kwargs):
+    """
+    Los triggers del registro de cambios (cambios.py) solo ven la base
+    principal: con FRAGMENTOS_PROYECTO los movimientos y viajes de los
+    fragmentos nunca llegan a EventoCambio. Un sitio que replica a la
+    central perdería esos cambios sin aviso.
+    """
+    if not fragmentos.activo():
+        return []
+    if getattr(settings, 'REPLICACION_NODO', '') or getattr(settings, 'REPLICACION_CENTRAL_URL', ''):
+        return [Error(
+            "La replicación a la central no funciona en modo fragmentado.",
+            hint="El registro de cambios solo ve la base principal. Quite FRAGMENTOS_PROYECTO o REPLICACION_NODO "
+                 "y REPLICACION_CENTRAL_URL.",
+            id='empresa.E001',
+        )]
+    return [Warning(
+        "En modo fragmentado el registro de cambios solo ve la base principal.",
+        hint="El feed /api/cambios/ y `consumir_cambios` quedan desactivados mientras haya FRAGMENTOS_PROYECTO.",
+        id='empresa.W001',
+    )]
@@ -0,0 +1,300 @@
+# empresa/combustible.py
+
+"""
+Analítica de consumo de combustible por máquina.
+
+El historial se lee con una sola consulta por columnas en cada base (más
+los años archivados del rango, ver archivo.py) y todo el cálculo se hace con
+arreglos de NumPy, sin recorrer las filas en Python:
+
+- Consumo de cada carga: litros cargados / horas trabajadas por la
+  máquina desde la carga anterior (la carga repone lo que se gastó).
+- Línea base por máquina: media y desviación móviles de las últimas
+  VENTANA cargas anteriores de la misma máquina (sumas acumuladas).
+- Línea base por tipo de equipo: mediana del consumo del tipo.
+- Anomalías: consumo muy por sobre la línea base de la máquina (posible
+  fuga o carga desviada), muy por sobre su tipo, y cargas hechas con el
+  chip de otro equipo (`detalle_chip_otro_equipo`).
+
+El resultado se guarda en ReporteCombustible con el comando
+`actualizar_reporte_combustible`.
+"""
+
+import time
+from datetime import date
+
+from . import archivo, fragmentos
+from .models import Maquinaria, Movimiento, ReporteCombustible
+
+ORIGEN_CHIP_OTRO_EQUIPO = 'Estación Copec con Chip de otro Equipo'
+VENTANA = 10
+MINIMO_HISTORIAL = 5
+DESVIACIONES = 3.0
+FACTOR_SOBRE_BASE = 1.25
+FACTOR_SOBRE_TIPO = 2.0
+MAXIMO_ANOMALIAS = 1000
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("La analítica de combustible requiere instalar numpy.")
+    return numpy
+
+
+def _consultar(sql, parametros):
+    with fragmentos.conexion().cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
+
+
+def _orden(fila):
+    # Mismo orden que la consulta: máquina, fecha, horómetro e id
+    return fila[1], fila[2], fila[6], fila[0]
+
+
+def cargar_historial(fecha_desde=None, fecha_hasta=None):
+    """
+    Devuelve el historial como dict de arreglos, ordenado por máquina, fecha
+    y horómetro: id, maquinaria_id, fecha (datetime64[D]), horas, litros y
+    chip_otro (bool).
+    """
+    np = _numpy()
+    chip_otro = Movimiento._meta.get_field('origen_combustible').get_prep_value(ORIGEN_CHIP_OTRO_EQUIPO)
+    condiciones, parametros = ["maquinaria_id IS NOT NULL"], [chip_otro]
+    if fecha_desde:
+        condiciones.append("fecha >= %s")
+        parametros.append(fecha_desde.isoformat())
+    if fecha_hasta:
+        condiciones.append("fecha <= %s")
+        parametros.append(fecha_hasta.isoformat())
+    sql = f"""
+        SELECT id, maquinaria_id, fecha,
+               CAST(COALESCE(horas_trabajadas, 0) AS REAL),
+               CAST(COALESCE(combustible_cargado, 0) AS REAL),
+               COALESCE(origen_combustible = %s, 0), horometro_inicial
+        FROM empresa_movimiento
+        WHERE {' AND '.join(condiciones)}
+        ORDER BY maquinaria_id, fecha, horometro_inicial, id
+    """
+    partes = list(fragmentos.en_paralelo(_consultar, sql, parametros).values())
+    filas = [fila for parte in partes for fila in parte]
+    if len(partes) > 1:
+        # Un equipo que trabajó en varias minas tiene cargas en varias bases
+        filas.sort(key=_orden)
+
+    desde, hasta = fecha_desde or date.min, fecha_hasta or date.max
+    if archivo.rango_archivado(desde, hasta):
+        filas = _con_archivados(filas, desde, hasta)
+
+    if not filas:
+        vacio = np.array([], dtype=np.int64)
+        return {'id': vacio, 'maquinaria_id': vacio, 'fecha': np.array([], dtype='datetime64[D]'),
+                'horas': np.array([], dtype=float), 'litros': np.array([], dtype=float),
+                'chip_otro': np.array([], dtype=bool)}
+    ids, maquinarias, fechas, horas, litros, chip, _ = zip(*filas)
+    return {
+        'id': np.array(ids, dtype=np.int64),
+        'maquinaria_id': np.array(maquinarias, dtype=np.int64),
+        'fecha': np.array(fechas, dtype='datetime64[D]'),
+        'horas': np.array(horas, dtype=float),
+        'litros': np.array(litros, dtype=float),
+        'chip_otro': np.array(chip, dtype=bool),
+    }
+
+
+def _con_archivados(filas, fecha_desde, fecha_hasta):
+    """Agrega a las filas vivas las de los años archivados del rango, en el mismo orden de la consulta."""
+    vivos = {fila[0] for fila in filas}
+    columnas = ['id', 'maquinaria_id', 'fecha', 'horas_trabajadas', 'combustible_cargado',
+                'origen_combustible', 'horometro_inicial']
+    archivadas = [
+        (id_, maquinaria_id, fecha.isoformat(), float(horas or 0), float(litros or 0),
+         origen == ORIGEN_CHIP_OTRO_EQUIPO, horometro)
+        for id_, maquinaria_id, fecha, horas, litros, origen, horometro in archivo.filas_archivadas(
+            fecha_desde, fecha_hasta, columnas, excluir_ids=vivos
+        )
+        if maquinaria_id is not None
+    ]
+    return sorted(filas + archivadas, key=_orden)
+
+
+def _inicio_de_grupo(np, grupos):
+    """Para cada posición, el índice donde empieza su grupo (arreglo ordenado por grupo)."""
+    inicio = np.r_[True, grupos[1:] != grupos[:-1]] if len(grupos) else np.array([], dtype=bool)
+    return np.maximum.accumulate(np.where(inicio, np.arange(len(grupos)), 0))
+
+
+def calcular_consumos(historial):
+    """
+    Devuelve un dict de arreglos con una entrada por carga que tiene una
+    carga anterior de la misma máquina: índice en el historial, horas
+    desde la carga anterior y litros por hora.
+    """
+    np = _numpy()
+    maquinarias, horas, litros = historial['maquinaria_id'], historial['horas'], historial['litros']
+    # Horas acumuladas por máquina hasta antes de cada movimiento
+    acumuladas = np.cumsum(horas) - horas
+    cargas = np.flatnonzero(litros > 0)
+    maq_cargas = maquinarias[cargas]
+    # Cada carga se compara con la anterior de la misma máquina
+    con_anterior = np.r_[False, maq_cargas[1:] == maq_cargas[:-1]] if len(cargas) else np.array([], dtype=bool)
+    actuales = cargas[con_anterior]
+    anteriores = cargas[np.flatnonzero(con_anterior) - 1]
+    horas_intervalo = acumuladas[actuales] - acumuladas[anteriores]
+    validas = horas_intervalo > 0
+    actuales, horas_intervalo = actuales[validas], horas_intervalo[validas]
+    return {
+        'indice': actuales,
+        'horas': horas_intervalo,
+        'litros_hora': litros[actuales] / horas_intervalo,
+    }
+
+
+def lineas_base(maquinarias, valores, ventana=VENTANA):
+    """
+    Media, desviación estándar y cantidad de los `ventana` valores
+    anteriores del mismo grupo, para cada posición (sin incluirla).
+    """
+    np = _numpy()
+    n = len(valores)
+    posiciones = np.arange(n)
+    inicio = np.maximum(_inicio_de_grupo(np, maquinarias), posiciones - ventana)
+    suma = np.r_[0.0, np.cumsum(valores)]
+    suma_cuadrados = np.r_[0.0, np.cumsum(valores * valores)]
+    cantidad = posiciones - inicio
+    with np.errstate(invalid='ignore', divide='ignore'):
+        media = (suma[posiciones] - suma[inicio]) / cantidad
+        varianza = (suma_cuadrados[posiciones] - suma_cuadrados[inicio]) / cantidad - media * media
+    return media, np.sqrt(np.clip(varianza, 0, None)), cantidad
+
+
+def analizar(fecha_desde=None, fecha_hasta=None):
+    """Calcula el reporte completo y lo devuelve como dict serializable a JSON."""
+    np = _numpy()
+    historial = cargar_historial(fecha_desde, fecha_hasta)
+    maquinas = {m['id']: m for m in Maquinaria.objects.values('id', 'codigo_eq', 'tipo')}
+
+    consumos = calcular_consumos(historial)
+    indice = consumos['indice']
+    maq_carga = historial['maquinaria_id'][indice]
+    litros_hora = consumos['litros_hora']
+    media, desviacion, cantidad = lineas_base(maq_carga, litros_hora)
+
+    # Mediana por tipo de equipo: un cálculo por tipo, no por fila
+    maq_unicas, maq_carga_pos = np.unique(maq_carga, return_inverse=True)
+    tipo_de = {m: maquinas.get(m, {}).get('tipo') or '' for m in maq_unicas.tolist()}
+    tipos = sorted(set(tipo_de.values()))
+    tipo_fila = np.array([tipos.index(tipo_de[m]) for m in maq_unicas.tolist()], dtype=np.int64)[maq_carga_pos]
+    mediana_tipo = np.array([np.median(litros_hora[tipo_fila == codigo]) for codigo in range(len(tipos))])
+    base_tipo = mediana_tipo[tipo_fila] if len(tipos) else np.zeros(0)
+
+    sobre_maquina = (
+        (cantidad >= MINIMO_HISTORIAL)
+        & (litros_hora > media + DESVIACIONES * desviacion)
+        & (litros_hora > media * FACTOR_SOBRE_BASE)
+    )
+    sobre_tipo = litros_hora > base_tipo * FACTOR_SOBRE_TIPO
+
+    # --- Resumen por máquina (sumas por grupo con bincount) ---
+    maq_ids, maq_pos = np.unique(historial['maquinaria_id'], return_inverse=True)
+    horas_maquina = np.bincount(maq_pos, weights=historial['horas'], minlength=len(maq_ids))
+    litros_maquina = np.bincount(maq_pos, weights=historial['litros'], minlength=len(maq_ids))
+    cargas_maquina = np.bincount(maq_pos, weights=historial['litros'] > 0, minlength=len(maq_ids))
+    # La línea base vigente de cada máquina: sus últimas VENTANA cargas
+    ultima_base = {}
+    if len(maq_carga):
+        inicios = _inicio_de_grupo(np, maq_carga)
+        for posicion in np.flatnonzero(np.r_[maq_carga[1:] != maq_carga[:-1], True]):
+            ventana = litros_hora[max(inicios[posicion], posicion + 1 - VENTANA):posicion + 1]
+            ultima_base[int(maq_carga[posicion])] = (float(ventana.mean()), float(ventana.std()))
+
+    por_maquina = []
+    for pos, maq_id in enumerate(maq_ids.tolist()):
+        maquina = maquinas.get(maq_id, {})
+        base = ultima_base.get(maq_id)
+        por_maquina.append({
+            'maquinaria_id': maq_id,
+            'codigo_eq': maquina.get('codigo_eq'),
+            'tipo': maquina.get('tipo'),
+            'horas': round(float(horas_maquina[pos]), 2),
+            'litros': round(float(litros_maquina[pos]), 2),
+            'cargas': int(cargas_maquina[pos]),
+            'litros_hora': round(float(litros_maquina[pos] / horas_maquina[pos]), 2) if horas_maquina[pos] else None,
+            'base_litros_hora': round(base[0], 2) if base else None,
+            'base_desviacion': round(base[1], 2) if base else None,
+        })
+
+    por_tipo = []
+    for codigo, tipo in enumerate(tipos):
+        en_tipo = tipo_fila == codigo
+        por_tipo.append({
+            'tipo': tipo,
+            'cargas': int(en_tipo.sum()),
+            'mediana_litros_hora': round(float(mediana_tipo[codigo]), 2),
+            'p90_litros_hora': round(float(np.percentile(litros_hora[en_tipo], 90)), 2),
+        })
+
+    # --- Anomalías ---
+    anomalias = []
+    marcadas = np.flatnonzero(sobre_maquina | sobre_tipo)
+    # Se guardan las más recientes primero
+    marcadas = marcadas[np.argsort(historial['fecha'][indice[marcadas]], kind='stable')[::-1]][:MAXIMO_ANOMALIAS]
+    for posicion in marcadas:
+        fila = indice[posicion]
+        motivos = []
+        if sobre_maquina[posicion]:
+            motivos.append('posible_fuga')
+        if sobre_tipo[posicion]:
+            motivos.append('sobre_consumo_tipo')
+        maquina = maquinas.get(int(maq_carga[posicion]), {})
+        anomalias.append({
+            'movimiento_id': int(historial['id'][fila]),
+            'fecha': str(historial['fecha'][fila]),
+            'codigo_eq': maquina.get('codigo_eq'),
+            'tipo': maquina.get('tipo'),
+            'litros': round(float(historial['litros'][fila]), 2),
+            'horas_desde_carga_anterior': round(float(consumos['horas'][posicion]), 2),
+            'litros_hora': round(float(litros_hora[posicion]), 2),
+            'base_maquina': round(float(media[posicion]), 2) if cantidad[posicion] else None,
+            'base_tipo': round(float(base_tipo[posicion]), 2),
+            'motivos': motivos,
+        })
+
+    ids_chip = historial['id'][historial['chip_otro'] & (historial['litros'] > 0)]
+    cargas_chip = [
+        {
+            'movimiento_id': m['id'],
+            'fecha': m['fecha'].isoformat(),
+            'codigo_eq': m['maquinaria__codigo_eq'],
+            'litros': float(m['combustible_cargado']),
+            'detalle_chip_otro_equipo': m['detalle_chip_otro_equipo'],
+            'motivos': ['chip_otro_equipo'],
+        }
+        for m in Movimiento.objects.filter(id__in=ids_chip[:MAXIMO_ANOMALIAS].tolist()).values(
+            'id', 'fecha', 'maquinaria__codigo_eq', 'combustible_cargado', 'detalle_chip_otro_equipo'
+        ).order_by('-fecha')
+    ]
+
+    return {
+        'por_maquina': por_maquina,
+        'por_tipo': por_tipo,
+        'anomalias': anomalias,
+        'cargas_chip_otro_equipo': cargas_chip,
+        'total_anomalias': int(np.count_nonzero(sobre_maquina | sobre_tipo)),
+        'total_cargas_chip_otro_equipo': int(len(ids_chip)),
+        'movimientos': int(len(historial['id'])),
+    }
+
+
+def actualizar_reporte(fecha_desde=None, fecha_hasta=None):
+    """Recalcula el análisis y guarda un nuevo ReporteCombustible."""
+    inicio = time.perf_counter()
+    datos = analizar(fecha_desde, fecha_hasta)
+    return ReporteCombustible.objects.create(
+        fecha_desde=fecha_desde, fecha_hasta=fecha_hasta,
+        movimientos_analizados=datos['movimientos'],
+        segundos=round(time.perf_counter() - inicio, 3),
+        datos=datos,
+    )
@@ -0,0 +1,192 @@
+# empresa/cubo.py
+
+"""
+Cubo de movimiento de material: viajes por día, turno, material, origen,
+destino, actividad y equipo, guardados ya sumados en CuboViajes.
+
+La unidad de mantenimiento es el turno (fecha, turno): cuando cambian
+viajes, posturas o el equipo de un movimiento, se vuelven a sumar solo
+los turnos afectados, en una consulta agrupada (ver signals.py; la grilla
+de viajes lo hace directamente porque usa operaciones en bloque). Igual
+que la utilización, el cubo conserva los turnos archivados y los
+recálculos combinan ambas capas (ver archivo.py).
+
+`consultar` corta y pivotea el cubo: un reporte de un año es una
+agrupación sobre unas pocas miles de filas en vez de un recorrido de
+Viaje, Postura, InformeDiario y Movimiento.
+"""
+
+from collections import defaultdict
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from . import archivo, fragmentos
+from .models import CuboViajes, InformeDiario, Postura, Viaje
+
+# Campos de Viaje que forman cada dimensión guardada, en el orden de CAMPOS_CUBO
+CAMPOS_VIAJE = [
+    'postura__informe__fecha', 'postura__informe__turno', 'postura__material',
+    'postura__origen', 'postura__destino', 'postura__tipo_actividad', 'movimiento__maquinaria_id',
+]
+CAMPOS_CUBO = ['fecha', 'turno', 'material', 'origen', 'destino', 'tipo_actividad', 'maquinaria_id']
+
+# Dimensiones para cortar y pivotear: nombre -> (expresión sobre CuboViajes, etiqueta)
+DIMENSIONES = {
+    'dia': (F('fecha'), 'Día'),
+    'mes': (F('mes'), 'Mes'),
+    'turno': (F('turno'), 'Turno'),
+    'material': (F('material'), 'Material'),
+    'origen': (F('origen'), 'Origen'),
+    'destino': (F('destino'), 'Destino'),
+    'tipo_actividad': (F('tipo_actividad'), 'Actividad'),
+    'maquinaria': (F('maquinaria__codigo_eq'), 'Equipo'),
+    'tipo_equipo': (F('maquinaria__tipo'), 'Tipo de equipo'),
+}
+# Dimensiones que se pueden usar como filtro exacto
+FILTROS = {
+    'turno': 'turno', 'material': 'material', 'origen': 'origen', 'destino': 'destino',
+    'tipo_actividad': 'tipo_actividad', 'maquinaria': 'maquinaria__codigo_eq', 'tipo_equipo': 'maquinaria__tipo',
+}
+
+
+# --- MANTENIMIENTO ---
+
+def _archivados(viajes_vivos, claves, fecha_desde, fecha_hasta):
+    """Totales {clave del cubo: [viajes, registros]} de los viajes archivados del rango."""
+    totales = defaultdict(lambda: [0, 0])
+    anios = [anio for anio in archivo.anios_archivados() if fecha_desde.year <= anio <= fecha_hasta.year]
+    if not anios:
+        return totales
+    excluir = set(viajes_vivos.filter(movimiento__fecha__year__in=anios).values_list('id', flat=True))
+    archivados = archivo.viajes_archivados(fecha_desde, fecha_hasta, excluir_ids=excluir)
+    posturas = {
+        fila[0]: fila[1:]
+        for fila in Postura.objects.filter(id__in={postura_id for _, postura_id, _, _ in archivados}).values_list(
+            'id', 'informe__fecha', 'informe__turno', 'material', 'origen', 'destino', 'tipo_actividad'
+        )
+    }
+    for _, postura_id, maquinaria_id, cantidad in archivados:
+        postura = posturas.get(postura_id)
+        if postura is None or not cantidad or (claves is not None and postura[:2] not in claves):
+            continue
+        total = totales[postura + (maquinaria_id,)]
+        total[0] += cantidad
+        total[1] += 1
+    return totales
+
+
+def _filas_cubo(viajes, claves, fecha_desde, fecha_hasta):
+    """Suma los viajes (y los archivados del rango) en filas de CuboViajes sin guardar."""
+    totales = _archivados(viajes, claves, fecha_desde, fecha_hasta)
+    for fila in viajes.filter(cantidad__gt=0).values(*CAMPOS_VIAJE).annotate(
+        total=Sum('cantidad'), registros=Count('id')
+    ).order_by():
+        clave = tuple(fila[campo] for campo in CAMPOS_VIAJE)
+        if claves is not None and clave[:2] not in claves:
+            continue
+        total = totales[clave]
+        total[0] += fila['total']
+        total[1] += fila['registros']
+    return [
+        CuboViajes(**dict(zip(CAMPOS_CUBO, clave)), mes=clave[0].replace(day=1), viajes=viajes_turno, registros=registros)
+        for clave, (viajes_turno, registros) in totales.items()
+    ]
+
+
+def actualizar_turnos(claves, fechas_por_consulta=500):
+    """Vuelve a sumar los turnos (fecha, turno) indicados."""
+    claves = {(fecha, turno) for fecha, turno in claves if fecha is not None and turno}
+    if not claves:
+        return
+    turnos = {turno for _, turno in claves}
+    fechas = sorted({fecha for fecha, _ in claves})
+    with transaction.atomic(using=fragmentos.actual()):
+        for i in range(0, len(fechas), fechas_por_consulta):
+            tramo = fechas[i:i + fechas_por_consulta]
+            existentes = CuboViajes.objects.filter(fecha__in=tramo, turno__in=turnos)
+            ids = [id_ for id_, fecha, turno in existentes.values_list('id', 'fecha', 'turno') if (fecha, turno) in claves]
+            if ids:
+                CuboViajes.objects.filter(id__in=ids).delete()
+            viajes = Viaje.objects.filter(postura__informe__fecha__in=tramo, postura__informe__turno__in=turnos)
+            CuboViajes.objects.bulk_create(_filas_cubo(viajes, claves, tramo[0], tramo[-1]))
+
+
+def actualizar_informes(informe_ids):
+    actualizar_turnos(InformeDiario.objects.filter(id__in=informe_ids).values_list('fecha', 'turno'))
+
+
+def actualizar_posturas(postura_ids):
+    actualizar_turnos(Postura.objects.filter(id__in=postura_ids).values_list('informe__fecha', 'informe__turno'))
+
+
+def actualizar_movimientos(movimiento_ids):
+    actualizar_turnos(
+        Viaje.objects.filter(movimiento_id__in=movimiento_ids)
+        .values_list('postura__informe__fecha', 'postura__informe__turno').distinct().order_by()
+    )
+
+
+def reconstruir():
+    """Vuelve a calcular todo el cubo. Devuelve la cantidad de filas."""
+    with transaction.atomic(using=fragmentos.actual()):
+        CuboViajes.objects.all().delete()
+        filas = _filas_cubo(Viaje.objects.all(), None, date.min, date.max)
+        CuboViajes.objects.bulk_create(filas, batch_size=5000)
+    return len(filas)
+
+
+# --- CONSULTA ---
+
+def _valor(valor):
+    return valor.isoformat() if isinstance(valor, date) else valor
+
+
+def consultar(fecha_desde, fecha_hasta, filas=('material',), columna=None, filtros=None):
+    """
+    Suma de viajes del rango agrupada por las dimensiones de `filas` y,
+    si se indica, pivoteada por la dimensión `columna`. `filtros` es un
+    dict {dimensión: valor} de FILTROS. Lanza ValueError si una dimensión
+    no existe.
+    """
+    filas = list(filas)
+    for dimension in filas + ([columna] if columna else []):
+        if dimension not in DIMENSIONES:
+            raise ValueError(f"Dimensión desconocida: {dimension}")
+    consulta = CuboViajes.objects.filter(fecha__range=(fecha_desde, fecha_hasta))
+    for dimension, valor in (filtros or {}).items():
+        if dimension not in FILTROS:
+            raise ValueError(f"No se puede filtrar por: {dimension}")
+        consulta = consulta.filter(**{FILTROS[dimension]: valor})
+
+    agrupadas = filas + ([columna] if columna else [])
+    alias = {dimension: f'dim_{dimension}' for dimension in agrupadas}
+    resultado = consulta.annotate(**{alias[d]: DIMENSIONES[d][0] for d in agrupadas}).values(
+        *alias.values()
+    ).annotate(total=Sum('viajes')).order_by(*alias.values())
+
+    # En modo fragmentado cada mina tiene su cubo: se suman los parciales de todas las bases
+    por_fila, columnas, total_columnas = {}, [], defaultdict(int)
+    # (cada base evalúa su propia copia del queryset: la caché de resultados no se comparte entre hilos)
+    for parcial in fragmentos.en_paralelo(lambda: list(resultado.all())).values():
+        for item in parcial:
+            clave = tuple(_valor(item[alias[d]]) for d in filas)
+            fila = por_fila.setdefault(clave, {'clave': list(clave), 'valores': {}, 'total': 0})
+            fila['total'] += item['total']
+            if columna:
+                valor_columna = _valor(item[alias[columna]])
+                if valor_columna not in total_columnas:
+                    columnas.append(valor_columna)
+                fila['valores'][valor_columna] = fila['valores'].get(valor_columna, 0) + item['total']
+                total_columnas[valor_columna] += item['total']
+
+    datos = sorted(por_fila.values(), key=lambda fila: -fila['total'])
+    return {
+        'filas': [{'dimension': d, 'etiqueta': DIMENSIONES[d][1]} for d in filas],
+        'columna': {'dimension': columna, 'etiqueta': DIMENSIONES[columna][1]} if columna else None,
+        'columnas': sorted(columnas, key=lambda v: (v is None, v)),
+        'datos': datos,
+        'total_columnas': dict(total_columnas),
+        'total': sum(fila['total'] for fila in datos),
+    }
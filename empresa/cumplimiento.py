@@ -0,0 +1,78 @@
+# empresa/cumplimiento.py
+
+"""
+Vencimientos de licencias de conducir y de contratos a plazo fijo.
+"""
+
+from datetime import date, timedelta
+
+from django.db.models import Q
+
+from .models import Empleado
+
+
+def vencimientos_proximos(dias=30, hoy=None):
+    """
+    Empleados cuya licencia o contrato a plazo fijo vence dentro de `dias`
+    días (incluye los ya vencidos). Usa los índices de ambas fechas y trae
+    las licencias de todos los empleados en una sola consulta adicional.
+    """
+    hoy = hoy or date.today()
+    limite = hoy + timedelta(days=dias)
+    empleados = Empleado.objects.filter(
+        Q(fecha_vencimiento_licencia__lte=limite) |
+        Q(tipo_contrato='Plazo Fijo', fecha_termino_contrato__lte=limite)
+    ).prefetch_related('licencias').order_by('cargo', 'nombre_completo')
+
+    resultado = []
+    for empleado in empleados:
+        dias_licencia = dias_contrato = None
+        motivos = []
+        if empleado.fecha_vencimiento_licencia and empleado.fecha_vencimiento_licencia <= limite:
+            dias_licencia = (empleado.fecha_vencimiento_licencia - hoy).days
+            motivos.append('Licencia vencida' if dias_licencia < 0 else 'Licencia por vencer')
+        if empleado.tipo_contrato == 'Plazo Fijo' and empleado.fecha_termino_contrato and empleado.fecha_termino_contrato <= limite:
+            dias_contrato = (empleado.fecha_termino_contrato - hoy).days
+            motivos.append('Contrato terminado' if dias_contrato < 0 else 'Contrato por terminar')
+        resultado.append({
+            'id': empleado.id,
+            'codigo_trabajador': empleado.codigo_trabajador,
+            'nombre_completo': empleado.nombre_completo,
+            'rut': empleado.rut,
+            'cargo': empleado.cargo,
+            'licencias': [licencia.nombre for licencia in empleado.licencias.all()],
+            'fecha_vencimiento_licencia': empleado.fecha_vencimiento_licencia,
+            'dias_vencimiento_licencia': dias_licencia,
+            'fecha_termino_contrato': empleado.fecha_termino_contrato,
+            'dias_termino_contrato': dias_contrato,
+            'motivos': motivos,
+            'vencido': any(d is not None and d < 0 for d in (dias_licencia, dias_contrato)),
+        })
+    return resultado
+
+
+def agrupar_por_cargo_y_licencia(vencimientos):
+    """
+    Agrupa la lista de `vencimientos_proximos` por cargo y luego por tipo de
+    licencia. Un empleado con varias licencias aparece en cada una de ellas.
+    """
+    grupos = {}
+    for item in vencimientos:
+        por_licencia = grupos.setdefault(item['cargo'], {})
+        for licencia in item['licencias'] or ['Sin licencia']:
+            por_licencia.setdefault(licencia, []).append(item)
+    return [
+        {
+            'cargo': cargo,
+            'licencias': [{'licencia': licencia, 'empleados': empleados} for licencia, empleados in sorted(por_licencia.items())],
+        }
+        for cargo, por_licencia in sorted(grupos.items())
+    ]
+
+
+def licencia_vencida(empleado, fecha):
+    """
+    Indica si la licencia del empleado está vencida en `fecha`. No hace
+    consultas: usa la fecha de vencimiento ya cargada en el objeto.
+    """
+    return bool(empleado.fecha_vencimiento_licencia and fecha and empleado.fecha_vencimiento_licencia < fecha)
@@ -0,0 +1,42 @@
+# empresa/diferido.py
+
+"""
+Acumula trabajo de mantenimiento durante una transacción y lo ejecuta una
+sola vez al confirmarla.
+
+Los signals se disparan por fila: un QuerySet.delete() de 10.000
+movimientos llama 10.000 veces a post_delete. En vez de recalcular los
+agregados en cada llamada, los receptores registran aquí las claves
+afectadas y la función recibe el conjunto completo al hacer commit.
+Fuera de un bloque atomic se ejecuta de inmediato, igual que on_commit.
+La función corre con la base de la transacción como base actual, así en
+el modo fragmentado mantiene los agregados de esa base (ver fragmentos.py).
+"""
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import fragmentos
+
+
+def al_confirmar(funcion, claves, using=DEFAULT_DB_ALIAS):
+    """Suma `claves` a las pendientes de `funcion` y la programa una vez por transacción."""
+    conexion = transaction.get_connection(using)
+    if not conexion.in_atomic_block:
+        with fragmentos.usar(using):
+            funcion(set(claves))
+        return
+
+    pendientes = conexion.__dict__.setdefault('_pendientes_al_confirmar', {})
+    registro = pendientes.get(funcion)
+    # Si la transacción anterior se revirtió, su callback ya no está en la cola
+    if registro is None or not any(callback is registro[1] for _, callback, _ in conexion.run_on_commit):
+        claves_pendientes = set()
+
+        def ejecutar():
+            pendientes.pop(funcion, None)
+            with fragmentos.usar(using):
+                funcion(claves_pendientes)
+
+        registro = pendientes[funcion] = (claves_pendientes, ejecutar)
+        transaction.on_commit(ejecutar, using=using)
+    registro[0].update(claves)
@@ -0,0 +1,205 @@
+# empresa/eventos.py
+
+"""
+Publicación y suscripción en memoria de los cambios de un turno, para el
+flujo de eventos (Server-Sent Events) de los reportes.
+
+Cada conexión abierta tiene una cola acotada en su propio event loop; los
+signals publican una vez por cambio y el canal reparte a las colas de los
+suscriptores de esa fecha (y turno). Si un cliente lento llena su cola, se
+descartan sus eventos pendientes y se le envía un único 'resincronizar'
+para que recargue la página, así nunca se acumula memoria sin límite.
+
+El canal vive en el proceso: con varios procesos de servidor, cada uno
+solo ve los cambios que se guardan a través de él.
+"""
+
+import asyncio
+import threading
+from decimal import Decimal
+
+from django.db.models import Min, Max, Sum
+
+from . import fragmentos
+from .models import Movimiento
+
+MAXIMO_COLA = 100
+
+
+class Suscripcion:
+    def __init__(self, fecha, turno, loop, maximo=MAXIMO_COLA):
+        self.fecha = fecha
+        self.turno = turno
+        self.loop = loop
+        self.cola = asyncio.Queue(maxsize=maximo)
+        self.descartados = 0
+
+    def recibe(self, fecha, turno):
+        return self.fecha == fecha and (self.turno is None or self.turno == turno)
+
+    def _entregar(self, evento):
+        # Se ejecuta dentro del event loop de la conexión
+        if self.cola.full():
+            self.descartados += self.cola.qsize()
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait({'tipo': 'resincronizar'})
+            return
+        self.cola.put_nowait(evento)
+
+
+class CanalEventos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._suscripciones = {}
+
+    def suscribir(self, fecha, turno=None, maximo=MAXIMO_COLA):
+        """Debe llamarse desde el event loop que va a consumir la cola."""
+        suscripcion = Suscripcion(fecha, turno, asyncio.get_running_loop(), maximo)
+        with self._lock:
+            self._suscripciones.setdefault(fecha, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            por_fecha = self._suscripciones.get(suscripcion.fecha)
+            if por_fecha:
+                por_fecha.discard(suscripcion)
+                if not por_fecha:
+                    del self._suscripciones[suscripcion.fecha]
+
+    def hay_suscriptores(self, fecha=None, turno=None):
+        with self._lock:
+            if fecha is None:
+                return bool(self._suscripciones)
+            return any(s.recibe(fecha, turno) for s in self._suscripciones.get(fecha, ()))
+
+    def publicar(self, fecha, turno, evento):
+        """Reparte el evento a los suscriptores; se puede llamar desde cualquier hilo."""
+        with self._lock:
+            destinatarios = [s for s in self._suscripciones.get(fecha, ()) if s.recibe(fecha, turno)]
+        for suscripcion in destinatarios:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion._entregar, evento)
+            except RuntimeError:
+                # El loop ya se cerró: la conexión terminó y se cancelará sola
+                pass
+
+
+canal = CanalEventos()
+
+
+# --- CONSTRUCCIÓN DE EVENTOS ---
+
+def _resumen_maquinaria(fecha, turno, maquinaria_id):
+    """Totales del equipo en el turno, los mismos que muestra el informe de producción."""
+    if not maquinaria_id:
+        return None
+    # En el modo fragmentado el equipo pudo trabajar el turno en más de una mina
+    partes = list(fragmentos.en_paralelo(
+        lambda: Movimiento.objects.filter(fecha=fecha, turno=turno, maquinaria_id=maquinaria_id).aggregate(
+            hora_inicio=Min('horometro_inicial'), hora_termino=Max('horometro_final'),
+            total_horas=Sum('horas_trabajadas'), total_combustible=Sum('combustible_cargado')
+        )
+    ).values())
+    valores = {clave: [parte[clave] for parte in partes if parte[clave] is not None] for clave in partes[0]}
+    resumen = {
+        'hora_inicio': min(valores['hora_inicio'], default=None),
+        'hora_termino': max(valores['hora_termino'], default=None),
+        'total_horas': sum(valores['total_horas']) if valores['total_horas'] else None,
+        'total_combustible': sum(valores['total_combustible']) if valores['total_combustible'] else None,
+    }
+    return {clave: float(valor) if isinstance(valor, Decimal) else valor for clave, valor in resumen.items()}
+
+
+def publicar_movimiento(movimiento, accion):
+    if not canal.hay_suscriptores(movimiento.fecha, movimiento.turno):
+        return
+    evento = {
+        'tipo': 'movimiento',
+        'accion': accion,
+        'id': movimiento.id,
+        'fecha': movimiento.fecha.isoformat(),
+        'turno': movimiento.turno,
+        'maquinaria_id': movimiento.maquinaria_id,
+        'resumen_maquinaria': _resumen_maquinaria(movimiento.fecha, movimiento.turno, movimiento.maquinaria_id),
+    }
+    if accion != 'eliminado':
+        evento.update({
+            'empleado': movimiento.empleado.nombre_completo if movimiento.empleado_id else None,
+            'maquinaria': movimiento.maquinaria.codigo_eq if movimiento.maquinaria_id else None,
+            'horometro_inicial': movimiento.horometro_inicial,
+            'horometro_final': movimiento.horometro_final,
+            'horas_trabajadas': float(movimiento.horas_trabajadas) if movimiento.horas_trabajadas is not None else None,
+            'nivel_inicial_combustible': movimiento.get_nivel_inicial_combustible_display(),
+            'nivel_final_combustible': movimiento.get_nivel_final_combustible_display(),
+            'combustible_cargado': float(movimiento.combustible_cargado) if movimiento.combustible_cargado is not None else None,
+            'proyecto': movimiento.proyecto,
+        })
+    canal.publicar(movimiento.fecha, movimiento.turno, evento)
+
+
+def publicar_movimiento_trasladado(movimiento, anteriores):
+    """
+    Avisa al turno y equipo donde estaba el movimiento antes de editarlo
+    (`anteriores` trae fecha, turno y maquinaria_id): para ellos es un borrado.
+    """
+    fecha, turno, maquinaria_id = anteriores['fecha'], anteriores['turno'], anteriores['maquinaria_id']
+    if not canal.hay_suscriptores(fecha, turno):
+        return
+    canal.publicar(fecha, turno, {
+        'tipo': 'movimiento',
+        'accion': 'eliminado',
+        'id': movimiento.id,
+        'fecha': fecha.isoformat(),
+        'turno': turno,
+        'maquinaria_id': maquinaria_id,
+        'resumen_maquinaria': _resumen_maquinaria(fecha, turno, maquinaria_id),
+    })
+
+
+def publicar_viaje(viaje, accion, fecha, turno):
+    """
+    `fecha` y `turno` son los del movimiento del viaje, leídos al guardar:
+    al confirmar un borrado en cascada el movimiento ya no existe.
+    """
+    if not canal.hay_suscriptores(fecha, turno):
+        return
+    canal.publicar(fecha, turno, {
+        'tipo': 'viaje',
+        'accion': accion,
+        'id': viaje.id,
+        'movimiento_id': viaje.movimiento_id,
+        'postura_id': viaje.postura_id,
+        'cantidad': 0 if accion == 'eliminado' else viaje.cantidad,
+    })
+
+
+def publicar_grilla_viajes(fecha, turno, celdas):
+    """
+    La grilla guarda en bloque, sin signals: se avisa una vez con las celdas
+    {(movimiento_id, postura_id): cantidad} que cambiaron.
+    """
+    if not canal.hay_suscriptores(fecha, turno):
+        return
+    canal.publicar(fecha, turno, {
+        'tipo': 'viajes',
+        'accion': 'grilla',
+        'celdas': [
+            {'movimiento_id': movimiento_id, 'postura_id': postura_id, 'cantidad': cantidad}
+            for (movimiento_id, postura_id), cantidad in celdas.items()
+        ],
+    })
+
+
+def publicar_produccion(produccion, accion):
+    informe = produccion.informe
+    if informe is None or not canal.hay_suscriptores(informe.fecha, informe.turno):
+        return
+    canal.publicar(informe.fecha, informe.turno, {
+        'tipo': 'produccion',
+        'accion': accion,
+        'id': produccion.id,
+        'maquinaria_id': produccion.maquinaria_id,
+        'observaciones': None if accion == 'eliminado' else produccion.observaciones,
+    })
@@ -4,15 +4,23 @@ from django import forms
 from decimal import Decimal
 from datetime import date
 from .models import Movimiento, Postura, Viaje
+from .cumplimiento import licencia_vencida
+from .jornada import verificar_turno
 
 class MovimientoCompletoForm(forms.ModelForm):
+    # Solo informativo: la base de datos calcula horas_trabajadas desde los horómetros
+    horas_trabajadas = forms.DecimalField(
+        required=False, decimal_places=2,
+        widget=forms.NumberInput(attrs={'readonly': True, 'step': '0.01'}),
+    )
+
     # Todos los campos de los dos formularios anteriores, combinados
     class Meta:
         model = Movimiento
         fields = [
             'fecha', 'empleado', 'maquinaria', 'turno', 
             'descripcion_trabajo_especial', 'horometro_inicial',
-            'horometro_final', 'horas_trabajadas',
+            'horometro_final',
             'proyecto', 'combustible_cargado', 'origen_combustible', 
             'detalle_chip_otro_equipo', 'nivel_inicial_combustible', 
             'nivel_final_combustible', 'observaciones'
@@ -22,7 +30,6 @@ class MovimientoCompletoForm(forms.ModelForm):
             'descripcion_trabajo_especial': forms.Textarea(attrs={'rows': 2}),
             'empleado': forms.HiddenInput(),
             'horometro_final': forms.NumberInput(attrs={'min': 0}),
-            'horas_trabajadas': forms.NumberInput(attrs={'readonly': True, 'step': '0.01'}),
             'observaciones': forms.Textarea(attrs={'rows': 3}),
         }
 
@@ -30,7 +37,6 @@ class MovimientoCompletoForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         # Combinación de la lógica de __init__ de ambos formularios
         self.fields['horometro_final'].required = False
-        self.fields['horas_trabajadas'].required = False
         self.fields['nivel_inicial_combustible'].disabled = True
         self.fields['nivel_inicial_combustible'].required = False
         self.fields['nivel_final_combustible'].required = True
@@ -62,6 +68,19 @@ class MovimientoCompletoForm(forms.ModelForm):
             self.add_error('origen_combustible', 'Si ingresó combustible, debe especificar el origen.')
         if origen == 'Estación Copec con Chip de otro Equipo' and not detalle_chip:
             self.add_error('detalle_chip_otro_equipo', 'Debe especificar de qué equipo usó el chip.')
+
+        # Validación de licencia: el empleado ya viene cargado por el campo, no requiere otra consulta
+        empleado = cleaned_data.get('empleado')
+        fecha = cleaned_data.get('fecha')
+        if empleado and licencia_vencida(empleado, fecha):
+            self.add_error(None, f"La licencia de {empleado.nombre_completo} venció el {empleado.fecha_vencimiento_licencia.strftime('%d-%m-%Y')}; no puede operar equipos.")
+
+        # Control de jornada: horas en 7 días y descanso entre turnos
+        turno = cleaned_data.get('turno')
+        if empleado and fecha and turno:
+            control = verificar_turno(empleado.id, fecha, turno, cleaned_data.get('horas_trabajadas'))
+            for problema in control['problemas']:
+                self.add_error(None, f"Jornada de {empleado.nombre_completo}: {problema}")
             
         return cleaned_data
 
@@ -0,0 +1,349 @@
+# empresa/fragmentos.py
+
+"""
+Modo fragmentado (opcional): los movimientos de cada mina en su propia
+base SQLite.
+
+Con una sola base, SQLite admite un escritor a la vez y un reporte largo
+retiene el bloqueo de lectura mientras corre: un reporte pesado de Mina
+Juana hace esperar las escrituras de Mina El Way. Con FRAGMENTOS_PROYECTO
+(proyecto -> alias de DATABASES) cada mina escribe y lee en su archivo:
+
+    DATABASES['mina_el_way'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'mina_el_way.sqlite3'}
+    FRAGMENTOS_PROYECTO = {'Mina El Way': 'mina_el_way', 'Mina Juana': 'mina_juana'}
+    DATABASE_ROUTERS = ['empresa.fragmentos.RouterFragmentos']
+
+y después `migrate --database=<alias>` por cada fragmento y el comando
+`fragmentar` (bloques de ids, copia de los maestros y, con --mover, los
+movimientos que ya estaban en la base principal). Los proyectos sin
+fragmento siguen en la base principal ('default').
+
+- Movimiento, Viaje y sus agregados (utilización, jornada, cubo) viven en
+  la base de la mina del movimiento. Un movimiento va a la base de su
+  proyecto; si se le cambia el proyecto, se traslada con sus viajes. Los
+  viajes se crean desde su movimiento (`movimiento.viajes.create()` o
+  `Viaje(movimiento=...).save()`): `Viaje.objects.create()` no le dice al
+  router de qué movimiento es.
+- Los datos maestros (empleados, licencias, equipos, supervisores) y los
+  informes y posturas se escriben en la base principal y se copian a cada
+  fragmento al confirmar (ver signals.py), con los mismos ids. Lo que se
+  carga sin signals (update(), bulk_create) se vuelve a copiar con
+  `fragmentar --maestros`.
+- Cada fragmento numera sus movimientos y viajes desde un bloque de ids
+  propio, así un id no se repite entre bases.
+- El mantenimiento de los agregados corre con la base de la transacción
+  que lo originó como base actual (`usar`, ver diferido.py).
+- Los reportes entre minas (informe de producción, utilización, ranking de
+  productividad, cubo de viajes, reporte diario, analítica de combustible,
+  búsqueda de texto) consultan todas las bases a la vez con `en_paralelo`
+  y suman los parciales. El control de jornada y su panel también: suman
+  las horas de cada trabajador por día entre las bases antes de calcular
+  las ventanas de 7 días y el descanso, porque un trabajador puede tener
+  turnos en dos minas.
+- `Movimiento.objects.create()` inserta directo en la base del proyecto.
+  Un `save(using=...)` a otra base se traslada después a la suya en dos
+  pasos sin transacción común: un corte entre ambos deja la fila en esa
+  base hasta el próximo `fragmentar --mover`.
+
+Las vistas de captura y listados que no son reportes entre minas siguen
+leyendo la base actual (la principal, salvo dentro de `usar`). La grilla
+de viajes lee todas las bases y guarda cada celda en la de su movimiento.
+La importación masiva carga en la base principal: después se reparten los
+movimientos con `fragmentar --mover`. El archivo histórico y la auditoría
+de horómetros solo ven la base principal; conviene usarlos sin fragmentos
+o archivar antes de fragmentar. El registro de cambios tampoco ve los
+fragmentos: con FRAGMENTOS_PROYECTO su feed, `consumir_cambios` y la
+replicación a la central se niegan a correr (ver checks.py).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+from .models import (
+    CuboViajes, Empleado, InformeDiario, JornadaDiaria, Maquinaria, Movimiento, Postura, Supervisor, TipoLicencia,
+    UtilizacionDiaria, Viaje,
+)
+
+# Modelos cuyas filas viven en la base de su mina
+FRAGMENTADOS = {Movimiento, Viaje, UtilizacionDiaria, JornadaDiaria, CuboViajes}
+
+# Modelos que se escriben en la base principal y se copian a cada fragmento, padres primero
+REPLICADOS = [TipoLicencia, Empleado, Empleado.licencias.through, Maquinaria, Supervisor, InformeDiario, Postura]
+
+# Ids por base: el fragmento n numera desde n * BLOQUE_IDS
+BLOQUE_IDS = 10 ** 12
+
+_base_actual = ContextVar('base_actual', default=None)
+
+
+def mapa():
+    return getattr(settings, 'FRAGMENTOS_PROYECTO', {})
+
+
+def activo():
+    return bool(mapa())
+
+
+def alias_de(proyecto):
+    """Base donde viven los movimientos de `proyecto`."""
+    return mapa().get(proyecto, DEFAULT_DB_ALIAS)
+
+
+def fragmentos():
+    """Alias de los fragmentos, sin la base principal."""
+    return sorted(set(mapa().values()) - {DEFAULT_DB_ALIAS})
+
+
+def bases():
+    """Todas las bases con movimientos: la principal y los fragmentos."""
+    return [DEFAULT_DB_ALIAS] + fragmentos()
+
+
+@contextmanager
+def usar(alias):
+    """Dentro del bloque, los modelos fragmentados y replicados se leen (y los fragmentados se escriben) en `alias`."""
+    token = _base_actual.set(alias)
+    try:
+        yield
+    finally:
+        _base_actual.reset(token)
+
+
+def actual():
+    return _base_actual.get() or DEFAULT_DB_ALIAS
+
+
+def fijada():
+    """La base fijada con `usar`, o None fuera de un bloque `usar`."""
+    return _base_actual.get()
+
+
+def conexion():
+    """
+    Conexión para las consultas con SQL directo sobre los movimientos: la
+    que eligen los routers para leerlos (la base actual, o la réplica de
+    lectura dentro de un reporte; ver replica.py).
+    """
+    return connections[router.db_for_read(Movimiento)]
+
+
+def base_de_movimiento(movimiento_id):
+    """Base que tiene el movimiento; como los ids no se repiten entre bases, se pregunta a cada una."""
+    if not activo():
+        return DEFAULT_DB_ALIAS
+    for alias in bases():
+        if Movimiento.objects.using(alias).filter(pk=movimiento_id).exists():
+            return alias
+    return actual()
+
+
+def _base_de_viaje(viaje):
+    if Viaje.movimiento.is_cached(viaje):
+        return alias_de(viaje.movimiento.proyecto)
+    if _base_actual.get():
+        return _base_actual.get()
+    if viaje._state.db:
+        return viaje._state.db
+    return base_de_movimiento(viaje.movimiento_id)
+
+
+class RouterFragmentos:
+    """Router de bases de datos del modo fragmentado. Sin FRAGMENTOS_PROYECTO no interviene."""
+
+    def db_for_read(self, model, **hints):
+        if not activo():
+            return None
+        instancia = hints.get('instance')
+        if instancia is not None and instancia._state.db:
+            return instancia._state.db
+        if model in FRAGMENTADOS or model in REPLICADOS:
+            return _base_actual.get()
+        return None
+
+    def db_for_write(self, model, **hints):
+        if not activo():
+            return None
+        if model not in FRAGMENTADOS:
+            # Los replicados se escriben en la principal; la copia a los fragmentos usa using() explícito
+            return DEFAULT_DB_ALIAS if model in REPLICADOS else None
+        instancia = hints.get('instance')
+        if isinstance(instancia, Movimiento):
+            return alias_de(instancia.proyecto)
+        if isinstance(instancia, Viaje):
+            return _base_de_viaje(instancia)
+        if instancia is not None and instancia._state.db:
+            return instancia._state.db
+        return _base_actual.get()
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Los replicados tienen los mismos ids en todas las bases
+        modelos = FRAGMENTADOS | set(REPLICADOS)
+        if activo() and type(obj1) in modelos and type(obj2) in modelos:
+            return True
+        return None
+
+
+def trasladar(movimiento_id, origen, destino):
+    """
+    Completa el traslado de un movimiento que cambió de proyecto y ya se
+    guardó en `destino`: copia allí sus viajes y lo borra de `origen` junto
+    con los suyos (los signals de ese borrado actualizan los agregados de
+    origen). Devuelve las posturas de los viajes copiados.
+    """
+    viajes = list(Viaje.objects.using(origen).filter(movimiento_id=movimiento_id))
+    Viaje.objects.using(destino).bulk_create(viajes)
+    Movimiento.objects.using(origen).filter(pk=movimiento_id).delete()
+    return {viaje.postura_id for viaje in viajes}
+
+
+# --- FAN-OUT DE REPORTES ---
+
+_hilos = None
+
+
+def en_paralelo(funcion, *args, **kwargs):
+    """
+    Ejecuta `funcion` en cada base a la vez y devuelve {alias: resultado}:
+    la principal en este hilo y cada fragmento en un hilo de un grupo fijo.
+    Sin fragmentos se ejecuta una sola vez en la base principal, sin hilos.
+    """
+    global _hilos
+    if not activo():
+        return {DEFAULT_DB_ALIAS: funcion(*args, **kwargs)}
+    if _hilos is None:
+        # Los hilos se reutilizan y con ellos sus conexiones (las de Django son
+        # por hilo): abrir una conexión por base en cada reporte costaba más
+        # que las consultas cortas
+        _hilos = ThreadPoolExecutor(thread_name_prefix='fragmentos')
+
+    def ejecutar(alias):
+        with usar(alias):
+            return funcion(*args, **kwargs)
+
+    futuros = {alias: _hilos.submit(ejecutar, alias) for alias in fragmentos()}
+    resultados = {DEFAULT_DB_ALIAS: ejecutar(DEFAULT_DB_ALIAS)}
+    resultados.update((alias, futuro.result()) for alias, futuro in futuros.items())
+    return resultados
+
+
+# --- PREPARACIÓN DE LOS FRAGMENTOS ---
+
+def bloque(alias):
+    """Bloque de ids de `alias`: 0 para la principal; en un fragmento, el código de su primer proyecto más uno."""
+    if alias == DEFAULT_DB_ALIAS:
+        return 0
+    # Los códigos de CampoCodificado no cambian, así el bloque tampoco
+    codigos = Movimiento._meta.get_field('proyecto').codigos
+    return min(codigos[proyecto] for proyecto, destino in mapa().items() if destino == alias) + 1
+
+
+def reservar_ids(alias):
+    """Hace que los movimientos y viajes nuevos de `alias` se numeren desde su bloque."""
+    inicio = bloque(alias) * BLOQUE_IDS
+    with connections[alias].cursor() as cursor:
+        for modelo in (Movimiento, Viaje):
+            tabla = modelo._meta.db_table
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [tabla])
+            fila = cursor.fetchone()
+            if fila is None:
+                cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [tabla, inicio])
+            elif fila[0] < inicio:
+                cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [inicio, tabla])
+
+
+def _copiar(modelo, ids, destinos):
+    """Copia de la principal a `destinos` las filas `ids` de `modelo` (todas si ids es None) y borra las que ya no están."""
+    origen = modelo.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+    filas = list(origen if ids is None else origen.filter(pk__in=ids))
+    presentes = {fila.pk for fila in filas}
+    campos = [campo.name for campo in modelo._meta.concrete_fields if not campo.primary_key]
+    for alias in destinos:
+        with transaction.atomic(using=alias):
+            copia = modelo.objects.using(alias)
+            sobrantes = set(copia.values_list('pk', flat=True) if ids is None else ids) - presentes
+            if sobrantes:
+                copia.filter(pk__in=sobrantes).delete()
+            if filas:
+                copia.bulk_create(filas, update_conflicts=True, unique_fields=['pk'], update_fields=campos, batch_size=2000)
+    return filas
+
+
+def replicar(claves, destinos=None):
+    """
+    Copia a los fragmentos los registros replicados indicados como
+    (etiqueta del modelo, pk), borrando en ellos los que ya no existen.
+    Lo llaman los signals al confirmar.
+    """
+    destinos = fragmentos() if destinos is None else destinos
+    por_modelo = {}
+    for etiqueta, pk in claves:
+        por_modelo.setdefault(etiqueta, set()).add(pk)
+    licencias = Empleado.licencias.through
+    for modelo in REPLICADOS:
+        ids = por_modelo.get(modelo._meta.label)
+        if modelo is licencias:
+            # Las licencias se copian por empleado: la tabla intermedia no tiene signals por fila
+            empleados = por_modelo.get(Empleado._meta.label)
+            if empleados:
+                ids = set(licencias.objects.using(DEFAULT_DB_ALIAS).filter(empleado_id__in=empleados).values_list('pk', flat=True))
+                for alias in destinos:
+                    licencias.objects.using(alias).filter(empleado_id__in=empleados).exclude(pk__in=ids).delete()
+        if ids:
+            filas = _copiar(modelo, ids, destinos)
+            if modelo is Postura:
+                # La copia no dispara signals: el cubo de cada fragmento se suma aquí
+                from . import cubo
+                for alias in destinos:
+                    with usar(alias):
+                        cubo.actualizar_informes({postura.informe_id for postura in filas})
+
+
+def copiar_maestros(destinos=None):
+    """Copia completa de los registros replicados a los fragmentos."""
+    destinos = fragmentos() if destinos is None else destinos
+    for modelo in REPLICADOS:
+        _copiar(modelo, None, destinos)
+
+
+def mover(alias, lote=2000):
+    """
+    Traslada de la base principal a `alias` los movimientos (con sus viajes)
+    de los proyectos de ese fragmento, con los mismos ids, y recalcula los
+    agregados en ambas bases. Cada lote se copia antes de borrarse: un corte
+    a mitad deja filas repetidas, nunca perdidas, y se retoma con otra
+    ejecución. Devuelve (movimientos, viajes) trasladados.
+    """
+    from . import archivo, cambios, cubo, jornada, productividad, utilizacion
+    proyectos = [proyecto for proyecto, destino in mapa().items() if destino == alias]
+    ids = list(
+        Movimiento.objects.using(DEFAULT_DB_ALIAS).filter(proyecto__in=proyectos).order_by('id').values_list('id', flat=True)
+    )
+    dias, jornadas, turnos = set(), set(), set()
+    total_viajes = 0
+    for i in range(0, len(ids), lote):
+        tramo = ids[i:i + lote]
+        movimientos = list(Movimiento.objects.using(DEFAULT_DB_ALIAS).filter(id__in=tramo))
+        viajes = list(Viaje.objects.using(DEFAULT_DB_ALIAS).filter(movimiento_id__in=tramo))
+        with transaction.atomic(using=alias):
+            # ignore_conflicts: lo que quedó copiado de una ejecución interrumpida no se duplica
+            Movimiento.objects.using(alias).bulk_create(movimientos, ignore_conflicts=True)
+            Viaje.objects.using(alias).bulk_create(viajes, ignore_conflicts=True)
+        # Las filas siguen existiendo en el fragmento: igual que al archivar, el borrado no es una baja
+        with transaction.atomic(), cambios.marcar_eventos('A'):
+            archivo._borrar_vivos(tramo)
+        dias.update((m.maquinaria_id, m.fecha) for m in movimientos)
+        jornadas.update((m.empleado_id, m.fecha) for m in movimientos)
+        turnos.update((m.fecha, m.turno) for m in movimientos)
+        total_viajes += len(viajes)
+    for base in (DEFAULT_DB_ALIAS, alias):
+        with usar(base):
+            utilizacion.actualizar_dias(dias)
+            jornada.actualizar_dias(jornadas)
+            cubo.actualizar_turnos(turnos)
+    productividad.invalidar()
+    return len(ids), total_viajes
+
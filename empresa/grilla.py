@@ -0,0 +1,121 @@
+# empresa/grilla.py
+
+"""
+Grilla de viajes de un turno para el supervisor: filas = movimientos,
+columnas = posturas, celdas = Viaje.cantidad.
+
+La carga hace cuatro consultas, sin importar el tamaño del turno, y el
+guardado compara la grilla con los viajes existentes y aplica las altas,
+cambios y bajas con una operación en bloque de cada tipo, en una sola
+transacción. Igual que en crear_movimiento, una celda vacía o en 0
+significa que no hay Viaje.
+"""
+
+from django.db import transaction
+
+from . import cubo, diferido, eventos, fragmentos, productividad
+from .models import InformeDiario, Movimiento, Postura, Viaje
+
+
+def _movimientos_y_celdas(fecha, turno):
+    movimientos = list(
+        Movimiento.objects.filter(fecha=fecha, turno=turno)
+        .select_related('empleado', 'maquinaria')
+        .order_by('maquinaria__codigo_eq', 'empleado__nombre_completo', 'id')
+    )
+    celdas = {
+        (movimiento_id, postura_id): cantidad
+        for movimiento_id, postura_id, cantidad in Viaje.objects.filter(
+            movimiento__fecha=fecha, movimiento__turno=turno
+        ).values_list('movimiento_id', 'postura_id', 'cantidad')
+    }
+    return movimientos, celdas
+
+
+def _orden_fila(movimiento):
+    # El mismo orden que la consulta, con los vacíos primero como en SQLite
+    equipo, empleado = movimiento.maquinaria, movimiento.empleado
+    return (equipo is not None, equipo.codigo_eq if equipo else '',
+            empleado is not None, empleado.nombre_completo if empleado else '', movimiento.id)
+
+
+def cargar_grilla(fecha, turno):
+    informe = InformeDiario.objects.filter(fecha=fecha, turno=turno).first()
+    posturas = list(Postura.objects.filter(informe=informe).order_by('numero_postura')) if informe else []
+    # En el modo fragmentado, los movimientos del turno están repartidos en las bases de cada mina
+    partes = list(fragmentos.en_paralelo(_movimientos_y_celdas, fecha, turno).values())
+    if len(partes) == 1:
+        movimientos, celdas = partes[0]
+    else:
+        movimientos = sorted((movimiento for parte, _ in partes for movimiento in parte), key=_orden_fila)
+        celdas = {clave: cantidad for _, parte in partes for clave, cantidad in parte.items()}
+    return {'informe': informe, 'posturas': posturas, 'movimientos': movimientos, 'celdas': celdas}
+
+
+def guardar_grilla(fecha, turno, celdas):
+    """
+    Guarda las celdas {(movimiento_id, postura_id): cantidad} de la grilla.
+    Solo se tocan las celdas recibidas; las demás quedan como estaban.
+
+    Lanza ValueError si una celda no pertenece al turno o la cantidad no es
+    un entero no negativo. Devuelve cuántos viajes se crearon, actualizaron
+    y eliminaron. En el modo fragmentado, cada base guarda las celdas de
+    sus movimientos en su propia transacción.
+    """
+    movimientos_por_base = fragmentos.en_paralelo(
+        lambda: set(Movimiento.objects.filter(fecha=fecha, turno=turno).values_list('id', flat=True))
+    )
+    ids_movimientos = set().union(*movimientos_por_base.values())
+    ids_posturas = set(
+        Postura.objects.filter(informe__fecha=fecha, informe__turno=turno).values_list('id', flat=True)
+    )
+    for (movimiento_id, postura_id), cantidad in celdas.items():
+        if movimiento_id not in ids_movimientos or postura_id not in ids_posturas:
+            raise ValueError(f"La celda ({movimiento_id}, {postura_id}) no pertenece al turno.")
+        if not isinstance(cantidad, int) or cantidad < 0:
+            raise ValueError(f"Cantidad inválida en la celda ({movimiento_id}, {postura_id}).")
+
+    resultado = {'creados': 0, 'actualizados': 0, 'eliminados': 0}
+    for alias, ids_base in movimientos_por_base.items():
+        celdas_base = {clave: cantidad for clave, cantidad in celdas.items() if clave[0] in ids_base}
+        if not celdas_base:
+            continue
+        with fragmentos.usar(alias):
+            for clave, cantidad in _guardar_celdas(fecha, turno, celdas_base, ids_base, alias).items():
+                resultado[clave] += cantidad
+    return resultado
+
+
+def _guardar_celdas(fecha, turno, celdas, ids_movimientos, alias):
+    with transaction.atomic(using=alias):
+        existentes = {
+            (viaje.movimiento_id, viaje.postura_id): viaje
+            for viaje in Viaje.objects.select_for_update().filter(movimiento_id__in=ids_movimientos)
+        }
+        nuevos, cambiados, eliminar = [], [], []
+        for clave, cantidad in celdas.items():
+            viaje = existentes.get(clave)
+            if viaje is None:
+                if cantidad > 0:
+                    nuevos.append(Viaje(movimiento_id=clave[0], postura_id=clave[1], cantidad=cantidad))
+            elif cantidad == 0:
+                eliminar.append(viaje.id)
+            elif viaje.cantidad != cantidad:
+                viaje.cantidad = cantidad
+                cambiados.append(viaje)
+
+        Viaje.objects.bulk_create(nuevos)
+        Viaje.objects.bulk_update(cambiados, ['cantidad'])
+        if eliminar:
+            Viaje.objects.filter(id__in=eliminar).delete()
+
+        resultado = {'creados': len(nuevos), 'actualizados': len(cambiados), 'eliminados': len(eliminar)}
+        # Las operaciones en bloque no disparan signals: los agregados se actualizan y
+        # el flujo en vivo se avisa una sola vez por grilla
+        if any(resultado.values()):
+            cubo.actualizar_turnos({(fecha, turno)})
+            diferido.al_confirmar(productividad.invalidar, (), using=alias)
+            cambios = {(viaje.movimiento_id, viaje.postura_id): viaje.cantidad for viaje in nuevos + cambiados}
+            cambios.update({clave: 0 for clave, viaje in existentes.items() if viaje.id in eliminar})
+            transaction.on_commit(lambda: eventos.publicar_grilla_viajes(fecha, turno, cambios), using=alias)
+    return resultado
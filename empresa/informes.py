@@ -0,0 +1,210 @@
+# empresa/informes.py
+
+"""
+Informes de producción por lotes: recopila los datos de varios turnos con
+pocas consultas agrupadas y renderiza los PDF en procesos paralelos.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Min, Max, Sum
+from django.template.loader import get_template
+
+from . import archivo, fragmentos, replica
+from .models import InformeDiario, Maquinaria, Movimiento, ProduccionEquipo, TrabajoInformePDF
+from .pdf import renderizar_pdf, combinar_pdfs
+
+TIPOS_EQUIPOS_PESADOS = ['Cargador Frontal', 'Excavadora', 'Motoniveladora']
+
+
+def preparar_equipo(equipo, datos_reporte, datos_produccion):
+    """Adjunta al equipo los datos que usan las plantillas del informe."""
+    equipo.datos_reporte = datos_reporte
+    equipo.datos_produccion = datos_produccion
+    datos_guardados = datos_produccion if datos_produccion else {}
+    if equipo.tipo == 'Camión Tolva':
+        datos_json = getattr(datos_guardados, 'datos_camion_tolva', {}) or {}
+        equipo.lista_datos_tolva = [{'id': i, 'valor': datos_json.get(f'campo_{i}', '')} for i in range(1, 11)]
+    if equipo.tipo == 'Camión Aljibe':
+        datos_json = getattr(datos_guardados, 'datos_camion_aljibe', {}) or {}
+        equipo.lista_datos_aljibe = [{'id': i, 'valor': datos_json.get(f'viaje_{i}', '')} for i in range(1, 5)]
+    return equipo
+
+
+def _sumar(a, b):
+    if a is None:
+        return b
+    return a if b is None else a + b
+
+
+def _acumular(item, inicial, final, horas, combustible):
+    item['hora_inicio'] = inicial if item['hora_inicio'] is None else min(item['hora_inicio'], inicial)
+    if final is not None:
+        item['hora_termino'] = final if item['hora_termino'] is None else max(item['hora_termino'], final)
+    item['total_horas'] = _sumar(item['total_horas'], horas)
+    item['total_combustible'] = _sumar(item['total_combustible'], combustible)
+
+
+def _agregados_vivos(fecha_desde, fecha_hasta, turnos, anios_archivados):
+    """Agregados de los movimientos de la base actual e ids de los que caen en años archivados."""
+    consulta = Movimiento.objects.filter(fecha__range=(fecha_desde, fecha_hasta), turno__in=turnos)
+    items = list(consulta.values('fecha', 'turno', 'maquinaria_id').annotate(
+        hora_inicio=Min('horometro_inicial'), hora_termino=Max('horometro_final'),
+        total_horas=Sum('horas_trabajadas'), total_combustible=Sum('combustible_cargado')
+    ))
+    vivos = set(consulta.filter(fecha__year__in=anios_archivados).values_list('id', flat=True)) if anios_archivados else set()
+    return items, vivos
+
+
+def agregados_movimientos(fecha_desde, fecha_hasta, turnos):
+    """
+    Agregados por fecha, turno y equipo ({(fecha, turno): {maquinaria_id: item}})
+    de los movimientos vivos y de los archivados del rango. En el modo
+    fragmentado se consultan todas las bases a la vez y se combinan los
+    parciales de un mismo equipo y turno.
+    """
+    anios = list(archivo.anios_archivados()) if archivo.rango_archivado(fecha_desde, fecha_hasta) else []
+    datos_agregados, vivos = {}, set()
+    for items, vivos_base in fragmentos.en_paralelo(_agregados_vivos, fecha_desde, fecha_hasta, turnos, anios).values():
+        vivos |= vivos_base
+        for item in items:
+            por_equipo = datos_agregados.setdefault((item['fecha'], item['turno']), {})
+            existente = por_equipo.get(item['maquinaria_id'])
+            if existente is None:
+                por_equipo[item['maquinaria_id']] = item
+            else:
+                _acumular(existente, item['hora_inicio'], item['hora_termino'], item['total_horas'], item['total_combustible'])
+
+    if anios:
+        columnas = ['fecha', 'turno', 'maquinaria_id', 'horometro_inicial', 'horometro_final',
+                    'horas_trabajadas', 'combustible_cargado']
+        for fecha, turno, maquinaria_id, *valores in archivo.filas_archivadas(
+            fecha_desde, fecha_hasta, columnas, turnos, excluir_ids=vivos
+        ):
+            item = datos_agregados.setdefault((fecha, turno), {}).setdefault(maquinaria_id, {
+                'fecha': fecha, 'turno': turno, 'maquinaria_id': maquinaria_id,
+                'hora_inicio': None, 'hora_termino': None, 'total_horas': None, 'total_combustible': None,
+            })
+            _acumular(item, *valores)
+    return datos_agregados
+
+
+def contextos_informes(fecha_desde, fecha_hasta, turnos):
+    """
+    Devuelve la lista ordenada de contextos (uno por fecha y turno con datos)
+    para la plantilla 'informe_produccion_pdf.html'.
+
+    Se hacen cuatro consultas en total, independiente del número de turnos:
+    informes, agregados de movimientos, producción manual y maquinarias.
+    """
+    informes = {
+        (informe.fecha, informe.turno): informe
+        for informe in InformeDiario.objects.filter(
+            fecha__range=(fecha_desde, fecha_hasta), turno__in=turnos
+        ).select_related('lider_tirreno', 'jefe_mandante')
+    }
+
+    datos_agregados = agregados_movimientos(fecha_desde, fecha_hasta, turnos)
+
+    datos_produccion = {}
+    for item in ProduccionEquipo.objects.filter(informe__in=[i.id for i in informes.values()]):
+        datos_produccion[(item.informe_id, item.maquinaria_id)] = item
+
+    ids_maquinaria = {maq_id for por_turno in datos_agregados.values() for maq_id in por_turno}
+    maquinarias = list(Maquinaria.objects.filter(id__in=ids_maquinaria).order_by('tipo', 'codigo_eq'))
+
+    orden_turnos = {valor: i for i, (valor, _) in enumerate(Movimiento.TURNOS)}
+    claves = sorted(set(informes) | set(datos_agregados), key=lambda c: (c[0], orden_turnos.get(c[1], 99)))
+
+    contextos = []
+    for fecha, turno in claves:
+        informe = informes.get((fecha, turno))
+        agregados = datos_agregados.get((fecha, turno), {})
+        equipos_pesados, camiones_tolva, camiones_aljibe = [], [], []
+        for maquina in maquinarias:
+            if maquina.id not in agregados:
+                continue
+            # Una copia por turno, porque cada informe adjunta datos distintos al equipo
+            equipo = Maquinaria(**{f.attname: getattr(maquina, f.attname) for f in Maquinaria._meta.concrete_fields})
+            produccion = datos_produccion.get((informe.id, maquina.id)) if informe else None
+            preparar_equipo(equipo, agregados[maquina.id], produccion)
+            if equipo.tipo in TIPOS_EQUIPOS_PESADOS:
+                equipos_pesados.append(equipo)
+            elif equipo.tipo == 'Camión Tolva':
+                camiones_tolva.append(equipo)
+            elif equipo.tipo == 'Camión Aljibe':
+                camiones_aljibe.append(equipo)
+        equipos_pesados.sort(key=lambda e: (e.tipo, e.codigo_eq))
+        contextos.append({
+            'titulo': f"Informe de Producción - {turno} {fecha.strftime('%d-%m-%Y')}",
+            # En el PDF por lotes la numeración del pie es la de cada turno; la del documento está en el índice
+            'pie': f"Turno {turno} {fecha.strftime('%d-%m-%Y')}",
+            'fecha': fecha,
+            'turno': turno,
+            'equipos_pesados': equipos_pesados,
+            'camiones_tolva': camiones_tolva,
+            'camiones_aljibe': camiones_aljibe,
+            'informe_diario': informe,
+        })
+    return contextos
+
+
+def _renderizar_indice(contextos, paginas, paginas_indice, base_url):
+    """Renderiza el índice asumiendo que ocupa `paginas_indice` páginas."""
+    entradas = []
+    pagina_actual = paginas_indice + 1
+    for contexto, num_paginas in zip(contextos, paginas):
+        entradas.append({'titulo': contexto['titulo'], 'pagina': pagina_actual, 'paginas': num_paginas})
+        pagina_actual += num_paginas
+    html = get_template('empresa/informe_lote_indice_pdf.html').render({'entradas': entradas})
+    return renderizar_pdf(html, base_url)
+
+
+def ejecutar_trabajo_pdf(trabajo_id, base_url=None):
+    """
+    Ejecuta un TrabajoInformePDF: renderiza cada turno en un proceso de trabajo,
+    actualiza el progreso a medida que terminan y guarda el PDF combinado.
+    Pensado para correr en un hilo aparte de la petición que lo crea.
+    """
+    trabajo = TrabajoInformePDF.objects.get(pk=trabajo_id)
+    try:
+        # El hilo no hereda el contexto de la petición: la lectura larga se pide aquí
+        with replica.lectura():
+            contextos = contextos_informes(trabajo.fecha_desde, trabajo.fecha_hasta, trabajo.turnos)
+        trabajo.estado = 'en_proceso'
+        trabajo.total = len(contextos)
+        trabajo.save(update_fields=['estado', 'total'])
+
+        plantilla = get_template('empresa/informe_produccion_pdf.html')
+        htmls = [plantilla.render(contexto) for contexto in contextos]
+
+        resultados = [None] * len(htmls)
+        procesos = getattr(settings, 'INFORMES_PDF_PROCESOS', None) or os.cpu_count()
+        # 'spawn' evita heredar los hilos y conexiones del servidor al hacer fork
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futuros = {executor.submit(renderizar_pdf, html, base_url): i for i, html in enumerate(htmls)}
+            for futuro in as_completed(futuros):
+                resultados[futuros[futuro]] = futuro.result()
+                TrabajoInformePDF.objects.filter(pk=trabajo_id).update(completados=sum(r is not None for r in resultados))
+
+        paginas = [num_paginas for _, num_paginas in resultados]
+        # El índice casi siempre cabe en una página; si no, se vuelve a numerar
+        indice, paginas_indice = _renderizar_indice(contextos, paginas, 1, base_url)
+        if paginas_indice != 1:
+            indice, _ = _renderizar_indice(contextos, paginas, paginas_indice, base_url)
+
+        trabajo.archivo = combinar_pdfs(indice, [(c['titulo'], pdf) for c, (pdf, _) in zip(contextos, resultados)])
+        trabajo.completados = len(contextos)
+        trabajo.estado = 'completado'
+        trabajo.save(update_fields=['archivo', 'completados', 'estado'])
+    except Exception as exc:
+        trabajo.estado = 'error'
+        trabajo.mensaje_error = str(exc)
+        trabajo.save(update_fields=['estado', 'mensaje_error'])
+    finally:
+        connections.close_all()
+
@@ -0,0 +1,363 @@
+# empresa/jornada.py
+
+"""
+Control de jornada laboral: horas semanales y descanso entre turnos.
+
+JornadaDiaria es un libro por trabajador y día con las horas trabajadas
+(suma de horas_trabajadas de sus movimientos), los turnos, la suma móvil
+de los últimos 7 días y el descanso desde el turno anterior. Se mantiene
+como la utilización: los signals acumulan los (empleado, fecha) tocados y
+se recalculan al confirmar, junto con las ventanas de los 7 días
+siguientes, que son las únicas que cambian (ver signals.py; la
+importación masiva lo hace al final de la carga).
+
+`verificar_turno` es el control previo a asignar un turno: lee a lo más
+15 filas del libro (una consulta por el índice único empleado-fecha), sin
+recorrer movimientos. Lo usan MovimientoCompletoForm y la API. En modo
+fragmentado cada mina tiene su libro: el control y el panel leen todas las
+bases, suman las horas por trabajador y día y recién entonces calculan las
+ventanas de 7 días y el descanso, así un turno en otra mina también cuenta.
+
+Los horarios de Día y Noche y los límites son configurables. El máximo
+semanal por defecto sigue la reducción gradual de la Ley 21.561 (44 horas
+desde el 26-04-2024, 42 desde 2026 y 40 desde 2028). Horas Extras y
+Trabajo Especial suman horas pero, sin horario fijo, no cuentan para el
+descanso.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+
+from . import archivo, fragmentos
+from .models import Empleado, JornadaDiaria, Movimiento
+
+COLUMNAS = ['empleado_id', 'fecha', 'turno', 'horas_trabajadas']
+
+# Turno -> (hora de inicio, duración en horas)
+HORARIOS_TURNO = {'Día': (8, 12), 'Noche': (20, 12)}
+
+# (desde, horas semanales) de la Ley 21.561; antes de la primera fecha, 45
+JORNADA_LEGAL = [(date(2024, 4, 26), 44), (date(2026, 4, 26), 42), (date(2028, 4, 26), 40)]
+
+# Más allá de este plazo el turno anterior no cuenta como "descanso previo"
+VENTANA = timedelta(days=7)
+
+
+def horarios_turno():
+    return getattr(settings, 'JORNADA_HORARIOS_TURNO', HORARIOS_TURNO)
+
+
+def horas_maximas_semanales(fecha):
+    configurado = getattr(settings, 'JORNADA_HORAS_SEMANALES', None)
+    if configurado is not None:
+        return Decimal(configurado)
+    maximo = 45
+    for desde, horas in JORNADA_LEGAL:
+        if fecha >= desde:
+            maximo = horas
+    return Decimal(maximo)
+
+
+def descanso_minimo():
+    return Decimal(getattr(settings, 'JORNADA_DESCANSO_MINIMO_HORAS', 10))
+
+
+def intervalos(fecha, turnos, horarios=None):
+    """[(inicio, fin)] de los turnos con horario, ordenados."""
+    horarios = horarios or horarios_turno()
+    resultado = []
+    for turno in turnos:
+        if turno in horarios:
+            hora, duracion = horarios[turno]
+            inicio = datetime.combine(fecha, datetime.min.time()) + timedelta(hours=hora)
+            resultado.append((inicio, inicio + timedelta(hours=duracion)))
+    return sorted(resultado)
+
+
+def _horas(delta):
+    return Decimal(delta.total_seconds() / 3600).quantize(Decimal('0.01'))
+
+
+def completar_ventanas(dias, horarios=None):
+    """
+    Recibe [(fecha, horas, turnos)] de un trabajador ordenados por fecha y
+    devuelve {fecha: (horas_7_dias, descanso_previo)}. El descanso previo
+    es el menor descanso antes de cada turno con horario del día, o None
+    si no hubo turnos en los 7 días anteriores.
+    """
+    horarios = horarios or horarios_turno()
+    resultado = {}
+    inicio_ventana, suma, fin_anterior = 0, Decimal(0), None
+    for fecha, horas, turnos in dias:
+        suma += horas
+        while dias[inicio_ventana][0] <= fecha - VENTANA:
+            suma -= dias[inicio_ventana][1]
+            inicio_ventana += 1
+        descanso = None
+        for inicio, fin in intervalos(fecha, turnos, horarios):
+            if fin_anterior is not None and inicio - fin_anterior <= VENTANA:
+                hueco = max(_horas(inicio - fin_anterior), Decimal(0))
+                descanso = hueco if descanso is None else min(descanso, hueco)
+            fin_anterior = fin if fin_anterior is None else max(fin_anterior, fin)
+        resultado[fecha] = (suma, descanso)
+    return resultado
+
+
+def sumar_dias(movimientos):
+    """Agrupa (empleado_id, fecha, turno, horas) en {(empleado_id, fecha): [horas, {turnos}, movimientos]}."""
+    dias = defaultdict(lambda: [Decimal(0), set(), 0])
+    for empleado_id, fecha, turno, horas in movimientos:
+        dia = dias[(empleado_id, fecha)]
+        dia[0] += horas or 0
+        dia[1].add(turno)
+        dia[2] += 1
+    return dias
+
+
+def _texto_turnos(turnos):
+    return ','.join(sorted(turnos))
+
+
+def _lista_turnos(texto):
+    return [turno for turno in texto.split(',') if turno]
+
+
+# --- MANTENIMIENTO ---
+
+def _recalcular_ventanas(empleados, fecha_desde, fecha_hasta):
+    """Actualiza horas_7_dias y descanso_previo de los días que dependen de [fecha_desde, fecha_hasta]."""
+    filas = JornadaDiaria.objects.filter(
+        empleado_id__in=empleados, fecha__range=(fecha_desde - VENTANA, fecha_hasta + VENTANA),
+    ).order_by('empleado_id', 'fecha')
+    por_empleado = defaultdict(list)
+    for fila in filas:
+        por_empleado[fila.empleado_id].append(fila)
+
+    horarios = horarios_turno()
+    cambiadas = []
+    for dias in por_empleado.values():
+        ventanas = completar_ventanas([(d.fecha, d.horas, _lista_turnos(d.turnos)) for d in dias], horarios)
+        for dia in dias:
+            if dia.fecha < fecha_desde:
+                continue
+            horas_7_dias, descanso = ventanas[dia.fecha]
+            if (dia.horas_7_dias, dia.descanso_previo) != (horas_7_dias, descanso):
+                dia.horas_7_dias, dia.descanso_previo = horas_7_dias, descanso
+                cambiadas.append(dia)
+    JornadaDiaria.objects.bulk_update(cambiadas, ['horas_7_dias', 'descanso_previo'], batch_size=1000)
+
+
+def _archivados(claves, empleados, fechas):
+    vivos = set(Movimiento.objects.filter(empleado_id__in=empleados, fecha__in=fechas).values_list('id', flat=True))
+    return [
+        fila for fila in archivo.filas_archivadas(min(fechas), max(fechas), COLUMNAS, excluir_ids=vivos)
+        if (fila[0], fila[1]) in claves
+    ]
+
+
+def actualizar_dias(claves, fechas_por_consulta=500):
+    """Recalcula el libro de los pares (empleado_id, fecha) indicados y las ventanas que dependen de ellos."""
+    claves = {(e, f) for e, f in claves if e is not None and f is not None}
+    if not claves:
+        return
+    empleados = {e for e, _ in claves}
+    fechas = sorted({f for _, f in claves})
+    with transaction.atomic(using=fragmentos.actual()):
+        for i in range(0, len(fechas), fechas_por_consulta):
+            tramo = fechas[i:i + fechas_por_consulta]
+            movimientos = [
+                fila for fila in Movimiento.objects.filter(empleado_id__in=empleados, fecha__in=tramo).values_list(*COLUMNAS)
+                if (fila[0], fila[1]) in claves
+            ]
+            if archivo.rango_archivado(tramo[0], tramo[-1]):
+                movimientos += _archivados(claves, empleados, tramo)
+            existentes = JornadaDiaria.objects.filter(empleado_id__in=empleados, fecha__in=tramo)
+            ids = [id_ for id_, e, f in existentes.values_list('id', 'empleado_id', 'fecha') if (e, f) in claves]
+            if ids:
+                JornadaDiaria.objects.filter(id__in=ids).delete()
+            JornadaDiaria.objects.bulk_create([
+                JornadaDiaria(empleado_id=e, fecha=f, horas=horas, turnos=_texto_turnos(turnos), movimientos=n)
+                for (e, f), (horas, turnos, n) in sumar_dias(movimientos).items()
+            ])
+            _recalcular_ventanas({e for e, f in claves if tramo[0] <= f <= tramo[-1]}, tramo[0], tramo[-1])
+
+
+def reconstruir():
+    """Vuelve a calcular todo el libro, trabajador por trabajador. Devuelve la cantidad de días."""
+    archivados = defaultdict(list)
+    for anio in archivo.anios_archivados():
+        vivos = set(Movimiento.objects.filter(fecha__year=anio).values_list('id', flat=True))
+        for fila in archivo.filas_archivadas(date(anio, 1, 1), date(anio, 12, 31), COLUMNAS, excluir_ids=vivos):
+            if fila[0] is not None:
+                archivados[fila[0]].append(fila)
+
+    horarios = horarios_turno()
+    total = 0
+    with transaction.atomic(using=fragmentos.actual()):
+        JornadaDiaria.objects.all().delete()
+        for empleado_id in Empleado.objects.values_list('id', flat=True):
+            dias = sumar_dias(
+                list(Movimiento.objects.filter(empleado_id=empleado_id).values_list(*COLUMNAS))
+                + archivados.get(empleado_id, [])
+            )
+            ordenados = sorted((f, horas, turnos, n) for (_, f), (horas, turnos, n) in dias.items())
+            ventanas = completar_ventanas([(f, horas, turnos) for f, horas, turnos, _ in ordenados], horarios)
+            JornadaDiaria.objects.bulk_create([
+                JornadaDiaria(
+                    empleado_id=empleado_id, fecha=f, horas=horas, turnos=_texto_turnos(turnos), movimientos=n,
+                    horas_7_dias=ventanas[f][0], descanso_previo=ventanas[f][1],
+                )
+                for f, horas, turnos, n in ordenados
+            ], batch_size=5000)
+            total += len(ordenados)
+    return total
+
+
+# --- CONTROL PREVIO Y PANEL ---
+
+def _dias_libro(fecha_desde, fecha_hasta, empleado_id=None):
+    """
+    {(empleado_id, fecha): [horas, [turnos]]} del libro en el rango. En modo
+    fragmentado cada mina lleva su propio libro: se leen todas las bases y
+    se suma por trabajador y día (las ventanas de 7 días y el descanso
+    guardados en cada base solo ven esa mina y se calculan de nuevo).
+    """
+    def leer():
+        filas = JornadaDiaria.objects.filter(fecha__range=(fecha_desde, fecha_hasta))
+        if empleado_id is not None:
+            filas = filas.filter(empleado_id=empleado_id)
+        return list(filas.values_list('empleado_id', 'fecha', 'horas', 'turnos'))
+
+    dias = {}
+    for filas in fragmentos.en_paralelo(leer).values():
+        for e, f, horas, turnos in filas:
+            dia = dias.setdefault((e, f), [Decimal(0), []])
+            dia[0] += horas
+            dia[1] = sorted(set(dia[1]) | set(_lista_turnos(turnos)))
+    return dias
+
+
+def verificar_turno(empleado_id, fecha, turno, horas=0):
+    """
+    Indica si el trabajador puede hacer `turno` en `fecha` con `horas`
+    horas más: la suma de ninguna ventana de 7 días que incluya la fecha
+    puede pasar el máximo semanal y el descanso antes y después del turno
+    debe ser al menos el mínimo. Hace una consulta por base.
+    """
+    horas = Decimal(str(horas or 0))
+    maximo, minimo = horas_maximas_semanales(fecha), descanso_minimo()
+    dias = {f: dia for (_, f), dia in _dias_libro(fecha - VENTANA, fecha + VENTANA, empleado_id).items()}
+    problemas = []
+
+    # Descanso: contra los turnos ya registrados, salvo el mismo turno del mismo día
+    # (un cambio de equipo dentro del turno no es un turno nuevo)
+    horarios = horarios_turno()
+    descanso_previo = descanso_siguiente = None
+    nuevo = intervalos(fecha, [turno], horarios) if turno not in dias.get(fecha, [0, []])[1] else []
+    if nuevo:
+        inicio, fin = nuevo[0]
+        for f, (_, turnos) in dias.items():
+            for otro_inicio, otro_fin in intervalos(f, turnos, horarios):
+                if otro_fin <= inicio:
+                    hueco = _horas(inicio - otro_fin)
+                    descanso_previo = hueco if descanso_previo is None else min(descanso_previo, hueco)
+                elif otro_inicio >= fin:
+                    hueco = _horas(otro_inicio - fin)
+                    descanso_siguiente = hueco if descanso_siguiente is None else min(descanso_siguiente, hueco)
+                else:
+                    problemas.append(f"Se superpone con el turno {', '.join(turnos)} del {f.strftime('%d-%m-%Y')}.")
+        for descanso, cuando in ((descanso_previo, 'antes'), (descanso_siguiente, 'después')):
+            if descanso is not None and descanso < minimo:
+                problemas.append(f"Descanso de {descanso} horas {cuando} del turno; el mínimo es {minimo}.")
+
+    # Horas: la peor de las ventanas de 7 días que contienen la fecha
+    dia = dias.setdefault(fecha, [Decimal(0), []])
+    dia[0] += horas
+    horas_semana = max(
+        sum((h for f, (h, _) in dias.items() if fin - timedelta(days=6) <= f <= fin), Decimal(0))
+        for fin in (fecha + timedelta(days=i) for i in range(7))
+    )
+    if horas_semana > maximo:
+        problemas.append(f"Sumaría {horas_semana} horas en 7 días; el máximo semanal es {maximo}.")
+
+    return {
+        'permitido': not problemas,
+        'horas_semana': float(horas_semana),
+        'maximo_semanal': float(maximo),
+        'descanso_previo': float(descanso_previo) if descanso_previo is not None else None,
+        'descanso_siguiente': float(descanso_siguiente) if descanso_siguiente is not None else None,
+        'descanso_minimo': float(minimo),
+        'problemas': problemas,
+    }
+
+
+def panel(fecha, dias_infracciones=30):
+    """
+    Horas de cada trabajador en los 7 días que terminan en `fecha` y las
+    infracciones (semana sobre el máximo o descanso bajo el mínimo) de los
+    últimos `dias_infracciones` días, leídas del libro. Las ventanas se
+    calculan sobre los días sumados de todas las bases.
+    """
+    maximo, minimo = horas_maximas_semanales(fecha), descanso_minimo()
+    inicio_semana = fecha - timedelta(days=6)
+    desde = fecha - timedelta(days=dias_infracciones - 1)
+    # Un día más que la ventana: el turno anterior puede terminar al día siguiente
+    dias = _dias_libro(min(desde, inicio_semana) - VENTANA - timedelta(days=1), fecha)
+
+    por_empleado = defaultdict(list)
+    for (e, f), (horas, turnos) in sorted(dias.items(), key=lambda item: (item[0][0] or 0, item[0][1])):
+        por_empleado[e].append((f, horas, turnos))
+    empleados = Empleado.objects.in_bulk([e for e in por_empleado if e is not None])
+    horarios = horarios_turno()
+
+    trabajadores, infracciones = [], []
+    for empleado_id, dias_empleado in por_empleado.items():
+        empleado = empleados.get(empleado_id)
+        if empleado is None:
+            continue
+        ventanas = completar_ventanas(dias_empleado, horarios)
+        semana = [(h, ventanas[f][1]) for f, h, _ in dias_empleado if f >= inicio_semana]
+        if semana:
+            horas = sum(h for h, _ in semana)
+            descansos = [d for _, d in semana if d is not None]
+            descanso = min(descansos) if descansos else None
+            trabajadores.append({
+                'empleado_id': empleado_id,
+                'codigo_trabajador': empleado.codigo_trabajador,
+                'nombre': empleado.nombre_completo,
+                'cargo': empleado.cargo,
+                'horas': horas,
+                'dias': len(semana),
+                'descanso_minimo': descanso,
+                'porcentaje': round(100 * horas / maximo, 1),
+                'excede': horas > maximo,
+                'descanso_insuficiente': descanso is not None and descanso < minimo,
+            })
+        for f, h, turnos in dias_empleado:
+            if f < desde:
+                continue
+            horas_7_dias, descanso = ventanas[f]
+            motivos = []
+            if horas_7_dias > horas_maximas_semanales(f):
+                motivos.append(f"{horas_7_dias} h en 7 días")
+            if descanso is not None and descanso < minimo:
+                motivos.append(f"descanso de {descanso} h")
+            if motivos:
+                jornada = JornadaDiaria(
+                    empleado=empleado, fecha=f, horas=h, turnos=_texto_turnos(turnos),
+                    horas_7_dias=horas_7_dias, descanso_previo=descanso,
+                )
+                infracciones.append({'jornada': jornada, 'motivos': motivos})
+
+    trabajadores.sort(key=lambda fila: (-fila['horas'], fila['nombre']))
+    infracciones.sort(key=lambda infraccion: (-infraccion['jornada'].fecha.toordinal(), infraccion['jornada'].empleado.nombre_completo))
+    return {
+        'trabajadores': trabajadores,
+        'infracciones': infracciones[:500],
+        'maximo_semanal': maximo,
+        'descanso_minimo': minimo,
+    }
@@ -0,0 +1,95 @@
+"""
+Utilidades compartidas por los comandos bench_*: crean una base de datos
+temporal (igual que el runner de tests) para no tocar la de producción,
+y la llenan con datos sintéticos.
+"""
+
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from django.db import connection, connections
+from django.test.utils import setup_databases, teardown_databases
+
+from empresa.models import Empleado, Maquinaria, Movimiento
+
+
+@contextmanager
+def base_de_datos_temporal(otras=()):
+    """
+    Crea y migra una base de datos SQLite temporal en disco (en memoria no
+    alcanza para millones de filas) y la elimina al salir. Los alias de
+    `otras` se agregan con la misma configuración y su propio archivo
+    temporal, para medir el modo fragmentado.
+    """
+    directorio = tempfile.mkdtemp(prefix='bench_empresa_')
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(directorio, 'bench.sqlite3')
+    for alias in otras:
+        connections.settings[alias] = {
+            **connection.settings_dict,
+            'TEST': {**connection.settings_dict['TEST'], 'NAME': os.path.join(directorio, f'{alias}.sqlite3')},
+        }
+    anteriores = setup_databases(verbosity=0, interactive=False, aliases={'default', *otras})
+    try:
+        yield
+    finally:
+        teardown_databases(anteriores, verbosity=0)
+        for alias in otras:
+            connections[alias].close()
+            del connections.settings[alias]
+
+
+@contextmanager
+def cronometro(resultados, nombre):
+    """Guarda en `resultados[nombre]` los segundos que tarda el bloque."""
+    inicio = time.perf_counter()
+    yield
+    resultados[nombre] = time.perf_counter() - inicio
+
+
+def crear_maestros(empleados=200, maquinarias=60):
+    Empleado.objects.bulk_create([
+        Empleado(codigo_trabajador=f"{i:04d}", nombre_completo=f"Operador {i}", rut=f"{i}-K",
+                 cargo='Operador Maquinaria', tipo_contrato='Indefinido', fecha_contratacion=date(2020, 1, 1))
+        for i in range(empleados)
+    ])
+    tipos = ['Cargador Frontal', 'Excavadora', 'Motoniveladora', 'Camión Tolva', 'Camión Aljibe']
+    Maquinaria.objects.bulk_create([
+        Maquinaria(codigo_eq=f"EQ-{i:03d}", tipo=tipos[i % len(tipos)]) for i in range(maquinarias)
+    ])
+    return list(Empleado.objects.values_list('id', flat=True)), list(Maquinaria.objects.values_list('id', flat=True))
+
+
+def sembrar_movimientos(filas, textos=None, lote=20000, semilla=1, desde=date(2020, 1, 1)):
+    """
+    Inserta `filas` movimientos sintéticos repartidos en el tiempo. Si se
+    entrega `textos`, cada observación se arma con palabras de esa lista.
+    """
+    azar = random.Random(semilla)
+    empleados, maquinarias = crear_maestros()
+    proyectos = [valor for valor, _ in Movimiento.PROYECTOS]
+    turnos = ['Día', 'Noche']
+    horometros = {maq: 0 for maq in maquinarias}
+    pendientes = []
+    for i in range(filas):
+        maq = maquinarias[i % len(maquinarias)]
+        inicio = horometros[maq]
+        duracion = azar.randint(300, 700)
+        horometros[maq] = inicio + duracion
+        observaciones = ' '.join(azar.choices(textos, k=8)) if textos else None
+        pendientes.append(Movimiento(
+            fecha=desde + timedelta(days=i // (len(maquinarias) * 2)),
+            empleado_id=azar.choice(empleados), maquinaria_id=maq,
+            proyecto=azar.choice(proyectos), turno=turnos[i % 2],
+            horometro_inicial=inicio, horometro_final=inicio + duracion,
+            combustible_cargado=azar.choice([None, 50, 120, 200]),
+            nivel_final_combustible='medio', observaciones=observaciones,
+        ))
+        if len(pendientes) >= lote:
+            Movimiento.objects.bulk_create(pendientes)
+            pendientes = []
+    if pendientes:
+        Movimiento.objects.bulk_create(pendientes)
@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresa import replica
+from empresa.combustible import actualizar_reporte
+
+
+class Command(BaseCommand):
+    help = "Recalcula el reporte de consumo de combustible (litros/hora, líneas base y anomalías)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', type=date.fromisoformat, help="Fecha inicial (AAAA-MM-DD); por defecto todo el historial.")
+        parser.add_argument('--hasta', type=date.fromisoformat, help="Fecha final (AAAA-MM-DD).")
+
+    def handle(self, *args, **options):
+        try:
+            # El historial se lee de la réplica si está vigente; el reporte se guarda en la principal
+            with replica.lectura():
+                reporte = actualizar_reporte(options['desde'], options['hasta'])
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            f"Reporte #{reporte.pk}: {reporte.movimientos_analizados} movimientos en {reporte.segundos:.2f} s, "
+            f"{reporte.datos['total_anomalias']} anomalías de consumo y "
+            f"{reporte.datos['total_cargas_chip_otro_equipo']} cargas con chip de otro equipo."
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from empresa import archivo
+
+
+class Command(BaseCommand):
+    help = ("Mueve los movimientos y viajes de los años cerrados a archivos comprimidos por año. "
+            "Por defecto archiva todos los años cerrados que aún tienen filas vivas.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--anio', type=int, action='append', help="Año a archivar (se puede repetir).")
+        parser.add_argument('--verificar', action='store_true', help="Solo verifica las sumas de los archivos existentes.")
+
+    def handle(self, *args, **options):
+        if options['verificar']:
+            errores = 0
+            for anio, error in archivo.verificar():
+                if error:
+                    errores += 1
+                    self.stderr.write(self.style.ERROR(f"{anio}: {error}"))
+                else:
+                    self.stdout.write(f"{anio}: OK")
+            if errores:
+                raise CommandError(f"{errores} archivo(s) con errores.")
+            return
+
+        for anio in options['anio'] or archivo.anios_archivables():
+            try:
+                entrada = archivo.archivar(anio)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS(
+                f"{anio}: {entrada['movimientos']} movimientos y {entrada['viajes']} viajes en "
+                f"{entrada['archivo']} ({entrada['bytes'] / 1024:.0f} KB)."
+            ))
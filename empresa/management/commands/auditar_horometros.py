@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from empresa.auditoria import auditar
+
+
+class Command(BaseCommand):
+    help = ("Audita la continuidad de los horómetros de todos los equipos. Por defecto solo revisa "
+            "los equipos con cambios desde la última auditoría.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completa', action='store_true', help="Revisa todo el historial de todos los equipos.")
+
+    def handle(self, *args, **options):
+        auditoria = auditar(incremental=not options['completa'])
+        segundos = (auditoria.terminada_en - auditoria.iniciada_en).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"Auditoría {auditoria.modo}: {auditoria.maquinas_revisadas} equipos, "
+            f"{auditoria.movimientos_revisados} movimientos, {auditoria.hallazgos} hallazgos en {segundos:.2f} s."
+        ))
@@ -0,0 +1,148 @@
+"""
+Prueba de carga de las APIs del formulario de captura bajo ASGI: la misma
+mezcla de solicitudes se envía con las vistas síncronas y con las
+asíncronas (ver urls.py) a la aplicación ASGI de Django, llamada en el
+mismo proceso con `clientes` clientes concurrentes, y se informa
+solicitudes por segundo y latencias p50/p95/p99.
+
+La aplicación se llama directamente (sin servidor ni red), así que se
+mide lo que agrega Django: middleware, vista, ORM y el hilo de la vista
+síncrona mientras espera a la base de datos.
+"""
+
+import asyncio
+import random
+import time
+import types
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from django.test.utils import override_settings
+from django.urls import path
+
+from empresa import views
+from empresa.models import Empleado, InformeDiario, Maquinaria, Movimiento
+
+from ._benchmark import base_de_datos_temporal, sembrar_movimientos
+from .bench_productividad import sembrar_viajes
+
+
+def _urlconf(nombre, buscar_empleado, ultimo_horometro, obtener_posturas):
+    modulo = types.ModuleType(nombre)
+    modulo.urlpatterns = [
+        path('api/buscar-empleado/', buscar_empleado),
+        path('api/ultimo-horometro/', ultimo_horometro),
+        path('api/obtener-posturas/', obtener_posturas),
+    ]
+    return modulo
+
+
+VARIANTES = {
+    'síncronas': _urlconf(
+        'bench_api_sincronas', views.buscar_empleado_api, views.ultimo_horometro_api, views.obtener_posturas_api,
+    ),
+    'asíncronas': _urlconf(
+        'bench_api_asincronas', views.buscar_empleado_api_async, views.ultimo_horometro_api_async,
+        views.obtener_posturas_api_async,
+    ),
+}
+
+
+async def solicitud(aplicacion, ruta, consulta):
+    """Envía un GET a la aplicación ASGI y devuelve el código de estado."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': ruta, 'raw_path': ruta.encode(), 'root_path': '', 'query_string': consulta.encode(),
+        'headers': [(b'host', b'localhost')], 'client': ('127.0.0.1', 50000), 'server': ('localhost', 80),
+    }
+    cuerpo_enviado = False
+
+    async def recibir():
+        nonlocal cuerpo_enviado
+        if not cuerpo_enviado:
+            cuerpo_enviado = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # El cliente no se desconecta: Django cancela esta espera al responder
+        await asyncio.Future()
+
+    estado = None
+
+    async def enviar(mensaje):
+        nonlocal estado
+        if mensaje['type'] == 'http.response.start':
+            estado = mensaje['status']
+
+    await aplicacion(scope, recibir, enviar)
+    return estado
+
+
+async def carga(aplicacion, solicitudes, clientes):
+    """
+    Reparte `solicitudes` (ruta, consulta) entre `clientes` que envían una
+    tras otra. Devuelve (segundos, latencias ordenadas, errores).
+    """
+    pendientes = iter(solicitudes)
+    latencias, errores = [], 0
+
+    async def cliente():
+        nonlocal errores
+        for ruta, consulta in pendientes:
+            inicio = time.perf_counter()
+            estado = await solicitud(aplicacion, ruta, consulta)
+            latencias.append(time.perf_counter() - inicio)
+            if estado != 200:
+                errores += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[cliente() for _ in range(clientes)])
+    return time.perf_counter() - inicio, sorted(latencias), errores
+
+
+def percentil(ordenadas, p):
+    return ordenadas[min(len(ordenadas) - 1, int(p / 100 * len(ordenadas)))]
+
+
+class Command(BaseCommand):
+    help = "Compara las APIs del formulario de captura síncronas y asíncronas bajo ASGI con clientes concurrentes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=200_000)
+        parser.add_argument('--clientes', type=int, default=500)
+        parser.add_argument('--solicitudes', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal():
+            sembrar_movimientos(options['filas'])
+            fecha_hasta = Movimiento.objects.aggregate(ultima=Max('fecha'))['ultima']
+            sembrar_viajes(fecha_hasta, 30)
+
+            azar = random.Random(1)
+            codigos = list(Empleado.objects.values_list('codigo_trabajador', flat=True))
+            maquinarias = list(Maquinaria.objects.values_list('id', flat=True))
+            turnos = list(InformeDiario.objects.values_list('fecha', 'turno'))
+            generadores = [
+                lambda: ('/api/buscar-empleado/', f'codigo={azar.choice(codigos)}'),
+                lambda: ('/api/ultimo-horometro/', f'maquinaria_id={azar.choice(maquinarias)}'),
+                lambda: ('/api/obtener-posturas/', 'fecha={}&turno={}'.format(*azar.choice(turnos))),
+            ]
+            solicitudes = [generadores[i % len(generadores)]() for i in range(options['solicitudes'])]
+            self.stdout.write(
+                f"{options['filas']} movimientos; {options['solicitudes']} solicitudes con "
+                f"{options['clientes']} clientes concurrentes"
+            )
+
+            for nombre, urlconf in VARIANTES.items():
+                with override_settings(ROOT_URLCONF=urlconf, DEBUG=False):
+                    aplicacion = ASGIHandler()
+                    # Calentamiento: caché de posturas, middleware y conexiones
+                    asyncio.run(carga(aplicacion, solicitudes[:200], 20))
+                    segundos, latencias, errores = asyncio.run(
+                        carga(aplicacion, solicitudes, options['clientes'])
+                    )
+                self.stdout.write(
+                    f"Vistas {nombre}: {len(latencias) / segundos:.0f} solicitudes/s | "
+                    f"p50 {percentil(latencias, 50) * 1000:.0f} ms | p95 {percentil(latencias, 95) * 1000:.0f} ms | "
+                    f"p99 {percentil(latencias, 99) * 1000:.0f} ms | máx {latencias[-1] * 1000:.0f} ms | "
+                    f"errores {errores}"
+                )
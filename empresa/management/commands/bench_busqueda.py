@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from empresa.busqueda import buscar
+from empresa.models import Movimiento
+
+from ._benchmark import base_de_datos_temporal, cronometro, sembrar_movimientos
+
+VOCABULARIO = [
+    'revisión', 'cambio', 'aceite', 'motor', 'neumático', 'pinchazo', 'falla', 'hidráulica',
+    'manguera', 'filtro', 'frenos', 'luces', 'batería', 'correa', 'fuga', 'combustible',
+    'carga', 'buzón', 'botadero', 'rampa', 'polvo', 'lluvia', 'espera', 'tronadura',
+    'detenido', 'mantención', 'operativo', 'sin', 'novedad', 'turno', 'apoyo', 'mina',
+]
+
+
+class Command(BaseCommand):
+    help = "Compara la búsqueda FTS5 con icontains sobre una base temporal con datos sintéticos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=2_000_000)
+        parser.add_argument('--repeticiones', type=int, default=5)
+
+    def handle(self, *args, **options):
+        consultas = ['neumático', 'falla hidráulica', 'fuga aceite motor']
+        with base_de_datos_temporal():
+            tiempos = {}
+            with cronometro(tiempos, 'carga'):
+                sembrar_movimientos(options['filas'], textos=VOCABULARIO + [f"x{i}" for i in range(2000)])
+            self.stdout.write(f"{options['filas']} movimientos cargados en {tiempos['carga']:.1f} s")
+
+            for texto in consultas:
+                palabras = texto.split()
+                for repeticion in range(options['repeticiones']):
+                    with cronometro(tiempos, f'fts_{repeticion}'):
+                        resultado = buscar(texto, limite=50)
+                    with cronometro(tiempos, f'icontains_{repeticion}'):
+                        filtro = Movimiento.objects.all()
+                        for palabra in palabras:
+                            filtro = filtro.filter(observaciones__icontains=palabra)
+                        total_icontains = filtro.count()
+                        list(filtro.order_by('-fecha')[:50])
+                fts = min(tiempos[f'fts_{r}'] for r in range(options['repeticiones']))
+                icontains = min(tiempos[f'icontains_{r}'] for r in range(options['repeticiones']))
+                self.stdout.write(
+                    f"'{texto}': FTS5 {fts * 1000:.1f} ms ({resultado['total']} coincidencias, con facetas) | "
+                    f"icontains {icontains * 1000:.1f} ms ({total_icontains} coincidencias) | "
+                    f"x{icontains / fts:.1f}"
+                )
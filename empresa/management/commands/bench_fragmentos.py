@@ -0,0 +1,131 @@
+"""
+Mide el modo fragmentado (ver empresa/fragmentos.py) contra una sola base,
+con bases temporales y datos sintéticos:
+
+- Escrituras de Mina El Way (un movimiento por transacción, con todos sus
+  signals) sin carga y mientras corre sin pausa el ranking de
+  productividad de Mina Juana: latencias p50/p99/máx y bloqueos.
+- Reportes entre minas (ranking, informe de producción y utilización):
+  una sola base contra todas las bases a la vez.
+
+Primero se mide con una sola base; después se activa el modo fragmentado y
+se trasladan los movimientos de las dos minas a sus fragmentos, igual que
+`fragmentar --mover`.
+"""
+
+import threading
+import time
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.db.models import Max
+from django.test.utils import override_settings
+
+from empresa import fragmentos, informes, productividad, utilizacion
+from empresa.models import Empleado, Maquinaria, Movimiento
+
+from ._benchmark import base_de_datos_temporal, cronometro, sembrar_movimientos
+from .bench_api_asgi import percentil
+from .bench_productividad import sembrar_viajes
+
+FRAGMENTOS = {'Mina El Way': 'bench_el_way', 'Mina Juana': 'bench_juana'}
+
+
+def escribir(segundos, empleado_id, maquinaria_id, fecha, latencias, bloqueos):
+    """Guarda movimientos de Mina El Way uno por uno durante `segundos`."""
+    horometro = 10_000_000
+    fin = time.monotonic() + segundos
+    try:
+        while time.monotonic() < fin:
+            movimiento = Movimiento(
+                fecha=fecha, turno='Día', empleado_id=empleado_id, maquinaria_id=maquinaria_id,
+                proyecto='Mina El Way', horometro_inicial=horometro, horometro_final=horometro + 60,
+                nivel_final_combustible='medio',
+            )
+            horometro += 60
+            inicio = time.perf_counter()
+            try:
+                with transaction.atomic(using=fragmentos.alias_de('Mina El Way')):
+                    movimiento.save()
+            except OperationalError:
+                # La escritura esperó más que el timeout de SQLite
+                bloqueos.append(time.perf_counter() - inicio)
+                continue
+            latencias.append(time.perf_counter() - inicio)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = "Compara una sola base con una base por mina: escrituras bajo un reporte pesado y reportes entre minas."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=400_000)
+        parser.add_argument('--segundos', type=float, default=10, help="Duración de cada medición de escrituras")
+        parser.add_argument('--repeticiones', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal(otras=sorted(FRAGMENTOS.values())):
+            tiempos = {}
+            with cronometro(tiempos, 'carga'):
+                sembrar_movimientos(options['filas'])
+                fecha_hasta = Movimiento.objects.aggregate(ultima=Max('fecha'))['ultima']
+                viajes = sembrar_viajes(fecha_hasta, max(productividad.VENTANAS))
+                # La carga masiva no dispara signals: el reporte de utilización lee la tabla diaria
+                utilizacion.reconstruir()
+            self.stdout.write(f"{options['filas']} movimientos y {viajes} viajes cargados en {tiempos['carga']:.1f} s")
+
+            self._medir('Una sola base', fecha_hasta, options)
+            with override_settings(FRAGMENTOS_PROYECTO=FRAGMENTOS, DATABASE_ROUTERS=['empresa.fragmentos.RouterFragmentos']):
+                with cronometro(tiempos, 'fragmentar'):
+                    for alias in fragmentos.fragmentos():
+                        fragmentos.reservar_ids(alias)
+                    fragmentos.copiar_maestros()
+                    for alias in fragmentos.fragmentos():
+                        fragmentos.mover(alias)
+                self.stdout.write(f"Movimientos trasladados a {len(FRAGMENTOS)} fragmentos en {tiempos['fragmentar']:.1f} s")
+                self._medir('Una base por mina', fecha_hasta, options)
+
+    def _medir(self, nombre, fecha_hasta, options):
+        self.stdout.write(f"\n{nombre}:")
+        empleado_id = Empleado.objects.values_list('id', flat=True).first()
+        maquinaria_id = Maquinaria.objects.values_list('id', flat=True).first()
+        dias = max(productividad.VENTANAS)
+        for con_reporte in (False, True):
+            latencias, bloqueos = [], []
+            # Cada medición escribe en un día nuevo: los agregados del día crecen con cada movimiento
+            self.dias_escritos = getattr(self, 'dias_escritos', 0) + 1
+            escritor = threading.Thread(target=escribir, args=(
+                options['segundos'], empleado_id, maquinaria_id, fecha_hasta + timedelta(days=self.dias_escritos),
+                latencias, bloqueos,
+            ))
+            reportes = 0
+            escritor.start()
+            while con_reporte and escritor.is_alive():
+                productividad.ranking_ventana(fecha_hasta, dias, proyecto='Mina Juana')
+                reportes += 1
+            escritor.join()
+            latencias.sort()
+            self.stdout.write(
+                f"  Escrituras de Mina El Way {'con' if con_reporte else 'sin'} reporte de Mina Juana"
+                f"{f' ({reportes} rankings)' if con_reporte else ''}: {len(latencias)} | "
+                f"p50 {percentil(latencias, 50) * 1000:.1f} ms | p99 {percentil(latencias, 99) * 1000:.1f} ms | "
+                f"máx {latencias[-1] * 1000:.1f} ms | bloqueadas {len(bloqueos)}"
+                if latencias else f"  Ninguna escritura terminó; bloqueadas {len(bloqueos)}"
+            )
+
+        desde = fecha_hasta - timedelta(days=dias - 1)
+        consultas = {
+            'Ranking de productividad': lambda: productividad.ranking_ventana(fecha_hasta, dias),
+            'Informe de producción': lambda: informes.agregados_movimientos(desde, fecha_hasta, ['Día', 'Noche']),
+            'Utilización por proyecto': lambda: utilizacion.reporte(desde, fecha_hasta, agrupar_por='proyecto'),
+        }
+        cache.clear()
+        for titulo, consulta in consultas.items():
+            tiempos = {}
+            for repeticion in range(options['repeticiones']):
+                with cronometro(tiempos, repeticion):
+                    consulta()
+            self.stdout.write(f"  {titulo} ({dias} días, todas las minas): {min(tiempos.values()) * 1000:.1f} ms")
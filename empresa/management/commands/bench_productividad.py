@@ -0,0 +1,100 @@
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from empresa import productividad
+from empresa.models import InformeDiario, Movimiento, Postura, Viaje
+
+from ._benchmark import base_de_datos_temporal, cronometro, sembrar_movimientos
+
+
+def sembrar_viajes(fecha_hasta, dias, semilla=1):
+    """Una postura por turno y un viaje por movimiento en los últimos `dias`."""
+    azar = random.Random(semilla)
+    desde = fecha_hasta - timedelta(days=dias - 1)
+    turnos = Movimiento.objects.filter(fecha__gte=desde).values_list('fecha', 'turno').distinct().order_by()
+    InformeDiario.objects.bulk_create([InformeDiario(fecha=fecha, turno=turno) for fecha, turno in turnos])
+    informes = InformeDiario.objects.filter(fecha__gte=desde)
+    Postura.objects.bulk_create([
+        Postura(informe=informe, numero_postura=1, tipo_actividad='Producción',
+                sector_prefijo='TA', sector_banco='610', sector_tiro='23')
+        for informe in informes
+    ])
+    posturas = {
+        (fecha, turno): id_
+        for id_, fecha, turno in Postura.objects.values_list('id', 'informe__fecha', 'informe__turno')
+    }
+    viajes = [
+        Viaje(movimiento_id=id_, postura_id=posturas[(fecha, turno)], cantidad=azar.randint(0, 20))
+        for id_, fecha, turno in Movimiento.objects.filter(fecha__gte=desde).values_list('id', 'fecha', 'turno')
+    ]
+    Viaje.objects.bulk_create(viajes, batch_size=20000)
+    return len(viajes)
+
+
+def ranking_en_python(fecha_hasta, dias):
+    """El mismo cálculo recorriendo las filas en Python, para comparar."""
+    desde = fecha_hasta - timedelta(days=dias - 1)
+    viajes = defaultdict(int)
+    for movimiento_id, cantidad in Viaje.objects.filter(
+        movimiento__fecha__range=(desde, fecha_hasta)
+    ).values_list('movimiento_id', 'cantidad'):
+        viajes[movimiento_id] += cantidad
+    totales = defaultdict(lambda: {'horas': 0, 'turnos': set(), 'viajes': 0, 'combustible': 0})
+    for movimiento in Movimiento.objects.filter(fecha__range=(desde, fecha_hasta), empleado__isnull=False):
+        total = totales[(movimiento.proyecto, movimiento.empleado_id)]
+        total['horas'] += movimiento.horas_trabajadas or 0
+        total['turnos'].add((movimiento.fecha, movimiento.turno))
+        total['viajes'] += viajes[movimiento.id]
+        total['combustible'] += movimiento.combustible_cargado or 0
+    por_proyecto = defaultdict(list)
+    for (proyecto, empleado_id), total in totales.items():
+        horas = float(total['horas'])
+        por_proyecto[proyecto].append((total['viajes'] / horas if horas else 0, empleado_id))
+    return {proyecto: sorted(filas, reverse=True) for proyecto, filas in por_proyecto.items()}
+
+
+class Command(BaseCommand):
+    help = "Mide el ranking de productividad de operadores sobre una base temporal con datos sintéticos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=2_000_000)
+        parser.add_argument('--repeticiones', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal():
+            tiempos = {}
+            with cronometro(tiempos, 'carga'):
+                sembrar_movimientos(options['filas'])
+                fecha_hasta = Movimiento.objects.aggregate(ultima=Max('fecha'))['ultima']
+                viajes = sembrar_viajes(fecha_hasta, max(productividad.VENTANAS))
+            self.stdout.write(
+                f"{options['filas']} movimientos y {viajes} viajes cargados en {tiempos['carga']:.1f} s"
+            )
+
+            for dias in productividad.VENTANAS:
+                for repeticion in range(options['repeticiones']):
+                    with cronometro(tiempos, f'sql_{repeticion}'):
+                        productividad.ranking_ventana(fecha_hasta, dias)
+                    with cronometro(tiempos, f'python_{repeticion}'):
+                        ranking_en_python(fecha_hasta, dias)
+                sql = min(tiempos[f'sql_{r}'] for r in range(options['repeticiones']))
+                python = min(tiempos[f'python_{r}'] for r in range(options['repeticiones']))
+                self.stdout.write(
+                    f"Ventana de {dias} días: SQL con ventanas {sql * 1000:.1f} ms | "
+                    f"Python {python * 1000:.1f} ms | x{python / sql:.1f}"
+                )
+
+            cache.clear()
+            with cronometro(tiempos, 'completo'):
+                productividad.ranking(fecha_hasta)
+            with cronometro(tiempos, 'cache'):
+                productividad.ranking(fecha_hasta)
+            self.stdout.write(
+                f"Ranking completo ({len(productividad.VENTANAS)} ventanas): {tiempos['completo'] * 1000:.1f} ms, "
+                f"desde caché {tiempos['cache'] * 1000:.2f} ms"
+            )
@@ -0,0 +1,95 @@
+"""
+Consume el registro de cambios (empresa/cambios.py) y lo agrega a un
+archivo JSON Lines, un evento por línea, para que el almacén de BI cargue
+solo lo nuevo.
+
+El archivo manda sobre el cursor guardado: al arrancar se descarta una
+última línea incompleta (un corte a mitad de escritura) y se continúa
+desde el mayor id entre el archivo y el cursor confirmado. Cada lote se
+escribe y sincroniza a disco antes de confirmarlo, así que un corte en
+cualquier punto no pierde ni repite eventos en el archivo.
+"""
+
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresa import cambios, fragmentos
+from empresa.models import ConsumidorCambios
+
+
+def recuperar_archivo(ruta):
+    """Quita una última línea incompleta y devuelve el id del último evento escrito (0 si no hay)."""
+    if not os.path.exists(ruta):
+        return 0
+    with open(ruta, 'rb+') as archivo:
+        archivo.seek(0, os.SEEK_END)
+        tamano = archivo.tell()
+        # Se lee hacia atrás por bloques hasta encontrar la penúltima línea completa
+        fin, bloque, cola = tamano, 64 * 1024, b''
+        while fin > 0:
+            inicio = max(0, fin - bloque)
+            archivo.seek(inicio)
+            cola = archivo.read(fin - inicio) + cola
+            fin = inicio
+            if cola.count(b'\n') >= 2 or (fin == 0 and b'\n' in cola):
+                break
+        completa = cola.rfind(b'\n')
+        if completa == -1:
+            archivo.truncate(0)
+            return 0
+        if completa != len(cola) - 1:
+            archivo.truncate(fin + completa + 1)
+        ultima = cola[:completa].rsplit(b'\n', 1)[-1]
+        return json.loads(ultima)['id']
+
+
+def escribir_lote(ruta, eventos):
+    with open(ruta, 'a', encoding='utf-8') as archivo:
+        for evento in eventos:
+            archivo.write(json.dumps(evento, ensure_ascii=False, separators=(',', ':')) + '\n')
+        archivo.flush()
+        os.fsync(archivo.fileno())
+
+
+class Command(BaseCommand):
+    help = "Agrega a un archivo JSON Lines los eventos del registro de cambios que el consumidor aún no procesó."
+
+    def add_arguments(self, parser):
+        parser.add_argument('salida', help="Archivo .jsonl donde agregar los eventos")
+        parser.add_argument('--consumidor', default='almacen', help="Nombre con que se confirma el avance")
+        parser.add_argument('--lote', type=int, default=cambios.LIMITE, help="Eventos por lectura")
+        parser.add_argument('--seguir', action='store_true', help="No terminar: esperar eventos nuevos")
+        parser.add_argument('--intervalo', type=float, default=5, help="Segundos entre consultas con --seguir")
+        parser.add_argument('--compactar', action='store_true',
+                            help="Borrar los eventos que ya confirmaron todos los consumidores")
+
+    def handle(self, *args, **options):
+        if not cambios.disponible():
+            raise CommandError("El registro de cambios requiere SQLite.")
+        if fragmentos.activo():
+            raise CommandError("En modo fragmentado el registro de cambios solo ve la base principal.")
+        nombre, ruta = options['consumidor'], options['salida']
+        confirmado = ConsumidorCambios.objects.filter(nombre=nombre).values_list('cursor', flat=True).first() or 0
+        cursor = max(confirmado, recuperar_archivo(ruta))
+        cambios.confirmar(nombre, cursor)
+        self.stdout.write(f"Consumidor '{nombre}' desde el evento #{cursor}.")
+
+        total = 0
+        while True:
+            eventos = cambios.eventos_desde(cursor, options['lote'])
+            if eventos:
+                escribir_lote(ruta, eventos)
+                cursor = eventos[-1]['id']
+                cambios.confirmar(nombre, cursor)
+                total += len(eventos)
+                if options['compactar']:
+                    cambios.compactar()
+            if len(eventos) < options['lote']:
+                if not options['seguir']:
+                    break
+                time.sleep(options['intervalo'])
+
+        self.stdout.write(self.style.SUCCESS(f"{total} eventos agregados a {ruta}; confirmado hasta #{cursor}."))
@@ -0,0 +1,50 @@
+"""
+Prepara los fragmentos del modo fragmentado (ver empresa/fragmentos.py).
+
+Después de declarar los fragmentos en settings y migrarlos:
+
+    python manage.py migrate --database=mina_el_way
+    python manage.py fragmentar --mover
+
+Sin --mover solo reserva los bloques de ids y copia los datos maestros; con
+--maestros vuelve a copiar solo los maestros (después de una carga que no
+dispara signals).
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from empresa import fragmentos
+from empresa.models import Movimiento
+
+
+class Command(BaseCommand):
+    help = "Reserva los ids de cada fragmento, le copia los datos maestros y, con --mover, le traslada sus movimientos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--maestros', action='store_true', help="Solo volver a copiar los datos maestros")
+        parser.add_argument('--mover', action='store_true',
+                            help="Trasladar a cada fragmento los movimientos de sus proyectos que siguen en la base principal")
+        parser.add_argument('--lote', type=int, default=2000, help="Movimientos por lote al trasladar")
+
+    def handle(self, *args, **options):
+        if not fragmentos.activo():
+            raise CommandError("No hay fragmentos declarados en FRAGMENTOS_PROYECTO.")
+        for alias in fragmentos.fragmentos():
+            if alias not in connections.settings:
+                raise CommandError(f"El fragmento '{alias}' no está en DATABASES.")
+            if Movimiento._meta.db_table not in connections[alias].introspection.table_names():
+                raise CommandError(f"El fragmento '{alias}' no está migrado: migrate --database={alias}")
+
+        if not options['maestros']:
+            for alias in fragmentos.fragmentos():
+                fragmentos.reservar_ids(alias)
+                self.stdout.write(f"{alias}: ids desde {fragmentos.bloque(alias) * fragmentos.BLOQUE_IDS}.")
+        fragmentos.copiar_maestros()
+        self.stdout.write("Datos maestros copiados a los fragmentos.")
+
+        if options['mover'] and not options['maestros']:
+            for alias in fragmentos.fragmentos():
+                movimientos, viajes = fragmentos.mover(alias, options['lote'])
+                self.stdout.write(f"{alias}: {movimientos} movimientos y {viajes} viajes trasladados.")
+        self.stdout.write(self.style.SUCCESS("Fragmentos listos."))
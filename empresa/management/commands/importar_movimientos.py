@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresa.importacion import TAMANO_LOTE, escribir_informe_errores, importar_movimientos
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa movimientos históricos desde un archivo CSV o XLSX. Si la importación "
+        "se interrumpe, al volver a ejecutarla con el mismo archivo continúa donde quedó."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help="Ruta del archivo .csv o .xlsx")
+        parser.add_argument('--lote', type=int, default=TAMANO_LOTE, help="Filas por transacción")
+        parser.add_argument('--errores', help="Ruta del CSV donde escribir las filas rechazadas")
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        def progreso(importacion):
+            self.stdout.write(f"  {importacion.filas_procesadas} filas procesadas...")
+
+        try:
+            importacion = importar_movimientos(options['archivo'], tamano_lote=options['lote'], progreso=progreso)
+        except (OSError, ValueError) as exc:
+            raise CommandError(str(exc))
+        duracion = time.perf_counter() - inicio
+
+        if options['errores']:
+            with open(options['errores'], 'w', newline='', encoding='utf-8') as destino:
+                escribir_informe_errores(importacion, destino)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{importacion.filas_importadas} movimientos importados, {importacion.filas_con_error} filas con errores "
+            f"({importacion.filas_procesadas} filas en {duracion:.1f} s, "
+            f"{importacion.filas_procesadas / duracion if duracion else 0:.0f} filas/s en esta ejecución)."
+        ))
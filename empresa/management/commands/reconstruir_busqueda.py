@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from empresa.busqueda import TABLA, asegurar_indice, disponible, reconstruir_indice
+
+
+class Command(BaseCommand):
+    help = "Reconstruye el índice de búsqueda de texto completo (FTS5) de observaciones y descripciones."
+
+    def handle(self, *args, **options):
+        if not disponible():
+            raise CommandError("El índice de búsqueda requiere SQLite con FTS5.")
+        asegurar_indice()
+        reconstruir_indice()
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {TABLA}")
+            total = cursor.fetchone()[0]
+        self.stdout.write(self.style.SUCCESS(f"Índice reconstruido: {total} documentos."))
@@ -0,0 +1,60 @@
+"""
+Refresca la réplica de lectura de los reportes (ver empresa/replica.py).
+
+Desde cron, con --si-corresponde solo copia cuando la foto tiene más de
+REPLICA_INTERVALO_SEGUNDOS; o bien queda corriendo con --seguir:
+
+    * * * * * cd /srv/app && python manage.py refrescar_replica --si-corresponde
+    python manage.py refrescar_replica --seguir
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresa import replica
+
+
+class Command(BaseCommand):
+    help = "Copia la base principal a la réplica de lectura que usan los reportes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--si-corresponde', action='store_true',
+                            help="Refrescar solo si la foto es más antigua que REPLICA_INTERVALO_SEGUNDOS")
+        parser.add_argument('--seguir', action='store_true', help="No terminar: refrescar cada --intervalo segundos")
+        parser.add_argument('--intervalo', type=float, help="Segundos entre copias (por defecto REPLICA_INTERVALO_SEGUNDOS)")
+        parser.add_argument('--paginas', type=int, help="Páginas copiadas por paso")
+        parser.add_argument('--pausa', type=float, help="Segundos de pausa entre pasos")
+
+    def handle(self, *args, **options):
+        if not replica.configurada():
+            raise CommandError("No hay réplica de lectura configurada (REPLICA_ALIAS y DATABASES, sin fragmentos).")
+        intervalo = options['intervalo'] or replica.intervalo()
+        if intervalo >= replica.max_retraso():
+            self.stdout.write(self.style.WARNING(
+                f"El intervalo ({intervalo:.0f} s) no es menor que REPLICA_MAX_RETRASO_SEGUNDOS "
+                f"({replica.max_retraso()} s): entre copias los reportes leerán de la principal."
+            ))
+        while True:
+            edad = replica.antiguedad()
+            if options['si_corresponde'] and edad is not None and edad < intervalo:
+                self.stdout.write(f"La réplica tiene {edad:.0f} s; no se refresca.")
+            else:
+                self._refrescar(options)
+            if not options['seguir']:
+                break
+            time.sleep(intervalo)
+
+    def _refrescar(self, options):
+        try:
+            resultado = replica.refrescar(paginas=options['paginas'], pausa=options['pausa'])
+        except ValueError as exc:
+            if not options['seguir']:
+                raise CommandError(str(exc))
+            # Con --seguir se reintenta en la próxima vuelta; mientras, los reportes leen de la principal
+            self.stdout.write(self.style.WARNING(f"No se pudo refrescar la réplica: {exc}"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Réplica {resultado['ruta']} refrescada: {resultado['bytes'] / 1024 / 1024:.1f} MB en "
+            f"{resultado['duracion_copia']:.1f} s (paso más largo {resultado['paso_mas_largo'] * 1000:.1f} ms)."
+        ))
@@ -0,0 +1,76 @@
+"""
+Envía a la oficina central los cambios de este sitio (ver empresa/replicacion.py).
+
+Cada ejecución agrupa los cambios nuevos en conjuntos y envía los
+pendientes en orden. Si el enlace está caído los conjuntos quedan
+guardados y se envían en la próxima ejecución; con --seguir el comando
+queda reintentando. La primera vez se usa --inicial para enviar lo que el
+sitio ya tenía:
+
+    python manage.py replicar --inicial
+    python manage.py replicar --seguir
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresa import cambios, fragmentos, replicacion
+from empresa.models import ConjuntoReplicacion
+
+
+class Command(BaseCommand):
+    help = "Agrupa los cambios de este sitio en conjuntos comprimidos y los envía a la oficina central."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--central', help="URL de la central (por defecto REPLICACION_CENTRAL_URL)")
+        parser.add_argument('--token', help="Token de la central (por defecto REPLICACION_TOKEN)")
+        parser.add_argument('--lote', type=int, default=replicacion.LOTE, help="Eventos por conjunto")
+        parser.add_argument('--inicial', action='store_true',
+                            help="Encolar antes todas las filas actuales (primera replicación del sitio)")
+        parser.add_argument('--sin-envio', action='store_true', help="Solo preparar los conjuntos, sin enviarlos")
+        parser.add_argument('--seguir', action='store_true', help="No terminar: seguir preparando y enviando")
+        parser.add_argument('--intervalo', type=float, default=10, help="Segundos entre rondas con --seguir")
+
+    def handle(self, *args, **options):
+        if not cambios.disponible():
+            raise CommandError("La replicación requiere el registro de cambios de SQLite.")
+        if fragmentos.activo():
+            raise CommandError("La replicación no funciona en modo fragmentado: el registro de cambios solo ve la base principal.")
+        try:
+            if options['inicial']:
+                creados = replicacion.encolar_estado_actual(options['lote'])
+                self.stdout.write(f"Carga inicial: {creados} conjuntos encolados.")
+            while True:
+                self._ronda(options)
+                if not options['seguir']:
+                    break
+                time.sleep(options['intervalo'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+    def _ronda(self, options):
+        leidos = 0
+        while True:
+            cantidad = replicacion.preparar_conjunto(options['lote'])
+            leidos += cantidad
+            if cantidad < options['lote']:
+                break
+        pendientes = ConjuntoReplicacion.objects.filter(enviado_en__isnull=True).count()
+        if leidos:
+            self.stdout.write(f"{leidos} cambios leídos; {pendientes} conjuntos por enviar.")
+        if options['sin_envio'] or not pendientes:
+            return
+        try:
+            resumen = replicacion.enviar_pendientes(url=options['central'], token=options['token'])
+        except OSError as exc:
+            # Sin enlace: los conjuntos quedan guardados para la próxima ronda
+            self.stdout.write(self.style.WARNING(f"No se pudo contactar a la central: {exc}"))
+            if not options['seguir']:
+                raise CommandError(f"Quedan {pendientes} conjuntos por enviar.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"{resumen['enviados']} conjuntos enviados ({resumen['duplicados']} ya estaban en la central): "
+            f"{resumen['aplicados']} cambios aplicados, {resumen['conflictos']} conflictos."
+        ))
+        replicacion.purgar_enviados()
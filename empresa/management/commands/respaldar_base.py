@@ -0,0 +1,59 @@
+"""
+Respalda la base de datos en línea (ver empresa/respaldo.py).
+
+Para programarlo basta una entrada de cron que lo llame seguido con
+--si-corresponde; solo respalda cuando el último respaldo tiene más de
+RESPALDO_INTERVALO_HORAS:
+
+    */15 * * * * cd /srv/app && python manage.py respaldar_base --si-corresponde
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from empresa import respaldo
+
+
+class Command(BaseCommand):
+    help = "Respalda la base SQLite sin detener las escrituras, verifica la copia y rota los respaldos antiguos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--si-corresponde', action='store_true',
+                            help="Respaldar solo si el último respaldo es más antiguo que RESPALDO_INTERVALO_HORAS")
+        parser.add_argument('--wal', action='store_true',
+                            help="Pasar antes la base a modo WAL (persistente) para que la copia no se reinicie con las escrituras")
+        parser.add_argument('--paginas', type=int, help="Páginas copiadas por paso")
+        parser.add_argument('--pausa', type=float, help="Segundos de pausa entre pasos")
+        parser.add_argument('--retener', type=int, help="Cantidad de respaldos a conservar (0 no borra ninguno)")
+        parser.add_argument('--verificacion-rapida', action='store_true',
+                            help="Verificar con quick_check en vez de integrity_check")
+
+    def handle(self, *args, **options):
+        if options['si_corresponde'] and not respaldo.respaldo_pendiente():
+            self.stdout.write("El último respaldo está vigente; no se respalda.")
+            return
+        if not respaldo.disponible():
+            raise CommandError("El respaldo en línea requiere SQLite.")
+        if options['wal']:
+            self.stdout.write(f"Modo del diario: {respaldo.activar_wal()}")
+        try:
+            resultado = respaldo.respaldar(
+                paginas=options['paginas'], pausa=options['pausa'], retener=options['retener'],
+                verificacion_rapida=options['verificacion_rapida'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Respaldo en {resultado['ruta']}: {resultado['bytes'] / 1024 / 1024:.1f} MB en {resultado['duracion']:.1f} s "
+            f"(copia {resultado['duracion_copia']:.1f} s, {resultado['bytes_por_segundo'] / 1024 / 1024:.1f} MB/s), verificado."
+        ))
+        self.stdout.write(
+            f"  Diario {resultado['modo_diario']}: {resultado['pasos']} pasos de {resultado['paginas_por_paso']} páginas; paso más largo "
+            f"{resultado['paso_mas_largo'] * 1000:.1f} ms; {resultado['reinicios']} reinicios por escrituras concurrentes."
+        )
+        if resultado['reinicios'] and resultado['modo_diario'] != 'wal':
+            self.stdout.write(self.style.WARNING(
+                "  Las escrituras reiniciaron la copia; con --wal la copia no se reinicia ni bloquea escrituras."
+            ))
+        for ruta in resultado['rotados']:
+            self.stdout.write(f"  Respaldo antiguo eliminado: {ruta.name}")
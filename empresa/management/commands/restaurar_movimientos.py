@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from empresa import archivo
+
+
+class Command(BaseCommand):
+    help = "Devuelve a las tablas vivas los movimientos y viajes archivados de un año."
+
+    def add_arguments(self, parser):
+        parser.add_argument('anio', type=int)
+
+    def handle(self, *args, **options):
+        anio = options['anio']
+        if anio not in archivo.anios_archivados():
+            raise CommandError(f"El año {anio} no está archivado.")
+        try:
+            movimientos, viajes, descartados = archivo.restaurar(anio)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"{anio}: {movimientos} movimientos y {viajes} viajes restaurados."))
+        if descartados:
+            self.stdout.write(self.style.WARNING(f"{descartados} viajes descartados porque su postura ya no existe."))
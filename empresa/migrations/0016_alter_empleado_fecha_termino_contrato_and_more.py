@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0015_trabajoinformepdf'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='empleado',
+            name='fecha_termino_contrato',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='empleado',
+            name='fecha_vencimiento_licencia',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+    ]
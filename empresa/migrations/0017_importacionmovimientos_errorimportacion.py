@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0016_alter_empleado_fecha_termino_contrato_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacionMovimientos',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+                ('nombre_archivo', models.CharField(max_length=255)),
+                ('huella', models.CharField(help_text='SHA-256 del archivo importado', max_length=64, unique=True)),
+                ('estado', models.CharField(choices=[('en_proceso', 'En Proceso'), ('completada', 'Completada'), ('error', 'Error')], default='en_proceso', max_length=20)),
+                ('filas_procesadas', models.PositiveIntegerField(default=0)),
+                ('filas_importadas', models.PositiveIntegerField(default=0)),
+                ('filas_con_error', models.PositiveIntegerField(default=0)),
+                ('mensaje_error', models.TextField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ErrorImportacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fila', models.PositiveIntegerField(help_text='Número de fila en el archivo, contando el encabezado como fila 1')),
+                ('mensajes', models.TextField()),
+                ('importacion', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='errores', to='empresa.importacionmovimientos')),
+            ],
+            options={
+                'ordering': ['importacion', 'fila'],
+            },
+        ),
+    ]
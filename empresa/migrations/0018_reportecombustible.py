@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0017_importacionmovimientos_errorimportacion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReporteCombustible',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('generado_en', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('fecha_desde', models.DateField(blank=True, null=True)),
+                ('fecha_hasta', models.DateField(blank=True, null=True)),
+                ('movimientos_analizados', models.PositiveIntegerField(default=0)),
+                ('segundos', models.FloatField(default=0)),
+                ('datos', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['-generado_en'],
+            },
+        ),
+    ]
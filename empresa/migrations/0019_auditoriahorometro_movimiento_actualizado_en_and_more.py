@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0018_reportecombustible'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditoriaHorometro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('iniciada_en', models.DateTimeField()),
+                ('terminada_en', models.DateTimeField(blank=True, null=True)),
+                ('modo', models.CharField(choices=[('completa', 'Completa'), ('incremental', 'Incremental')], max_length=20)),
+                ('maquinas_revisadas', models.PositiveIntegerField(default=0)),
+                ('movimientos_revisados', models.PositiveIntegerField(default=0)),
+                ('hallazgos', models.PositiveIntegerField(default=0)),
+                ('conteos', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ['-iniciada_en'],
+            },
+        ),
+        migrations.AddField(
+            model_name='movimiento',
+            name='actualizado_en',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='HallazgoHorometro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('lectura_invalida', 'Horómetro final menor o igual al inicial'), ('sin_lectura_final', 'Falta el horómetro final'), ('retroceso', 'Horómetro inicial menor al inicio anterior'), ('superposicion', 'Se superpone con el movimiento anterior'), ('brecha', 'Minutos sin registrar desde el movimiento anterior'), ('salto_improbable', 'Salto mayor al tiempo transcurrido')], db_index=True, max_length=20)),
+                ('diferencia_minutos', models.IntegerField(blank=True, null=True)),
+                ('fecha', models.DateField(db_index=True)),
+                ('detectado_en', models.DateTimeField(auto_now_add=True)),
+                ('maquinaria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hallazgos_horometro', to='empresa.maquinaria')),
+                ('movimiento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hallazgos_horometro', to='empresa.movimiento')),
+                ('movimiento_anterior', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='empresa.movimiento')),
+            ],
+            options={
+                'ordering': ['-fecha', 'maquinaria'],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:11
+
+import django.db.models.deletion
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fusionar_intervalos(intervalos):
+    # Copia de empresa.utilizacion.fusionar_intervalos tal como era al crear la
+    # migración: las migraciones no deben importar el código de la aplicación
+    minutos = defaultdict(int)
+    cubierto_hasta = None
+    for inicio, fin, proyecto in sorted(intervalos):
+        if cubierto_hasta is not None and inicio < cubierto_hasta:
+            inicio = cubierto_hasta
+        if fin > inicio:
+            minutos[proyecto] += fin - inicio
+            cubierto_hasta = fin
+    return dict(minutos)
+
+
+def calcular_utilizacion(apps, schema_editor):
+    Movimiento = apps.get_model('empresa', 'Movimiento')
+    UtilizacionDiaria = apps.get_model('empresa', 'UtilizacionDiaria')
+    por_dia, conteos = defaultdict(list), defaultdict(int)
+    for maquinaria_id, fecha, proyecto, inicial, final in Movimiento.objects.filter(
+        maquinaria__isnull=False
+    ).values_list('maquinaria_id', 'fecha', 'proyecto', 'horometro_inicial', 'horometro_final').iterator():
+        conteos[(maquinaria_id, fecha, proyecto)] += 1
+        if final is not None and final > inicial:
+            por_dia[(maquinaria_id, fecha)].append((inicial, final, proyecto))
+    minutos = {}
+    for (maquinaria_id, fecha), intervalos in por_dia.items():
+        for proyecto, total in fusionar_intervalos(intervalos).items():
+            minutos[(maquinaria_id, fecha, proyecto)] = total
+    UtilizacionDiaria.objects.bulk_create([
+        UtilizacionDiaria(maquinaria_id=m, fecha=f, proyecto=p, minutos_trabajados=minutos.get((m, f, p), 0), movimientos=n)
+        for (m, f, p), n in conteos.items()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0019_auditoriahorometro_movimiento_actualizado_en_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UtilizacionDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(db_index=True)),
+                ('proyecto', models.CharField(choices=[('Mina El Way', 'Mina El Way'), ('Mina Juana', 'Mina Juana'), ('Mina Paty', 'Mina Paty'), ('CBB Fábrica', 'CBB Fábrica')], max_length=50)),
+                ('minutos_trabajados', models.PositiveIntegerField(default=0)),
+                ('movimientos', models.PositiveIntegerField(default=0)),
+                ('maquinaria', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='utilizacion_diaria', to='empresa.maquinaria')),
+            ],
+            options={
+                'unique_together': {('maquinaria', 'fecha', 'proyecto')},
+            },
+        ),
+        migrations.RunPython(calcular_utilizacion, migrations.RunPython.noop),
+    ]
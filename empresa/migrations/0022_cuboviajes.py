@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def calcular_cubo(apps, schema_editor):
+    Viaje = apps.get_model('empresa', 'Viaje')
+    CuboViajes = apps.get_model('empresa', 'CuboViajes')
+    CuboViajes.objects.bulk_create([
+        CuboViajes(
+            fecha=fila['postura__informe__fecha'], mes=fila['postura__informe__fecha'].replace(day=1),
+            turno=fila['postura__informe__turno'],
+            material=fila['postura__material'], origen=fila['postura__origen'], destino=fila['postura__destino'],
+            tipo_actividad=fila['postura__tipo_actividad'], maquinaria_id=fila['movimiento__maquinaria_id'],
+            viajes=fila['total'], registros=fila['registros'],
+        )
+        for fila in Viaje.objects.filter(cantidad__gt=0).values(
+            'postura__informe__fecha', 'postura__informe__turno', 'postura__material', 'postura__origen',
+            'postura__destino', 'postura__tipo_actividad', 'movimiento__maquinaria_id',
+        ).annotate(total=Sum('cantidad'), registros=Count('id')).order_by()
+    ], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0021_movimiento_movimiento_fecha_turno_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CuboViajes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(db_index=True)),
+                ('mes', models.DateField(db_index=True)),
+                ('turno', models.CharField(choices=[('Día', 'Turno Día'), ('Noche', 'Turno Noche'), ('Horas Extras', 'Horas Extras'), ('Trabajo Especial', 'Trabajo Especial')], max_length=20)),
+                ('material', models.CharField(choices=[('Cal Alta Ley', 'Cal tronada Alta Ley'), ('Cal Normal', 'Cal tronada Normal'), ('Cal Cemento', 'Cal tronada Cemento o Baja Ley'), ('Fino', 'Fino'), ('Fino Ecometales', 'Fino Ecometales'), ('Fino Bitumix', 'Fino Bitumix'), ('Estéril', 'Estéril'), ('Descarte', 'Materiales de Descarte'), ('Cal 15-50 AL', 'Cal 15-50 mm Alta Ley'), ('Cal 15-50 N', 'Cal 15-50 mm Normal'), ('Cal 6-15 AL', 'Cal 6-15 mm Alta Ley'), ('Cal 6-15 N', 'Cal 6-15 mm Normal'), ('Cemento', 'Cemento')], max_length=50)),
+                ('origen', models.CharField(choices=[('TA', 'Mina Sector Tableado (TA)'), ('LA', 'Mina Sector Lagarto (LA)'), ('LA_C', 'Mina Sector Lagarto/Cedro (LA)'), ('LA_E', 'Mina Sector Lagarto/Camino Emergencia (LA)'), ('LA_M', 'Mina Sector Mastodonte (LA)'), ('PCH', 'Planta Chancado (PCH)'), ('BA', 'Buzón Alimentación (BA)'), ('BF', 'Buzón de Fino (BF)'), ('BTN', 'Botadero Norte (BTN)'), ('BTS', 'Botadero Sur (BTS)'), ('BE', 'Botadero Ecometales (BE)'), ('CS', 'Canchas de Stock (CS)'), ('CBBF', 'Fábrica (CBBF)')], max_length=50)),
+                ('destino', models.CharField(choices=[('TA', 'Mina Sector Tableado (TA)'), ('LA', 'Mina Sector Lagarto (LA)'), ('LA_C', 'Mina Sector Lagarto/Cedro (LA)'), ('LA_E', 'Mina Sector Lagarto/Camino Emergencia (LA)'), ('LA_M', 'Mina Sector Mastodonte (LA)'), ('PCH', 'Planta Chancado (PCH)'), ('BA', 'Buzón Alimentación (BA)'), ('BF', 'Buzón de Fino (BF)'), ('BTN', 'Botadero Norte (BTN)'), ('BTS', 'Botadero Sur (BTS)'), ('BE', 'Botadero Ecometales (BE)'), ('CS', 'Canchas de Stock (CS)'), ('CBBF', 'Fábrica (CBBF)')], max_length=50)),
+                ('tipo_actividad', models.CharField(choices=[('Producción', 'Producción'), ('Confinamiento', 'Confinamiento'), ('Remanejo', 'Remanejo'), ('Arriendo', 'Arriendo'), ('Despacho', 'Despacho'), ('Limpieza', 'Limpieza'), ('Apoyo Mina', 'Apoyo Mina')], max_length=50)),
+                ('viajes', models.PositiveIntegerField(default=0)),
+                ('registros', models.PositiveIntegerField(default=0, help_text='Cantidad de filas de Viaje sumadas')),
+                ('maquinaria', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='empresa.maquinaria')),
+            ],
+            options={
+                'unique_together': {('fecha', 'turno', 'material', 'origen', 'destino', 'tipo_actividad', 'maquinaria')},
+            },
+        ),
+        migrations.RunPython(calcular_cubo, migrations.RunPython.noop),
+    ]
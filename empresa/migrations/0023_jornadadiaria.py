@@ -0,0 +1,107 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:11
+
+import django.db.models.deletion
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Copia del cálculo de empresa.jornada tal como era al crear la migración:
+# las migraciones no deben importar el código de la aplicación.
+
+COLUMNAS = ['empleado_id', 'fecha', 'turno', 'horas_trabajadas']
+HORARIOS_TURNO = {'Día': (8, 12), 'Noche': (20, 12)}
+VENTANA = timedelta(days=7)
+
+
+def _horas(delta):
+    return Decimal(delta.total_seconds() / 3600).quantize(Decimal('0.01'))
+
+
+def _intervalos(fecha, turnos, horarios):
+    resultado = []
+    for turno in turnos:
+        if turno in horarios:
+            hora, duracion = horarios[turno]
+            inicio = datetime.combine(fecha, datetime.min.time()) + timedelta(hours=hora)
+            resultado.append((inicio, inicio + timedelta(hours=duracion)))
+    return sorted(resultado)
+
+
+def sumar_dias(movimientos):
+    dias = defaultdict(lambda: [Decimal(0), set(), 0])
+    for empleado_id, fecha, turno, horas in movimientos:
+        dia = dias[(empleado_id, fecha)]
+        dia[0] += horas or 0
+        dia[1].add(turno)
+        dia[2] += 1
+    return dias
+
+
+def completar_ventanas(dias):
+    horarios = getattr(settings, 'JORNADA_HORARIOS_TURNO', HORARIOS_TURNO)
+    resultado = {}
+    inicio_ventana, suma, fin_anterior = 0, Decimal(0), None
+    for fecha, horas, turnos in dias:
+        suma += horas
+        while dias[inicio_ventana][0] <= fecha - VENTANA:
+            suma -= dias[inicio_ventana][1]
+            inicio_ventana += 1
+        descanso = None
+        for inicio, fin in _intervalos(fecha, turnos, horarios):
+            if fin_anterior is not None and inicio - fin_anterior <= VENTANA:
+                hueco = max(_horas(inicio - fin_anterior), Decimal(0))
+                descanso = hueco if descanso is None else min(descanso, hueco)
+            fin_anterior = fin if fin_anterior is None else max(fin_anterior, fin)
+        resultado[fecha] = (suma, descanso)
+    return resultado
+
+
+def calcular_jornadas(apps, schema_editor):
+    Movimiento = apps.get_model('empresa', 'Movimiento')
+    JornadaDiaria = apps.get_model('empresa', 'JornadaDiaria')
+    por_empleado = defaultdict(list)
+    dias = sumar_dias(Movimiento.objects.filter(empleado__isnull=False).values_list(*COLUMNAS).iterator())
+    for (empleado_id, fecha), (horas, turnos, movimientos) in dias.items():
+        por_empleado[empleado_id].append((fecha, horas, turnos, movimientos))
+    filas = []
+    for empleado_id, dias_empleado in por_empleado.items():
+        dias_empleado.sort()
+        ventanas = completar_ventanas([(fecha, horas, turnos) for fecha, horas, turnos, _ in dias_empleado])
+        filas += [
+            JornadaDiaria(
+                empleado_id=empleado_id, fecha=fecha, horas=horas, turnos=','.join(sorted(turnos)),
+                movimientos=movimientos, horas_7_dias=ventanas[fecha][0], descanso_previo=ventanas[fecha][1],
+            )
+            for fecha, horas, turnos, movimientos in dias_empleado
+        ]
+    JornadaDiaria.objects.bulk_create(filas, batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0022_cuboviajes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JornadaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(db_index=True)),
+                ('horas', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('turnos', models.CharField(blank=True, help_text='Turnos trabajados, separados por coma', max_length=100)),
+                ('movimientos', models.PositiveIntegerField(default=0)),
+                ('horas_7_dias', models.DecimalField(decimal_places=2, default=0, help_text='Horas de este día y los 6 anteriores', max_digits=10)),
+                ('descanso_previo', models.DecimalField(blank=True, decimal_places=2, help_text='Menor descanso, en horas, antes de los turnos con horario del día (vacío si no hubo turnos en los 7 días anteriores)', max_digits=6, null=True)),
+                ('empleado', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jornadas', to='empresa.empleado')),
+            ],
+            options={
+                'unique_together': {('empleado', 'fecha')},
+            },
+        ),
+        migrations.RunPython(calcular_jornadas, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:02
+
+import csv
+import sys
+import django.db.models.expressions
+import django.db.models.functions.math
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def reportar_horas_inconsistentes(apps, schema_editor):
+    """
+    Antes de reemplazar horas_trabajadas por la columna generada, deja en
+    un CSV los movimientos cuyo valor guardado no coincide con los
+    horómetros (el valor nuevo sale siempre de los horómetros). Ese CSV es
+    la única copia de los valores anteriores.
+    """
+    Movimiento = apps.get_model('empresa', 'Movimiento')
+    inconsistentes = []
+    for id_, fecha, maquinaria_id, inicial, final, guardadas in Movimiento.objects.order_by('id').values_list(
+        'id', 'fecha', 'maquinaria_id', 'horometro_inicial', 'horometro_final', 'horas_trabajadas'
+    ).iterator(chunk_size=5000):
+        calculadas = round(Decimal(final - inicial) / 60, 2) if final is not None else None
+        if guardadas != calculadas:
+            inconsistentes.append((id_, fecha, maquinaria_id, inicial, final, guardadas, calculadas))
+    if not inconsistentes:
+        return
+
+    # Fuera del código: MIGRACION_REPORTES_DIR o, si no está, el directorio de respaldos
+    directorio = Path(getattr(settings, 'MIGRACION_REPORTES_DIR',
+                              getattr(settings, 'RESPALDO_DIR', settings.BASE_DIR / 'respaldos')))
+    directorio.mkdir(parents=True, exist_ok=True)
+    ruta = directorio / f"inconsistencias_horas_trabajadas_{datetime.now():%Y%m%d_%H%M%S_%f}.csv"
+    with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(['id', 'fecha', 'maquinaria_id', 'horometro_inicial', 'horometro_final',
+                           'horas_guardadas', 'horas_calculadas'])
+        escritor.writerows(inconsistentes)
+    sys.stdout.write(
+        f"\n  ATENCIÓN: {len(inconsistentes)} movimientos con horas_trabajadas distintas a los horómetros.\n"
+        f"  Esta migración reemplaza esos valores por los calculados; {ruta} es la ÚNICA copia\n"
+        f"  de los valores anteriores de horas_trabajadas. Guárdelo antes de borrar ese directorio.\n"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0023_jornadadiaria'),
+    ]
+
+    operations = [
+        migrations.RunPython(reportar_horas_inconsistentes, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='movimiento',
+            name='horas_trabajadas',
+        ),
+        migrations.AddField(
+            model_name='movimiento',
+            name='horas_trabajadas',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('horometro_final'), '-', models.F('horometro_inicial')), '/', models.Value(60.0)), 2, output_field=models.DecimalField()), output_field=models.DecimalField(decimal_places=2, max_digits=9, null=True)),
+        ),
+        migrations.AddField(
+            model_name='movimiento',
+            name='litros_por_hora',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=models.Case(models.When(horometro_final__gt=models.F('horometro_inicial'), then=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('combustible_cargado'), '*', models.Value(60.0)), '/', django.db.models.expressions.CombinedExpression(models.F('horometro_final'), '-', models.F('horometro_inicial'))), 2, output_field=models.DecimalField()))), output_field=models.DecimalField(decimal_places=2, max_digits=9, null=True)),
+        ),
+        migrations.AddField(
+            model_name='movimiento',
+            name='variacion_nivel_combustible',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=django.db.models.expressions.CombinedExpression(models.Case(models.When(nivel_final_combustible='vacio', then=models.Value(0)), models.When(nivel_final_combustible='alarma', then=models.Value(1)), models.When(nivel_final_combustible='un_cuarto', then=models.Value(2)), models.When(nivel_final_combustible='medio', then=models.Value(3)), models.When(nivel_final_combustible='tres_cuartos', then=models.Value(4)), models.When(nivel_final_combustible='full', then=models.Value(5))), '-', models.Case(models.When(nivel_inicial_combustible='vacio', then=models.Value(0)), models.When(nivel_inicial_combustible='alarma', then=models.Value(1)), models.When(nivel_inicial_combustible='un_cuarto', then=models.Value(2)), models.When(nivel_inicial_combustible='medio', then=models.Value(3)), models.When(nivel_inicial_combustible='tres_cuartos', then=models.Value(4)), models.When(nivel_inicial_combustible='full', then=models.Value(5)))), output_field=models.SmallIntegerField(null=True)),
+        ),
+    ]
@@ -0,0 +1,165 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:36
+
+import csv
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import empresa.models
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Case, Value, When
+
+# Modelo -> campos que pasan de texto a código (posición de la opción en choices)
+CAMPOS = {
+    'movimiento': ['proyecto', 'turno', 'origen_combustible', 'nivel_inicial_combustible', 'nivel_final_combustible'],
+    'postura': ['tipo_actividad', 'origen', 'destino', 'material'],
+}
+
+# Valores guardados con opciones que ya no existen -> opción que los reemplaza.
+# 'Cal 6-15' se dividió en Alta Ley y Normal; sin más datos queda como Normal.
+# Se amplía o corrige con MIGRACION_VALORES_ANTERIORES, con la misma forma:
+#     MIGRACION_VALORES_ANTERIORES = {'postura.material': {'Cal 6-15': 'Cal 6-15 AL'}}
+VALORES_ANTERIORES = {
+    'postura.material': {'Cal 6-15': 'Cal 6-15 N'},
+}
+
+# Tabla de búsqueda tal como eran al crear la migración (ver
+# empresa/busqueda.py): las migraciones no deben importar el código de la aplicación
+TABLA_BUSQUEDA = 'empresa_busqueda'
+
+
+def _valores_anteriores(nombre, campo):
+    reemplazos = dict(VALORES_ANTERIORES.get(f'{nombre}.{campo}', {}))
+    reemplazos.update(getattr(settings, 'MIGRACION_VALORES_ANTERIORES', {}).get(f'{nombre}.{campo}', {}))
+    return reemplazos
+
+
+def _reemplazar_desconocidos(Modelo, nombre, campo, valores):
+    """
+    Pasa los valores fuera de las opciones a la opción indicada en
+    VALORES_ANTERIORES o, si no hay, al valor por defecto del campo (o NULL).
+    Devuelve las filas cambiadas para el reporte.
+    """
+    field = Modelo._meta.get_field(campo)
+    reemplazos = _valores_anteriores(nombre, campo)
+    invalidos = {anterior: nuevo for anterior, nuevo in reemplazos.items() if nuevo not in valores}
+    if invalidos:
+        raise ValueError(f"MIGRACION_VALORES_ANTERIORES: {nombre}.{campo} apunta a valores que no son opciones: {invalidos}")
+    por_defecto = field.get_default() if field.has_default() else None
+
+    cambiadas = []
+    filas = (Modelo.objects.exclude(**{f'{campo}__in': valores + ['']}).exclude(**{f'{campo}__isnull': True})
+             .order_by('id').values_list('id', campo))
+    for id_, valor in filas:
+        nuevo = reemplazos.get(valor, por_defecto)
+        if nuevo is None and not field.null:
+            raise ValueError(
+                f"{nombre}.{campo} tiene el valor '{valor}' fuera de las opciones y el campo no tiene valor "
+                f"por defecto: indique su reemplazo en MIGRACION_VALORES_ANTERIORES['{nombre}.{campo}']."
+            )
+        cambiadas.append((nombre, campo, id_, valor, nuevo))
+    for anterior in {valor for _, _, _, valor, _ in cambiadas}:
+        Modelo.objects.filter(**{campo: anterior}).update(**{campo: reemplazos.get(anterior, por_defecto)})
+    return cambiadas
+
+
+def _reportar_reemplazos(cambiadas):
+    # Mismo directorio que el reporte de la 0024: fuera del código
+    directorio = Path(getattr(settings, 'MIGRACION_REPORTES_DIR',
+                              getattr(settings, 'RESPALDO_DIR', settings.BASE_DIR / 'respaldos')))
+    directorio.mkdir(parents=True, exist_ok=True)
+    ruta = directorio / f"valores_fuera_de_opciones_{datetime.now():%Y%m%d_%H%M%S_%f}.csv"
+    with open(ruta, 'w', newline='', encoding='utf-8') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(['modelo', 'campo', 'id', 'valor_anterior', 'valor_nuevo'])
+        escritor.writerows(cambiadas)
+    sys.stdout.write(
+        f"\n  ATENCIÓN: {len(cambiadas)} valores fuera de las opciones se reemplazaron antes de codificar.\n"
+        f"  {ruta} es la ÚNICA copia de los valores anteriores. Guárdelo antes de borrar ese directorio.\n"
+    )
+
+
+def _convertir(apps, schema_editor, a_codigo):
+    if schema_editor.connection.vendor == 'sqlite':
+        # El UPDATE masivo reindexaría cada fila en la búsqueda; el trigger
+        # se vuelve a crear en post_migrate (ver apps.py)
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {TABLA_BUSQUEDA}_movimiento_au')
+    cambiadas = []
+    for nombre, campos in CAMPOS.items():
+        Modelo = apps.get_model('empresa', nombre)
+        cambios = {}
+        for campo in campos:
+            valores = [valor for valor, _ in Modelo._meta.get_field(campo).flatchoices]
+            codigos = [str(codigo) for codigo in range(len(valores))]
+            if a_codigo:
+                cambiadas += _reemplazar_desconocidos(Modelo, nombre, campo, valores)
+            origen, destino = (valores, codigos) if a_codigo else (codigos, valores)
+            cambios[campo] = Case(*[When(**{campo: o}, then=Value(d)) for o, d in zip(origen, destino)], default=Value(None))
+        Modelo.objects.update(**cambios)
+    if cambiadas:
+        _reportar_reemplazos(cambiadas)
+
+
+def codificar_opciones(apps, schema_editor):
+    _convertir(apps, schema_editor, True)
+
+
+def decodificar_opciones(apps, schema_editor):
+    _convertir(apps, schema_editor, False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0024_movimiento_columnas_generadas'),
+    ]
+
+    operations = [
+        migrations.RunPython(codificar_opciones, decodificar_opciones),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='nivel_final_combustible',
+            field=empresa.models.CampoCodificado(choices=[('vacio', 'Vacío'), ('alarma', 'Alarma Nivel Bajo'), ('un_cuarto', '1/4 Estanque'), ('medio', '1/2 Estanque'), ('tres_cuartos', '3/4 Estanque'), ('full', 'Estanque Full')], default='vacio'),
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='nivel_inicial_combustible',
+            field=empresa.models.CampoCodificado(blank=True, choices=[('vacio', 'Vacío'), ('alarma', 'Alarma Nivel Bajo'), ('un_cuarto', '1/4 Estanque'), ('medio', '1/2 Estanque'), ('tres_cuartos', '3/4 Estanque'), ('full', 'Estanque Full')], null=True),
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='origen_combustible',
+            field=empresa.models.CampoCodificado(blank=True, choices=[('Estación Copec con Chip del Equipo', 'Estación Copec con Chip del Equipo'), ('Estación Copec con Chip de otro Equipo', 'Estación Copec con Chip de otro Equipo'), ('Con Camión Combustible', 'Con Camión Combustible'), ('Carga Manual Con Bidones', 'Carga Manual Con Bidones')], null=True),
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='proyecto',
+            field=empresa.models.CampoCodificado(choices=[('Mina El Way', 'Mina El Way'), ('Mina Juana', 'Mina Juana'), ('Mina Paty', 'Mina Paty'), ('CBB Fábrica', 'CBB Fábrica')], default='Mina El Way'),
+        ),
+        migrations.AlterField(
+            model_name='movimiento',
+            name='turno',
+            field=empresa.models.CampoCodificado(choices=[('Día', 'Turno Día'), ('Noche', 'Turno Noche'), ('Horas Extras', 'Horas Extras'), ('Trabajo Especial', 'Trabajo Especial')], default='Día'),
+        ),
+        migrations.AlterField(
+            model_name='postura',
+            name='destino',
+            field=empresa.models.CampoCodificado(choices=[('TA', 'Mina Sector Tableado (TA)'), ('LA', 'Mina Sector Lagarto (LA)'), ('LA_C', 'Mina Sector Lagarto/Cedro (LA)'), ('LA_E', 'Mina Sector Lagarto/Camino Emergencia (LA)'), ('LA_M', 'Mina Sector Mastodonte (LA)'), ('PCH', 'Planta Chancado (PCH)'), ('BA', 'Buzón Alimentación (BA)'), ('BF', 'Buzón de Fino (BF)'), ('BTN', 'Botadero Norte (BTN)'), ('BTS', 'Botadero Sur (BTS)'), ('BE', 'Botadero Ecometales (BE)'), ('CS', 'Canchas de Stock (CS)'), ('CBBF', 'Fábrica (CBBF)')], default='PCH'),
+        ),
+        migrations.AlterField(
+            model_name='postura',
+            name='material',
+            field=empresa.models.CampoCodificado(choices=[('Cal Alta Ley', 'Cal tronada Alta Ley'), ('Cal Normal', 'Cal tronada Normal'), ('Cal Cemento', 'Cal tronada Cemento o Baja Ley'), ('Fino', 'Fino'), ('Fino Ecometales', 'Fino Ecometales'), ('Fino Bitumix', 'Fino Bitumix'), ('Estéril', 'Estéril'), ('Descarte', 'Materiales de Descarte'), ('Cal 15-50 AL', 'Cal 15-50 mm Alta Ley'), ('Cal 15-50 N', 'Cal 15-50 mm Normal'), ('Cal 6-15 AL', 'Cal 6-15 mm Alta Ley'), ('Cal 6-15 N', 'Cal 6-15 mm Normal'), ('Cemento', 'Cemento')], default='Estéril'),
+        ),
+        migrations.AlterField(
+            model_name='postura',
+            name='origen',
+            field=empresa.models.CampoCodificado(choices=[('TA', 'Mina Sector Tableado (TA)'), ('LA', 'Mina Sector Lagarto (LA)'), ('LA_C', 'Mina Sector Lagarto/Cedro (LA)'), ('LA_E', 'Mina Sector Lagarto/Camino Emergencia (LA)'), ('LA_M', 'Mina Sector Mastodonte (LA)'), ('PCH', 'Planta Chancado (PCH)'), ('BA', 'Buzón Alimentación (BA)'), ('BF', 'Buzón de Fino (BF)'), ('BTN', 'Botadero Norte (BTN)'), ('BTS', 'Botadero Sur (BTS)'), ('BE', 'Botadero Ecometales (BE)'), ('CS', 'Canchas de Stock (CS)'), ('CBBF', 'Fábrica (CBBF)')], default='TA'),
+        ),
+        migrations.AlterField(
+            model_name='postura',
+            name='tipo_actividad',
+            field=empresa.models.CampoCodificado(choices=[('Producción', 'Producción'), ('Confinamiento', 'Confinamiento'), ('Remanejo', 'Remanejo'), ('Arriendo', 'Arriendo'), ('Despacho', 'Despacho'), ('Limpieza', 'Limpieza'), ('Apoyo Mina', 'Apoyo Mina')]),
+        ),
+    ]
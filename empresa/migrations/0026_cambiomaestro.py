@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:24
+
+from django.db import migrations, models
+
+
+def registrar_existentes(apps, schema_editor):
+    # Igual que empresa.sincronizacion.registrar_existentes, con los modelos históricos:
+    # las migraciones no deben importar el código de la aplicación
+    conexion = schema_editor.connection
+    if conexion.vendor != 'sqlite':
+        return
+    tabla = apps.get_model('empresa', 'CambioMaestro')._meta.db_table
+    with conexion.cursor() as cursor:
+        for modelo in ('empleado', 'maquinaria', 'supervisor', 'postura'):
+            cursor.execute(f"""
+                INSERT INTO {tabla} (modelo, objeto_id, eliminado)
+                SELECT %s, id, 0 FROM {apps.get_model('empresa', modelo)._meta.db_table}
+                WHERE id NOT IN (SELECT objeto_id FROM {tabla} WHERE modelo = %s)
+                ORDER BY id
+            """, [modelo, modelo])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0025_alter_movimiento_nivel_final_combustible_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioMaestro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('eliminado', models.BooleanField(default=False)),
+            ],
+            options={
+                'unique_together': {('modelo', 'objeto_id')},
+            },
+        ),
+        migrations.RunPython(registrar_existentes, migrations.RunPython.noop),
+    ]
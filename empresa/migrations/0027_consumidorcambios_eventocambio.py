@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0026_cambiomaestro'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumidorCambios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=50, unique=True)),
+                ('cursor', models.BigIntegerField(default=0)),
+                ('actualizado_en', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EventoCambio',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(max_length=20)),
+                ('objeto_id', models.BigIntegerField()),
+                ('operacion', models.CharField(choices=[('I', 'Alta'), ('U', 'Modificación'), ('D', 'Baja'), ('A', 'Archivado'), ('R', 'Restaurado del archivo')], max_length=1)),
+                ('datos', models.JSONField(null=True)),
+                ('registrado_en', models.DateTimeField()),
+            ],
+        ),
+    ]
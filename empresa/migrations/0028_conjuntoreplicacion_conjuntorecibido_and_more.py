@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:18
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('empresa', '0027_consumidorcambios_eventocambio'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConjuntoReplicacion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(default=uuid.uuid4, editable=False, unique=True)),
+                ('secuencia', models.PositiveIntegerField(unique=True)),
+                ('eventos', models.PositiveIntegerField()),
+                ('contenido', models.BinaryField()),
+                ('creado_en', models.DateTimeField(auto_now_add=True)),
+                ('enviado_en', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ConjuntoRecibido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('uuid', models.UUIDField(unique=True)),
+                ('nodo', models.CharField(max_length=50)),
+                ('secuencia', models.PositiveIntegerField()),
+                ('eventos', models.PositiveIntegerField()),
+                ('aplicados', models.PositiveIntegerField()),
+                ('conflictos', models.JSONField(default=list)),
+                ('recibido_en', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'unique_together': {('nodo', 'secuencia')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RegistroReplicado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nodo', models.CharField(max_length=50)),
+                ('modelo', models.CharField(max_length=20)),
+                ('id_origen', models.BigIntegerField()),
+                ('objeto_id', models.BigIntegerField()),
+                ('registrado_en', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['modelo', 'objeto_id'], name='replicado_modelo_objeto_idx')],
+                'unique_together': {('nodo', 'modelo', 'id_origen')},
+            },
+        ),
+    ]
@@ -1,6 +1,52 @@
 # empresa/models.py
 
+import uuid
+
 from django.db import models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Round
+from django.utils.functional import cached_property
+
+
+class CampoCodificado(models.Field):
+    """
+    Opción de `choices` guardada como entero pequeño en vez del texto
+    repetido en cada fila y en cada índice que la incluye. El código es la
+    posición de la opción en `choices`, así que las opciones nuevas se
+    agregan al final y no se reordenan (CampoCodificadoTests lo vigila).
+
+    En Python el valor sigue siendo el texto de siempre ('Día',
+    'Mina El Way', ...): formularios, filtros del ORM, plantillas, la API y
+    el archivo no cambian. Solo el SQL escrito a mano ve los códigos.
+    """
+
+    def get_internal_type(self):
+        return 'PositiveSmallIntegerField'
+
+    @cached_property
+    def valores(self):
+        return [valor for valor, _ in self.flatchoices]
+
+    @cached_property
+    def codigos(self):
+        return {valor: codigo for codigo, valor in enumerate(self.valores)}
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else self.valores[value]
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+        if value is None or value == '':
+            return None
+        try:
+            return self.codigos[value]
+        except KeyError:
+            raise ValueError(f"'{value}' no es una opción válida de {self.name}.")
+
+    def como_texto(self, ruta=None):
+        """Expresión SQL con el texto de la opción, para Concat y otras funciones de texto."""
+        ruta = ruta or self.name
+        return Case(*[When(**{ruta: valor}, then=Value(valor)) for valor in self.valores], output_field=models.CharField())
 
 class Cliente(models.Model):
     nombre = models.CharField(max_length=200, help_text="Nombre de la empresa o persona cliente")
@@ -43,9 +89,9 @@ class Empleado(models.Model):
     cargo = models.CharField(max_length=100, choices=CARGOS)
     tipo_contrato = models.CharField(max_length=20, choices=TIPOS_CONTRATO)
     fecha_contratacion = models.DateField()
-    fecha_termino_contrato = models.DateField(null=True, blank=True)
+    fecha_termino_contrato = models.DateField(null=True, blank=True, db_index=True)
     licencias = models.ManyToManyField(TipoLicencia, blank=True)
-    fecha_vencimiento_licencia = models.DateField(null=True, blank=True)
+    fecha_vencimiento_licencia = models.DateField(null=True, blank=True, db_index=True)
     fecha_nacimiento = models.DateField(null=True, blank=True)
 
     def __str__(self):
@@ -66,6 +112,36 @@ NIVEL_COMBUSTIBLE_CHOICES = [
     ('medio', '1/2 Estanque'), ('tres_cuartos', '3/4 Estanque'), ('full', 'Estanque Full'),
 ]
 
+
+def _ordinal_nivel(campo):
+    """Posición del nivel de combustible en NIVEL_COMBUSTIBLE_CHOICES (vacío = 0, full = 5)."""
+    return Case(*[When(**{campo: valor}, then=Value(i)) for i, (valor, _) in enumerate(NIVEL_COMBUSTIBLE_CHOICES)])
+
+
+# Expresiones de las columnas generadas de Movimiento. La base de datos las
+# calcula al escribir, venga la fila del formulario, el admin, la
+# importación o la API, así que nunca contradicen a los horómetros.
+_MINUTOS = F('horometro_final') - F('horometro_inicial')
+HORAS_TRABAJADAS = Round(_MINUTOS / Value(60.0), 2, output_field=models.DecimalField())
+LITROS_POR_HORA = Case(
+    When(horometro_final__gt=F('horometro_inicial'),
+         then=Round(F('combustible_cargado') * Value(60.0) / _MINUTOS, 2, output_field=models.DecimalField())),
+)
+VARIACION_NIVEL_COMBUSTIBLE = _ordinal_nivel('nivel_final_combustible') - _ordinal_nivel('nivel_inicial_combustible')
+
+
+class MovimientoQuerySet(models.QuerySet):
+    def create(self, **kwargs):
+        # QuerySet.create() elige la base sin mirar la instancia; en modo
+        # fragmentado el movimiento se inserta de una vez en la de su proyecto
+        from . import fragmentos
+        if not fragmentos.activo():
+            return super().create(**kwargs)
+        movimiento = self.model(**kwargs)
+        movimiento.save(force_insert=True, using=fragmentos.alias_de(movimiento.proyecto))
+        return movimiento
+
+
 class Movimiento(models.Model):
     PROYECTOS = [
         ('Mina El Way', 'Mina El Way'), ('Mina Juana', 'Mina Juana'),
@@ -80,23 +156,53 @@ class Movimiento(models.Model):
     fecha = models.DateField()
     empleado = models.ForeignKey(Empleado, on_delete=models.SET_NULL, null=True)
     maquinaria = models.ForeignKey(Maquinaria, on_delete=models.SET_NULL, null=True)
-    proyecto = models.CharField(max_length=50, choices=PROYECTOS, default='Mina El Way')
+    proyecto = CampoCodificado(choices=PROYECTOS, default='Mina El Way')
     horometro_inicial = models.PositiveIntegerField()
     horometro_final = models.PositiveIntegerField(null=True, blank=True)
-    horas_trabajadas = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
-    turno = models.CharField(max_length=20, choices=TURNOS, default='Día')
+    horas_trabajadas = models.GeneratedField(
+        expression=HORAS_TRABAJADAS, output_field=models.DecimalField(max_digits=9, decimal_places=2, null=True),
+        db_persist=True, db_index=True,
+    )
+    turno = CampoCodificado(choices=TURNOS, default='Día')
     descripcion_trabajo_especial = models.CharField(max_length=500, blank=True, null=True)
     combustible_cargado = models.DecimalField(max_digits=6, decimal_places=2, help_text="Litros de combustible", null=True, blank=True)
-    origen_combustible = models.CharField(max_length=100, choices=ORIGENES_COMBUSTIBLE, null=True, blank=True)
+    origen_combustible = CampoCodificado(choices=ORIGENES_COMBUSTIBLE, null=True, blank=True)
     detalle_chip_otro_equipo = models.CharField(max_length=100, null=True, blank=True, help_text="Especifique el código o patente del otro equipo")
-    nivel_inicial_combustible = models.CharField(max_length=50, choices=NIVEL_COMBUSTIBLE_CHOICES, null=True, blank=True)
-    nivel_final_combustible = models.CharField(max_length=50, choices=NIVEL_COMBUSTIBLE_CHOICES, default='vacio')
+    nivel_inicial_combustible = CampoCodificado(choices=NIVEL_COMBUSTIBLE_CHOICES, null=True, blank=True)
+    nivel_final_combustible = CampoCodificado(choices=NIVEL_COMBUSTIBLE_CHOICES, default='vacio')
     observaciones = models.TextField(blank=True, null=True)
+    actualizado_en = models.DateTimeField(auto_now=True, db_index=True, editable=False)
+    litros_por_hora = models.GeneratedField(
+        expression=LITROS_POR_HORA, output_field=models.DecimalField(max_digits=9, decimal_places=2, null=True),
+        db_persist=True, db_index=True,
+    )
+    variacion_nivel_combustible = models.GeneratedField(
+        expression=VARIACION_NIVEL_COMBUSTIBLE, output_field=models.SmallIntegerField(null=True),
+        db_persist=True, db_index=True,
+    )
+
+    objects = MovimientoQuerySet.as_manager()
+
+    class Meta:
+        # Los informes filtran por fecha y turno; el admin filtra por proyecto y navega por fecha
+        indexes = [
+            models.Index(fields=['fecha', 'turno'], name='movimiento_fecha_turno_idx'),
+            models.Index(fields=['proyecto', 'fecha'], name='movimiento_proyecto_fecha_idx'),
+        ]
 
     def __str__(self):
         fecha_str = self.fecha.strftime('%d-%m-%Y') if self.fecha else 'Sin Fecha'
         return f"Movimiento del {fecha_str} - {self.empleado}"
 
+    def save(self, *args, **kwargs):
+        # Al modificar, Django no relee las columnas generadas: se descartan
+        # para que se lean de la base de datos la próxima vez que se usen
+        # (incluidos los receptores de post_save). Al crear, llegan con RETURNING.
+        for campo in self._meta.concrete_fields:
+            if campo.generated:
+                self.__dict__.pop(campo.attname, None)
+        super().save(*args, **kwargs)
+
 
 # --- NUEVOS MODELOS PARA EL INFORME DE PRODUCCIÓN Y POSTURAS ---
 
@@ -173,15 +279,15 @@ class Postura(models.Model):
 
     informe = models.ForeignKey(InformeDiario, on_delete=models.CASCADE, related_name="posturas")
     numero_postura = models.PositiveIntegerField()
-    tipo_actividad = models.CharField(max_length=50, choices=ACTIVIDAD_CHOICES)
+    tipo_actividad = CampoCodificado(choices=ACTIVIDAD_CHOICES)
 
     # --- CAMPOS MODIFICADOS ---
-    origen = models.CharField(max_length=50, choices=LUGAR_CHOICES, default='TA')
+    origen = CampoCodificado(choices=LUGAR_CHOICES, default='TA')
     sector_prefijo = models.CharField(max_length=10, help_text="Ej: TA, LA")
     sector_banco = models.CharField(max_length=10, help_text="Ej: 610")
     sector_tiro = models.CharField(max_length=10, help_text="Ej: 23")
-    destino = models.CharField(max_length=50, choices=LUGAR_CHOICES, default='PCH')
-    material = models.CharField(max_length=50, choices=MATERIAL_CHOICES, default='Estéril')
+    destino = CampoCodificado(choices=LUGAR_CHOICES, default='PCH')
+    material = CampoCodificado(choices=MATERIAL_CHOICES, default='Estéril')
 
     class Meta:
         ordering = ['informe', 'numero_postura']
@@ -204,4 +310,306 @@ class Viaje(models.Model):
         unique_together = ('movimiento', 'postura')
 
     def __str__(self):
-        return f"{self.cantidad} viajes para {self.postura} en mov. #{self.movimiento.id}"
\ No newline at end of file
+        return f"{self.cantidad} viajes para {self.postura} en mov. #{self.movimiento_id}"
+
+# --- TRABAJOS EN SEGUNDO PLANO ---
+
+class TrabajoInformePDF(models.Model):
+    """
+    Generación por lotes de los informes de producción de un rango de fechas
+    y turnos, combinados en un único PDF con índice.
+    """
+    ESTADOS = [
+        ('pendiente', 'Pendiente'), ('en_proceso', 'En Proceso'),
+        ('completado', 'Completado'), ('error', 'Error'),
+    ]
+    creado_en = models.DateTimeField(auto_now_add=True)
+    fecha_desde = models.DateField()
+    fecha_hasta = models.DateField()
+    turnos = models.JSONField(default=list)
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='pendiente')
+    total = models.PositiveIntegerField(default=0)
+    completados = models.PositiveIntegerField(default=0)
+    mensaje_error = models.TextField(blank=True, null=True)
+    archivo = models.BinaryField(null=True, blank=True, editable=False)
+
+    def __str__(self):
+        return f"Lote PDF {self.fecha_desde.strftime('%d-%m-%Y')} a {self.fecha_hasta.strftime('%d-%m-%Y')} ({self.estado})"
+
+
+class ImportacionMovimientos(models.Model):
+    """
+    Carga masiva de movimientos históricos desde un archivo CSV o XLSX.
+    `filas_procesadas` se guarda en la misma transacción que cada lote
+    insertado, así una importación interrumpida se retoma donde quedó.
+    """
+    ESTADOS = [('en_proceso', 'En Proceso'), ('completada', 'Completada'), ('error', 'Error')]
+    creado_en = models.DateTimeField(auto_now_add=True)
+    actualizado_en = models.DateTimeField(auto_now=True)
+    nombre_archivo = models.CharField(max_length=255)
+    huella = models.CharField(max_length=64, unique=True, help_text="SHA-256 del archivo importado")
+    estado = models.CharField(max_length=20, choices=ESTADOS, default='en_proceso')
+    filas_procesadas = models.PositiveIntegerField(default=0)
+    filas_importadas = models.PositiveIntegerField(default=0)
+    filas_con_error = models.PositiveIntegerField(default=0)
+    mensaje_error = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Importación {self.nombre_archivo} ({self.estado})"
+
+class ErrorImportacion(models.Model):
+    importacion = models.ForeignKey(ImportacionMovimientos, on_delete=models.CASCADE, related_name='errores')
+    fila = models.PositiveIntegerField(help_text="Número de fila en el archivo, contando el encabezado como fila 1")
+    mensajes = models.TextField()
+
+    class Meta:
+        ordering = ['importacion', 'fila']
+
+    def __str__(self):
+        return f"Fila {self.fila}: {self.mensajes}"
+
+
+# --- ANALÍTICA ---
+
+class ReporteCombustible(models.Model):
+    """
+    Resultado precalculado del análisis de consumo de combustible
+    (ver empresa/combustible.py). Se regenera con el comando
+    `actualizar_reporte_combustible`; las vistas leen el último.
+    """
+    generado_en = models.DateTimeField(auto_now_add=True, db_index=True)
+    fecha_desde = models.DateField(null=True, blank=True)
+    fecha_hasta = models.DateField(null=True, blank=True)
+    movimientos_analizados = models.PositiveIntegerField(default=0)
+    segundos = models.FloatField(default=0)
+    datos = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['-generado_en']
+
+    def __str__(self):
+        return f"Reporte de combustible #{self.pk} ({self.movimientos_analizados} movimientos)"
+
+
+class UtilizacionDiaria(models.Model):
+    """
+    Minutos trabajados por equipo, día y proyecto, con los intervalos de
+    horómetro ya fusionados. Se mantiene en empresa/utilizacion.py.
+    """
+    maquinaria = models.ForeignKey(Maquinaria, on_delete=models.CASCADE, related_name='utilizacion_diaria')
+    fecha = models.DateField(db_index=True)
+    proyecto = models.CharField(max_length=50, choices=Movimiento.PROYECTOS)
+    minutos_trabajados = models.PositiveIntegerField(default=0)
+    movimientos = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('maquinaria', 'fecha', 'proyecto')
+
+    def __str__(self):
+        return f"{self.maquinaria} {self.fecha.strftime('%d-%m-%Y')} {self.proyecto}: {self.minutos_trabajados} min"
+
+
+class CuboViajes(models.Model):
+    """
+    Viajes por día, turno, material, origen, destino, actividad y equipo
+    (Viaje unido a su Postura y Movimiento), ya sumados. Se mantiene por
+    turno en empresa/cubo.py; los reportes de material lo consultan en
+    vez de recorrer los viajes.
+    """
+    fecha = models.DateField(db_index=True)
+    # Primer día del mes de `fecha`: agrupar por mes no requiere funciones de fecha por fila
+    mes = models.DateField(db_index=True)
+    turno = models.CharField(max_length=20, choices=Movimiento.TURNOS)
+    material = models.CharField(max_length=50, choices=Postura.MATERIAL_CHOICES)
+    origen = models.CharField(max_length=50, choices=Postura.LUGAR_CHOICES)
+    destino = models.CharField(max_length=50, choices=Postura.LUGAR_CHOICES)
+    tipo_actividad = models.CharField(max_length=50, choices=Postura.ACTIVIDAD_CHOICES)
+    maquinaria = models.ForeignKey(Maquinaria, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    viajes = models.PositiveIntegerField(default=0)
+    registros = models.PositiveIntegerField(default=0, help_text="Cantidad de filas de Viaje sumadas")
+
+    class Meta:
+        unique_together = ('fecha', 'turno', 'material', 'origen', 'destino', 'tipo_actividad', 'maquinaria')
+
+    def __str__(self):
+        return f"{self.fecha.strftime('%d-%m-%Y')} {self.turno} {self.material} {self.origen}-{self.destino}: {self.viajes} viajes"
+
+
+class JornadaDiaria(models.Model):
+    """
+    Horas y turnos de un trabajador en un día, con la suma móvil de los
+    últimos 7 días y el descanso desde el turno anterior. Es el libro que
+    usa el control de jornada (empresa/jornada.py) y se mantiene al
+    guardar o borrar movimientos.
+    """
+    empleado = models.ForeignKey(Empleado, on_delete=models.CASCADE, related_name='jornadas')
+    fecha = models.DateField(db_index=True)
+    horas = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    turnos = models.CharField(max_length=100, blank=True, help_text="Turnos trabajados, separados por coma")
+    movimientos = models.PositiveIntegerField(default=0)
+    horas_7_dias = models.DecimalField(max_digits=10, decimal_places=2, default=0, help_text="Horas de este día y los 6 anteriores")
+    descanso_previo = models.DecimalField(
+        max_digits=6, decimal_places=2, null=True, blank=True,
+        help_text="Menor descanso, en horas, antes de los turnos con horario del día (vacío si no hubo turnos en los 7 días anteriores)",
+    )
+
+    class Meta:
+        unique_together = ('empleado', 'fecha')
+
+    def __str__(self):
+        return f"{self.empleado} {self.fecha.strftime('%d-%m-%Y')}: {self.horas} h"
+
+
+class AuditoriaHorometro(models.Model):
+    """
+    Una ejecución de la auditoría de continuidad de horómetros. Las
+    revisiones incrementales usan `iniciada_en` de la última ejecución y
+    `conteos` ({maquinaria_id: movimientos}) para saber qué equipos
+    cambiaron desde entonces, incluidos los borrados.
+    """
+    MODOS = [('completa', 'Completa'), ('incremental', 'Incremental')]
+    iniciada_en = models.DateTimeField()
+    terminada_en = models.DateTimeField(null=True, blank=True)
+    modo = models.CharField(max_length=20, choices=MODOS)
+    maquinas_revisadas = models.PositiveIntegerField(default=0)
+    movimientos_revisados = models.PositiveIntegerField(default=0)
+    hallazgos = models.PositiveIntegerField(default=0)
+    conteos = models.JSONField(default=dict)
+
+    class Meta:
+        ordering = ['-iniciada_en']
+
+    def __str__(self):
+        return f"Auditoría {self.modo} #{self.pk} ({self.hallazgos} hallazgos)"
+
+class HallazgoHorometro(models.Model):
+    TIPOS = [
+        ('lectura_invalida', 'Horómetro final menor o igual al inicial'),
+        ('sin_lectura_final', 'Falta el horómetro final'),
+        ('retroceso', 'Horómetro inicial menor al inicio anterior'),
+        ('superposicion', 'Se superpone con el movimiento anterior'),
+        ('brecha', 'Minutos sin registrar desde el movimiento anterior'),
+        ('salto_improbable', 'Salto mayor al tiempo transcurrido'),
+    ]
+    maquinaria = models.ForeignKey(Maquinaria, on_delete=models.CASCADE, related_name='hallazgos_horometro')
+    movimiento = models.ForeignKey(Movimiento, on_delete=models.CASCADE, related_name='hallazgos_horometro')
+    movimiento_anterior = models.ForeignKey(Movimiento, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    tipo = models.CharField(max_length=20, choices=TIPOS, db_index=True)
+    diferencia_minutos = models.IntegerField(null=True, blank=True)
+    fecha = models.DateField(db_index=True)
+    detectado_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-fecha', 'maquinaria']
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} en mov. #{self.movimiento_id}"
+
+
+class CambioMaestro(models.Model):
+    """
+    Última versión de cada empleado, equipo, supervisor y postura, para la
+    sincronización de los clientes sin conexión (empresa/sincronizacion.py).
+    Hay una fila por registro y los triggers de SQLite la reemplazan en cada
+    cambio, así el id autoincremental es la versión: solo crece y nunca se
+    reutiliza. Las filas con `eliminado` son las lápidas de los borrados.
+    """
+    modelo = models.CharField(max_length=20)
+    objeto_id = models.BigIntegerField()
+    eliminado = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('modelo', 'objeto_id')
+
+    def __str__(self):
+        return f"v{self.pk} {self.modelo} #{self.objeto_id}{' (eliminado)' if self.eliminado else ''}"
+
+
+class EventoCambio(models.Model):
+    """
+    Registro de solo anexado de los cambios de movimientos, viajes,
+    producción, posturas e informes, para los consumidores externos (ver
+    empresa/cambios.py). Lo escriben triggers de SQLite en la misma
+    transacción que el cambio; `datos` es la fila después del cambio o,
+    en las bajas, la fila borrada.
+    """
+    OPERACIONES = [
+        ('I', 'Alta'), ('U', 'Modificación'), ('D', 'Baja'),
+        ('A', 'Archivado'), ('R', 'Restaurado del archivo'),
+    ]
+    modelo = models.CharField(max_length=20)
+    objeto_id = models.BigIntegerField()
+    operacion = models.CharField(max_length=1, choices=OPERACIONES)
+    datos = models.JSONField(null=True)
+    registrado_en = models.DateTimeField()
+
+    def __str__(self):
+        return f"#{self.pk} {self.get_operacion_display()} {self.modelo} #{self.objeto_id}"
+
+
+class ConsumidorCambios(models.Model):
+    """
+    Un consumidor del registro de cambios y el último evento que confirmó.
+    Los eventos confirmados por todos los consumidores se pueden compactar.
+    """
+    nombre = models.CharField(max_length=50, unique=True)
+    cursor = models.BigIntegerField(default=0)
+    actualizado_en = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nombre} (hasta #{self.cursor})"
+
+
+# --- REPLICACIÓN ENTRE SITIOS Y OFICINA CENTRAL ---
+
+class ConjuntoReplicacion(models.Model):
+    """
+    Conjunto de cambios del nodo de sitio, comprimido y listo para enviar
+    a la oficina central (ver empresa/replicacion.py). Se conserva hasta
+    que la central lo confirma, así un corte del enlace no pierde nada.
+    """
+    uuid = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    secuencia = models.PositiveIntegerField(unique=True)
+    eventos = models.PositiveIntegerField()
+    contenido = models.BinaryField()
+    creado_en = models.DateTimeField(auto_now_add=True)
+    enviado_en = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    def __str__(self):
+        return f"Conjunto #{self.secuencia} ({self.eventos} eventos)"
+
+
+class ConjuntoRecibido(models.Model):
+    """Conjunto de cambios ya aplicado en la central; su uuid hace idempotente el reenvío."""
+    uuid = models.UUIDField(unique=True)
+    nodo = models.CharField(max_length=50)
+    secuencia = models.PositiveIntegerField()
+    eventos = models.PositiveIntegerField()
+    aplicados = models.PositiveIntegerField()
+    conflictos = models.JSONField(default=list)
+    recibido_en = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('nodo', 'secuencia')
+
+    def __str__(self):
+        return f"{self.nodo} #{self.secuencia}: {self.aplicados}/{self.eventos} aplicados"
+
+
+class RegistroReplicado(models.Model):
+    """
+    En la central, qué fila local corresponde a cada fila de un sitio
+    (nodo, modelo, id en el sitio) y el momento del último cambio aplicado.
+    """
+    nodo = models.CharField(max_length=50)
+    modelo = models.CharField(max_length=20)
+    id_origen = models.BigIntegerField()
+    objeto_id = models.BigIntegerField()
+    registrado_en = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('nodo', 'modelo', 'id_origen')
+        indexes = [models.Index(fields=['modelo', 'objeto_id'], name='replicado_modelo_objeto_idx')]
+
+    def __str__(self):
+        return f"{self.nodo} {self.modelo} #{self.id_origen} -> #{self.objeto_id}"
@@ -0,0 +1,34 @@
+# empresa/pdf.py
+
+"""
+Funciones de renderizado de PDF que se ejecutan en procesos de trabajo.
+
+Este módulo no importa Django a propósito: los procesos hijos (creados con
+'spawn') solo necesitan WeasyPrint y pypdf, y no tienen las apps cargadas.
+"""
+
+from io import BytesIO
+
+from pypdf import PdfReader, PdfWriter
+from weasyprint import HTML
+
+
+def renderizar_pdf(html, base_url=None):
+    """Renderiza un documento HTML y devuelve (bytes del PDF, número de páginas)."""
+    documento = HTML(string=html, base_url=base_url).render()
+    return documento.write_pdf(), len(documento.pages)
+
+
+def combinar_pdfs(indice, partes):
+    """
+    Une el PDF del índice con los PDF de cada turno, en orden, y agrega
+    un marcador (outline) por turno que apunta a su primera página.
+    `partes` es una lista de tuplas (titulo, bytes_pdf).
+    """
+    writer = PdfWriter()
+    writer.append(PdfReader(BytesIO(indice)), outline_item="Índice")
+    for titulo, contenido in partes:
+        writer.append(PdfReader(BytesIO(contenido)), outline_item=titulo)
+    salida = BytesIO()
+    writer.write(salida)
+    return salida.getvalue()
@@ -0,0 +1,146 @@
+# empresa/planificacion.py
+
+"""
+Planificación de posturas por lotes: copiar las posturas de un turno a
+muchos otros, o cargar el plan de una semana desde un archivo.
+
+Todo se aplica con operaciones por conjunto: una consulta para los
+informes existentes, un bulk_create para los InformeDiario que faltan y
+otro para todas las posturas, sin importar cuántos turnos se planifiquen.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+
+from . import posturas
+from .forms import PosturaForm
+from .importacion import leer_filas, _fecha, _texto, TURNOS
+from .models import InformeDiario, Postura, Viaje
+
+CAMPOS_POSTURA = ['tipo_actividad', 'origen', 'sector_prefijo', 'sector_banco', 'sector_tiro', 'destino', 'material']
+
+
+def turnos_en_rango(fecha_desde, fecha_hasta, turnos):
+    """Lista de (fecha, turno) entre dos fechas, ambas incluidas."""
+    destinos = []
+    fecha = fecha_desde
+    while fecha <= fecha_hasta:
+        destinos.extend((fecha, turno) for turno in turnos)
+        fecha += timedelta(days=1)
+    return destinos
+
+
+def _informes_de(destinos):
+    """Devuelve {(fecha, turno): InformeDiario}, creando en bloque los que falten."""
+    destinos = set(destinos)
+    fechas = {fecha for fecha, _ in destinos}
+    turnos = {turno for _, turno in destinos}
+
+    def existentes():
+        return {
+            (informe.fecha, informe.turno): informe
+            for informe in InformeDiario.objects.filter(fecha__range=(min(fechas), max(fechas)), turno__in=turnos)
+            if (informe.fecha, informe.turno) in destinos
+        }
+
+    informes = existentes()
+    faltantes = [InformeDiario(fecha=fecha, turno=turno) for fecha, turno in destinos - set(informes)]
+    if faltantes:
+        # ignore_conflicts por si otra petición creó el mismo informe entre medio;
+        # como así no vuelven los ids, se leen de nuevo
+        InformeDiario.objects.bulk_create(faltantes, ignore_conflicts=True)
+        informes = existentes()
+    return informes, len(faltantes)
+
+
+def aplicar_plan(plan, reemplazar=False):
+    """
+    Aplica un plan {(fecha, turno): [dict con CAMPOS_POSTURA]} en una sola
+    transacción.
+
+    Los turnos que ya tienen posturas se omiten, salvo con `reemplazar`;
+    aun así, no se reemplazan las posturas de un turno que ya tiene viajes
+    registrados, para no borrar esos viajes en cascada.
+
+    Devuelve un dict con los informes creados, las posturas creadas y los
+    turnos omitidos.
+    """
+    resultado = {'informes_creados': 0, 'posturas_creadas': 0, 'turnos_planificados': [], 'turnos_omitidos': []}
+    if not plan:
+        return resultado
+
+    with transaction.atomic():
+        informes, resultado['informes_creados'] = _informes_de(plan)
+        ids_informes = [informe.id for informe in informes.values()]
+        con_posturas = set(
+            Postura.objects.filter(informe_id__in=ids_informes).order_by().values_list('informe_id', flat=True).distinct()
+        )
+        con_viajes = set(
+            Viaje.objects.filter(postura__informe_id__in=con_posturas).order_by().values_list('postura__informe_id', flat=True).distinct()
+        ) if reemplazar and con_posturas else set()
+
+        a_reemplazar, nuevas = [], []
+        for clave in sorted(plan):
+            informe = informes[clave]
+            if informe.id in con_posturas and (not reemplazar or informe.id in con_viajes):
+                resultado['turnos_omitidos'].append(clave)
+                continue
+            if informe.id in con_posturas:
+                a_reemplazar.append(informe.id)
+            resultado['turnos_planificados'].append(clave)
+            nuevas.extend(
+                Postura(informe=informe, numero_postura=numero, **{campo: datos.get(campo) or '' for campo in CAMPOS_POSTURA})
+                for numero, datos in enumerate(plan[clave], start=1)
+            )
+
+        if a_reemplazar:
+            Postura.objects.filter(informe_id__in=a_reemplazar).delete()
+        Postura.objects.bulk_create(nuevas)
+        resultado['posturas_creadas'] = len(nuevas)
+        # bulk_create no dispara signals: se invalida la caché de los turnos planificados
+        transaction.on_commit(lambda: posturas.invalidar(resultado['turnos_planificados']))
+    return resultado
+
+
+def copiar_posturas(fecha_origen, turno_origen, destinos, reemplazar=False):
+    """Copia las posturas del turno de origen a cada (fecha, turno) de `destinos`."""
+    origen = list(
+        Postura.objects.filter(informe__fecha=fecha_origen, informe__turno=turno_origen)
+        .order_by('numero_postura').values(*CAMPOS_POSTURA)
+    )
+    if not origen:
+        raise ValueError("El turno de origen no tiene posturas definidas.")
+    destinos = [d for d in destinos if d != (fecha_origen, turno_origen)]
+    return aplicar_plan({destino: origen for destino in destinos}, reemplazar=reemplazar)
+
+
+def leer_plan(ruta):
+    """
+    Lee un plan desde CSV o XLSX con las columnas fecha, turno y los campos
+    de la postura. Cada fila se valida con PosturaForm; el orden de las
+    filas de un mismo turno define el número de postura.
+
+    Devuelve (plan, errores) con errores como [(fila, mensaje)].
+    """
+    plan, errores = {}, []
+    for numero, fila in enumerate(leer_filas(ruta), start=2):
+        fila = {columna: _texto(valor) for columna, valor in fila.items()}
+        if not any(fila.values()):
+            continue
+        try:
+            fecha = _fecha(fila.get('fecha', ''))
+        except ValueError:
+            errores.append((numero, "fecha: formato inválido (use AAAA-MM-DD o DD-MM-AAAA)."))
+            continue
+        turno = TURNOS.get(fila.get('turno', '').lower())
+        if turno is None:
+            errores.append((numero, f"turno: opción inválida '{fila.get('turno', '')}'."))
+            continue
+        form = PosturaForm(data={campo: fila.get(campo, '') for campo in CAMPOS_POSTURA})
+        if not form.is_valid():
+            mensajes = [f"{campo}: {' '.join(lista)}" for campo, lista in form.errors.items()]
+            errores.append((numero, ' | '.join(mensajes)))
+            continue
+        plan.setdefault((fecha, turno), []).append({campo: form.cleaned_data.get(campo) for campo in CAMPOS_POSTURA})
+    return plan, errores
@@ -0,0 +1,93 @@
+# empresa/posturas.py
+
+"""
+Posturas de un turno para los formularios de captura de movimientos.
+
+Se consultan en una sola consulta (Postura unida a su InformeDiario por
+fecha y turno), con la descripción armada en SQL, y se guardan en la
+caché de Django. Cada turno tiene un número de versión en la caché que se
+incrementa cuando cambian sus posturas (ver signals.py y planificacion.py),
+así la clave anterior simplemente deja de usarse.
+"""
+
+import time
+
+from django.core.cache import cache
+from django.db.models import CharField, Value
+from django.db.models.functions import Cast, Concat
+
+from .models import InformeDiario, Postura
+
+TIEMPO_CACHE = 60 * 60
+
+
+def _clave_version(fecha, turno):
+    return f'posturas_turno:version:{fecha.isoformat()}:{turno}'
+
+
+def _version(fecha, turno):
+    # Si la versión no está (caché nueva o desalojada) se parte de un valor
+    # que no se haya usado antes, para no revivir una entrada vieja
+    return cache.get_or_set(_clave_version(fecha, turno), time.time_ns, None)
+
+
+def _clave(version, fecha, turno):
+    return f'posturas_turno:{version}:{fecha.isoformat()}:{turno}'
+
+
+def descripcion_postura():
+    """Expresión SQL con la descripción 'Postura #n: actividad - origen a destino'."""
+    campos = {campo: Postura._meta.get_field(campo).como_texto() for campo in ('tipo_actividad', 'origen', 'destino')}
+    return Concat(
+        Value('Postura #'), Cast('numero_postura', CharField()), Value(': '), campos['tipo_actividad'],
+        Value(' - '), campos['origen'], Value(' a '), campos['destino'],
+        output_field=CharField(),
+    )
+
+
+def _consulta(fecha, turno):
+    return (
+        Postura.objects.filter(informe__fecha=fecha, informe__turno=turno)
+        .order_by('numero_postura')
+        .annotate(descripcion=descripcion_postura())
+        .values('id', 'descripcion')
+    )
+
+
+def consultar_posturas(fecha, turno):
+    return list(_consulta(fecha, turno))
+
+
+def posturas_del_turno(fecha, turno):
+    """[{'id', 'descripcion'}] de las posturas del turno, ordenadas por número."""
+    clave = _clave(_version(fecha, turno), fecha, turno)
+    posturas = cache.get(clave)
+    if posturas is None:
+        posturas = consultar_posturas(fecha, turno)
+        cache.set(clave, posturas, TIEMPO_CACHE)
+    return posturas
+
+
+async def aposturas_del_turno(fecha, turno):
+    """posturas_del_turno con la caché y el ORM asíncronos, para las vistas bajo ASGI."""
+    version = await cache.aget_or_set(_clave_version(fecha, turno), time.time_ns, None)
+    clave = _clave(version, fecha, turno)
+    posturas = await cache.aget(clave)
+    if posturas is None:
+        posturas = [postura async for postura in _consulta(fecha, turno)]
+        await cache.aset(clave, posturas, TIEMPO_CACHE)
+    return posturas
+
+
+def invalidar(claves):
+    """Incrementa la versión de cada (fecha, turno) de `claves`."""
+    for fecha, turno in claves:
+        try:
+            cache.incr(_clave_version(fecha, turno))
+        except ValueError:
+            # Sin versión guardada no hay nada en caché que invalidar
+            pass
+
+
+def invalidar_informes(informe_ids):
+    invalidar(InformeDiario.objects.filter(id__in=informe_ids).values_list('fecha', 'turno'))
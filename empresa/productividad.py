@@ -0,0 +1,174 @@
+# empresa/productividad.py
+
+"""
+Ranking de productividad de operadores por proyecto: viajes por hora,
+horas por turno y combustible por hora en ventanas de 7, 30 y 90 días
+que terminan en una fecha.
+
+Cada ventana es una sola consulta SQL: Movimiento agrupado por proyecto
+y operador, con los viajes sumados antes por movimiento, y las
+posiciones calculadas en la misma consulta con
+RANK() OVER (PARTITION BY proyecto ...). Con el ORM, la subconsulta de
+viajes se repetía en cada métrica y posición y tardaba el triple. En el
+modo fragmentado es una consulta por base, todas a la vez (ver
+fragmentos.py).
+
+El resultado se guarda en caché por fecha y proyecto. La clave incluye
+un número de versión que se incrementa cuando cambian movimientos o
+viajes (ver signals.py, importacion.py y grilla.py).
+
+Solo se leen los movimientos vivos: las ventanas son recientes y el
+archivo guarda años cerrados (ver archivo.py). Una fecha cuyas ventanas
+llegan a un año archivado se rechaza con ValueError, en vez de devolver
+un ranking al que le faltan datos.
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import archivo, fragmentos, replica
+from .models import Movimiento
+
+VENTANAS = (7, 30, 90)
+
+# Métrica -> (etiqueta, True si más alto es mejor)
+METRICAS = {
+    'viajes_por_hora': ('Viajes por hora', True),
+    'horas_por_turno': ('Horas por turno', True),
+    'combustible_por_hora': ('Litros por hora', False),
+}
+
+CLAVE_VERSION = 'productividad:version'
+
+
+def _version():
+    return cache.get_or_set(CLAVE_VERSION, time.time_ns, None)
+
+
+def invalidar(claves=None):
+    """Deja sin uso los rankings en caché (recibe las claves de diferido, que no importan)."""
+    try:
+        cache.incr(CLAVE_VERSION)
+    except ValueError:
+        pass
+
+
+# Totales por proyecto y operador, métricas y posiciones en una consulta.
+# Los viajes se suman primero por movimiento para no multiplicar las horas
+# al unir con Viaje; RANK() numera dentro de cada proyecto.
+SQL_RANKING = """
+WITH viajes AS (
+    SELECT v.movimiento_id, SUM(v.cantidad) AS viajes
+    FROM empresa_viaje v INNER JOIN empresa_movimiento m ON m.id = v.movimiento_id
+    WHERE m.fecha BETWEEN %(desde)s AND %(hasta)s {filtro}
+    GROUP BY v.movimiento_id
+), totales AS (
+    SELECT m.proyecto, m.empleado_id,
+           COALESCE(SUM(m.horas_trabajadas), 0) AS horas,
+           -- Un operador puede usar dos equipos en el mismo turno
+           COUNT(DISTINCT m.fecha || ' ' || m.turno) AS turnos,
+           COALESCE(SUM(v.viajes), 0) AS viajes,
+           COALESCE(SUM(m.combustible_cargado), 0) AS combustible
+    FROM empresa_movimiento m LEFT JOIN viajes v ON v.movimiento_id = m.id
+    WHERE m.fecha BETWEEN %(desde)s AND %(hasta)s AND m.empleado_id IS NOT NULL {filtro}
+    -- El + evita que SQLite recorra entero el índice (proyecto, fecha) para
+    -- no ordenar el GROUP BY, en vez de buscar el rango de fechas
+    GROUP BY +m.proyecto, m.empleado_id
+), metricas AS (
+    SELECT t.*,
+           t.viajes * 1.0 / NULLIF(t.horas, 0) AS viajes_por_hora,
+           t.horas * 1.0 / NULLIF(t.turnos, 0) AS horas_por_turno,
+           t.combustible * 1.0 / NULLIF(t.horas, 0) AS combustible_por_hora
+    FROM totales t
+)
+SELECT m.proyecto, m.empleado_id, e.codigo_trabajador, e.nombre_completo,
+       m.horas, m.turnos, m.viajes, m.combustible,
+       m.viajes_por_hora, m.horas_por_turno, m.combustible_por_hora,
+       RANK() OVER (PARTITION BY m.proyecto ORDER BY m.viajes_por_hora DESC NULLS LAST),
+       RANK() OVER (PARTITION BY m.proyecto ORDER BY m.horas_por_turno DESC NULLS LAST),
+       RANK() OVER (PARTITION BY m.proyecto ORDER BY m.combustible_por_hora ASC NULLS LAST)
+FROM metricas m INNER JOIN empresa_empleado e ON e.id = m.empleado_id
+ORDER BY m.proyecto, 12, e.nombre_completo
+"""
+
+
+def _consultar(sql, parametros):
+    with fragmentos.conexion().cursor() as cursor:
+        cursor.execute(sql, parametros)
+        return cursor.fetchall()
+
+
+def ranking_ventana(fecha_hasta, dias, proyecto=None):
+    """
+    Filas por proyecto y operador con los totales de los `dias` que terminan
+    en `fecha_hasta`, las tres métricas y la posición en cada una dentro
+    del proyecto (1 = mejor). Ordenadas por proyecto y viajes por hora.
+    """
+    # proyecto se guarda codificado (ver CampoCodificado)
+    campo_proyecto = Movimiento._meta.get_field('proyecto')
+    parametros = {
+        'desde': (fecha_hasta - timedelta(days=dias - 1)).isoformat(), 'hasta': fecha_hasta.isoformat(),
+        'proyecto': campo_proyecto.get_prep_value(proyecto),
+    }
+    sql = SQL_RANKING.format(filtro='AND m.proyecto = %(proyecto)s' if proyecto else '')
+    if proyecto:
+        with fragmentos.usar(fragmentos.alias_de(proyecto)):
+            filas = _consultar(sql, parametros)
+    else:
+        # Cada proyecto vive entero en una base, así que las posiciones de cada
+        # base ya son las definitivas: basta juntar las filas en orden de proyecto
+        partes = fragmentos.en_paralelo(_consultar, sql, parametros).values()
+        filas = sorted((fila for parte in partes for fila in parte), key=lambda fila: fila[0])
+
+    resultado = []
+    for (proyecto_fila, empleado_id, codigo, nombre, horas, turnos, viajes, combustible,
+         *metricas_y_posiciones) in filas:
+        valores, posiciones = metricas_y_posiciones[:len(METRICAS)], metricas_y_posiciones[len(METRICAS):]
+        resultado.append({
+            'proyecto': campo_proyecto.valores[proyecto_fila],
+            'empleado_id': empleado_id,
+            'codigo_trabajador': codigo,
+            'nombre': nombre,
+            'horas': round(float(horas), 2),
+            'turnos': turnos,
+            'viajes': viajes,
+            'combustible': round(float(combustible), 2),
+            **{metrica: round(valor, 2) if valor is not None else None for metrica, valor in zip(METRICAS, valores)},
+            'posiciones': dict(zip(METRICAS, posiciones)),
+        })
+    return resultado
+
+
+def _agrupar_por_proyecto(filas):
+    proyectos = {}
+    for fila in filas:
+        proyectos.setdefault(fila.pop('proyecto'), []).append(fila)
+    return proyectos
+
+
+def ranking(fecha_hasta, proyecto=None):
+    """
+    {'ventanas': {dias: {proyecto: [operadores]}}} para cada ventana de
+    VENTANAS, desde la caché si los datos no cambiaron. Lanza ValueError si
+    las ventanas llegan a un año archivado.
+    """
+    desde = fecha_hasta - timedelta(days=max(VENTANAS) - 1)
+    if archivo.rango_archivado(desde, fecha_hasta):
+        raise ValueError(
+            f"El ranking no incluye movimientos archivados: la ventana de {max(VENTANAS)} días desde "
+            f"{desde.strftime('%d-%m-%Y')} llega a un año archivado. Restaure el año (restaurar_movimientos) para consultarlo."
+        )
+    # Lo calculado sobre una foto de la réplica no se sirve a quien lee la principal
+    clave = f'productividad:{_version()}{replica.marca()}:{fecha_hasta.isoformat()}:{proyecto or ""}'
+    datos = cache.get(clave)
+    if datos is None:
+        datos = {
+            'ventanas': {
+                dias: _agrupar_por_proyecto(ranking_ventana(fecha_hasta, dias, proyecto)) for dias in VENTANAS
+            },
+        }
+        cache.set(clave, datos, getattr(settings, 'PRODUCTIVIDAD_CACHE_SEGUNDOS', 60 * 60))
+    return datos
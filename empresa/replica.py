@@ -0,0 +1,178 @@
+# empresa/replica.py
+
+"""
+Réplica de lectura para los reportes.
+
+Los reportes largos (rangos de fechas, PDF, analítica) leen mucho y
+compiten con las escrituras del turno por la misma base SQLite. Con una
+réplica configurada, los reportes leen de una foto de la base que se
+refresca cada pocos minutos y las escrituras siguen en la principal:
+
+    DATABASES['replica'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': BASE_DIR / 'replica.sqlite3'}
+    REPLICA_ALIAS = 'replica'
+    DATABASE_ROUTERS = ['empresa.replica.RouterReplica']
+
+y el comando `refrescar_replica` en cron o con --seguir. La foto se copia
+con la API de respaldo en línea (ver respaldo.py) y reemplaza a la
+anterior recién verificada; su antigüedad es la fecha del archivo. Si la
+réplica se mantiene por otro medio, basta que el archivo conserve la fecha
+de la copia.
+
+- Solo leen de la réplica los bloques `lectura()` (las vistas de reportes
+  con `@en_replica` y los comandos de analítica), y solo si la foto tiene
+  menos de REPLICA_MAX_RETRASO_SEGUNDOS; si no, leen de la principal. La
+  decisión se toma una vez por bloque, para no mezclar datos de dos fotos.
+- Las escrituras nunca van a la réplica: un objeto leído de ella se guarda
+  en la principal y la conexión de la réplica es de solo lectura
+  (PRAGMA query_only, ver signals.py).
+- Los modelos de control que se leen justo después de escribirse
+  (trabajos de PDF, importaciones, registro de cambios, replicación)
+  siempre se leen de la principal, igual que el mantenimiento de los
+  agregados que corre dentro de `fragmentos.usar`.
+
+En el modo fragmentado la réplica no se usa: copia solo la base principal
+y cada mina ya lee y escribe en su propio archivo.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import fragmentos, respaldo
+from .models import (
+    ConjuntoRecibido, ConjuntoReplicacion, ErrorImportacion, EventoCambio, ImportacionMovimientos,
+    RegistroReplicado, TrabajoInformePDF,
+)
+
+# Se leen siempre de la principal
+SOLO_PRINCIPAL = {
+    TrabajoInformePDF, ImportacionMovimientos, ErrorImportacion, EventoCambio, ConjuntoReplicacion,
+    ConjuntoRecibido, RegistroReplicado,
+}
+
+# (alias, fecha de la foto) de la réplica que lee el bloque `lectura` actual
+_leyendo = ContextVar('replica_leyendo', default=None)
+
+
+def alias():
+    return getattr(settings, 'REPLICA_ALIAS', None)
+
+
+def max_retraso():
+    return getattr(settings, 'REPLICA_MAX_RETRASO_SEGUNDOS', 10 * 60)
+
+
+def intervalo():
+    return getattr(settings, 'REPLICA_INTERVALO_SEGUNDOS', 5 * 60)
+
+
+def configurada():
+    return bool(alias()) and alias() in connections.settings and not fragmentos.activo()
+
+
+def ruta():
+    return Path(connections[alias()].settings_dict['NAME'])
+
+
+def fecha_foto():
+    """Momento (epoch) en que se tomó la foto de la réplica, o None si no hay."""
+    try:
+        return ruta().stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def antiguedad():
+    """Segundos desde que se tomó la foto, o None si no hay réplica."""
+    foto = fecha_foto() if configurada() else None
+    return None if foto is None else time.time() - foto
+
+
+def vigente():
+    edad = antiguedad()
+    return edad is not None and edad <= max_retraso()
+
+
+@contextmanager
+def lectura():
+    """
+    Dentro del bloque, las lecturas de los modelos de la aplicación van a la
+    réplica si está vigente y a la principal si no. Las escrituras no cambian.
+    """
+    token = _leyendo.set((alias(), fecha_foto()) if vigente() else None)
+    try:
+        yield
+    finally:
+        _leyendo.reset(token)
+
+
+def en_replica(vista):
+    """Decorador de las vistas de reportes: la vista completa corre dentro de `lectura()`."""
+    @wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        with lectura():
+            return vista(request, *args, **kwargs)
+    return envoltura
+
+
+def marca():
+    """Identifica la foto que lee el bloque actual ('' si lee la principal), para las cachés de resultados."""
+    leyendo = _leyendo.get()
+    return f'r{leyendo[1]:.0f}' if leyendo else ''
+
+
+def refrescar(paginas=None, pausa=None):
+    """
+    Toma una foto nueva de la base principal y reemplaza la réplica.
+    Devuelve las estadísticas de la copia (ver respaldo.copiar).
+    """
+    if not configurada():
+        raise ValueError("No hay réplica de lectura configurada (REPLICA_ALIAS y DATABASES).")
+    destino = ruta()
+    if destino.resolve() == Path(connections[DEFAULT_DB_ALIAS].settings_dict['NAME']).resolve():
+        raise ValueError("La réplica no puede ser el mismo archivo que la base principal.")
+    inicio = time.time()
+    resultado = respaldo.copiar(destino, paginas=paginas, pausa=pausa, verificacion_rapida=True)
+    # La foto tiene los datos de cuando empezó la copia
+    os.utime(destino, (inicio, inicio))
+    # Las conexiones abiertas siguen viendo el archivo anterior hasta cerrarse
+    connections[alias()].close()
+    return {'ruta': destino, 'bytes': destino.stat().st_size, **resultado}
+
+
+class RouterReplica:
+    """Router de la réplica de lectura. Va antes de RouterFragmentos en DATABASE_ROUTERS."""
+
+    def db_for_read(self, model, **hints):
+        leyendo = _leyendo.get()
+        # Dentro de fragmentos.usar corren el mantenimiento de agregados y los reportes por base
+        if leyendo is None or fragmentos.fijada() is not None:
+            return None
+        if model._meta.app_label != 'empresa' or model in SOLO_PRINCIPAL:
+            return None
+        return leyendo[0]
+
+    def db_for_write(self, model, **hints):
+        instancia = hints.get('instance')
+        if alias() and instancia is not None and instancia._state.db == alias():
+            # Sin esto Django guardaría el objeto en la base de la que se leyó
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        bases = {DEFAULT_DB_ALIAS, alias()}
+        if alias() and obj1._state.db in bases and obj2._state.db in bases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # La réplica es una copia de la principal, con sus tablas y migraciones
+        if alias() and db == alias():
+            return False
+        return None
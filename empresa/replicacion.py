@@ -0,0 +1,457 @@
+# empresa/replicacion.py
+
+"""
+Replicación de los servidores de cada mina (nodos de sitio) hacia la
+oficina central.
+
+Cada sitio sigue capturando aunque se corte el enlace. Sus cambios a
+movimientos, viajes, informes, posturas y producción salen del registro
+de cambios (empresa/cambios.py, consumidor 'replicacion') y se agrupan en
+conjuntos comprimidos con un uuid y un número de secuencia por nodo
+(ConjuntoReplicacion). El conjunto y el avance del cursor se guardan en la
+misma transacción, así que ningún cambio queda fuera ni entra en dos
+conjuntos. El comando `replicar` envía los pendientes en orden y los
+reenvía mientras la central no confirme.
+
+Los ids de los datos maestros no coinciden entre sitios: empleados,
+equipos y supervisores viajan por su clave natural (código de trabajador,
+código de equipo y nombre). Los ids de las filas replicadas se conservan
+y la central los traduce con RegistroReplicado (nodo, modelo, id en el
+sitio -> id en la central).
+
+La central aplica cada conjunto una sola vez (por uuid) y en orden por
+nodo; un hueco en la secuencia se rechaza para que el sitio reenvíe desde
+el que falta. Reglas de conflicto:
+
+- Gana la última escritura: un cambio más antiguo que el último aplicado
+  a la misma fila (desde cualquier nodo) no pisa sus datos.
+- Informes con la misma fecha y turno, y producción del mismo equipo en el
+  mismo informe, se funden en una sola fila de la central.
+- Una postura cuyo número ya usa otra del mismo informe recibe el
+  siguiente número libre.
+- Una baja borra la fila de la central solo si ningún otro nodo la usa.
+- Un empleado o supervisor que la central no conoce queda vacío; sin el
+  equipo o sin la fila padre (informe, movimiento, postura) el cambio se
+  omite. Todo queda anotado en los conflictos del ConjuntoRecibido.
+- Archivar un año en un sitio no borra nada en la central; restaurarlo
+  vuelve a enviar las filas como altas.
+
+La central aplica los cambios con el ORM, así que sus tablas agregadas
+(utilización, jornada, cubo de viajes) se mantienen como con cualquier
+otra escritura.
+"""
+
+import gzip
+import hmac
+import json
+import urllib.error
+import urllib.request
+from datetime import timedelta, timezone as zona
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import cambios
+from .models import (
+    ConjuntoRecibido, ConjuntoReplicacion, ConsumidorCambios, Empleado, EventoCambio, InformeDiario, Maquinaria,
+    ProduccionEquipo, Postura, RegistroReplicado, Supervisor,
+)
+
+# Nombre del consumidor del registro de cambios
+CONSUMIDOR = 'replicacion'
+
+MODELOS = cambios.MODELOS
+
+# Orden de la carga inicial: los padres antes que los hijos
+ORDEN_INICIAL = ['informediario', 'postura', 'movimiento', 'produccionequipo', 'viaje']
+
+# Datos maestros -> campo con su clave natural
+CLAVES_NATURALES = {Empleado: 'codigo_trabajador', Maquinaria: 'codigo_eq', Supervisor: 'nombre_completo'}
+
+# Eventos por conjunto
+LOTE = getattr(settings, 'REPLICACION_LOTE', 1000)
+
+# Segundos de espera por cada envío a la central
+TIEMPO_ESPERA = getattr(settings, 'REPLICACION_TIEMPO_ESPERA', 30)
+
+# Días que se guardan los conjuntos ya confirmados por la central
+RETENER_DIAS = getattr(settings, 'REPLICACION_RETENER_DIAS', 7)
+
+RUTA_API = '/api/replicacion/conjuntos/'
+
+
+def _nodo():
+    nodo = getattr(settings, 'REPLICACION_NODO', '')
+    if not nodo:
+        raise ValueError("Falta REPLICACION_NODO: el nombre de este sitio para la central.")
+    return nodo
+
+
+def _maestros(clase):
+    """Claves foráneas de `clase` a datos maestros: [(attname, nombre, modelo maestro)]."""
+    return [
+        (campo.attname, campo.name, campo.related_model) for campo in clase._meta.concrete_fields
+        if campo.is_relation and campo.related_model in CLAVES_NATURALES
+    ]
+
+
+def _replicadas(clase):
+    """Claves foráneas de `clase` a otras filas replicadas: [(attname, nombre del modelo padre)]."""
+    return [
+        (campo.attname, campo.related_model._meta.model_name) for campo in clase._meta.concrete_fields
+        if campo.is_relation and campo.related_model._meta.model_name in MODELOS
+    ]
+
+
+# --- NODO DE SITIO ---
+
+def _traducir_maestros(eventos):
+    """Reemplaza en los datos los ids de maestros por su clave natural, con una consulta por modelo maestro."""
+    ids = {maestro: set() for maestro in CLAVES_NATURALES}
+    eventos = [evento for evento in eventos if evento['datos'] is not None]
+    for evento in eventos:
+        for attname, _, maestro in _maestros(MODELOS[evento['modelo']]):
+            if evento['datos'].get(attname) is not None:
+                ids[maestro].add(evento['datos'][attname])
+    claves = {
+        maestro: dict(maestro.objects.filter(id__in=pendientes).values_list('id', CLAVES_NATURALES[maestro]))
+        for maestro, pendientes in ids.items() if pendientes
+    }
+    for evento in eventos:
+        for attname, nombre, maestro in _maestros(MODELOS[evento['modelo']]):
+            valor = evento['datos'].pop(attname, None)
+            evento['datos'][nombre] = claves.get(maestro, {}).get(valor)
+
+
+def _limpiar(modelo, datos):
+    # Las columnas generadas las calcula la central
+    clase = MODELOS[modelo]
+    for campo in clase._meta.concrete_fields:
+        if campo.generated or campo.primary_key:
+            datos.pop(campo.attname, None)
+    return datos
+
+
+def _guardar_conjunto(eventos):
+    """Crea el siguiente ConjuntoReplicacion con `eventos`. Debe llamarse dentro de una transacción."""
+    _traducir_maestros(eventos)
+    secuencia = (ConjuntoReplicacion.objects.aggregate(ultima=Max('secuencia'))['ultima'] or 0) + 1
+    conjunto = ConjuntoReplicacion(secuencia=secuencia, eventos=len(eventos))
+    contenido = {'uuid': str(conjunto.uuid), 'nodo': _nodo(), 'secuencia': secuencia, 'eventos': eventos}
+    conjunto.contenido = gzip.compress(
+        json.dumps(contenido, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    )
+    conjunto.save()
+    return conjunto
+
+
+def preparar_conjunto(limite=None):
+    """
+    Agrupa en un conjunto los siguientes eventos del registro de cambios y
+    avanza el cursor del consumidor en la misma transacción. Devuelve
+    cuántos eventos se leyeron (0 si no había nuevos); los de archivado se
+    leen pero no se envían.
+    """
+    limite = limite or LOTE
+    with transaction.atomic():
+        cursor = ConsumidorCambios.objects.filter(nombre=CONSUMIDOR).values_list('cursor', flat=True).first() or 0
+        leidos = cambios.eventos_desde(cursor, limite)
+        if not leidos:
+            return 0
+        eventos = [
+            {
+                'modelo': evento['modelo'], 'id': evento['objeto_id'],
+                # Restaurar un año archivado equivale a volver a dar de alta sus filas
+                'operacion': 'I' if evento['operacion'] == 'R' else evento['operacion'],
+                'registrado_en': evento['registrado_en'],
+                'datos': _limpiar(evento['modelo'], evento['datos']) if evento['operacion'] != 'D' else None,
+            }
+            # Archivar un año es una limpieza local, no una baja en la central
+            for evento in leidos if evento['operacion'] != 'A'
+        ]
+        if eventos:
+            _guardar_conjunto(eventos)
+        cambios.confirmar(CONSUMIDOR, leidos[-1]['id'])
+    return len(leidos)
+
+
+def encolar_estado_actual(limite=None):
+    """
+    Carga inicial: encola como altas todas las filas actuales, por lotes y
+    con los padres antes que los hijos, y salta el cursor al último evento.
+    Los cambios que ocurran mientras tanto llegan después como eventos con
+    fecha posterior, así que ganan sobre la foto. Devuelve cuántos conjuntos se crearon.
+    """
+    limite = limite or LOTE
+    registrado_en = timezone.now().isoformat()
+    ultimo = EventoCambio.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+    cambios.confirmar(CONSUMIDOR, ultimo)
+    creados = 0
+    for modelo in ORDEN_INICIAL:
+        clase = MODELOS[modelo]
+        campos = [campo.attname for campo in clase._meta.concrete_fields]
+        desde = 0
+        while True:
+            filas = list(clase.objects.filter(id__gt=desde).order_by('id').values(*campos)[:limite])
+            if not filas:
+                break
+            desde = filas[-1]['id']
+            eventos = [
+                {'modelo': modelo, 'id': fila['id'], 'operacion': 'I', 'registrado_en': registrado_en,
+                 'datos': _limpiar(modelo, fila)}
+                for fila in filas
+            ]
+            with transaction.atomic():
+                _guardar_conjunto(eventos)
+            creados += 1
+    return creados
+
+
+def _enviar(conjunto, url, token):
+    """POST del conjunto a la central. Devuelve (código HTTP, respuesta JSON)."""
+    peticion = urllib.request.Request(
+        url.rstrip('/') + RUTA_API, data=bytes(conjunto.contenido), method='POST',
+        headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip', 'Authorization': f'Token {token}'},
+    )
+    try:
+        with urllib.request.urlopen(peticion, timeout=TIEMPO_ESPERA) as respuesta:
+            return respuesta.status, json.loads(respuesta.read())
+    except urllib.error.HTTPError as exc:
+        try:
+            cuerpo = json.loads(exc.read())
+        except ValueError:
+            cuerpo = {}
+        return exc.code, cuerpo
+
+
+def enviar_pendientes(url=None, token=None):
+    """
+    Envía a la central los conjuntos pendientes, en orden, hasta terminar
+    o hasta el primer fallo. Devuelve un resumen con los enviados, los que
+    la central ya tenía y los eventos aplicados y en conflicto. Un error de red lanza OSError (se
+    reintenta en el próximo envío); un rechazo de la central, ValueError.
+    """
+    url = url or getattr(settings, 'REPLICACION_CENTRAL_URL', '')
+    token = token or getattr(settings, 'REPLICACION_TOKEN', '')
+    if not url:
+        raise ValueError("Falta REPLICACION_CENTRAL_URL: la dirección de la oficina central.")
+    resumen = {'enviados': 0, 'duplicados': 0, 'aplicados': 0, 'conflictos': 0}
+    while True:
+        conjunto = ConjuntoReplicacion.objects.filter(enviado_en__isnull=True).order_by('secuencia').first()
+        if conjunto is None:
+            break
+        estado, respuesta = _enviar(conjunto, url, token)
+        if estado == 409 and respuesta.get('esperada'):
+            # La central perdió conjuntos ya confirmados (p. ej. se restauró un respaldo): se reenvían
+            # desde el que espera, si todavía están guardados
+            esperada = respuesta['esperada']
+            if esperada < conjunto.secuencia and ConjuntoReplicacion.objects.filter(secuencia=esperada).exists():
+                ConjuntoReplicacion.objects.filter(secuencia__gte=esperada).update(enviado_en=None)
+                continue
+        if estado != 200:
+            raise ValueError(
+                f"La central rechazó el conjunto #{conjunto.secuencia} ({estado}): {respuesta.get('error', respuesta)}"
+            )
+        conjunto.enviado_en = timezone.now()
+        conjunto.save(update_fields=['enviado_en'])
+        resumen['enviados'] += 1
+        resumen['duplicados'] += respuesta.get('estado') == 'duplicado'
+        resumen['aplicados'] += respuesta.get('aplicados', 0)
+        resumen['conflictos'] += respuesta.get('conflictos', 0)
+    return resumen
+
+
+def purgar_enviados(dias=None):
+    """Borra los conjuntos que la central confirmó hace más de `dias`. Devuelve cuántos se borraron."""
+    dias = RETENER_DIAS if dias is None else dias
+    borrados, _ = ConjuntoReplicacion.objects.filter(
+        enviado_en__lt=timezone.now() - timedelta(days=dias)
+    ).delete()
+    return borrados
+
+
+# --- NODO CENTRAL ---
+
+class _Omitido(Exception):
+    pass
+
+
+class _Aplicador:
+    """Aplica los eventos de un conjunto de `nodo`, con cachés de maestros y de ids traducidos."""
+
+    def __init__(self, nodo):
+        self.nodo = nodo
+        self.conflictos = []
+        self._maestros = {maestro: {} for maestro in CLAVES_NATURALES}
+
+    def _conflicto(self, evento, motivo):
+        self.conflictos.append({'modelo': evento['modelo'], 'id': evento['id'], 'motivo': motivo})
+
+    def _maestro(self, maestro, clave):
+        cache = self._maestros[maestro]
+        if clave not in cache:
+            cache[clave] = maestro.objects.filter(**{CLAVES_NATURALES[maestro]: clave}).values_list('id', flat=True).first()
+        return cache[clave]
+
+    def _registro(self, modelo, id_origen):
+        return RegistroReplicado.objects.filter(nodo=self.nodo, modelo=modelo, id_origen=id_origen).first()
+
+    def _valores(self, evento):
+        """Valores de los campos del evento, con las claves foráneas traducidas a ids de la central."""
+        clase = MODELOS[evento['modelo']]
+        datos = evento['datos']
+        valores = {}
+        for attname, nombre, maestro in _maestros(clase):
+            clave = datos.get(nombre)
+            valor = self._maestro(maestro, clave) if clave is not None else None
+            if valor is None and clave is not None:
+                if not clase._meta.get_field(nombre).null:
+                    raise _Omitido(f"{maestro._meta.verbose_name} desconocido: {clave}")
+                self._conflicto(evento, f"{maestro._meta.verbose_name} desconocido, queda vacío: {clave}")
+            valores[attname] = valor
+        for attname, padre in _replicadas(clase):
+            id_origen = datos.get(attname)
+            if id_origen is None:
+                valores[attname] = None
+                continue
+            registro = self._registro(padre, id_origen)
+            if registro is None:
+                raise _Omitido(f"{padre} #{id_origen} del sitio no existe en la central")
+            valores[attname] = registro.objeto_id
+        for campo in clase._meta.concrete_fields:
+            if campo.attname in datos and campo.attname not in valores and not (campo.generated or campo.primary_key):
+                valores[campo.attname] = campo.to_python(datos[campo.attname])
+        return valores
+
+    def _equivalente(self, clase, valores):
+        """Fila de la central que representa lo mismo aunque venga de otro nodo."""
+        if clase is InformeDiario:
+            return InformeDiario.objects.filter(fecha=valores['fecha'], turno=valores['turno']).first()
+        if clase is ProduccionEquipo and valores['informe_id'] is not None:
+            return ProduccionEquipo.objects.filter(
+                informe_id=valores['informe_id'], maquinaria_id=valores['maquinaria_id']
+            ).first()
+        return None
+
+    def _mas_reciente(self, modelo, objeto_id):
+        return RegistroReplicado.objects.filter(modelo=modelo, objeto_id=objeto_id).aggregate(
+            ultimo=Max('registrado_en'))['ultimo']
+
+    def _borrar(self, evento, registro, registrado_en):
+        if registro is None:
+            return
+        clase = MODELOS[evento['modelo']]
+        ultimo = self._mas_reciente(evento['modelo'], registro.objeto_id)
+        registro.delete()
+        if ultimo and registrado_en < ultimo:
+            self._conflicto(evento, "baja anterior al último cambio; la fila se conserva")
+        elif RegistroReplicado.objects.filter(modelo=evento['modelo'], objeto_id=registro.objeto_id).exists():
+            self._conflicto(evento, "la fila la usa otro nodo; solo se desvincula")
+        else:
+            objeto = clase.objects.filter(pk=registro.objeto_id).first()
+            if objeto is not None:
+                objeto.delete()
+
+    def _guardar(self, evento, registro, registrado_en):
+        clase = MODELOS[evento['modelo']]
+        valores = self._valores(evento)
+        objeto = clase.objects.filter(pk=registro.objeto_id).first() if registro else None
+        if objeto is None:
+            objeto = self._equivalente(clase, valores) or clase()
+
+        ultimo = self._mas_reciente(evento['modelo'], objeto.pk) if objeto.pk else None
+        if ultimo and registrado_en < ultimo:
+            self._conflicto(evento, "cambio anterior al último aplicado; se conservan los datos actuales")
+        else:
+            if clase is Postura:
+                self._numerar_postura(evento, objeto, valores)
+            for attname, valor in valores.items():
+                setattr(objeto, attname, valor)
+            objeto.save()
+
+        if registro is not None:
+            registrado_en = max(registrado_en, registro.registrado_en)
+        RegistroReplicado.objects.update_or_create(
+            nodo=self.nodo, modelo=evento['modelo'], id_origen=evento['id'],
+            defaults={'objeto_id': objeto.pk, 'registrado_en': registrado_en},
+        )
+
+    def _numerar_postura(self, evento, objeto, valores):
+        ocupada = Postura.objects.filter(
+            informe_id=valores['informe_id'], numero_postura=valores['numero_postura']
+        ).exclude(pk=objeto.pk).exists()
+        if not ocupada:
+            return
+        if objeto.pk and objeto.informe_id == valores['informe_id']:
+            # Ya se había renumerado: conserva el número que tiene en la central
+            valores['numero_postura'] = objeto.numero_postura
+            return
+        siguiente = (Postura.objects.filter(informe_id=valores['informe_id'])
+                     .aggregate(ultimo=Max('numero_postura'))['ultimo'] or 0) + 1
+        self._conflicto(evento, f"postura {valores['numero_postura']} ya existe en el informe; pasa a ser la {siguiente}")
+        valores['numero_postura'] = siguiente
+
+    def aplicar(self, evento):
+        """Aplica un evento. Devuelve True si se aplicó (aunque con conflictos), False si se omitió."""
+        registrado_en = parse_datetime(evento['registrado_en'])
+        if timezone.is_naive(registrado_en):
+            registrado_en = timezone.make_aware(registrado_en, zona.utc)
+        registro = self._registro(evento['modelo'], evento['id'])
+        try:
+            # Cada evento en su propio punto de guardado: uno que falla no revierte el resto
+            with transaction.atomic():
+                if evento['operacion'] == 'D':
+                    self._borrar(evento, registro, registrado_en)
+                else:
+                    self._guardar(evento, registro, registrado_en)
+        except _Omitido as exc:
+            self._conflicto(evento, f"omitido: {exc}")
+            return False
+        except IntegrityError as exc:
+            self._conflicto(evento, f"omitido: {exc}")
+            return False
+        return True
+
+
+def token_valido(token):
+    """Compara el token recibido con REPLICACION_TOKEN; sin token configurado la central no recibe nada."""
+    esperado = getattr(settings, 'REPLICACION_TOKEN', '')
+    return bool(esperado) and hmac.compare_digest(token.encode('utf-8'), esperado.encode('utf-8'))
+
+
+def aplicar_conjunto(contenido):
+    """
+    Aplica en la central un conjunto ya descomprimido. Devuelve un resumen
+    con 'estado' ('aplicado' o 'duplicado'), 'aplicados' y 'conflictos'.
+    Lanza ValueError si el conjunto no es el siguiente de su nodo; el
+    mensaje lleva la secuencia esperada en `exc.esperada`.
+    """
+    try:
+        uuid, nodo, secuencia, eventos = (
+            contenido['uuid'], str(contenido['nodo']), int(contenido['secuencia']), contenido['eventos']
+        )
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("Conjunto de cambios mal formado.")
+    if ConjuntoRecibido.objects.filter(uuid=uuid).exists():
+        return {'estado': 'duplicado', 'aplicados': 0, 'conflictos': 0}
+    try:
+        with transaction.atomic():
+            ultima = ConjuntoRecibido.objects.filter(nodo=nodo).aggregate(ultima=Max('secuencia'))['ultima'] or 0
+            if secuencia != ultima + 1:
+                error = ValueError(f"Se esperaba el conjunto #{ultima + 1} de {nodo}, llegó el #{secuencia}.")
+                error.esperada = ultima + 1
+                raise error
+            aplicador = _Aplicador(nodo)
+            aplicados = sum(aplicador.aplicar(evento) for evento in eventos)
+            ConjuntoRecibido.objects.create(
+                uuid=uuid, nodo=nodo, secuencia=secuencia, eventos=len(eventos), aplicados=aplicados,
+                conflictos=aplicador.conflictos,
+            )
+    except IntegrityError:
+        # Otro envío del mismo conjunto se aplicó en paralelo
+        return {'estado': 'duplicado', 'aplicados': 0, 'conflictos': 0}
+    return {'estado': 'aplicado', 'aplicados': aplicados, 'conflictos': len(aplicador.conflictos)}
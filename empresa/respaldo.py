@@ -0,0 +1,226 @@
+# empresa/respaldo.py
+
+"""
+Respaldo en línea de la base SQLite, sin detener la aplicación.
+
+Se usa la API de respaldo de SQLite en pasos de pocas páginas con una
+pausa entre uno y otro, para no acaparar el disco. Cómo afecta a las
+escrituras depende del modo del diario de la base:
+
+- WAL: la copia se hace dentro de una transacción de lectura, así que ve
+  una foto fija de la base y no se reinicia. En WAL los lectores no
+  bloquean a los escritores: las escrituras no esperan a la copia.
+- Diario clásico (el modo por defecto): el bloqueo de lectura se toma solo
+  durante cada paso, así que una escritura espera como mucho un paso (unos
+  pocos milisegundos). Pero cada escritura de otra conexión hace que SQLite
+  vuelva a empezar la copia; después de RESPALDO_MAX_REINICIOS reinicios
+  se agranda el paso para que termine aun con escrituras continuas, y el
+  resultado informa el paso más largo. Con escrituras frecuentes conviene
+  pasar la base a WAL (`respaldar_base --wal`, que es persistente).
+
+La copia se escribe con nombre temporal, se verifica con
+`PRAGMA integrity_check` (o quick_check) y recién entonces toma su nombre definitivo;
+después se borran los respaldos más antiguos que RESPALDO_RETENER.
+`respaldo_pendiente` permite llamar al comando desde cron cada pocos
+minutos y respaldar solo cuando corresponde (ver el comando respaldar_base).
+"""
+
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+PREFIJO = 'db-'
+EXTENSION = '.sqlite3'
+
+
+def directorio():
+    return Path(getattr(settings, 'RESPALDO_DIR', settings.BASE_DIR / 'respaldos'))
+
+
+def disponible(conexion=connection):
+    return conexion.vendor == 'sqlite'
+
+
+def activar_wal(conexion=connection):
+    """Pasa la base a modo WAL y devuelve el modo resultante. El modo queda guardado en el archivo."""
+    with conexion.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        return cursor.fetchone()[0]
+
+
+# Cada cuántos pasos se baja a disco lo ya copiado
+_PASOS_POR_VOLCADO = 16
+
+
+class _Reiniciado(Exception):
+    pass
+
+
+def _intento(origen, ruta, paginas, pausa, max_reinicios, espera_maxima, estadisticas):
+    """Una copia completa a `ruta`, desde cero. Lanza _Reiniciado si las escrituras la reinician demasiado."""
+    ruta.unlink(missing_ok=True)
+    destino = sqlite3.connect(ruta)
+    # La copia es un archivo temporal: sin diario y con poco caché, las páginas
+    # van al disco a medida que se copian y se bajan de a poco con fdatasync, en
+    # vez de un solo volcado de toda la base al final que frena los fsync de la aplicación
+    destino.execute('PRAGMA journal_mode=OFF')
+    destino.execute('PRAGMA synchronous=OFF')
+    destino.execute('PRAGMA cache_size=-8192')
+    descriptor = os.open(ruta, os.O_RDONLY | os.O_CREAT)
+    estado = {'restantes': None, 'reinicios': 0, 'inicio_paso': time.perf_counter(), 'ultimo_avance': time.monotonic()}
+
+    def progreso(status, restantes, total):
+        if status in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED):
+            # Otra conexión tiene la base bloqueada; sqlite3 reintenta por su cuenta
+            if time.monotonic() - estado['ultimo_avance'] > espera_maxima:
+                raise ValueError(f"La base estuvo bloqueada más de {espera_maxima} s; no se pudo respaldar.")
+            return
+        estado['ultimo_avance'] = time.monotonic()
+        estadisticas['pasos'] += 1
+        estadisticas['paso_mas_largo'] = max(estadisticas['paso_mas_largo'], time.perf_counter() - estado['inicio_paso'])
+        if estado['restantes'] is not None and restantes > estado['restantes']:
+            # Otra conexión escribió: SQLite volvió a empezar la copia
+            estadisticas['reinicios'] += 1
+            estado['reinicios'] += 1
+            if estado['reinicios'] >= max_reinicios:
+                raise _Reiniciado()
+        estado['restantes'] = restantes
+        if estadisticas['pasos'] % _PASOS_POR_VOLCADO == 0:
+            os.fdatasync(descriptor)
+        if restantes:
+            time.sleep(pausa)
+        estado['inicio_paso'] = time.perf_counter()
+
+    try:
+        origen.backup(destino, pages=paginas, progress=progreso, sleep=0.05)
+        # La copia hereda el modo WAL del origen; un respaldo queda en un solo archivo
+        destino.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        destino.close()
+        os.fsync(descriptor)
+        os.close(descriptor)
+
+
+def _copiar(origen, ruta, paginas, pausa, max_reinicios, espera_maxima):
+    """Copia `origen` a `ruta` por pasos. Devuelve estadísticas de la copia."""
+    estadisticas = {'pasos': 0, 'paso_mas_largo': 0.0, 'reinicios': 0, 'paginas_por_paso': paginas}
+    while True:
+        try:
+            _intento(origen, ruta, paginas, pausa, max_reinicios, espera_maxima, estadisticas)
+            return estadisticas
+        except _Reiniciado:
+            # Pasos más grandes: menos oportunidades de reinicio, a cambio de bloqueos más largos
+            paginas *= 4
+            estadisticas['paginas_por_paso'] = paginas
+
+
+def verificar(ruta, rapida=False):
+    """
+    Devuelve None si la copia está íntegra, o el primer problema que informa
+    SQLite. La verificación rápida (quick_check) no revisa los índices
+    contra las tablas y tarda una fracción.
+    """
+    conexion = sqlite3.connect(f'file:{ruta}?mode=ro', uri=True)
+    try:
+        resultado = conexion.execute(f"PRAGMA {'quick_check' if rapida else 'integrity_check'}").fetchone()[0]
+    finally:
+        conexion.close()
+    return None if resultado == 'ok' else resultado
+
+
+def respaldos():
+    """Rutas de los respaldos terminados, del más antiguo al más nuevo."""
+    return sorted(directorio().glob(f'{PREFIJO}*{EXTENSION}'))
+
+
+def rotar(retener):
+    """Borra los respaldos más antiguos, dejando los `retener` más nuevos (0 los deja todos). Devuelve los borrados."""
+    borrados = respaldos()[:-retener] if retener > 0 else []
+    for ruta in borrados:
+        ruta.unlink(missing_ok=True)
+    return borrados
+
+
+def respaldo_pendiente(intervalo=None):
+    """True si el respaldo más nuevo tiene más de `intervalo` (por defecto RESPALDO_INTERVALO_HORAS)."""
+    intervalo = intervalo or timedelta(hours=getattr(settings, 'RESPALDO_INTERVALO_HORAS', 24))
+    existentes = respaldos()
+    if not existentes:
+        return True
+    ultimo = datetime.fromtimestamp(existentes[-1].stat().st_mtime, tz=timezone.get_current_timezone())
+    return timezone.now() - ultimo >= intervalo
+
+
+def copiar(ruta, paginas=None, pausa=None, max_reinicios=None, verificacion_rapida=False, conexion=connection):
+    """
+    Copia en línea la base de `conexion` a `ruta` y la verifica. La copia se
+    escribe con nombre temporal y toma el definitivo recién verificada, así
+    quien lee `ruta` nunca ve una copia a medias. Devuelve las estadísticas
+    de la copia; si no está íntegra se borra y se lanza ValueError.
+    """
+    if not disponible(conexion):
+        raise ValueError("La copia en línea requiere SQLite.")
+    paginas = paginas or getattr(settings, 'RESPALDO_PAGINAS_POR_PASO', 256)
+    pausa = getattr(settings, 'RESPALDO_PAUSA_SEGUNDOS', 0.005) if pausa is None else pausa
+    max_reinicios = max_reinicios or getattr(settings, 'RESPALDO_MAX_REINICIOS', 3)
+    espera_maxima = getattr(settings, 'RESPALDO_ESPERA_MAXIMA_SEGUNDOS', 60)
+    ruta = Path(ruta)
+    temporal = ruta.with_name(ruta.name + '.parcial')
+
+    inicio = time.perf_counter()
+    try:
+        # Conexión propia, para no tocar el estado de transacción de la de Django
+        origen = sqlite3.connect(**conexion.get_connection_params())
+        try:
+            modo = origen.execute('PRAGMA journal_mode').fetchone()[0]
+            if modo == 'wal':
+                origen.execute('BEGIN')
+                origen.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()
+            estadisticas = _copiar(origen, temporal, paginas, pausa, max_reinicios, espera_maxima)
+        finally:
+            origen.close()
+        duracion_copia = time.perf_counter() - inicio
+        problema = verificar(temporal, rapida=verificacion_rapida)
+        if problema:
+            raise ValueError(f"La copia no pasó la verificación de integridad: {problema}")
+    except BaseException:
+        temporal.unlink(missing_ok=True)
+        raise
+    temporal.replace(ruta)
+    return {'modo_diario': modo, 'duracion_copia': duracion_copia, **estadisticas}
+
+
+def respaldar(paginas=None, pausa=None, retener=None, max_reinicios=None, verificacion_rapida=False, conexion=connection):
+    """
+    Respalda la base de `conexion` en el directorio de respaldos, verifica
+    la copia y rota los antiguos. Devuelve un resumen con la ruta, el tamaño,
+    la duración, el rendimiento y el paso más largo. Si la copia no está
+    íntegra se borra y se lanza ValueError.
+    """
+    if not disponible(conexion):
+        raise ValueError("El respaldo en línea requiere SQLite.")
+    retener = getattr(settings, 'RESPALDO_RETENER', 7) if retener is None else retener
+
+    directorio().mkdir(parents=True, exist_ok=True)
+    # Con microsegundos, dos respaldos en el mismo segundo no se pisan
+    ruta = directorio() / f"{PREFIJO}{timezone.localtime().strftime('%Y%m%d-%H%M%S-%f')}{EXTENSION}"
+
+    inicio = time.perf_counter()
+    estadisticas = copiar(ruta, paginas, pausa, max_reinicios, verificacion_rapida, conexion)
+    duracion = time.perf_counter() - inicio
+
+    tamano = ruta.stat().st_size
+    return {
+        'ruta': ruta,
+        'bytes': tamano,
+        'duracion': duracion,
+        'bytes_por_segundo': tamano / estadisticas['duracion_copia'] if estadisticas['duracion_copia'] else 0,
+        'rotados': rotar(retener),
+        **estadisticas,
+    }
@@ -0,0 +1,310 @@
+# empresa/signals.py
+
+"""
+Receptores de signals de los modelos. Se registran en EmpresaConfig.ready().
+"""
+
+import copy
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cubo, diferido, eventos, fragmentos, jornada, posturas, productividad, replica, utilizacion
+from .models import Empleado, InformeDiario, Movimiento, Postura, ProduccionEquipo, Viaje
+
+
+# --- VALORES ANTERIORES DE UN MOVIMIENTO ---
+# Los agregados que se mantienen al guardar necesitan saber dónde estaba
+# el movimiento antes del cambio (equipo y fecha pueden cambiar).
+
+CAMPOS_ANTERIORES = ['maquinaria_id', 'empleado_id', 'fecha', 'turno']
+
+
+@receiver(pre_save, sender=Movimiento)
+def guardar_valores_anteriores(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    instance._valores_anteriores = None
+    if instance.pk and not raw:
+        instance._valores_anteriores = Movimiento.objects.using(using).filter(pk=instance.pk).values(*CAMPOS_ANTERIORES).first()
+
+
+# --- UTILIZACIÓN DIARIA ---
+# Los días afectados se acumulan y se recalculan una vez al confirmar, así un
+# borrado masivo no recalcula el mismo día por cada fila.
+
+@receiver(post_save, sender=Movimiento)
+def actualizar_utilizacion_guardado(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    if raw:
+        return
+    claves = {(instance.maquinaria_id, instance.fecha)}
+    anteriores = getattr(instance, '_valores_anteriores', None)
+    if anteriores:
+        claves.add((anteriores['maquinaria_id'], anteriores['fecha']))
+    diferido.al_confirmar(utilizacion.actualizar_dias, claves, using=using)
+
+
+@receiver(post_delete, sender=Movimiento)
+def actualizar_utilizacion_eliminado(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    diferido.al_confirmar(utilizacion.actualizar_dias, {(instance.maquinaria_id, instance.fecha)}, using=using)
+
+
+# --- JORNADA LABORAL ---
+# Igual que la utilización, pero por trabajador y día.
+
+@receiver(post_save, sender=Movimiento)
+def actualizar_jornada_guardado(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    if raw:
+        return
+    claves = {(instance.empleado_id, instance.fecha)}
+    anteriores = getattr(instance, '_valores_anteriores', None)
+    if anteriores:
+        claves.add((anteriores['empleado_id'], anteriores['fecha']))
+    diferido.al_confirmar(jornada.actualizar_dias, claves, using=using)
+
+
+@receiver(post_delete, sender=Movimiento)
+def actualizar_jornada_eliminado(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    diferido.al_confirmar(jornada.actualizar_dias, {(instance.empleado_id, instance.fecha)}, using=using)
+
+
+# --- CUBO DE VIAJES ---
+# Se vuelven a sumar, al confirmar, los turnos de los viajes y posturas
+# tocados. Si se borra el informe, sus posturas ya no existen al confirmar
+# y el turno se toma del propio informe. Si un viaje, una postura o un
+# informe cambia de turno se suman el turno anterior y el nuevo.
+
+@receiver(pre_save, sender=Viaje)
+def guardar_postura_anterior(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    instance._postura_anterior = None
+    if instance.pk and not raw:
+        instance._postura_anterior = Viaje.objects.using(using).filter(pk=instance.pk).values_list('postura_id', flat=True).first()
+
+
+@receiver(post_save, sender=Viaje)
+def actualizar_cubo_viaje_guardado(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    if raw:
+        return
+    postura_ids = {instance.postura_id}
+    if getattr(instance, '_postura_anterior', None):
+        postura_ids.add(instance._postura_anterior)
+    diferido.al_confirmar(cubo.actualizar_posturas, postura_ids, using=using)
+
+
+@receiver(post_delete, sender=Viaje)
+def actualizar_cubo_viaje_eliminado(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    diferido.al_confirmar(cubo.actualizar_posturas, {instance.postura_id}, using=using)
+
+
+@receiver(pre_save, sender=Postura)
+def guardar_informe_anterior(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    instance._informe_anterior = None
+    if instance.pk and not raw:
+        instance._informe_anterior = Postura.objects.using(using).filter(pk=instance.pk).values_list('informe_id', flat=True).first()
+
+
+@receiver(post_save, sender=Postura)
+@receiver(post_delete, sender=Postura)
+def actualizar_cubo_postura(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    if raw:
+        return
+    informe_ids = {instance.informe_id}
+    if getattr(instance, '_informe_anterior', None):
+        informe_ids.add(instance._informe_anterior)
+    diferido.al_confirmar(cubo.actualizar_informes, informe_ids, using=using)
+
+
+@receiver(pre_save, sender=InformeDiario)
+def guardar_turno_anterior(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    instance._turno_anterior = None
+    if instance.pk and not raw:
+        instance._turno_anterior = InformeDiario.objects.using(using).filter(pk=instance.pk).values_list('fecha', 'turno').first()
+
+
+@receiver(post_save, sender=InformeDiario)
+def actualizar_cubo_informe_guardado(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    anterior = getattr(instance, '_turno_anterior', None)
+    if raw or not anterior or anterior == (instance.fecha, instance.turno):
+        return
+    diferido.al_confirmar(cubo.actualizar_turnos, {anterior, (instance.fecha, instance.turno)}, using=using)
+
+
+@receiver(post_delete, sender=InformeDiario)
+def actualizar_cubo_informe(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    diferido.al_confirmar(cubo.actualizar_turnos, {(instance.fecha, instance.turno)}, using=using)
+
+
+@receiver(post_save, sender=Movimiento)
+def actualizar_cubo_movimiento(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    # Solo importa si cambió el equipo, que es una dimensión del cubo
+    anteriores = getattr(instance, '_valores_anteriores', None)
+    if not raw and anteriores and anteriores['maquinaria_id'] != instance.maquinaria_id:
+        diferido.al_confirmar(cubo.actualizar_movimientos, {instance.pk}, using=using)
+
+
+# --- MODO FRAGMENTADO ---
+# Los maestros, informes y posturas se copian a los fragmentos al confirmar
+# (ver fragmentos.py). Un movimiento al que se le cambia el proyecto se
+# guarda en la base del nuevo y se borra de la anterior con sus viajes.
+
+@receiver(pre_save, sender=Movimiento)
+def guardar_base_anterior(sender, instance, raw=False, **kwargs):
+    instance._base_anterior = None
+    if fragmentos.activo() and not raw and not instance._state.adding:
+        instance._base_anterior = instance._state.db
+
+
+@receiver(post_save, sender=Movimiento)
+def trasladar_movimiento(sender, instance, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    if raw or not fragmentos.activo():
+        return
+    destino = fragmentos.alias_de(instance.proyecto)
+    if using != destino:
+        # Un save(using=...) a otra base: se vuelve a guardar en la suya y este
+        # mismo receiver completa el traslado. Son dos bases sin transacción
+        # común: si el proceso se corta entre ambos pasos la fila queda en
+        # `using` y se corrige con `fragmentar --mover`. objects.create() ya
+        # inserta en la base del proyecto (ver MovimientoQuerySet).
+        instance.save(using=destino)
+        return
+    anterior = getattr(instance, '_base_anterior', None)
+    if not anterior or anterior == using:
+        return
+    posturas_copiadas = fragmentos.trasladar(instance.pk, anterior, using)
+    diferido.al_confirmar(cubo.actualizar_posturas, posturas_copiadas, using=using)
+
+
+def _replicar(sender, instance, raw=False, **kwargs):
+    if fragmentos.activo() and not raw:
+        diferido.al_confirmar(fragmentos.replicar, {(sender._meta.label, instance.pk)})
+
+
+for _modelo in fragmentos.REPLICADOS:
+    if not _modelo._meta.auto_created:
+        post_save.connect(_replicar, sender=_modelo, dispatch_uid=f'replicar_{_modelo._meta.label}_guardado')
+        post_delete.connect(_replicar, sender=_modelo, dispatch_uid=f'replicar_{_modelo._meta.label}_eliminado')
+
+
+@receiver(m2m_changed, sender=Empleado.licencias.through)
+def replicar_licencias(sender, instance, action, reverse, pk_set, **kwargs):
+    if not fragmentos.activo() or not action.startswith('post_'):
+        return
+    # Desde una licencia (reverse) cambian los empleados de pk_set; al vaciar, todos los de la licencia
+    if not reverse:
+        empleados = {instance.pk}
+    elif pk_set is not None:
+        empleados = set(pk_set)
+    else:
+        empleados = set(Empleado.objects.values_list('pk', flat=True))
+    diferido.al_confirmar(fragmentos.replicar, {(Empleado._meta.label, pk) for pk in empleados})
+
+
+# --- RÉPLICA DE LECTURA ---
+# La conexión a la réplica no escribe ni aunque se pida con using() (ver replica.py).
+
+@receiver(connection_created)
+def replica_solo_lectura(sender, connection, **kwargs):
+    if replica.alias() and connection.alias == replica.alias():
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA query_only = ON')
+
+
+# --- POSTURAS POR TURNO EN CACHÉ ---
+# Se invalida al confirmar, para que nadie vuelva a guardar en caché la
+# lista anterior mientras la transacción sigue abierta.
+
+@receiver(post_save, sender=Postura)
+@receiver(post_delete, sender=Postura)
+def invalidar_posturas_turno(sender, instance, raw=False, **kwargs):
+    if not raw:
+        diferido.al_confirmar(posturas.invalidar_informes, {instance.informe_id})
+
+
+@receiver(post_delete, sender=InformeDiario)
+def invalidar_posturas_informe(sender, instance, **kwargs):
+    # El informe ya no existe al confirmar: se invalida con sus propios datos
+    diferido.al_confirmar(posturas.invalidar, {(instance.fecha, instance.turno)})
+
+
+# --- RANKING DE PRODUCTIVIDAD EN CACHÉ ---
+# Cualquier cambio de movimientos o viajes deja sin uso los rankings
+# guardados; se hace una vez por transacción.
+
+@receiver(post_save, sender=Movimiento)
+@receiver(post_delete, sender=Movimiento)
+@receiver(post_save, sender=Viaje)
+@receiver(post_delete, sender=Viaje)
+def invalidar_productividad(sender, instance, raw=False, **kwargs):
+    if not raw:
+        diferido.al_confirmar(productividad.invalidar, ())
+
+
+# --- FLUJO DE EVENTOS EN VIVO ---
+# Se publica al confirmar la transacción, para no anunciar cambios que luego se deshacen.
+# Si no hay nadie conectado no se hace ninguna consulta extra.
+
+@receiver(post_save, sender=Movimiento)
+def publicar_movimiento_guardado(sender, instance, created, using=DEFAULT_DB_ALIAS, **kwargs):
+    if eventos.canal.hay_suscriptores():
+        anteriores = getattr(instance, '_valores_anteriores', None)
+        if anteriores and (anteriores['fecha'], anteriores['turno'], anteriores['maquinaria_id']) != (
+            instance.fecha, instance.turno, instance.maquinaria_id
+        ):
+            # Quien mira el turno (o el equipo) anterior también debe ver que el movimiento salió de ahí.
+            # Va antes que el evento nuevo, para que quien reciba los dos termine con el movimiento.
+            transaction.on_commit(lambda: eventos.publicar_movimiento_trasladado(instance, anteriores), using=using)
+        accion = 'creado' if created else 'actualizado'
+        transaction.on_commit(lambda: eventos.publicar_movimiento(instance, accion), using=using)
+
+
+@receiver(post_delete, sender=Movimiento)
+def publicar_movimiento_eliminado(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if eventos.canal.hay_suscriptores():
+        # Django borra la clave primaria de la instancia al terminar el delete: se publica una copia
+        eliminado = copy.copy(instance)
+        transaction.on_commit(lambda: eventos.publicar_movimiento(eliminado, 'eliminado'), using=using)
+
+
+def _turno_del_viaje(viaje, using):
+    # Se lee antes de confirmar: en un borrado en cascada el movimiento se borra después que sus viajes
+    return Movimiento.objects.using(using).filter(pk=viaje.movimiento_id).values_list('fecha', 'turno').first()
+
+
+@receiver(post_save, sender=Viaje)
+def publicar_viaje_guardado(sender, instance, created, raw=False, using=DEFAULT_DB_ALIAS, **kwargs):
+    if not raw and eventos.canal.hay_suscriptores():
+        turno = _turno_del_viaje(instance, using)
+        if turno:
+            accion = 'creado' if created else 'actualizado'
+            transaction.on_commit(lambda: eventos.publicar_viaje(instance, accion, *turno), using=using)
+
+
+@receiver(post_delete, sender=Viaje)
+def publicar_viaje_eliminado(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if eventos.canal.hay_suscriptores():
+        turno = _turno_del_viaje(instance, using)
+        if turno:
+            eliminado = copy.copy(instance)
+            transaction.on_commit(lambda: eventos.publicar_viaje(eliminado, 'eliminado', *turno), using=using)
+
+
+@receiver(post_save, sender=ProduccionEquipo)
+def publicar_produccion_guardada(sender, instance, created, using=DEFAULT_DB_ALIAS, **kwargs):
+    if eventos.canal.hay_suscriptores():
+        accion = 'creado' if created else 'actualizado'
+        transaction.on_commit(lambda: eventos.publicar_produccion(instance, accion), using=using)
+
+
+@receiver(pre_delete, sender=ProduccionEquipo)
+def guardar_informe_produccion(sender, instance, **kwargs):
+    if eventos.canal.hay_suscriptores():
+        # Al borrar el informe, la producción se borra en cascada después que él:
+        # se lee ahora y queda en caché en la instancia
+        instance.informe
+
+
+@receiver(post_delete, sender=ProduccionEquipo)
+def publicar_produccion_eliminada(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if eventos.canal.hay_suscriptores():
+        eliminada = copy.copy(instance)
+        transaction.on_commit(lambda: eventos.publicar_produccion(eliminada, 'eliminado'), using=using)
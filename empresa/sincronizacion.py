@@ -0,0 +1,170 @@
+# empresa/sincronizacion.py
+
+"""
+Sincronización incremental de los datos maestros (empleados, equipos,
+supervisores y posturas) para los clientes que capturan sin conexión.
+
+Cada registro tiene una fila en CambioMaestro que los triggers de SQLite
+reemplazan en la misma transacción que el cambio, así que también se
+registran bulk_create, update() y escrituras fuera del ORM. El id de esa
+fila es la versión del registro; el cliente guarda la mayor que recibió
+(el cursor) y en la siguiente sincronización pide solo lo posterior. Sin
+cambios, eso es una sola búsqueda por rango de clave primaria.
+
+Las lápidas de los borrados se conservan, de modo que cualquier cursor
+sigue siendo válido. Igual que con el índice de búsqueda, los triggers se
+vuelven a crear después de cada `migrate` (ver EmpresaConfig.ready).
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import CambioMaestro, Empleado, Maquinaria, Postura, Supervisor
+
+TABLA = CambioMaestro._meta.db_table
+
+# Cambios por respuesta; si hay más, el cliente vuelve a pedir desde el cursor devuelto
+LIMITE = getattr(settings, 'SINCRONIZACION_LIMITE', 5000)
+
+# Solo se envían las posturas de los turnos de los últimos N días y los planificados
+POSTURAS_DIAS = getattr(settings, 'SINCRONIZACION_POSTURAS_DIAS', 14)
+
+# Nombre sincronizado -> (modelo, columnas enviadas: nombre -> campo del ORM)
+MODELOS = {
+    'empleado': (Empleado, {
+        'id': 'id', 'codigo_trabajador': 'codigo_trabajador', 'nombre_completo': 'nombre_completo',
+        'rut': 'rut', 'cargo': 'cargo', 'fecha_vencimiento_licencia': 'fecha_vencimiento_licencia',
+        'fecha_termino_contrato': 'fecha_termino_contrato',
+    }),
+    'maquinaria': (Maquinaria, {
+        'id': 'id', 'codigo_eq': 'codigo_eq', 'marca': 'marca', 'modelo': 'modelo', 'tipo': 'tipo',
+        'patente': 'patente', 'horometro_actual': 'horometro_actual',
+    }),
+    'supervisor': (Supervisor, {'id': 'id', 'nombre_completo': 'nombre_completo', 'empresa': 'empresa'}),
+    'postura': (Postura, {
+        'id': 'id', 'fecha': 'informe__fecha', 'turno': 'informe__turno', 'numero_postura': 'numero_postura',
+        'tipo_actividad': 'tipo_actividad', 'origen': 'origen', 'sector_prefijo': 'sector_prefijo',
+        'sector_banco': 'sector_banco', 'sector_tiro': 'sector_tiro', 'destino': 'destino', 'material': 'material',
+    }),
+}
+
+
+def _registrar(modelo, objeto_id, eliminado=0):
+    return f"""
+        DELETE FROM {TABLA} WHERE modelo = '{modelo}' AND objeto_id = {objeto_id};
+        INSERT INTO {TABLA} (modelo, objeto_id, eliminado) VALUES ('{modelo}', {objeto_id}, {eliminado});
+    """
+
+
+def _triggers():
+    triggers = []
+    for modelo, (clase, _) in MODELOS.items():
+        tabla = clase._meta.db_table
+        triggers += [
+            f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_{modelo}_ai AFTER INSERT ON {tabla} BEGIN
+                {_registrar(modelo, 'new.id')}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_{modelo}_au AFTER UPDATE ON {tabla} BEGIN
+                {_registrar(modelo, 'new.id')}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_{modelo}_ad AFTER DELETE ON {tabla} BEGIN
+                {_registrar(modelo, 'old.id', 1)}
+            END""",
+        ]
+    # Las licencias del empleado viven en la tabla intermedia del ManyToMany
+    licencias = Empleado.licencias.through._meta.db_table
+    triggers += [
+        f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_licencias_ai AFTER INSERT ON {licencias} BEGIN
+            {_registrar('empleado', 'new.empleado_id')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_licencias_ad AFTER DELETE ON {licencias} BEGIN
+            {_registrar('empleado', 'old.empleado_id')}
+        END""",
+    ]
+    # La fecha y el turno de una postura son los de su informe
+    triggers.append(f"""CREATE TRIGGER IF NOT EXISTS {TABLA}_informe_au
+        AFTER UPDATE OF fecha, turno ON empresa_informediario BEGIN
+            DELETE FROM {TABLA} WHERE modelo = 'postura'
+                AND objeto_id IN (SELECT id FROM empresa_postura WHERE informe_id = new.id);
+            INSERT INTO {TABLA} (modelo, objeto_id, eliminado)
+                SELECT 'postura', id, 0 FROM empresa_postura WHERE informe_id = new.id ORDER BY id;
+        END""")
+    return triggers
+
+
+def disponible(conexion=connection):
+    return conexion.vendor == 'sqlite'
+
+
+def registrar_existentes(conexion=connection):
+    """Da una versión a cada registro que aún no tiene (la carga inicial de la migración)."""
+    with conexion.cursor() as cursor:
+        for modelo, (clase, _) in MODELOS.items():
+            cursor.execute(f"""
+                INSERT INTO {TABLA} (modelo, objeto_id, eliminado)
+                SELECT %s, id, 0 FROM {clase._meta.db_table}
+                WHERE id NOT IN (SELECT objeto_id FROM {TABLA} WHERE modelo = %s)
+                ORDER BY id
+            """, [modelo, modelo])
+
+
+def asegurar_triggers(conexion=connection):
+    """Crea los triggers que faltan, si las tablas ya existen."""
+    if not disponible(conexion):
+        return
+    tablas = set(conexion.introspection.table_names())
+    necesarias = {TABLA, 'empresa_informediario', Empleado.licencias.through._meta.db_table}
+    necesarias |= {clase._meta.db_table for clase, _ in MODELOS.values()}
+    if not necesarias <= tablas:
+        return
+    with conexion.cursor() as cursor:
+        for trigger in _triggers():
+            cursor.execute(trigger)
+
+
+def _filas(modelo, ids):
+    clase, columnas = MODELOS[modelo]
+    consulta = clase.objects.filter(id__in=ids).order_by('id')
+    if modelo == 'postura':
+        consulta = consulta.filter(informe__fecha__gte=timezone.localdate() - timedelta(days=POSTURAS_DIAS))
+    filas = [list(fila) for fila in consulta.values_list(*columnas.values())]
+    nombres = list(columnas)
+    if modelo == 'empleado':
+        licencias = defaultdict(list)
+        for empleado_id, nombre in (
+            Empleado.licencias.through.objects.filter(empleado_id__in=ids)
+            .order_by('tipolicencia__nombre').values_list('empleado_id', 'tipolicencia__nombre')
+        ):
+            licencias[empleado_id].append(nombre)
+        for fila in filas:
+            fila.append(licencias[fila[0]])
+        nombres.append('licencias')
+    return {'columnas': nombres, 'filas': filas}
+
+
+def cambios_desde(cursor, limite=LIMITE):
+    """
+    Registros cambiados después de la versión `cursor`, en formato por
+    columnas: {'cursor', 'completo', 'cambios': {modelo: {'columnas',
+    'filas'}}, 'eliminados': {modelo: [ids]}}. Si `completo` es falso
+    quedan más cambios y hay que volver a pedir desde el cursor devuelto.
+    """
+    versiones = list(
+        CambioMaestro.objects.filter(id__gt=cursor).order_by('id')
+        .values_list('id', 'modelo', 'objeto_id', 'eliminado')[:limite + 1]
+    )
+    completo = len(versiones) <= limite
+    versiones = versiones[:limite]
+    cambiados, eliminados = defaultdict(list), defaultdict(list)
+    for _, modelo, objeto_id, eliminado in versiones:
+        (eliminados if eliminado else cambiados)[modelo].append(objeto_id)
+    return {
+        'cursor': versiones[-1][0] if versiones else cursor,
+        'completo': completo,
+        'cambios': {modelo: _filas(modelo, ids) for modelo, ids in cambiados.items()},
+        'eliminados': dict(eliminados),
+    }
@@ -1,3 +1,1062 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib.util
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, router, transaction
+from django.db.models import Max
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import (
+    archivo, busqueda, cambios, combustible, cubo, fragmentos, importacion, jornada, productividad, replica,
+    replicacion, respaldo,
+)
+from .admin import ConteoEstimadoPaginator
+from .forms import MovimientoCompletoForm
+from .informes import agregados_movimientos
+from .models import (
+    CampoCodificado, ConjuntoRecibido, ConjuntoReplicacion, ConsumidorCambios, Empleado, EventoCambio,
+    ImportacionMovimientos, InformeDiario, JornadaDiaria, Maquinaria, Movimiento, Postura, ProduccionEquipo,
+    RegistroReplicado, Supervisor, TipoLicencia, UtilizacionDiaria, Viaje,
+)
+
+
+class ChangelistAdminTests(TestCase):
+    """
+    Cada changelist hace una cantidad fija de consultas, sin importar
+    cuántas filas muestre la página (sin N+1 por los __str__ de las FK).
+    """
+
+    # Sesión, usuario, conteo y resultados, más las dos del date_hierarchy
+    # (rango y fechas). Las tablas chicas cuentan además el total sin
+    # filtros; las grandes lo reemplazan por las dos consultas de la estimación.
+    CONSULTAS = {
+        'movimiento': 8,
+        'viaje': 6,
+        'postura': 7,
+        'produccionequipo': 7,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def crear_turno(self, numero):
+        """Crea un turno con su informe, una postura, y un movimiento, viaje y producción por equipo."""
+        fecha = date(2025, 3, numero)
+        informe = InformeDiario.objects.create(fecha=fecha, turno='Día')
+        postura = Postura.objects.create(
+            informe=informe, numero_postura=1, tipo_actividad='Producción',
+            sector_prefijo='TA', sector_banco='610', sector_tiro='23',
+        )
+        for i in range(3):
+            codigo = f'{numero:02d}{i}'
+            empleado = Empleado.objects.create(
+                codigo_trabajador=codigo, nombre_completo=f'Operador {codigo}', rut=f'{codigo}-K',
+                cargo='Operador Maquinaria', tipo_contrato='Indefinido', fecha_contratacion=date(2020, 1, 1),
+            )
+            maquinaria = Maquinaria.objects.create(codigo_eq=f'EQ-{codigo}', tipo='Camión Tolva')
+            movimiento = Movimiento.objects.create(
+                fecha=fecha, empleado=empleado, maquinaria=maquinaria, horometro_inicial=0, horometro_final=600,
+            )
+            Viaje.objects.create(movimiento=movimiento, postura=postura, cantidad=5)
+            ProduccionEquipo.objects.create(informe=informe, maquinaria=maquinaria)
+
+    def consultas_changelist(self, modelo):
+        url = reverse(f'admin:empresa_{modelo}_changelist')
+        with self.assertNumQueries(self.CONSULTAS[modelo]):
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_consultas_fijas(self):
+        self.crear_turno(1)
+        for modelo in self.CONSULTAS:
+            with self.subTest(modelo=modelo, turnos=1):
+                self.consultas_changelist(modelo)
+
+        for numero in range(2, 6):
+            self.crear_turno(numero)
+        for modelo in self.CONSULTAS:
+            with self.subTest(modelo=modelo, turnos=5):
+                self.consultas_changelist(modelo)
+
+    def test_conteo_estimado_sin_filtros(self):
+        self.crear_turno(1)
+        Movimiento.objects.filter(id=Movimiento.objects.order_by('id')[1].id).delete()
+        with mock.patch('empresa.admin.CONTEO_EXACTO_HASTA', 0):
+            # El rango de ids sobrestima los borrados; con filtros se cuenta exacto
+            self.assertEqual(ConteoEstimadoPaginator(Movimiento.objects.order_by('-id'), 100).count, 3)
+            self.assertEqual(ConteoEstimadoPaginator(Movimiento.objects.filter(turno='Día').order_by('-id'), 100).count, 2)
+
+
+class SincronizacionMaestrosTests(TestCase):
+    """
+    Un cliente al día sincroniza con una sola consulta por rango de clave
+    primaria, y después recibe solo lo que cambió.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.licencia = TipoLicencia.objects.create(nombre='Clase D')
+        cls.empleado = Empleado.objects.create(
+            codigo_trabajador='0001', nombre_completo='Operador Uno', rut='1-9', cargo='Operador Maquinaria',
+            tipo_contrato='Indefinido', fecha_contratacion=date(2020, 1, 1),
+        )
+        cls.maquinaria = Maquinaria.objects.create(codigo_eq='EQ-1', tipo='Camión Tolva')
+        cls.supervisor = Supervisor.objects.create(nombre_completo='Supervisor Uno', empresa='Tirreno')
+
+    def sincronizar(self, cursor=0):
+        respuesta = self.client.get(reverse('empresa:api_sincronizacion_maestros'), {'cursor': cursor})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def test_sin_cambios_una_consulta_por_indice(self):
+        cursor = self.sincronizar()['cursor']
+        with CaptureQueriesContext(connection) as consultas:
+            datos = self.sincronizar(cursor)
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(datos, {'cursor': cursor, 'completo': True, 'cambios': {}, 'eliminados': {}})
+        with connection.cursor() as cursor_db:
+            cursor_db.execute('EXPLAIN QUERY PLAN ' + consultas[0]['sql'])
+            plan = ' '.join(str(fila[-1]) for fila in cursor_db.fetchall())
+        self.assertIn('USING INTEGER PRIMARY KEY', plan)
+
+    def test_solo_lo_cambiado(self):
+        inicial = self.sincronizar()
+        self.assertEqual(set(inicial['cambios']), {'empleado', 'maquinaria', 'supervisor'})
+
+        self.empleado.licencias.add(self.licencia)
+        Maquinaria.objects.filter(pk=self.maquinaria.pk).update(horometro_actual=1200)
+        supervisor_id = self.supervisor.pk
+        self.supervisor.delete()
+        datos = self.sincronizar(inicial['cursor'])
+
+        self.assertGreater(datos['cursor'], inicial['cursor'])
+        self.assertEqual(set(datos['cambios']), {'empleado', 'maquinaria'})
+        empleado = dict(zip(datos['cambios']['empleado']['columnas'], datos['cambios']['empleado']['filas'][0]))
+        self.assertEqual(empleado['licencias'], ['Clase D'])
+        maquinaria = dict(zip(datos['cambios']['maquinaria']['columnas'], datos['cambios']['maquinaria']['filas'][0]))
+        self.assertEqual(maquinaria['horometro_actual'], 1200)
+        self.assertEqual(datos['eliminados'], {'supervisor': [supervisor_id]})
+        self.assertEqual(self.sincronizar(datos['cursor'])['cambios'], {})
+
+
+class ReplicaLecturaTests(TransactionTestCase):
+    """
+    Dentro de `replica.lectura()` las lecturas van a la foto vigente, pero
+    ninguna escritura llega a la réplica.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directorio = tempfile.mkdtemp()
+        principal = connections['default'].settings_dict
+        # El runner no conoce este alias: se registra acá y se habilita para la clase. Como
+        # MIRROR de la principal, el flush entre pruebas no la toca (es de solo lectura).
+        connections.settings['replica'] = {
+            **principal, 'NAME': str(Path(cls.directorio) / 'replica.sqlite3'),
+            'TEST': {**principal['TEST'], 'MIRROR': 'default'},
+        }
+        cls.databases = {*cls.databases, 'replica'}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+        del cls.databases
+        shutil.rmtree(cls.directorio, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.ruta = Path(connections['replica'].settings_dict['NAME'])
+        ajustes = override_settings(REPLICA_ALIAS='replica', DATABASE_ROUTERS=['empresa.replica.RouterReplica'])
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.addCleanup(connections['replica'].close)
+
+        self.licencia = TipoLicencia.objects.create(nombre='Clase D')
+        self.empleado = Empleado.objects.create(
+            codigo_trabajador='0001', nombre_completo='Operador Uno', rut='1-9', cargo='Operador Maquinaria',
+            tipo_contrato='Indefinido', fecha_contratacion=date(2020, 1, 1),
+        )
+        self.maquinaria = Maquinaria.objects.create(codigo_eq='EQ-1', tipo='Camión Tolva', horometro_actual=100)
+        self.retirada = Maquinaria.objects.create(codigo_eq='EQ-9', tipo='Excavadora')
+        replica.refrescar()
+
+    def filas_en_replica(self, tabla):
+        with sqlite3.connect(self.ruta) as base:
+            return base.execute(f'SELECT COUNT(*) FROM {tabla}').fetchone()[0]
+
+    def test_lee_la_foto_vigente_y_vuelve_a_la_principal_si_esta_vencida(self):
+        Maquinaria.objects.create(codigo_eq='EQ-2', tipo='Camión Tolva')
+        with replica.lectura():
+            self.assertEqual(Maquinaria.objects.db, 'replica')
+            self.assertEqual(Maquinaria.objects.count(), 2)
+        self.assertEqual(Maquinaria.objects.count(), 3)
+
+        vencida = time.time() - replica.max_retraso() - 1
+        os.utime(self.ruta, (vencida, vencida))
+        with replica.lectura():
+            self.assertEqual(Maquinaria.objects.db, 'default')
+            self.assertEqual(Maquinaria.objects.count(), 3)
+
+    def test_las_escrituras_nunca_van_a_la_replica(self):
+        tabla_maquinaria = Maquinaria._meta.db_table
+        tabla_licencias = Empleado.licencias.through._meta.db_table
+        with replica.lectura(), CaptureQueriesContext(connections['replica']) as en_replica:
+            maquinaria = Maquinaria.objects.get(pk=self.maquinaria.pk)
+            self.assertEqual(maquinaria._state.db, 'replica')
+            self.assertEqual(router.db_for_write(Maquinaria, instance=maquinaria), 'default')
+            maquinaria.horometro_actual = 150
+            maquinaria.save()
+
+            Maquinaria.objects.create(codigo_eq='EQ-2', tipo='Camión Tolva')
+            Maquinaria.objects.filter(pk=self.maquinaria.pk).update(horometro_actual=200)
+            empleado = Empleado.objects.get(pk=self.empleado.pk)
+            empleado.licencias.add(self.licencia)
+            Maquinaria.objects.get(pk=self.retirada.pk).delete()
+        self.assertFalse([c['sql'] for c in en_replica if not c['sql'].startswith('SELECT')])
+
+        self.assertEqual(Maquinaria.objects.get(pk=self.maquinaria.pk).horometro_actual, 200)
+        self.assertEqual(set(Maquinaria.objects.values_list('codigo_eq', flat=True)), {'EQ-1', 'EQ-2'})
+        self.assertEqual(list(self.empleado.licencias.all()), [self.licencia])
+        self.assertEqual(self.filas_en_replica(tabla_maquinaria), 2)
+        self.assertEqual(self.filas_en_replica(tabla_licencias), 0)
+
+    def test_la_conexion_de_la_replica_es_de_solo_lectura(self):
+        with self.assertRaises(OperationalError):
+            Maquinaria.objects.using('replica').filter(pk=self.maquinaria.pk).update(horometro_actual=300)
+        self.assertEqual(Maquinaria.objects.using('replica').get(pk=self.maquinaria.pk).horometro_actual, 100)
+
+
+class CampoCodificadoTests(TestCase):
+    """
+    Los códigos guardados son la posición de cada opción en `choices`: las
+    opciones existentes no pueden reordenarse ni borrarse, solo agregarse
+    al final. Al agregar una, también se agrega al final de esta lista.
+    """
+
+    LUGARES = ['TA', 'LA', 'LA_C', 'LA_E', 'LA_M', 'PCH', 'BA', 'BF', 'BTN', 'BTS', 'BE', 'CS', 'CBBF']
+    NIVELES = ['vacio', 'alarma', 'un_cuarto', 'medio', 'tres_cuartos', 'full']
+    CODIGOS = {
+        'movimiento.proyecto': ['Mina El Way', 'Mina Juana', 'Mina Paty', 'CBB Fábrica'],
+        'movimiento.turno': ['Día', 'Noche', 'Horas Extras', 'Trabajo Especial'],
+        'movimiento.origen_combustible': [
+            'Estación Copec con Chip del Equipo', 'Estación Copec con Chip de otro Equipo',
+            'Con Camión Combustible', 'Carga Manual Con Bidones',
+        ],
+        'movimiento.nivel_inicial_combustible': NIVELES,
+        'movimiento.nivel_final_combustible': NIVELES,
+        'postura.tipo_actividad': [
+            'Producción', 'Confinamiento', 'Remanejo', 'Arriendo', 'Despacho', 'Limpieza', 'Apoyo Mina',
+        ],
+        'postura.origen': LUGARES,
+        'postura.destino': LUGARES,
+        'postura.material': [
+            'Cal Alta Ley', 'Cal Normal', 'Cal Cemento', 'Fino', 'Fino Ecometales', 'Fino Bitumix', 'Estéril',
+            'Descarte', 'Cal 15-50 AL', 'Cal 15-50 N', 'Cal 6-15 AL', 'Cal 6-15 N', 'Cemento',
+        ],
+    }
+
+    def test_opciones_no_cambian_de_codigo(self):
+        campos = {
+            f'{modelo._meta.model_name}.{campo.name}': campo
+            for modelo in apps.get_app_config('empresa').get_models()
+            for campo in modelo._meta.get_fields() if isinstance(campo, CampoCodificado)
+        }
+        self.assertEqual(set(campos), set(self.CODIGOS), "Cada CampoCodificado debe estar en CODIGOS")
+        for nombre, campo in campos.items():
+            with self.subTest(campo=nombre):
+                self.assertEqual(campo.valores[:len(self.CODIGOS[nombre])], self.CODIGOS[nombre])
+
+
+@override_settings(REPLICACION_TOKEN='token-central')
+class ReplicacionCentralTests(TestCase):
+    """
+    La central aplica cada conjunto una vez y en orden por nodo, y resuelve
+    los conflictos entre sitios con las reglas de empresa/replicacion.py.
+    La base de prueba hace a la vez de sitio (arma los conjuntos) y de central.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.lider_a = Supervisor.objects.create(nombre_completo='Líder A', empresa='Tirreno')
+        cls.lider_b = Supervisor.objects.create(nombre_completo='Líder B', empresa='Tirreno')
+        cls.maquinaria = Maquinaria.objects.create(codigo_eq='EQ-1', tipo='Cargador Frontal')
+
+    def setUp(self):
+        self.secuencias = {}
+
+    def conjunto(self, nodo, eventos):
+        """Arma el siguiente conjunto de `nodo` como lo haría su sitio y lo devuelve descomprimido."""
+        # Cada sitio numera sus conjuntos por separado: solo queda el último de `nodo`
+        ConjuntoReplicacion.objects.all().delete()
+        if nodo in self.secuencias:
+            ConjuntoReplicacion.objects.create(secuencia=self.secuencias[nodo], eventos=0, contenido=b'')
+        with override_settings(REPLICACION_NODO=nodo), transaction.atomic():
+            guardado = replicacion._guardar_conjunto(eventos)
+        self.secuencias[nodo] = guardado.secuencia
+        return json.loads(gzip.decompress(bytes(guardado.contenido)))
+
+    def informe(self, id_, hora, lider=None, operacion='I'):
+        return {
+            'modelo': 'informediario', 'id': id_, 'operacion': operacion, 'registrado_en': f'2026-03-02T{hora}:00+00:00',
+            'datos': None if operacion == 'D' else {
+                'fecha': '2026-03-02', 'turno': 'Día', 'lider_tirreno_id': lider and lider.pk, 'jefe_mandante_id': None,
+            },
+        }
+
+    def postura(self, id_, informe_id, numero, hora='08:00'):
+        return {
+            'modelo': 'postura', 'id': id_, 'operacion': 'I', 'registrado_en': f'2026-03-02T{hora}:00+00:00',
+            'datos': {
+                'informe_id': informe_id, 'numero_postura': numero, 'tipo_actividad': 'Producción', 'origen': 'TA',
+                'destino': 'PCH', 'material': 'Fino', 'sector_prefijo': 'A', 'sector_banco': '1', 'sector_tiro': '1',
+            },
+        }
+
+    def produccion(self, id_, informe_id, observaciones):
+        return {
+            'modelo': 'produccionequipo', 'id': id_, 'operacion': 'I', 'registrado_en': '2026-03-02T08:00:00+00:00',
+            'datos': {'informe_id': informe_id, 'maquinaria_id': self.maquinaria.pk, 'observaciones': observaciones},
+        }
+
+    def enviar(self, contenido):
+        return self.client.post(
+            reverse('empresa:api_replicacion_conjuntos'), data=gzip.compress(json.dumps(contenido).encode('utf-8')),
+            content_type='application/json', HTTP_CONTENT_ENCODING='gzip', HTTP_AUTHORIZATION='Token token-central',
+        )
+
+    def test_un_conjunto_repetido_se_aplica_una_sola_vez(self):
+        contenido = self.conjunto('mina-norte', [self.informe(1, '08:00', self.lider_a)])
+        self.assertEqual(replicacion.aplicar_conjunto(contenido), {'estado': 'aplicado', 'aplicados': 1, 'conflictos': 0})
+        self.assertEqual(replicacion.aplicar_conjunto(contenido), {'estado': 'duplicado', 'aplicados': 0, 'conflictos': 0})
+        self.assertEqual(InformeDiario.objects.count(), 1)
+        self.assertEqual(ConjuntoRecibido.objects.count(), 1)
+
+    def test_un_hueco_en_la_secuencia_se_rechaza_con_409(self):
+        primero = self.conjunto('mina-norte', [self.informe(1, '08:00', self.lider_a)])
+        segundo = self.conjunto('mina-norte', [self.informe(1, '09:00', self.lider_b)])
+        respuesta = self.enviar(segundo)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.json()['esperada'], 1)
+        self.assertFalse(InformeDiario.objects.exists())
+        self.assertEqual(self.enviar(primero).status_code, 200)
+        self.assertEqual(self.enviar(segundo).json()['estado'], 'aplicado')
+        self.assertEqual(InformeDiario.objects.get().lider_tirreno, self.lider_b)
+
+    def test_gana_la_ultima_escritura_entre_nodos(self):
+        replicacion.aplicar_conjunto(self.conjunto('mina-norte', [self.informe(1, '10:00', self.lider_a)]))
+        # Un cambio más antiguo de otro nodo no pisa los datos
+        resultado = replicacion.aplicar_conjunto(self.conjunto('mina-sur', [self.informe(7, '09:00', self.lider_b)]))
+        self.assertEqual(resultado['conflictos'], 1)
+        self.assertEqual(InformeDiario.objects.get().lider_tirreno, self.lider_a)
+        replicacion.aplicar_conjunto(self.conjunto('mina-sur', [self.informe(7, '11:00', self.lider_b)]))
+        self.assertEqual(InformeDiario.objects.get().lider_tirreno, self.lider_b)
+
+    def test_informes_y_produccion_del_mismo_turno_se_funden(self):
+        replicacion.aplicar_conjunto(self.conjunto('mina-norte', [
+            self.informe(1, '08:00', self.lider_a), self.produccion(1, 1, 'norte'),
+        ]))
+        replicacion.aplicar_conjunto(self.conjunto('mina-sur', [
+            self.informe(4, '09:00', self.lider_b), self.produccion(9, 4, 'sur'),
+        ]))
+        informe = InformeDiario.objects.get()
+        self.assertEqual(informe.lider_tirreno, self.lider_b)
+        self.assertEqual(ProduccionEquipo.objects.get().observaciones, 'sur')
+        self.assertEqual(
+            set(RegistroReplicado.objects.filter(modelo='informediario').values_list('nodo', 'objeto_id')),
+            {('mina-norte', informe.pk), ('mina-sur', informe.pk)},
+        )
+
+    def test_postura_con_numero_ocupado_pasa_al_siguiente(self):
+        replicacion.aplicar_conjunto(self.conjunto('mina-norte', [self.informe(1, '08:00'), self.postura(1, 1, 1)]))
+        resultado = replicacion.aplicar_conjunto(self.conjunto('mina-sur', [self.informe(4, '08:00'), self.postura(2, 4, 1)]))
+        self.assertEqual(resultado['conflictos'], 1)
+        self.assertEqual(sorted(Postura.objects.values_list('numero_postura', flat=True)), [1, 2])
+        # Un cambio posterior de la misma postura conserva el número que le dio la central
+        replicacion.aplicar_conjunto(self.conjunto('mina-sur', [self.postura(2, 4, 1, hora='09:00')]))
+        self.assertEqual(sorted(Postura.objects.values_list('numero_postura', flat=True)), [1, 2])
+
+    def test_la_baja_de_una_fila_compartida_solo_la_desvincula(self):
+        replicacion.aplicar_conjunto(self.conjunto('mina-norte', [self.informe(1, '08:00')]))
+        replicacion.aplicar_conjunto(self.conjunto('mina-sur', [self.informe(4, '08:00')]))
+        resultado = replicacion.aplicar_conjunto(self.conjunto('mina-norte', [self.informe(1, '09:00', operacion='D')]))
+        self.assertEqual(resultado['conflictos'], 1)
+        self.assertTrue(InformeDiario.objects.exists())
+        replicacion.aplicar_conjunto(self.conjunto('mina-sur', [self.informe(4, '10:00', operacion='D')]))
+        self.assertFalse(InformeDiario.objects.exists())
+        self.assertFalse(RegistroReplicado.objects.exists())
+
+    @override_settings(REPLICACION_NODO='mina-norte')
+    def test_el_conjunto_del_sitio_viaja_con_claves_naturales(self):
+        if not cambios.disponible():
+            self.skipTest("El registro de cambios requiere SQLite.")
+        informe = InformeDiario.objects.create(fecha=date(2026, 3, 2), turno='Noche', lider_tirreno=self.lider_a)
+        self.assertEqual(replicacion.preparar_conjunto(), 1)
+        self.assertEqual(replicacion.preparar_conjunto(), 0)
+        contenido = json.loads(gzip.decompress(bytes(ConjuntoReplicacion.objects.get().contenido)))
+        self.assertEqual(contenido['eventos'][0]['datos']['lider_tirreno'], 'Líder A')
+        # Aplicado en la central, se funde con el informe del mismo turno
+        self.assertEqual(replicacion.aplicar_conjunto(contenido)['aplicados'], 1)
+        self.assertEqual(RegistroReplicado.objects.get().objeto_id, informe.pk)
+
+
+class FragmentosTests(TransactionTestCase):
+    """
+    En modo fragmentado los movimientos de Mina Juana viven en su propia
+    base; las lecturas entre minas suman todas las bases.
+    """
+
+    ALIAS = 'mina_juana'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directorio = tempfile.mkdtemp()
+        principal = connections['default'].settings_dict
+        # Igual que la réplica: el runner no conoce este alias y se registra para la clase
+        connections.settings[cls.ALIAS] = {**principal, 'NAME': str(Path(cls.directorio) / 'mina_juana.sqlite3')}
+        cls.databases = {*cls.databases, cls.ALIAS}
+        call_command('migrate', database=cls.ALIAS, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        # Los hilos de en_paralelo guardan su conexión al fragmento
+        if fragmentos._hilos is not None:
+            fragmentos._hilos.shutdown()
+            fragmentos._hilos = None
+        connections[cls.ALIAS].close()
+        del connections[cls.ALIAS]
+        del connections.settings[cls.ALIAS]
+        del cls.databases
+        shutil.rmtree(cls.directorio, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        ajustes = override_settings(
+            FRAGMENTOS_PROYECTO={'Mina Juana': self.ALIAS}, DATABASE_ROUTERS=['empresa.fragmentos.RouterFragmentos'],
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        fragmentos.reservar_ids(self.ALIAS)
+
+        self.empleado = Empleado.objects.create(
+            codigo_trabajador='0001', nombre_completo='Operador Uno', rut='1-9', cargo='Operador Maquinaria',
+            tipo_contrato='Indefinido', fecha_contratacion=date(2020, 1, 1),
+        )
+        self.maquinaria = Maquinaria.objects.create(codigo_eq='EQ-1', tipo='Camión Tolva', horometro_actual=100)
+        self.informe = InformeDiario.objects.create(fecha=date(2025, 6, 2), turno='Día')
+        self.postura = Postura.objects.create(
+            informe=self.informe, numero_postura=1, tipo_actividad='Producción', origen='TA', destino='PCH',
+            material='Fino', sector_prefijo='A', sector_banco='1', sector_tiro='1',
+        )
+
+    def movimiento(self, proyecto, fecha, turno='Día', inicial=0, horas=12, **campos):
+        return Movimiento.objects.create(
+            fecha=fecha, turno=turno, proyecto=proyecto, empleado=self.empleado, maquinaria=self.maquinaria,
+            horometro_inicial=inicial, horometro_final=inicial + horas * 60, **campos,
+        )
+
+    def test_create_inserta_directo_en_el_fragmento_desde_su_bloque_de_ids(self):
+        with CaptureQueriesContext(connections['default']) as en_principal:
+            juana = self.movimiento('Mina Juana', date(2025, 6, 2))
+        self.assertFalse([c['sql'] for c in en_principal if 'INSERT INTO "empresa_movimiento"' in c['sql']])
+        self.assertEqual(juana._state.db, self.ALIAS)
+        self.assertGreaterEqual(juana.pk, fragmentos.bloque(self.ALIAS) * fragmentos.BLOQUE_IDS)
+        el_way = self.movimiento('Mina El Way', date(2025, 6, 2))
+        self.assertLess(el_way.pk, fragmentos.BLOQUE_IDS)
+        self.assertEqual(list(Movimiento.objects.using('default').values_list('pk', flat=True)), [el_way.pk])
+        self.assertEqual(list(Movimiento.objects.using(self.ALIAS).values_list('pk', flat=True)), [juana.pk])
+        # Los maestros, informes y posturas se copiaron al fragmento con los mismos ids
+        self.assertTrue(Postura.objects.using(self.ALIAS).filter(pk=self.postura.pk).exists())
+
+    def test_cambiar_el_proyecto_traslada_el_movimiento_con_sus_viajes(self):
+        movimiento = self.movimiento('Mina El Way', date(2025, 6, 2))
+        movimiento.viajes.create(postura=self.postura, cantidad=4)
+        movimiento.proyecto = 'Mina Juana'
+        movimiento.save()
+        self.assertFalse(Movimiento.objects.using('default').exists())
+        self.assertFalse(Viaje.objects.using('default').exists())
+        self.assertEqual(Viaje.objects.using(self.ALIAS).get(movimiento_id=movimiento.pk).cantidad, 4)
+        with fragmentos.usar(self.ALIAS):
+            self.assertEqual(cubo.consultar(date(2025, 6, 1), date(2025, 6, 30))['total'], 4)
+
+    def test_los_reportes_entre_minas_suman_todas_las_bases(self):
+        self.movimiento('Mina El Way', date(2025, 6, 2)).viajes.create(postura=self.postura, cantidad=3)
+        self.movimiento('Mina Juana', date(2025, 6, 2), inicial=720).viajes.create(postura=self.postura, cantidad=5)
+        datos = cubo.consultar(date(2025, 6, 1), date(2025, 6, 30), filas=('material',), columna='turno')
+        self.assertEqual(datos['total'], 8)
+        self.assertEqual(datos['datos'][0]['valores'], {'Día': 8})
+
+        respuesta = self.client.get(reverse('empresa:reporte_diario'), {'fecha': '2025-06-02'})
+        self.assertEqual(len(respuesta.context['movimientos']), 2)
+        respuesta = self.client.get(reverse('empresa:api_ultimo_horometro'), {'maquinaria_id': self.maquinaria.pk})
+        self.assertEqual(respuesta.json(), {'ultimo_horometro': 1440})
+
+    @skipUnless(busqueda.disponible(), "La búsqueda de texto completo requiere SQLite")
+    def test_la_busqueda_combina_los_indices_de_todas_las_bases(self):
+        el_way = self.movimiento('Mina El Way', date(2025, 6, 2), observaciones='Falla hidráulica en pala')
+        juana = self.movimiento('Mina Juana', date(2025, 6, 3), inicial=720, observaciones='Revisión hidráulica')
+        resultado = busqueda.buscar('hidraulica')
+        self.assertEqual(sorted(r['id'] for r in resultado['resultados']), [el_way.pk, juana.pk])
+        self.assertEqual(resultado['total'], 2)
+        self.assertEqual([f['fecha'] for f in resultado['facetas']['fechas']], ['2025-06-03', '2025-06-02'])
+        self.assertEqual(resultado['facetas']['maquinarias'], [{'id': self.maquinaria.pk, 'codigo_eq': 'EQ-1', 'total': 2}])
+        self.assertEqual(len(busqueda.buscar('hidraulica', limite=1)['resultados']), 1)
+
+    @skipUnless(importlib.util.find_spec('numpy'), "La analítica de combustible requiere numpy")
+    def test_el_historial_de_combustible_lee_todas_las_bases_en_orden(self):
+        self.movimiento('Mina Juana', date(2025, 6, 3), inicial=720)
+        self.movimiento('Mina El Way', date(2025, 6, 2))
+        historial = combustible.cargar_historial()
+        self.assertEqual([str(fecha) for fecha in historial['fecha']], ['2025-06-02', '2025-06-03'])
+
+    def test_la_jornada_suma_los_turnos_de_todas_las_minas(self):
+        # Noche en Mina Juana y, sin descanso, Día en Mina El Way
+        self.movimiento('Mina Juana', date(2025, 6, 1), turno='Noche')
+        control = jornada.verificar_turno(self.empleado.pk, date(2025, 6, 2), 'Día', 12)
+        self.assertFalse(control['permitido'])
+        self.assertEqual(control['descanso_previo'], 0.0)
+
+        for dia in (2, 3):
+            self.movimiento('Mina El Way', date(2025, 6, dia), turno='Noche')
+        self.movimiento('Mina Juana', date(2025, 6, 5))
+        panel = jornada.panel(date(2025, 6, 5))
+        self.assertEqual(panel['trabajadores'][0]['horas'], 48)
+        self.assertTrue(panel['trabajadores'][0]['excede'])
+        self.assertTrue(any('48.00 h en 7 días' in motivo for i in panel['infracciones'] for motivo in i['motivos']))
+
+
+@override_settings(CAMBIOS_TOKEN='token-bi')
+class RegistroCambiosTests(TestCase):
+    """
+    Los triggers escriben cada alta, modificación y baja en EventoCambio
+    dentro de la misma transacción; los consumidores confirman lo leído y
+    solo se compacta lo que confirmaron todos.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empleado = Empleado.objects.create(
+            codigo_trabajador='0001', nombre_completo='Operador Uno', rut='1-9', cargo='Operador Maquinaria',
+            tipo_contrato='Indefinido', fecha_contratacion=date(2020, 1, 1),
+        )
+        cls.maquinaria = Maquinaria.objects.create(codigo_eq='EQ-1', tipo='Camión Tolva')
+
+    def setUp(self):
+        if not cambios.disponible():
+            self.skipTest("El registro de cambios requiere SQLite.")
+        self.inicio = EventoCambio.objects.aggregate(ultimo=Max('id'))['ultimo'] or 0
+
+    def movimiento(self, **campos):
+        return Movimiento.objects.create(**{
+            'fecha': date(2025, 6, 2), 'turno': 'Noche', 'empleado': self.empleado, 'maquinaria': self.maquinaria,
+            'horometro_inicial': 0, 'horometro_final': 600, **campos,
+        })
+
+    def eventos(self):
+        return [e for e in cambios.eventos_desde(self.inicio, 1000) if e['modelo'] == 'movimiento']
+
+    def confirmar(self, consumidor, cursor, token='token-bi'):
+        return self.client.post(
+            reverse('empresa:api_confirmar_cambios'), {'consumidor': consumidor, 'cursor': cursor},
+            HTTP_AUTHORIZATION=f'Token {token}',
+        )
+
+    def test_altas_modificaciones_y_bajas_en_orden_con_opciones_decodificadas(self):
+        movimiento = self.movimiento()
+        movimiento.horometro_final = 720
+        movimiento.save()
+        movimiento_id = movimiento.pk
+        movimiento.delete()
+        eventos = self.eventos()
+        self.assertEqual(
+            [(e['operacion'], e['objeto_id']) for e in eventos],
+            [('I', movimiento_id), ('U', movimiento_id), ('D', movimiento_id)],
+        )
+        self.assertEqual([e['id'] for e in eventos], sorted(e['id'] for e in eventos))
+        self.assertEqual(eventos[0]['datos']['turno'], 'Noche')
+        self.assertEqual(eventos[0]['datos']['proyecto'], 'Mina El Way')
+        self.assertEqual(eventos[1]['datos']['horometro_final'], 720)
+
+    def test_archivar_y_restaurar_se_marcan_aparte(self):
+        movimiento = self.movimiento()
+        with transaction.atomic(), cambios.marcar_eventos('A'):
+            Movimiento.objects.filter(pk=movimiento.pk).delete()
+        with transaction.atomic(), cambios.marcar_eventos('R'):
+            self.movimiento()
+        self.assertEqual([e['operacion'] for e in self.eventos()], ['I', 'A', 'R'])
+
+    def test_una_transaccion_revertida_no_deja_eventos(self):
+        with self.assertRaises(ValueError), transaction.atomic():
+            self.movimiento()
+            raise ValueError("se revierte")
+        self.assertEqual(self.eventos(), [])
+
+    def test_el_cursor_confirmado_nunca_retrocede_ni_se_adelanta(self):
+        self.movimiento()
+        self.movimiento()
+        primero, segundo = [e['id'] for e in self.eventos()]
+        cambios.confirmar('bi', segundo)
+        cambios.confirmar('bi', primero)
+        self.assertEqual(ConsumidorCambios.objects.get(nombre='bi').cursor, segundo)
+        # Confirmar eventos que todavía no existen no adelanta el cursor más allá del último
+        cambios.confirmar('bi', segundo + 1000)
+        self.assertEqual(ConsumidorCambios.objects.get(nombre='bi').cursor, segundo)
+
+    def test_compactar_solo_borra_lo_que_confirmaron_todos(self):
+        self.movimiento()
+        self.movimiento()
+        self.movimiento()
+        ids = [e['id'] for e in self.eventos()]
+        cambios.confirmar('bi', ids[2])
+        cambios.confirmar('replicacion', ids[0])
+        cambios.compactar()
+        self.assertEqual([e['id'] for e in self.eventos()], ids[1:])
+
+    def test_el_feed_es_de_solo_lectura_y_confirmar_requiere_token(self):
+        self.movimiento()
+        ultimo = self.eventos()[-1]['id']
+        respuesta = self.client.get(reverse('empresa:api_cambios'), {'cursor': ultimo, 'consumidor': 'bi'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertFalse(ConsumidorCambios.objects.filter(nombre='bi').exists())
+        self.assertEqual(self.client.get(reverse('empresa:api_confirmar_cambios')).status_code, 405)
+        self.assertEqual(self.confirmar('bi', ultimo, token='otro').status_code, 403)
+        self.assertFalse(ConsumidorCambios.objects.filter(nombre='bi').exists())
+        self.assertEqual(self.confirmar('bi', ultimo).json(), {'consumidor': 'bi', 'cursor': ultimo})
+
+
+class RespaldoTests(TestCase):
+    """
+    El respaldo en línea copia la base a un archivo temporal, lo verifica y
+    recién entonces le da su nombre; los antiguos se rotan.
+    """
+
+    ALIAS = 'origen_respaldo'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directorio = Path(tempfile.mkdtemp())
+        origen = cls.directorio / 'origen.sqlite3'
+        with sqlite3.connect(origen) as base:
+            base.execute('CREATE TABLE lectura (id INTEGER PRIMARY KEY, horometro INTEGER)')
+            base.execute('CREATE INDEX lectura_horometro ON lectura (horometro)')
+            base.executemany('INSERT INTO lectura (horometro) VALUES (?)', [(i,) for i in range(5000)])
+        base.close()
+        # Solo se usa su configuración: el respaldo abre su propia conexión sqlite3
+        connections.settings[cls.ALIAS] = {**connections['default'].settings_dict, 'NAME': str(origen)}
+
+    @classmethod
+    def tearDownClass(cls):
+        del connections[cls.ALIAS]
+        del connections.settings[cls.ALIAS]
+        shutil.rmtree(cls.directorio, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.respaldos = Path(tempfile.mkdtemp(dir=self.directorio))
+        ajustes = override_settings(RESPALDO_DIR=self.respaldos, RESPALDO_PAUSA_SEGUNDOS=0)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def crear_respaldos(self, *nombres):
+        for nombre in nombres:
+            (self.respaldos / f'{respaldo.PREFIJO}{nombre}{respaldo.EXTENSION}').touch()
+
+    def test_respalda_una_copia_integra(self):
+        resultado = respaldo.respaldar(paginas=4, retener=0, conexion=connections[self.ALIAS])
+        self.assertEqual(respaldo.respaldos(), [resultado['ruta']])
+        self.assertGreater(resultado['pasos'], 1)
+        with sqlite3.connect(resultado['ruta']) as base:
+            self.assertEqual(base.execute('PRAGMA integrity_check').fetchone()[0], 'ok')
+            self.assertEqual(base.execute('SELECT COUNT(*), SUM(horometro) FROM lectura').fetchone(), (5000, 12497500))
+        base.close()
+        self.assertEqual(list(self.respaldos.glob('*.parcial')), [])
+
+    def test_la_copia_que_no_pasa_la_verificacion_se_borra(self):
+        with mock.patch.object(respaldo, 'verificar', return_value='Page 3 is never used'):
+            with self.assertRaisesMessage(ValueError, 'Page 3 is never used'):
+                respaldo.respaldar(retener=0, conexion=connections[self.ALIAS])
+        self.assertEqual(list(self.respaldos.iterdir()), [])
+
+    def test_rotar_deja_los_mas_nuevos_y_cero_deja_todos(self):
+        self.crear_respaldos('20250601-020000-000000', '20250602-020000-000000', '20250603-020000-000000')
+        self.assertEqual(respaldo.rotar(0), [])
+        self.assertEqual(len(respaldo.respaldos()), 3)
+        borrados = respaldo.rotar(2)
+        self.assertEqual([ruta.name for ruta in borrados], ['db-20250601-020000-000000.sqlite3'])
+        self.assertEqual(
+            [ruta.name for ruta in respaldo.respaldos()],
+            ['db-20250602-020000-000000.sqlite3', 'db-20250603-020000-000000.sqlite3'],
+        )
+
+    def test_respaldo_pendiente_respeta_el_intervalo(self):
+        self.assertTrue(respaldo.respaldo_pendiente(timedelta(hours=6)))
+        self.crear_respaldos('20250601-020000-000000')
+        self.assertFalse(respaldo.respaldo_pendiente(timedelta(hours=6)))
+        hace_siete_horas = time.time() - 7 * 3600
+        os.utime(respaldo.respaldos()[-1], (hace_siete_horas, hace_siete_horas))
+        self.assertTrue(respaldo.respaldo_pendiente(timedelta(hours=6)))
+
+
+class ImportacionMovimientosTests(TestCase):
+    """
+    La importación lee el archivo en streaming, guarda cada lote con su
+    avance y, al terminar, pone al día los agregados de los días cargados.
+    """
+
+    ENCABEZADO = ['fecha', 'codigo_trabajador', 'codigo_eq', 'turno', 'horometro_inicial', 'horometro_final',
+                  'nivel_final_combustible']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empleado = Empleado.objects.create(
+            codigo_trabajador='0001', nombre_completo='Operador Uno', rut='1-9', cargo='Operador Maquinaria',
+            tipo_contrato='Indefinido', fecha_contratacion=date(2020, 1, 1),
+        )
+        cls.vencido = Empleado.objects.create(
+            codigo_trabajador='0002', nombre_completo='Operador Dos', rut='2-7', cargo='Operador Maquinaria',
+            tipo_contrato='Indefinido', fecha_contratacion=date(2020, 1, 1),
+            fecha_vencimiento_licencia=date(2025, 5, 31),
+        )
+        cls.maquinaria = Maquinaria.objects.create(codigo_eq='EQ-1', tipo='Camión Tolva')
+
+    def setUp(self):
+        self.directorio = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+
+    def archivo(self, *filas):
+        ruta = self.directorio / 'movimientos.csv'
+        with open(ruta, 'w', newline='', encoding='utf-8') as destino:
+            escritor = csv.writer(destino)
+            escritor.writerow(self.ENCABEZADO)
+            escritor.writerows(filas)
+        return ruta
+
+    def fila(self, dia, codigo='0001', inicial=0, final=600, turno='Día'):
+        return [f'2025-06-{dia:02d}', codigo, 'EQ-1', turno, inicial, final, 'Vacío']
+
+    def test_una_importacion_interrumpida_se_retoma_desde_la_ultima_fila_confirmada(self):
+        ruta = self.archivo(*[self.fila(dia) for dia in range(2, 7)])
+
+        def cortar(_):
+            raise RuntimeError("Se cortó la conexión")
+
+        with self.assertRaisesMessage(RuntimeError, "Se cortó la conexión"):
+            importacion.importar_movimientos(ruta, tamano_lote=2, progreso=cortar)
+        interrumpida = ImportacionMovimientos.objects.get()
+        self.assertEqual((interrumpida.estado, interrumpida.filas_procesadas), ('error', 2))
+        self.assertEqual(Movimiento.objects.count(), 2)
+
+        retomada = importacion.importar_movimientos(ruta, tamano_lote=2)
+        self.assertEqual(retomada.pk, interrumpida.pk)
+        self.assertEqual((retomada.estado, retomada.filas_procesadas, retomada.filas_importadas), ('completada', 5, 5))
+        self.assertEqual(sorted(Movimiento.objects.values_list('fecha__day', flat=True)), [2, 3, 4, 5, 6])
+        # Un archivo ya importado completo no se vuelve a cargar
+        importacion.importar_movimientos(ruta)
+        self.assertEqual(Movimiento.objects.count(), 5)
+
+    def test_rechaza_la_fila_de_un_trabajador_con_la_licencia_vencida(self):
+        ruta = self.archivo(self.fila(2, codigo='0002'), self.fila(2, codigo='0001'))
+        resultado = importacion.importar_movimientos(ruta)
+        self.assertEqual((resultado.filas_importadas, resultado.filas_con_error), (1, 1))
+        error = resultado.errores.get()
+        self.assertEqual(error.fila, 2)
+        self.assertIn("la licencia de Operador Dos estaba vencida", error.mensajes)
+        self.assertEqual(list(Movimiento.objects.values_list('empleado_id', flat=True)), [self.empleado.pk])
+
+    def test_una_fila_mal_formada_se_informa_sin_detener_la_carga(self):
+        ruta = self.archivo(
+            self.fila(2),
+            ['ayer', '0001', 'EQ-9', 'Tarde', 'mucho', '', 'Lleno'],
+            ['2025-06-03', '0001', 'EQ-1'],
+            self.fila(4),
+        )
+        resultado = importacion.importar_movimientos(ruta)
+        self.assertEqual((resultado.estado, resultado.filas_importadas, resultado.filas_con_error), ('completada', 2, 2))
+        errores = dict(resultado.errores.values_list('fila', 'mensajes'))
+        self.assertEqual(set(errores), {3, 4})
+        for mensaje in ("fecha: formato inválido", "codigo_eq: no existe el equipo 'EQ-9'", "turno: opción inválida",
+                        "horometro: ingrese un valor numérico", "nivel_final_combustible: opción inválida"):
+            self.assertIn(mensaje, errores[3])
+        self.assertIn("horometro_inicial: este campo es obligatorio", errores[4])
+
+    def test_pone_al_dia_utilizacion_jornada_y_productividad(self):
+        ruta = self.archivo(self.fila(2, final=300), self.fila(2, inicial=300, final=600, turno='Noche'), self.fila(3))
+        with mock.patch.object(productividad, 'invalidar') as invalidar:
+            importacion.importar_movimientos(ruta, tamano_lote=2)
+        invalidar.assert_called()
+        self.assertEqual(
+            list(UtilizacionDiaria.objects.order_by('fecha').values_list('fecha__day', 'minutos_trabajados', 'movimientos')),
+            [(2, 600, 2), (3, 600, 1)],
+        )
+        dia = JornadaDiaria.objects.get(empleado=self.empleado, fecha=date(2025, 6, 2))
+        self.assertEqual((dia.horas, dia.movimientos), (10, 2))
+        self.assertEqual(set(dia.turnos.split(',')), {'Día', 'Noche'})
+        self.assertEqual(JornadaDiaria.objects.get(empleado=self.empleado, fecha=date(2025, 6, 3)).horas_7_dias, 20)
+
+
+class ArchivoMovimientosTests(TestCase):
+    """
+    Archivar un año saca sus filas de las tablas vivas sin cambiar lo que
+    informan los reportes; restaurarlo las devuelve tal cual.
+    """
+
+    DESDE, HASTA = date(2020, 1, 1), date(2020, 12, 31)
+    TURNOS = ['Día', 'Noche']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empleado = Empleado.objects.create(
+            codigo_trabajador='0001', nombre_completo='Operador Uno', rut='1-9', cargo='Operador Maquinaria',
+            tipo_contrato='Indefinido', fecha_contratacion=date(2019, 1, 1),
+        )
+        cls.maquinaria = Maquinaria.objects.create(codigo_eq='EQ-1', tipo='Camión Tolva')
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        ajustes = override_settings(ARCHIVO_MOVIMIENTOS_DIR=directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        # El cubo se mantiene al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            self.movimientos = []
+            for dia, turno, combustible, viajes in ((date(2020, 3, 2), 'Día', 120, 4), (date(2020, 3, 2), 'Noche', None, 2),
+                                                     (date(2020, 11, 30), 'Día', Decimal('80.50'), 5)):
+                informe, _ = InformeDiario.objects.get_or_create(fecha=dia, turno=turno)
+                postura = Postura.objects.create(
+                    informe=informe, numero_postura=1, tipo_actividad='Producción', origen='TA', destino='PCH',
+                    material='Fino', sector_prefijo='A', sector_banco='1', sector_tiro='1',
+                )
+                movimiento = Movimiento.objects.create(
+                    fecha=dia, turno=turno, empleado=self.empleado, maquinaria=self.maquinaria,
+                    horometro_inicial=0, horometro_final=600, combustible_cargado=combustible,
+                    origen_combustible='Con Camión Combustible' if combustible else None,
+                )
+                movimiento.viajes.create(postura=postura, cantidad=viajes)
+                self.movimientos.append(movimiento)
+            self.vigente = Movimiento.objects.create(
+                fecha=date(2025, 6, 2), turno='Día', empleado=self.empleado, maquinaria=self.maquinaria,
+                horometro_inicial=0, horometro_final=300,
+            )
+
+    def totales(self):
+        return agregados_movimientos(self.DESDE, self.HASTA, self.TURNOS), cubo.consultar(self.DESDE, self.HASTA)['total']
+
+    def test_archivar_y_restaurar_un_anio_conserva_los_totales(self):
+        antes = self.totales()
+        por_turno, viajes = antes
+        self.assertEqual(sum(item['total_combustible'] or 0 for equipos in por_turno.values() for item in equipos.values()),
+                         Decimal('200.50'))
+        self.assertEqual(viajes, 11)
+
+        entrada = archivo.archivar(2020)
+        self.assertEqual(entrada['movimientos'], 3)
+        self.assertEqual(list(Movimiento.objects.all()), [self.vigente])
+        self.assertFalse(Viaje.objects.exists())
+        # El cubo se recalcula desde el archivo igual que desde las tablas vivas
+        cubo.reconstruir()
+        self.assertEqual(self.totales(), antes)
+        self.assertEqual(archivo.verificar(), [(2020, None)])
+
+        self.assertEqual(archivo.restaurar(2020), (3, 3, 0))
+        self.assertEqual(archivo.anios_archivados(), {})
+        self.assertEqual(Movimiento.objects.count(), 4)
+        self.assertEqual(
+            sorted(Viaje.objects.values_list('movimiento_id', 'cantidad')),
+            sorted((movimiento.id, viaje.cantidad) for movimiento in self.movimientos for viaje in movimiento.viajes.all()),
+        )
+        cubo.reconstruir()
+        self.assertEqual(self.totales(), antes)
+
+    def test_filas_archivadas_excluye_los_ids_pedidos(self):
+        archivo.archivar(2020)
+        primero, segundo, tercero = [movimiento.id for movimiento in self.movimientos]
+        columnas = ['id', 'turno', 'combustible_cargado']
+        self.assertEqual(
+            archivo.filas_archivadas(self.DESDE, self.HASTA, columnas),
+            [(primero, 'Día', Decimal('120.00')), (segundo, 'Noche', None), (tercero, 'Día', Decimal('80.50'))],
+        )
+        self.assertEqual(
+            [fila[0] for fila in archivo.filas_archivadas(self.DESDE, self.HASTA, columnas, excluir_ids={segundo})],
+            [primero, tercero],
+        )
+        self.assertEqual(
+            archivo.filas_archivadas(date(2020, 3, 1), date(2020, 3, 31), ['id'], turnos=['Día'], excluir_ids={tercero}),
+            [(primero,)],
+        )
+
+
+class JornadaTests(TestCase):
+    """
+    El control de jornada rechaza un turno que haría pasar alguna ventana de
+    7 días del máximo semanal o que deja menos descanso que el mínimo.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.empleado = Empleado.objects.create(
+            codigo_trabajador='0001', nombre_completo='Operador Uno', rut='1-9', cargo='Operador Maquinaria',
+            tipo_contrato='Indefinido', fecha_contratacion=date(2020, 1, 1),
+        )
+        cls.tolva = Maquinaria.objects.create(codigo_eq='EQ-1', tipo='Camión Tolva')
+        cls.excavadora = Maquinaria.objects.create(codigo_eq='EQ-2', tipo='Excavadora')
+
+    def movimiento(self, fecha, turno='Día', horas=12, maquinaria=None):
+        # El libro de jornada se actualiza al confirmar la transacción
+        with self.captureOnCommitCallbacks(execute=True):
+            return Movimiento.objects.create(
+                fecha=fecha, turno=turno, empleado=self.empleado, maquinaria=maquinaria or self.tolva,
+                horometro_inicial=0, horometro_final=horas * 60,
+            )
+
+    def verificar(self, fecha, turno='Día', horas=12):
+        return jornada.verificar_turno(self.empleado.pk, fecha, turno, horas)
+
+    def formulario(self, fecha, turno='Día', maquinaria=None, horas=12):
+        return MovimientoCompletoForm(data={
+            'fecha': fecha.isoformat(), 'empleado': self.empleado.pk, 'maquinaria': (maquinaria or self.tolva).pk,
+            'turno': turno, 'horometro_inicial': 0, 'horometro_final': horas * 60, 'proyecto': 'Mina El Way',
+            'nivel_final_combustible': 'medio',
+        })
+
+    def test_ninguna_ventana_de_7_dias_supera_el_maximo_semanal(self):
+        for dia in (2, 3, 4):
+            self.movimiento(date(2025, 6, dia))
+        self.assertTrue(self.verificar(date(2025, 6, 5), horas=8)['permitido'])
+        control = self.verificar(date(2025, 6, 5))
+        self.assertFalse(control['permitido'])
+        self.assertEqual((control['horas_semana'], control['maximo_semanal']), (48.0, 44.0))
+        # También cuentan las ventanas que terminan después de la fecha
+        self.assertFalse(self.verificar(date(2025, 5, 29))['permitido'])
+        self.assertTrue(self.verificar(date(2025, 5, 27))['permitido'])
+
+    def test_respeta_el_descanso_minimo_antes_y_despues_del_turno(self):
+        self.movimiento(date(2025, 6, 2), turno='Noche')
+        self.movimiento(date(2025, 6, 4))
+        # Día del 3: empieza a las 8, justo cuando termina la Noche del 2
+        control = self.verificar(date(2025, 6, 3))
+        self.assertEqual(control['descanso_previo'], 0.0)
+        self.assertIn("Descanso de 0.00 horas antes del turno; el mínimo es 10.", control['problemas'])
+        # Noche del 3: 12 horas después de la anterior, pero termina cuando empieza el Día del 4
+        control = self.verificar(date(2025, 6, 3), turno='Noche')
+        self.assertEqual((control['descanso_previo'], control['descanso_siguiente']), (12.0, 0.0))
+        self.assertFalse(control['permitido'])
+
+    def test_el_mismo_turno_con_otro_equipo_no_es_un_turno_nuevo(self):
+        self.movimiento(date(2025, 6, 2), horas=6)
+        control = self.verificar(date(2025, 6, 2), horas=6)
+        self.assertTrue(control['permitido'])
+        self.assertEqual(control['horas_semana'], 12.0)
+        self.assertFalse(self.verificar(date(2025, 6, 2), turno='Noche', horas=6)['permitido'])
+
+    def test_el_formulario_aplica_el_control_de_jornada(self):
+        self.movimiento(date(2025, 6, 2), horas=6)
+        self.assertTrue(self.formulario(date(2025, 6, 2), maquinaria=self.excavadora, horas=6).is_valid())
+
+        formulario = self.formulario(date(2025, 6, 2), turno='Noche', horas=6)
+        self.assertFalse(formulario.is_valid())
+        self.assertIn(
+            "Jornada de Operador Uno: Descanso de 0.00 horas antes del turno; el mínimo es 10.",
+            formulario.non_field_errors(),
+        )
+        for dia in (3, 4, 5):
+            self.movimiento(date(2025, 6, dia))
+        formulario = self.formulario(date(2025, 6, 6))
+        self.assertFalse(formulario.is_valid())
+        self.assertIn(
+            "Jornada de Operador Uno: Sumaría 54.00 horas en 7 días; el máximo semanal es 44.",
+            formulario.non_field_errors(),
+        )
+
+
+@skipUnless(busqueda.disponible(), "La búsqueda de texto completo requiere SQLite")
+class BusquedaTests(TestCase):
+    """
+    Los triggers mantienen el índice FTS5 al insertar, modificar y borrar,
+    también con update() del ORM; lo que escribe el usuario nunca rompe la
+    sintaxis de la consulta.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.maquinaria = Maquinaria.objects.create(codigo_eq='EQ-1', tipo='Excavadora')
+        cls.informe = InformeDiario.objects.create(fecha=date(2025, 6, 2), turno='Día')
+
+    def movimiento(self, **campos):
+        return Movimiento.objects.create(**{
+            'fecha': date(2025, 6, 2), 'turno': 'Día', 'maquinaria': self.maquinaria,
+            'horometro_inicial': 0, 'horometro_final': 600, **campos,
+        })
+
+    def encontrados(self, texto):
+        return [(r['tipo'], r['id']) for r in busqueda.buscar(texto)['resultados']]
+
+    def test_el_indice_sigue_las_altas_cambios_y_bajas_de_movimientos(self):
+        movimiento = self.movimiento(observaciones='Cambio de neumático trasero')
+        self.assertEqual(self.encontrados('neum'), [('movimiento', movimiento.pk)])
+
+        movimiento.observaciones = 'Fuga de aceite'
+        movimiento.descripcion_trabajo_especial = 'Apoyo en botadero'
+        movimiento.save()
+        self.assertEqual(self.encontrados('neumatico'), [])
+        self.assertEqual(self.encontrados('aceite'), [('movimiento', movimiento.pk)])
+        self.assertEqual(self.encontrados('botadero'), [('movimiento', movimiento.pk)])
+
+        # update() no pasa por save(): lo sigue el trigger
+        Movimiento.objects.filter(pk=movimiento.pk).update(observaciones='', descripcion_trabajo_especial=None)
+        self.assertEqual(self.encontrados('aceite'), [])
+
+        Movimiento.objects.filter(pk=movimiento.pk).update(observaciones='Falla eléctrica')
+        self.assertEqual(self.encontrados('electrica'), [('movimiento', movimiento.pk)])
+        movimiento.delete()
+        self.assertEqual(self.encontrados('electrica'), [])
+
+    def test_el_indice_sigue_la_produccion_con_la_fecha_de_su_informe(self):
+        produccion = ProduccionEquipo.objects.create(
+            informe=self.informe, maquinaria=self.maquinaria, observaciones='Carguío lento por lluvia',
+        )
+        resultado = busqueda.buscar('lluvia')
+        self.assertEqual(resultado['resultados'][0]['fecha'], '2025-06-02')
+        self.assertEqual(self.encontrados('lluvia'), [('produccion', produccion.pk)])
+
+        produccion.observaciones = 'Sin novedad'
+        produccion.save()
+        self.assertEqual(self.encontrados('lluvia'), [])
+        produccion.delete()
+        self.assertEqual(self.encontrados('novedad'), [])
+
+    def test_la_consulta_cita_cada_palabra_y_escapa_el_resultado(self):
+        self.assertEqual(busqueda.construir_consulta('  neum  "pala" '), '"neum"* """pala"""*')
+        self.assertEqual(busqueda.construir_consulta('   '), '')
+        movimiento = self.movimiento(observaciones='<b>Motor</b> AND "pala" NEAR falla')
+        for texto in ('motor AND', 'NEAR(', '"pala', 'falla*', 'OR -', 'col:motor'):
+            # Los operadores de FTS5 se buscan como texto y nunca producen un error de sintaxis
+            busqueda.buscar(texto)
+        self.assertEqual(self.encontrados('motor AND'), [('movimiento', movimiento.pk)])
+        resultado = busqueda.buscar('motor')['resultados'][0]
+        self.assertEqual(resultado['observaciones'], '&lt;b&gt;<mark>Motor</mark>&lt;/b&gt; AND &quot;pala&quot; NEAR falla')
+        self.assertEqual(busqueda.buscar('   '), {'resultados': [], 'total': 0, 'facetas': {'fechas': [], 'maquinarias': []}})
@@ -1,10 +1,19 @@
 # empresa/urls.py
 
+from django.conf import settings
 from django.urls import path
 from . import views
 
 app_name = 'empresa'
 
+
+def _segun_servidor(sincrona, asincrona):
+    # API_CAPTURA_ASINCRONA elige las versiones asíncronas de las APIs del
+    # formulario de captura para despliegues ASGI (mysite/asgi.py). Con WSGI
+    # Django también las sirve, pero en un ciclo de eventos por solicitud.
+    return asincrona if getattr(settings, 'API_CAPTURA_ASINCRONA', False) else sincrona
+
+
 urlpatterns = [
     # --- Vistas de Páginas ---
     path('empleados/', views.lista_empleados, name='lista_empleados'),
@@ -14,16 +23,46 @@ urlpatterns = [
     
     # path('reportes/por-turno/', views.reporte_por_turno, name='reporte_por_turno'),
     path('reportes/diario/', views.reporte_diario, name='reporte_diario'),
+    path('reportes/licencias/', views.cumplimiento_licencias, name='cumplimiento_licencias'),
+    path('reportes/combustible/', views.reporte_combustible, name='reporte_combustible'),
+    path('reportes/horometros/', views.auditoria_horometros, name='auditoria_horometros'),
+    path('reportes/utilizacion/', views.utilizacion_equipos, name='utilizacion_equipos'),
+    path('reportes/productividad/', views.productividad_operadores, name='productividad_operadores'),
+    path('reportes/jornada/', views.jornada_empleados, name='jornada_empleados'),
 
     # --- Endpoints de API ---
-    path('api/buscar-empleado/', views.buscar_empleado_api, name='api_buscar_empleado'),
-    path('api/ultimo-horometro/', views.ultimo_horometro_api, name='api_ultimo_horometro'),
+    path('api/buscar-empleado/', _segun_servidor(views.buscar_empleado_api, views.buscar_empleado_api_async), name='api_buscar_empleado'),
+    path('api/ultimo-horometro/', _segun_servidor(views.ultimo_horometro_api, views.ultimo_horometro_api_async), name='api_ultimo_horometro'),
+    path('api/obtener-posturas/', _segun_servidor(views.obtener_posturas_api, views.obtener_posturas_api_async), name='api_obtener_posturas'),
+    path('api/busqueda/', views.busqueda_api, name='api_busqueda'),
+    path('api/licencias-por-vencer/', views.cumplimiento_licencias_api, name='api_cumplimiento_licencias'),
+    path('api/reporte-combustible/', views.reporte_combustible_api, name='api_reporte_combustible'),
+    path('api/utilizacion/', views.utilizacion_api, name='api_utilizacion'),
+    path('api/cubo-viajes/', views.cubo_viajes_api, name='api_cubo_viajes'),
+    path('api/productividad/', views.productividad_api, name='api_productividad'),
+    path('api/jornada/verificar/', views.verificar_jornada_api, name='api_verificar_jornada'),
+    path('api/cambios/', views.cambios_api, name='api_cambios'),
+    path('api/cambios/confirmar/', views.confirmar_cambios_api, name='api_confirmar_cambios'),
+    path('api/replicacion/conjuntos/', views.replicacion_conjuntos_api, name='api_replicacion_conjuntos'),
+    path('api/sincronizacion/maestros/', views.sincronizacion_maestros_api, name='api_sincronizacion_maestros'),
+    path('eventos/turno/', views.eventos_turno, name='eventos_turno'),
+    path('api/importar-movimientos/', views.importar_movimientos_api, name='api_importar_movimientos'),
+    path('api/importar-movimientos/<int:importacion_id>/', views.estado_importacion_api, name='estado_importacion'),
+    path('api/grilla-viajes/', views.grilla_viajes_api, name='api_grilla_viajes'),
 
     path('produccion/diaria/', views.informe_produccion_diario, name='informe_produccion_diario'),
 
     # --- AÑADE ESTA LÍNEA PARA EXPORTAR EL INFORME A PDF ---
     path('produccion/diaria/pdf/<str:fecha>/<str:turno>/', views.generar_informe_pdf, name='generar_informe_pdf'),
 
+    # --- Informes PDF por lotes (rango de fechas y turnos) ---
+    path('produccion/lote-pdf/', views.iniciar_lote_pdf, name='iniciar_lote_pdf'),
+    path('produccion/lote-pdf/<int:trabajo_id>/', views.estado_lote_pdf, name='estado_lote_pdf'),
+    path('produccion/lote-pdf/<int:trabajo_id>/descargar/', views.descargar_lote_pdf, name='descargar_lote_pdf'),
+
     # --- AÑADE ESTA LÍNEA PARA LA NUEVA PÁGINA DE POSTURAS ---
+    path('produccion/viajes/', views.grilla_viajes, name='grilla_viajes'),
     path('produccion/definir-posturas/', views.definir_posturas, name='definir_posturas'),
+    path('produccion/definir-posturas/copiar/', views.copiar_plan_posturas, name='copiar_plan_posturas'),
+    path('produccion/definir-posturas/importar/', views.importar_plan_posturas, name='importar_plan_posturas'),
 ]
\ No newline at end of file
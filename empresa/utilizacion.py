@@ -0,0 +1,200 @@
+# empresa/utilizacion.py
+
+"""
+Utilización de equipos: horas trabajadas frente a horas disponibles.
+
+Cada movimiento con horómetro inicial y final es un intervalo de trabajo
+del equipo (en minutos de horómetro). Los intervalos de un mismo equipo y
+día se ordenan y se fusionan, así dos registros que se superponen (por
+ejemplo, dos operadores en el mismo equipo) no cuentan dos veces. Los
+minutos resultantes se guardan por equipo, día y proyecto en
+UtilizacionDiaria, que se mantiene al guardar o borrar movimientos (ver
+signals.py) y en las cargas masivas. Los reportes leen solo esa tabla, que conserva los
+días de los años archivados (ver archivo.py).
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from . import archivo, fragmentos
+from .models import Maquinaria, Movimiento, UtilizacionDiaria
+
+AGRUPACIONES = {
+    'maquinaria': ('maquinaria__codigo_eq', 'Equipo'),
+    'tipo': ('maquinaria__tipo', 'Tipo'),
+    'proyecto': ('proyecto', 'Proyecto'),
+}
+COLUMNAS = ['maquinaria_id', 'fecha', 'proyecto', 'horometro_inicial', 'horometro_final']
+
+
+def horas_disponibles_por_dia():
+    return getattr(settings, 'UTILIZACION_HORAS_DIA', 24)
+
+
+def fusionar_intervalos(intervalos):
+    """
+    Recibe [(inicio, fin, proyecto)] y devuelve {proyecto: minutos} sin contar
+    dos veces los tramos superpuestos: cada minuto se asigna al primer
+    intervalo (por inicio) que lo cubre.
+    """
+    minutos = defaultdict(int)
+    cubierto_hasta = None
+    for inicio, fin, proyecto in sorted(intervalos):
+        if cubierto_hasta is not None and inicio < cubierto_hasta:
+            inicio = cubierto_hasta
+        if fin > inicio:
+            minutos[proyecto] += fin - inicio
+            cubierto_hasta = fin
+    return dict(minutos)
+
+
+def _calcular(movimientos):
+    """Agrupa (maquinaria_id, fecha, proyecto, inicial, final) en filas de UtilizacionDiaria."""
+    por_dia = defaultdict(list)
+    conteos = defaultdict(int)
+    for maquinaria_id, fecha, proyecto, inicial, final in movimientos:
+        conteos[(maquinaria_id, fecha, proyecto)] += 1
+        if final is not None and final > inicial:
+            por_dia[(maquinaria_id, fecha)].append((inicial, final, proyecto))
+    filas = []
+    minutos_por_clave = {}
+    for (maquinaria_id, fecha), intervalos in por_dia.items():
+        for proyecto, minutos in fusionar_intervalos(intervalos).items():
+            minutos_por_clave[(maquinaria_id, fecha, proyecto)] = minutos
+    for (maquinaria_id, fecha, proyecto), movimientos_dia in conteos.items():
+        filas.append(UtilizacionDiaria(
+            maquinaria_id=maquinaria_id, fecha=fecha, proyecto=proyecto,
+            minutos_trabajados=minutos_por_clave.get((maquinaria_id, fecha, proyecto), 0),
+            movimientos=movimientos_dia,
+        ))
+    return filas
+
+
+def _archivados(claves, maquinas, fechas):
+    """Filas de los movimientos archivados de esos días, en el formato de _calcular."""
+    vivos = set(Movimiento.objects.filter(maquinaria_id__in=maquinas, fecha__in=fechas).values_list('id', flat=True))
+    return [
+        fila for fila in archivo.filas_archivadas(min(fechas), max(fechas), COLUMNAS, excluir_ids=vivos)
+        if (fila[0], fila[1]) in claves
+    ]
+
+
+def actualizar_dias(claves, fechas_por_consulta=500):
+    """
+    Recalcula la utilización de los pares (maquinaria_id, fecha) indicados.
+    Los signals la llaman al confirmar la transacción con todos los días
+    tocados; las cargas masivas, directamente después de cada lote.
+    """
+    claves = {(m, f) for m, f in claves if m is not None and f is not None}
+    if not claves:
+        return
+    maquinas = {m for m, _ in claves}
+    fechas = sorted({f for _, f in claves})
+    with transaction.atomic(using=fragmentos.actual()):
+        for i in range(0, len(fechas), fechas_por_consulta):
+            tramo = fechas[i:i + fechas_por_consulta]
+            movimientos = [
+                fila for fila in Movimiento.objects.filter(maquinaria_id__in=maquinas, fecha__in=tramo).values_list(*COLUMNAS)
+                if (fila[0], fila[1]) in claves
+            ]
+            if archivo.rango_archivado(tramo[0], tramo[-1]):
+                movimientos += _archivados(claves, maquinas, tramo)
+            existentes = UtilizacionDiaria.objects.filter(maquinaria_id__in=maquinas, fecha__in=tramo)
+            ids = [id_ for id_, m, f in existentes.values_list('id', 'maquinaria_id', 'fecha') if (m, f) in claves]
+            if ids:
+                UtilizacionDiaria.objects.filter(id__in=ids).delete()
+            UtilizacionDiaria.objects.bulk_create(_calcular(movimientos))
+
+
+def reconstruir(lote=50000):
+    """Vuelve a calcular toda la tabla desde los movimientos."""
+    with transaction.atomic(using=fragmentos.actual()):
+        UtilizacionDiaria.objects.all().delete()
+        movimientos = Movimiento.objects.filter(maquinaria__isnull=False).order_by('maquinaria_id', 'fecha').values_list(*COLUMNAS).iterator(chunk_size=lote)
+        pendientes, clave_actual, total = [], None, 0
+        for fila in movimientos:
+            # Se corta el lote solo entre días distintos, para no partir una fusión
+            if len(pendientes) >= lote and (fila[0], fila[1]) != clave_actual:
+                UtilizacionDiaria.objects.bulk_create(_calcular(pendientes), batch_size=5000)
+                total += len(pendientes)
+                pendientes = []
+            pendientes.append(fila)
+            clave_actual = (fila[0], fila[1])
+        UtilizacionDiaria.objects.bulk_create(_calcular(pendientes), batch_size=5000)
+        total += len(pendientes)
+        # Los días archivados se recalculan combinando ambas capas
+        for anio in archivo.anios_archivados():
+            archivados = archivo.filas_archivadas(date(anio, 1, 1), date(anio, 12, 31), COLUMNAS)
+            actualizar_dias({(fila[0], fila[1]) for fila in archivados})
+            total += len(archivados)
+    return total
+
+
+def _minutos(fecha_desde, fecha_hasta, campo):
+    """Minutos y movimientos por grupo, y minutos por día, de la base actual."""
+    filas = UtilizacionDiaria.objects.filter(fecha__range=(fecha_desde, fecha_hasta))
+    por_grupo = list(
+        filas.values(campo).annotate(minutos=Sum('minutos_trabajados'), movimientos=Sum('movimientos'))
+        .order_by(campo).values_list(campo, 'minutos', 'movimientos')
+    )
+    por_dia = list(filas.values('fecha').annotate(minutos=Sum('minutos_trabajados')).order_by().values_list('fecha', 'minutos'))
+    return por_grupo, por_dia
+
+
+def reporte(fecha_desde, fecha_hasta, agrupar_por='maquinaria'):
+    """
+    Utilización del período agrupada por equipo, tipo o proyecto, y la
+    serie diaria de la flota. Para proyectos, el porcentaje es sobre las
+    horas disponibles de toda la flota. En el modo fragmentado los minutos
+    de cada base se consultan a la vez y se suman.
+    """
+    campo, _ = AGRUPACIONES[agrupar_por]
+    dias = (fecha_hasta - fecha_desde).days + 1
+    horas_dia = horas_disponibles_por_dia()
+
+    equipos_por_grupo = {}
+    if agrupar_por == 'tipo':
+        equipos_por_grupo = dict(Maquinaria.objects.values('tipo').annotate(total=Count('id')).values_list('tipo', 'total'))
+    total_equipos = Maquinaria.objects.count()
+
+    minutos_por_grupo, movimientos_por_grupo, por_dia = defaultdict(int), defaultdict(int), defaultdict(int)
+    for filas_grupo, filas_dia in fragmentos.en_paralelo(_minutos, fecha_desde, fecha_hasta, campo).values():
+        for grupo, minutos, movimientos in filas_grupo:
+            minutos_por_grupo[grupo] += minutos
+            movimientos_por_grupo[grupo] += movimientos
+        for fecha, minutos in filas_dia:
+            por_dia[fecha] += minutos
+
+    grupos = []
+    for grupo in sorted(minutos_por_grupo):
+        if agrupar_por == 'maquinaria':
+            equipos = 1
+        elif agrupar_por == 'tipo':
+            equipos = equipos_por_grupo.get(grupo, 0)
+        else:
+            equipos = total_equipos
+        disponibles = equipos * dias * horas_dia
+        horas = minutos_por_grupo[grupo] / 60
+        grupos.append({
+            'grupo': grupo,
+            'horas_trabajadas': round(horas, 2),
+            'horas_disponibles': disponibles,
+            'utilizacion': round(100 * horas / disponibles, 1) if disponibles else None,
+            'movimientos': movimientos_por_grupo[grupo],
+        })
+
+    disponibles_dia = total_equipos * horas_dia
+    serie = []
+    for i in range(dias):
+        fecha = fecha_desde + timedelta(days=i)
+        horas = por_dia.get(fecha, 0) / 60
+        serie.append({
+            'fecha': fecha,
+            'horas_trabajadas': round(horas, 2),
+            'utilizacion': round(100 * horas / disponibles_dia, 1) if disponibles_dia else None,
+        })
+    return {'grupos': grupos, 'serie': serie, 'dias': dias, 'horas_dia': horas_dia}
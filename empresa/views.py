@@ -1,23 +1,55 @@
 # empresa/views.py
 
+from django.conf import settings
+from django.db import connections
 from django.shortcuts import render, redirect
+from django.urls import reverse
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.template.loader import get_template
 from django.utils import timezone
-from django.db.models import Count, Sum, Min, Max
+from django.db.models import Count
 from weasyprint import HTML
 from decimal import Decimal
-from datetime import date
+from datetime import date, timedelta
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
 from django.forms import formset_factory
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
 # Se importan todos los modelos necesarios en una sola instrucción
 from .models import (
     Empleado, Maquinaria, Movimiento, TipoLicencia, ProduccionEquipo,
-    Supervisor, InformeDiario, Postura, Lugar, Material, Viaje
+    Supervisor, InformeDiario, Postura, Lugar, Material, Viaje, TrabajoInformePDF,
+    ImportacionMovimientos, ReporteCombustible, AuditoriaHorometro, HallazgoHorometro, ConsumidorCambios,
 )
 # Se importan los formularios que usaremos
 from .forms import MovimientoCompletoForm, PosturaForm, ViajeForm
+from .informes import agregados_movimientos, ejecutar_trabajo_pdf
+from . import busqueda
+from .eventos import canal
+from .cumplimiento import vencimientos_proximos, agrupar_por_cargo_y_licencia
+from .importacion import importar_movimientos, reservar_importacion
+from . import planificacion
+from .grilla import cargar_grilla, guardar_grilla
+from . import utilizacion
+from . import archivo
+from . import sincronizacion
+from . import cambios
+from . import replica
+from . import replicacion
+from . import posturas
+from . import cubo
+from . import fragmentos
+from . import productividad
+from . import jornada
 
 
 # --- VISTAS ORIGINALES ---
@@ -48,41 +80,72 @@ def generar_certificado_pdf(request, empleado_id):
 
 # --- VISTAS DE API ---
 
+# Las tres APIs del formulario de captura tienen una versión asíncrona
+# (sufijo _async) para despliegues ASGI, que urls.py usa con
+# API_CAPTURA_ASINCRONA. Con el ORM de Django 5.2 cada consulta asíncrona
+# pasa igual por un hilo (no hay driver asíncrono para SQLite), así que por
+# ahora no ganan frente a las síncronas: ver el comando bench_api_asgi.
+
+def _datos_empleado(empleado, licencias):
+    dias_restantes = None
+    fecha_vencimiento_str = 'No especificada'
+    if empleado.fecha_vencimiento_licencia:
+        fecha_vencimiento_str = empleado.fecha_vencimiento_licencia.strftime('%d-%m-%Y')
+        diferencia = empleado.fecha_vencimiento_licencia - date.today()
+        dias_restantes = diferencia.days
+    return {
+        'id': empleado.id,
+        'nombre_completo': empleado.nombre_completo,
+        'rut': empleado.rut,
+        'cargo': empleado.cargo,
+        'tipo_licencia': ", ".join(licencias),
+        'fecha_vencimiento_licencia': fecha_vencimiento_str,
+        'dias_vencimiento_licencia': dias_restantes
+    }
+
 def buscar_empleado_api(request):
     codigo = request.GET.get('codigo', None)
     if not codigo:
         return JsonResponse({'error': 'Código de trabajador no proporcionado'}, status=400)
     try:
         empleado = Empleado.objects.get(codigo_trabajador=codigo)
-        licencias = ", ".join([lic.nombre for lic in empleado.licencias.all()])
-        dias_restantes = None
-        fecha_vencimiento_str = 'No especificada'
-        if empleado.fecha_vencimiento_licencia:
-            fecha_vencimiento_str = empleado.fecha_vencimiento_licencia.strftime('%d-%m-%Y')
-            diferencia = empleado.fecha_vencimiento_licencia - date.today()
-            dias_restantes = diferencia.days
-        data = { 
-            'id': empleado.id, 
-            'nombre_completo': empleado.nombre_completo, 
-            'rut': empleado.rut, 
-            'cargo': empleado.cargo, 
-            'tipo_licencia': licencias, 
-            'fecha_vencimiento_licencia': fecha_vencimiento_str, 
-            'dias_vencimiento_licencia': dias_restantes 
-        }
-        return JsonResponse(data)
     except Empleado.DoesNotExist:
         return JsonResponse({'error': 'Empleado no encontrado'}, status=404)
+    return JsonResponse(_datos_empleado(empleado, [lic.nombre for lic in empleado.licencias.all()]))
+
+async def buscar_empleado_api_async(request):
+    codigo = request.GET.get('codigo', None)
+    if not codigo:
+        return JsonResponse({'error': 'Código de trabajador no proporcionado'}, status=400)
+    try:
+        # Con prefetch las dos consultas van en una sola pasada al hilo del ORM
+        empleado = await Empleado.objects.prefetch_related('licencias').aget(codigo_trabajador=codigo)
+    except Empleado.DoesNotExist:
+        return JsonResponse({'error': 'Empleado no encontrado'}, status=404)
+    return JsonResponse(_datos_empleado(empleado, [lic.nombre for lic in empleado.licencias.all()]))
+
+def _ultimos_movimientos(maquinaria_id):
+    """Último movimiento del equipo en cada base: en modo fragmentado pudo trabajar en varias minas."""
+    return [
+        Movimiento.objects.using(alias).filter(maquinaria_id=maquinaria_id).order_by('-fecha', '-id')
+        .values('fecha', 'horometro_final')
+        for alias in fragmentos.bases()
+    ]
+
+def _mas_reciente(movimientos):
+    # Entre bases los ids no dicen cuál es posterior: en la misma fecha gana el horómetro mayor
+    movimientos = [movimiento for movimiento in movimientos if movimiento]
+    return max(movimientos, key=lambda movimiento: (movimiento['fecha'], movimiento['horometro_final'] or 0), default=None)
 
 def ultimo_horometro_api(request):
     maquinaria_id = request.GET.get('maquinaria_id', None)
     if not maquinaria_id:
         return JsonResponse({'error': 'ID de maquinaria no proporcionado'}, status=400)
     
-    ultimo_movimiento = Movimiento.objects.filter(maquinaria_id=maquinaria_id).order_by('-fecha', '-id').first()
+    ultimo_movimiento = _mas_reciente(consulta.first() for consulta in _ultimos_movimientos(maquinaria_id))
     
     if ultimo_movimiento:
-        data = {'ultimo_horometro': ultimo_movimiento.horometro_final}
+        data = {'ultimo_horometro': ultimo_movimiento['horometro_final']}
     else:
         try:
             maquina = Maquinaria.objects.get(pk=maquinaria_id)
@@ -92,31 +155,361 @@ def ultimo_horometro_api(request):
             
     return JsonResponse(data)
 
-def obtener_posturas_api(request):
+async def ultimo_horometro_api_async(request):
+    maquinaria_id = request.GET.get('maquinaria_id', None)
+    if not maquinaria_id:
+        return JsonResponse({'error': 'ID de maquinaria no proporcionado'}, status=400)
+
+    ultimo_movimiento = _mas_reciente(await asyncio.gather(
+        *(consulta.afirst() for consulta in _ultimos_movimientos(maquinaria_id))
+    ))
+
+    if ultimo_movimiento:
+        data = {'ultimo_horometro': ultimo_movimiento['horometro_final']}
+    else:
+        try:
+            maquina = await Maquinaria.objects.aget(pk=maquinaria_id)
+            data = {'ultimo_horometro': maquina.horometro_actual}
+        except Maquinaria.DoesNotExist:
+            data = {'ultimo_horometro': 0}
+
+    return JsonResponse(data)
+
+def _parametros_posturas(request):
+    """(fecha, turno, respuesta): respuesta no es None si no hay que consultar."""
     fecha_str = request.GET.get('fecha')
     turno = request.GET.get('turno')
     
     if not fecha_str or not turno:
-        return JsonResponse({'error': 'Faltan los parámetros de fecha o turno'}, status=400)
+        return None, None, JsonResponse({'error': 'Faltan los parámetros de fecha o turno'}, status=400)
     
     try:
         fecha = date.fromisoformat(fecha_str)
-        informe_diario = InformeDiario.objects.get(fecha=fecha, turno=turno)
-        
-        posturas = Postura.objects.filter(informe=informe_diario).order_by('numero_postura')
-        
-        posturas_data = [
-            {
-                'id': postura.id,
-                'descripcion': f"Postura #{postura.numero_postura}: {postura.tipo_actividad} - {postura.origen} a {postura.destino}",
-            }
-            for postura in posturas
-        ]
-        
-        return JsonResponse({'posturas': posturas_data})
+    except ValueError:
+        return None, None, JsonResponse({'posturas': []})
+    return fecha, turno, None
+
+def obtener_posturas_api(request):
+    fecha, turno, respuesta = _parametros_posturas(request)
+    if respuesta is not None:
+        return respuesta
+    return JsonResponse({'posturas': posturas.posturas_del_turno(fecha, turno)})
+
+async def obtener_posturas_api_async(request):
+    fecha, turno, respuesta = _parametros_posturas(request)
+    if respuesta is not None:
+        return respuesta
+    return JsonResponse({'posturas': await posturas.aposturas_del_turno(fecha, turno)})
+
+def busqueda_api(request):
+    """
+    Búsqueda de texto completo en observaciones y descripciones de trabajo,
+    con resultados ordenados por relevancia y facetas por fecha y máquina.
+    """
+    texto = request.GET.get('q', '').strip()
+    if not texto:
+        return JsonResponse({'error': 'Texto de búsqueda no proporcionado'}, status=400)
+    if not busqueda.disponible():
+        return JsonResponse({'error': 'La búsqueda de texto completo no está disponible'}, status=501)
+    try:
+        fecha_desde = date.fromisoformat(request.GET['desde']) if request.GET.get('desde') else None
+        fecha_hasta = date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta') else None
+        maquinaria_id = int(request.GET['maquinaria_id']) if request.GET.get('maquinaria_id') else None
+        limite = min(int(request.GET.get('limite', 50)), 500)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+
+    return JsonResponse(busqueda.buscar(texto, fecha_desde, fecha_hasta, maquinaria_id, limite))
+
+# Diez años: más allá la fecha límite se sale del rango de `date`
+MAXIMO_DIAS_VENCIMIENTO = 3650
+
+def _dias_parametro(request, por_defecto=30):
+    try:
+        return min(max(int(request.GET.get('dias', por_defecto)), 0), MAXIMO_DIAS_VENCIMIENTO)
+    except ValueError:
+        return por_defecto
+
+@replica.en_replica
+def cumplimiento_licencias_api(request):
+    """Licencias y contratos a plazo fijo que vencen dentro de N días, agrupados por cargo y licencia."""
+    dias = _dias_parametro(request)
+    vencimientos = vencimientos_proximos(dias)
+    for item in vencimientos:
+        for campo in ('fecha_vencimiento_licencia', 'fecha_termino_contrato'):
+            item[campo] = item[campo].isoformat() if item[campo] else None
+    return JsonResponse({
+        'dias': dias,
+        'total': len(vencimientos),
+        'grupos': agrupar_por_cargo_y_licencia(vencimientos),
+    })
+
+async def eventos_turno(request):
+    """
+    Flujo Server-Sent Events con los movimientos, los viajes y la producción
+    que se guardan para una fecha (y opcionalmente un turno). Debe servirse con el
+    servidor ASGI (mysite/asgi.py): cada conexión espera en el event loop
+    sin ocupar un hilo. Envía un comentario de latido cada
+    EVENTOS_LATIDO_SEGUNDOS para que proxies y navegadores no la cierren.
+    """
+    try:
+        fecha = date.fromisoformat(request.GET.get('fecha', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Fecha inválida'}, status=400)
+    turno = request.GET.get('turno') or None
+    latido = getattr(settings, 'EVENTOS_LATIDO_SEGUNDOS', 15)
+
+    suscripcion = canal.suscribir(fecha, turno)
+
+    async def flujo():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), timeout=latido)
+                except asyncio.TimeoutError:
+                    yield ": latido\n\n"
+                    continue
+                yield f"event: {evento['tipo']}\ndata: {json.dumps(evento)}\n\n"
+        finally:
+            canal.cancelar(suscripcion)
+
+    response = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@replica.en_replica
+def reporte_combustible_api(request):
+    """Último reporte de combustible precalculado (ver `actualizar_reporte_combustible`)."""
+    reporte = ReporteCombustible.objects.first()
+    if reporte is None:
+        return JsonResponse({'error': 'Aún no se ha generado el reporte de combustible.'}, status=404)
+    return JsonResponse({
+        'generado_en': reporte.generado_en.isoformat(),
+        'fecha_desde': reporte.fecha_desde.isoformat() if reporte.fecha_desde else None,
+        'fecha_hasta': reporte.fecha_hasta.isoformat() if reporte.fecha_hasta else None,
+        **reporte.datos,
+    })
+
+@replica.en_replica
+def utilizacion_api(request):
+    """Utilización por equipo, tipo o proyecto (?agrupar=) y serie diaria de la flota."""
+    try:
+        fecha_desde, fecha_hasta, agrupar_por = _periodo_utilizacion(request)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    datos = utilizacion.reporte(fecha_desde, fecha_hasta, agrupar_por)
+    for dia in datos['serie']:
+        dia['fecha'] = dia['fecha'].isoformat()
+    return JsonResponse({'desde': fecha_desde.isoformat(), 'hasta': fecha_hasta.isoformat(), 'agrupar': agrupar_por, **datos})
+
+@replica.en_replica
+def cubo_viajes_api(request):
+    """
+    Viajes del cubo de material cortados y pivoteados:
+    ?desde=&hasta=&filas=material,origen&columna=mes y filtros exactos por
+    dimensión (?turno=Día&tipo_actividad=Despacho). Por defecto, el último año por material.
+    """
+    try:
+        fecha_desde, fecha_hasta, _ = _periodo_utilizacion(request)
+        filas = [d for d in request.GET.get('filas', 'material').split(',') if d]
+        filtros = {d: request.GET[d] for d in cubo.FILTROS if request.GET.get(d)}
+        datos = cubo.consultar(fecha_desde, fecha_hasta, filas, request.GET.get('columna') or None, filtros)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({'desde': fecha_desde.isoformat(), 'hasta': fecha_hasta.isoformat(), 'filtros': filtros, **datos})
+
+def _parametros_productividad(request):
+    fecha_hasta = date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta') else timezone.localdate()
+    proyecto = request.GET.get('proyecto') or None
+    if proyecto and proyecto not in dict(Movimiento.PROYECTOS):
+        raise ValueError(f"Proyecto desconocido: {proyecto}")
+    return fecha_hasta, proyecto
+
+@replica.en_replica
+def productividad_api(request):
+    """
+    Ranking de operadores por proyecto en las ventanas de 7, 30 y 90 días
+    que terminan en ?hasta= (por defecto hoy), opcionalmente de un ?proyecto=.
+    """
+    try:
+        fecha_hasta, proyecto = _parametros_productividad(request)
+        datos = productividad.ranking(fecha_hasta, proyecto)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    return JsonResponse({
+        'hasta': fecha_hasta.isoformat(),
+        'proyecto': proyecto,
+        'metricas': {metrica: etiqueta for metrica, (etiqueta, _) in productividad.METRICAS.items()},
+        'ventanas': {str(dias): proyectos for dias, proyectos in datos['ventanas'].items()},
+    })
+
+def verificar_jornada_api(request):
+    """
+    Control previo a asignar un turno: ?empleado_id=&fecha=&turno=&horas=.
+    Responde si el trabajador puede hacerlo y, si no, por qué.
+    """
+    try:
+        empleado_id = int(request.GET['empleado_id'])
+        fecha = date.fromisoformat(request.GET['fecha'])
+        turno = request.GET.get('turno', 'Día')
+        horas = Decimal(request.GET.get('horas') or 0)
+    except (KeyError, ValueError, ArithmeticError):
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    if turno not in dict(Movimiento.TURNOS):
+        return JsonResponse({'error': f'Turno desconocido: {turno}'}, status=400)
+    return JsonResponse({
+        'empleado_id': empleado_id, 'fecha': fecha.isoformat(), 'turno': turno,
+        **jornada.verificar_turno(empleado_id, fecha, turno, horas),
+    })
+
+@gzip_page
+def sincronizacion_maestros_api(request):
+    """
+    Empleados, equipos, supervisores y posturas cambiados desde ?cursor=
+    (0 o ausente: todos), por columnas y comprimidos con gzip si el cliente
+    lo acepta. Ver empresa/sincronizacion.py.
+    """
+    if not sincronizacion.disponible():
+        return JsonResponse({'error': 'La sincronización no está disponible'}, status=501)
+    try:
+        cursor = max(int(request.GET.get('cursor') or 0), 0)
+    except ValueError:
+        return JsonResponse({'error': 'Cursor inválido'}, status=400)
+    return JsonResponse(sincronizacion.cambios_desde(cursor), json_dumps_params={'separators': (',', ':')})
+
+@gzip_page
+def cambios_api(request):
+    """
+    Feed de cambios de movimientos, viajes, producción, posturas e informes
+    posteriores a ?cursor= (hasta ?limite= eventos). Solo lectura: los
+    consumidores confirman lo procesado con confirmar_cambios_api. Ver
+    empresa/cambios.py.
+    """
+    if not cambios.disponible():
+        return JsonResponse({'error': 'El registro de cambios no está disponible'}, status=501)
+    if fragmentos.activo():
+        return JsonResponse({'error': 'El registro de cambios no ve los fragmentos (ver empresa/checks.py)'}, status=501)
+    try:
+        cursor = max(int(request.GET.get('cursor') or 0), 0)
+        limite = min(max(int(request.GET.get('limite') or cambios.LIMITE), 1), 10000)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    eventos = cambios.eventos_desde(cursor, limite)
+    return JsonResponse(
+        {'cursor': eventos[-1]['id'] if eventos else cursor, 'completo': len(eventos) < limite, 'eventos': eventos},
+        json_dumps_params={'separators': (',', ':')},
+    )
+
+@csrf_exempt
+@require_POST
+def confirmar_cambios_api(request):
+    """
+    Un consumidor del feed (POST consumidor, cursor) confirma que procesó
+    todo hasta `cursor`. Requiere `Authorization: Token <CAMBIOS_TOKEN>`:
+    los eventos que confirmaron todos los consumidores se pueden compactar.
+    """
+    esquema, _, token = request.headers.get('Authorization', '').partition(' ')
+    if esquema != 'Token' or not cambios.token_valido(token):
+        return JsonResponse({'error': 'Token inválido'}, status=403)
+    consumidor = request.POST.get('consumidor', '').strip()
+    try:
+        cursor = max(int(request.POST.get('cursor') or 0), 0)
+    except ValueError:
+        return JsonResponse({'error': 'Parámetros inválidos'}, status=400)
+    if not consumidor:
+        return JsonResponse({'error': 'Falta el consumidor'}, status=400)
+    cambios.confirmar(consumidor, cursor)
+    confirmado = ConsumidorCambios.objects.filter(nombre=consumidor).values_list('cursor', flat=True).first()
+    return JsonResponse({'consumidor': consumidor, 'cursor': confirmado})
+
+@csrf_exempt
+@require_POST
+def replicacion_conjuntos_api(request):
+    """
+    Recibe en la oficina central un conjunto de cambios de un nodo de sitio
+    (JSON comprimido con gzip) y lo aplica. Reenviar un conjunto ya aplicado
+    no hace nada. Ver empresa/replicacion.py.
+    """
+    esquema, _, token = request.headers.get('Authorization', '').partition(' ')
+    if esquema != 'Token' or not replicacion.token_valido(token):
+        return JsonResponse({'error': 'Token inválido'}, status=403)
+    try:
+        cuerpo = request.body
+        if request.headers.get('Content-Encoding') == 'gzip':
+            cuerpo = gzip.decompress(cuerpo)
+        contenido = json.loads(cuerpo)
+    except (OSError, EOFError, ValueError):
+        return JsonResponse({'error': 'Conjunto ilegible'}, status=400)
+    try:
+        resultado = replicacion.aplicar_conjunto(contenido)
+    except ValueError as exc:
+        esperada = getattr(exc, 'esperada', None)
+        return JsonResponse({'error': str(exc), 'esperada': esperada}, status=409 if esperada else 400)
+    return JsonResponse(resultado)
+
+# --- IMPORTACIÓN MASIVA DE MOVIMIENTOS ---
+
+def _importar_en_segundo_plano(ruta, importacion):
+    try:
+        importar_movimientos(ruta, importacion=importacion)
+    except Exception:
+        # El error queda registrado en la ImportacionMovimientos
+        pass
+    finally:
+        os.remove(ruta)
+        connections.close_all()
+
+@require_POST
+def importar_movimientos_api(request):
+    """
+    Recibe un archivo CSV o XLSX de movimientos históricos y lo importa en
+    segundo plano. El avance se consulta en la URL de estado que se devuelve.
+    Subir de nuevo un archivo que falló o quedó interrumpido retoma su
+    importación; si todavía se está importando, se devuelve la misma URL.
+    """
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return JsonResponse({'error': 'Debe adjuntar un archivo'}, status=400)
+    extension = os.path.splitext(archivo.name)[1].lower()
+    if extension not in ('.csv', '.xlsx'):
+        return JsonResponse({'error': 'Formato no soportado (use .csv o .xlsx)'}, status=400)
+
+    sha = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(suffix=extension, delete=False) as destino:
+        for bloque in archivo.chunks():
+            sha.update(bloque)
+            destino.write(bloque)
+    importacion, reservada = reservar_importacion(sha.hexdigest(), archivo.name)
+    if reservada:
+        hilo = threading.Thread(target=_importar_en_segundo_plano, args=(destino.name, importacion), daemon=True)
+        hilo.start()
+    else:
+        # Ya está completa o la está cargando otra petición: se informa su estado
+        os.remove(destino.name)
 
-    except (ValueError, InformeDiario.DoesNotExist):
-        return JsonResponse({'posturas': []})
+    return JsonResponse({
+        'id': importacion.id,
+        'url_estado': reverse('empresa:estado_importacion', args=[importacion.id]),
+    }, status=202)
+
+def estado_importacion_api(request, importacion_id):
+    try:
+        importacion = ImportacionMovimientos.objects.get(pk=importacion_id)
+    except ImportacionMovimientos.DoesNotExist:
+        return JsonResponse({'error': 'Importación no encontrada'}, status=404)
+    data = {
+        'id': importacion.id,
+        'archivo': importacion.nombre_archivo,
+        'estado': importacion.estado,
+        'filas_procesadas': importacion.filas_procesadas,
+        'filas_importadas': importacion.filas_importadas,
+        'filas_con_error': importacion.filas_con_error,
+        'errores': list(importacion.errores.values('fila', 'mensajes')[:500]),
+        'error': importacion.mensaje_error,
+    }
+    return JsonResponse(data)
 
 # --- VISTA PARA CREAR UN MOVIMIENTO ---
 
@@ -131,13 +524,7 @@ def crear_movimiento(request):
         formset = ViajeFormSet(request.POST, prefix='viajes')
 
         if form.is_valid() and formset.is_valid():
-            movimiento = form.save(commit=False)
-            
-            # Ajuste de horas trabajadas si no se ingresó horómetro final
-            if movimiento.horometro_final is None:
-                movimiento.horas_trabajadas = None
-                
-            movimiento.save()
+            movimiento = form.save()
             
             # Guardar los objetos Viaje para cada form validado
             for viaje_form in formset:
@@ -158,14 +545,8 @@ def crear_movimiento(request):
             posturas_json = []
             if fecha_str and turno:
                 try:
-                    fecha_obj = date.fromisoformat(fecha_str)
-                    informe = InformeDiario.objects.get(fecha=fecha_obj, turno=turno)
-                    posturas_qs = Postura.objects.filter(informe=informe).order_by('numero_postura')
-                    posturas_json = [
-                        {'id': p.id, 'descripcion': f"Postura #{p.numero_postura}: {p.tipo_actividad} - {p.origen} a {p.destino}"}
-                        for p in posturas_qs
-                    ]
-                except (ValueError, InformeDiario.DoesNotExist):
+                    posturas_json = posturas.posturas_del_turno(date.fromisoformat(fecha_str), turno)
+                except ValueError:
                     pass
             
             contexto = {
@@ -189,6 +570,7 @@ def crear_movimiento(request):
 
 # --- OTRAS VISTAS ---
 
+@replica.en_replica
 def reporte_diario(request):
     fecha_seleccionada_str = request.GET.get('fecha')
     if fecha_seleccionada_str:
@@ -196,7 +578,17 @@ def reporte_diario(request):
     else:
         fecha_seleccionada = timezone.localdate()
 
-    movimientos_del_dia = Movimiento.objects.filter(fecha=fecha_seleccionada).select_related('empleado', 'maquinaria').order_by('id')
+    # Todas las minas: en modo fragmentado se lee cada base
+    movimientos_del_dia = [
+        movimiento for parte in fragmentos.en_paralelo(
+            lambda: list(Movimiento.objects.filter(fecha=fecha_seleccionada).select_related('empleado', 'maquinaria'))
+        ).values() for movimiento in parte
+    ]
+    if archivo.rango_archivado(fecha_seleccionada, fecha_seleccionada):
+        movimientos_del_dia += archivo.movimientos_archivados(
+            fecha_seleccionada, fecha_seleccionada, excluir_ids={m.id for m in movimientos_del_dia}, relacionados=True
+        )
+    movimientos_del_dia.sort(key=lambda m: m.id)
     contexto = {
         'titulo': f"Reporte Diario de Movimientos - {fecha_seleccionada.strftime('%d/%m/%Y')}",
         'movimientos': movimientos_del_dia,
@@ -204,6 +596,119 @@ def reporte_diario(request):
     }
     return render(request, 'empresa/reporte_diario.html', contexto)
 
+@replica.en_replica
+def cumplimiento_licencias(request):
+    dias = _dias_parametro(request)
+    contexto = {
+        'titulo': f"Licencias y Contratos por Vencer ({dias} días)",
+        'dias': dias,
+        'grupos': agrupar_por_cargo_y_licencia(vencimientos_proximos(dias)),
+    }
+    return render(request, 'empresa/cumplimiento_licencias.html', contexto)
+
+@replica.en_replica
+def reporte_combustible(request):
+    reporte = ReporteCombustible.objects.first()
+    contexto = {
+        'titulo': "Consumo de Combustible por Equipo",
+        'reporte': reporte,
+        'datos': reporte.datos if reporte else {},
+    }
+    return render(request, 'empresa/reporte_combustible.html', contexto)
+
+@replica.en_replica
+def auditoria_horometros(request):
+    hallazgos = HallazgoHorometro.objects.select_related('maquinaria', 'movimiento', 'movimiento_anterior')
+    tipo = request.GET.get('tipo')
+    if tipo:
+        hallazgos = hallazgos.filter(tipo=tipo)
+    maquinaria_id = request.GET.get('maquinaria')
+    if maquinaria_id and maquinaria_id.isdigit():
+        hallazgos = hallazgos.filter(maquinaria_id=maquinaria_id)
+    contexto = {
+        'titulo': "Auditoría de Continuidad de Horómetros",
+        'auditoria': AuditoriaHorometro.objects.filter(terminada_en__isnull=False).first(),
+        'resumen': HallazgoHorometro.objects.values('tipo').annotate(total=Count('id')).order_by('tipo'),
+        'hallazgos': hallazgos[:500],
+        'tipos': HallazgoHorometro.TIPOS,
+        'tipo_seleccionado': tipo or '',
+        'maquinarias': Maquinaria.objects.order_by('codigo_eq'),
+        'maquinaria_seleccionada': int(maquinaria_id) if maquinaria_id and maquinaria_id.isdigit() else None,
+    }
+    return render(request, 'empresa/auditoria_horometros.html', contexto)
+
+def _periodo_utilizacion(request):
+    hoy = timezone.localdate()
+    fecha_hasta = date.fromisoformat(request.GET['hasta']) if request.GET.get('hasta') else hoy
+    fecha_desde = date.fromisoformat(request.GET['desde']) if request.GET.get('desde') else fecha_hasta - timedelta(days=364)
+    agrupar_por = request.GET.get('agrupar', 'maquinaria')
+    if agrupar_por not in utilizacion.AGRUPACIONES or fecha_desde > fecha_hasta:
+        raise ValueError("Parámetros inválidos")
+    return fecha_desde, fecha_hasta, agrupar_por
+
+@replica.en_replica
+def utilizacion_equipos(request):
+    try:
+        fecha_desde, fecha_hasta, agrupar_por = _periodo_utilizacion(request)
+    except ValueError:
+        messages.error(request, "Período o agrupación inválidos.")
+        return redirect('empresa:utilizacion_equipos')
+    datos = utilizacion.reporte(fecha_desde, fecha_hasta, agrupar_por)
+    maximo = max((d['horas_trabajadas'] for d in datos['serie']), default=0) or 1
+    for dia in datos['serie']:
+        dia['alto'] = round(100 * dia['horas_trabajadas'] / maximo, 1)
+    contexto = {
+        'titulo': "Utilización de Equipos",
+        'fecha_desde': fecha_desde.isoformat(),
+        'fecha_hasta': fecha_hasta.isoformat(),
+        'agrupar_por': agrupar_por,
+        'agrupaciones': [(clave, etiqueta) for clave, (_, etiqueta) in utilizacion.AGRUPACIONES.items()],
+        'etiqueta_grupo': utilizacion.AGRUPACIONES[agrupar_por][1],
+        **datos,
+    }
+    return render(request, 'empresa/utilizacion_equipos.html', contexto)
+
+@replica.en_replica
+def productividad_operadores(request):
+    try:
+        fecha_hasta, proyecto = _parametros_productividad(request)
+        dias = int(request.GET.get('dias', 30))
+        if dias not in productividad.VENTANAS:
+            raise ValueError
+    except ValueError:
+        messages.error(request, "Fecha, proyecto o ventana inválidos.")
+        return redirect('empresa:productividad_operadores')
+    try:
+        ranking = productividad.ranking(fecha_hasta, proyecto)['ventanas'][dias]
+    except ValueError as exc:
+        messages.error(request, str(exc))
+        return redirect('empresa:productividad_operadores')
+    contexto = {
+        'titulo': "Productividad de Operadores",
+        'fecha_hasta': fecha_hasta.isoformat(),
+        'proyecto': proyecto or '',
+        'proyectos': Movimiento.PROYECTOS,
+        'dias': dias,
+        'ventanas': productividad.VENTANAS,
+        'ranking': ranking,
+    }
+    return render(request, 'empresa/productividad_operadores.html', contexto)
+
+@replica.en_replica
+def jornada_empleados(request):
+    try:
+        fecha = date.fromisoformat(request.GET['fecha']) if request.GET.get('fecha') else timezone.localdate()
+    except ValueError:
+        messages.error(request, "Fecha inválida.")
+        return redirect('empresa:jornada_empleados')
+    contexto = {
+        'titulo': "Control de Jornada Laboral",
+        'fecha': fecha.isoformat(),
+        'desde': (fecha - timedelta(days=6)).isoformat(),
+        **jornada.panel(fecha),
+    }
+    return render(request, 'empresa/jornada_empleados.html', contexto)
+
 def informe_produccion_diario(request):
     fecha_seleccionada = None
     turno_seleccionado = None
@@ -284,16 +789,11 @@ def informe_produccion_diario(request):
         turno=turno_seleccionado
     )
     
-    active_equipment_ids = Movimiento.objects.filter(
-        fecha=fecha_seleccionada, 
-        turno=turno_seleccionado
-    ).values_list('maquinaria_id', flat=True).distinct()
-    
-    datos_movimientos = Movimiento.objects.filter(id__in=active_equipment_ids).values('maquinaria_id').annotate(
-        hora_inicio=Min('horometro_inicial'), hora_termino=Max('horometro_final'),
-        total_horas=Sum('horas_trabajadas'), total_combustible=Sum('combustible_cargado')
+    # Igual que el PDF: incluye los movimientos archivados si la fecha pertenece a un año cerrado
+    datos_agregados = agregados_movimientos(fecha_seleccionada, fecha_seleccionada, [turno_seleccionado]).get(
+        (fecha_seleccionada, turno_seleccionado), {}
     )
-    datos_agregados = {item['maquinaria_id']: item for item in datos_movimientos}
+    active_equipment_ids = list(datos_agregados)
 
     datos_produccion_guardados = ProduccionEquipo.objects.filter(informe=informe_diario)
     datos_produccion_map = {item.maquinaria_id: item for item in datos_produccion_guardados}
@@ -336,6 +836,7 @@ def informe_produccion_diario(request):
     
     return render(request, 'empresa/informe_produccion.html', contexto)
 
+@replica.en_replica
 def generar_informe_pdf(request, fecha, turno):
     """
     Genera una versión en PDF del Informe de Producción Diario
@@ -350,18 +851,11 @@ def generar_informe_pdf(request, fecha, turno):
         turno=turno_seleccionado
     )
     
-    active_equipment_ids = Movimiento.objects.filter(
-        fecha=fecha_seleccionada, 
-        turno=turno_seleccionado
-    ).values_list('maquinaria_id', flat=True).distinct()
-    
-    datos_movimientos = Movimiento.objects.filter(
-        fecha=fecha_seleccionada, turno=turno_seleccionado
-    ).values('maquinaria_id').annotate(
-        hora_inicio=Min('horometro_inicial'), hora_termino=Max('horometro_final'),
-        total_horas=Sum('horas_trabajadas'), total_combustible=Sum('combustible_cargado')
+    # Incluye los movimientos archivados si la fecha pertenece a un año cerrado
+    datos_agregados = agregados_movimientos(fecha_seleccionada, fecha_seleccionada, [turno_seleccionado]).get(
+        (fecha_seleccionada, turno_seleccionado), {}
     )
-    datos_agregados = {item['maquinaria_id']: item for item in datos_movimientos}
+    active_equipment_ids = list(datos_agregados)
 
     datos_produccion_guardados = ProduccionEquipo.objects.filter(informe=informe_diario)
     datos_produccion_map = {item.maquinaria_id: item for item in datos_produccion_guardados}
@@ -408,6 +902,73 @@ def generar_informe_pdf(request, fecha, turno):
     
     return response
 
+# --- INFORMES PDF POR LOTES ---
+
+MAXIMO_DIAS_LOTE_PDF = 366
+# Un trabajo que quedó sin terminar (el servidor se reinició) deja de bloquear pasado este tiempo
+VIGENCIA_LOTE_PDF = timedelta(hours=2)
+_lock_lote_pdf = threading.Lock()
+
+@require_POST
+def iniciar_lote_pdf(request):
+    """
+    Crea un trabajo que genera en segundo plano los informes de producción
+    de un rango de fechas y turnos, combinados en un solo PDF con índice.
+    Corre un trabajo a la vez: mientras hay uno pendiente o en proceso se
+    responde 409.
+    """
+    try:
+        fecha_desde = date.fromisoformat(request.POST.get('fecha_desde', ''))
+        fecha_hasta = date.fromisoformat(request.POST.get('fecha_hasta', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Fechas inválidas'}, status=400)
+    if fecha_hasta < fecha_desde:
+        return JsonResponse({'error': 'La fecha final debe ser posterior a la inicial'}, status=400)
+    if (fecha_hasta - fecha_desde).days > MAXIMO_DIAS_LOTE_PDF:
+        return JsonResponse({'error': f'El rango no puede superar {MAXIMO_DIAS_LOTE_PDF} días'}, status=400)
+
+    turnos_validos = [valor for valor, _ in Movimiento.TURNOS]
+    turnos = [t for t in request.POST.getlist('turnos') if t in turnos_validos] or turnos_validos
+
+    with _lock_lote_pdf:
+        if TrabajoInformePDF.objects.filter(
+            estado__in=['pendiente', 'en_proceso'], creado_en__gte=timezone.now() - VIGENCIA_LOTE_PDF
+        ).exists():
+            return JsonResponse({'error': 'Ya hay un PDF por lotes generándose; espere a que termine'}, status=409)
+        trabajo = TrabajoInformePDF.objects.create(fecha_desde=fecha_desde, fecha_hasta=fecha_hasta, turnos=turnos)
+    hilo = threading.Thread(target=ejecutar_trabajo_pdf, args=(trabajo.id, request.build_absolute_uri('/')), daemon=True)
+    hilo.start()
+
+    return JsonResponse({
+        'id': trabajo.id,
+        'url_estado': reverse('empresa:estado_lote_pdf', args=[trabajo.id]),
+    }, status=202)
+
+def estado_lote_pdf(request, trabajo_id):
+    try:
+        trabajo = TrabajoInformePDF.objects.defer('archivo').get(pk=trabajo_id)
+    except TrabajoInformePDF.DoesNotExist:
+        return JsonResponse({'error': 'Trabajo no encontrado'}, status=404)
+    data = {
+        'id': trabajo.id,
+        'estado': trabajo.estado,
+        'total': trabajo.total,
+        'completados': trabajo.completados,
+        'error': trabajo.mensaje_error,
+        'url_descarga': reverse('empresa:descargar_lote_pdf', args=[trabajo.id]) if trabajo.estado == 'completado' else None,
+    }
+    return JsonResponse(data)
+
+def descargar_lote_pdf(request, trabajo_id):
+    try:
+        trabajo = TrabajoInformePDF.objects.get(pk=trabajo_id, estado='completado')
+    except TrabajoInformePDF.DoesNotExist:
+        return HttpResponse("Informe no disponible.", status=404)
+    response = HttpResponse(bytes(trabajo.archivo), content_type='application/pdf')
+    filename = f"informes_produccion_{trabajo.fecha_desde.isoformat()}_{trabajo.fecha_hasta.isoformat()}.pdf"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
 def definir_posturas(request):
     PosturaFormSet = formset_factory(PosturaForm, extra=1, can_delete=True)
 
@@ -486,4 +1047,170 @@ def definir_posturas(request):
         'turno_seleccionado': turno_seleccionado,
         'opciones_turno': Movimiento.TURNOS,
     }
-    return render(request, 'empresa/definir_posturas.html', contexto)
\ No newline at end of file
+    return render(request, 'empresa/definir_posturas.html', contexto)
+
+
+# --- PLANIFICACIÓN DE POSTURAS POR LOTES ---
+
+def _resumen_plan(resultado):
+    mensaje = (f"Se planificaron {len(resultado['turnos_planificados'])} turnos "
+               f"({resultado['posturas_creadas']} posturas, {resultado['informes_creados']} informes nuevos).")
+    if resultado['turnos_omitidos']:
+        omitidos = ', '.join(f"{fecha.strftime('%d-%m-%Y')} {turno}" for fecha, turno in resultado['turnos_omitidos'][:10])
+        mensaje += f" Se omitieron {len(resultado['turnos_omitidos'])} turnos que ya tenían posturas o viajes: {omitidos}."
+    return mensaje
+
+@require_POST
+def copiar_plan_posturas(request):
+    fecha_origen_str = request.POST.get('fecha')
+    turno_origen = request.POST.get('turno')
+    try:
+        fecha_origen = date.fromisoformat(fecha_origen_str)
+        fecha_desde = date.fromisoformat(request.POST.get('fecha_desde', ''))
+        fecha_hasta = date.fromisoformat(request.POST.get('fecha_hasta', ''))
+    except (TypeError, ValueError):
+        messages.error(request, "Fechas inválidas para copiar el plan.")
+        return redirect(f"{reverse('empresa:definir_posturas')}?fecha={fecha_origen_str}&turno={turno_origen}")
+
+    turnos_validos = dict(Movimiento.TURNOS)
+    turnos = [t for t in request.POST.getlist('turnos') if t in turnos_validos]
+    if not turnos or fecha_hasta < fecha_desde or (fecha_hasta - fecha_desde).days > 366:
+        messages.error(request, "Seleccione al menos un turno y un rango de fechas de hasta un año.")
+    else:
+        destinos = planificacion.turnos_en_rango(fecha_desde, fecha_hasta, turnos)
+        try:
+            resultado = planificacion.copiar_posturas(
+                fecha_origen, turno_origen, destinos, reemplazar=bool(request.POST.get('reemplazar'))
+            )
+        except ValueError as exc:
+            messages.error(request, str(exc))
+        else:
+            messages.success(request, _resumen_plan(resultado))
+    return redirect(f"{reverse('empresa:definir_posturas')}?fecha={fecha_origen_str}&turno={turno_origen}")
+
+@require_POST
+def importar_plan_posturas(request):
+    archivo = request.FILES.get('archivo')
+    destino = reverse('empresa:definir_posturas')
+    if archivo is None or not archivo.name.lower().endswith(('.csv', '.xlsx')):
+        messages.error(request, "Adjunte un archivo .csv o .xlsx con el plan de posturas.")
+        return redirect(destino)
+
+    sufijo = os.path.splitext(archivo.name)[1].lower()
+    with tempfile.NamedTemporaryFile(suffix=sufijo, delete=False) as temporal:
+        for bloque in archivo.chunks():
+            temporal.write(bloque)
+    try:
+        plan, errores = planificacion.leer_plan(temporal.name)
+    finally:
+        os.remove(temporal.name)
+
+    if errores:
+        # El plan se aplica completo o no se aplica, para no dejar una semana a medias
+        detalle = '; '.join(f"fila {fila}: {mensaje}" for fila, mensaje in errores[:10])
+        messages.error(request, f"El plan tiene {len(errores)} filas con errores y no se aplicó. {detalle}")
+        return redirect(destino)
+    if not plan:
+        messages.error(request, "El archivo no contiene posturas.")
+        return redirect(destino)
+
+    resultado = planificacion.aplicar_plan(plan, reemplazar=bool(request.POST.get('reemplazar')))
+    messages.success(request, _resumen_plan(resultado))
+    fecha, turno = min(plan)
+    return redirect(f"{destino}?fecha={fecha.isoformat()}&turno={turno}")
+
+
+# --- GRILLA DE VIAJES DEL TURNO ---
+
+def _fecha_turno_parametros(datos):
+    fecha_str = datos.get('fecha')
+    fecha = date.fromisoformat(fecha_str) if fecha_str else timezone.localdate()
+    turno = datos.get('turno') or 'Día'
+    if turno not in dict(Movimiento.TURNOS):
+        raise ValueError(f"Turno inválido: {turno}")
+    return fecha, turno
+
+def grilla_viajes(request):
+    try:
+        fecha, turno = _fecha_turno_parametros(request.POST if request.method == 'POST' else request.GET)
+    except ValueError:
+        messages.error(request, "Fecha o turno inválidos.")
+        return redirect('empresa:grilla_viajes')
+
+    if request.method == 'POST':
+        celdas = {}
+        try:
+            for nombre, valor in request.POST.items():
+                if nombre.startswith('viaje_'):
+                    _, movimiento_id, postura_id = nombre.split('_')
+                    celdas[(int(movimiento_id), int(postura_id))] = int(valor) if valor.strip() else 0
+            resultado = guardar_grilla(fecha, turno, celdas)
+        except ValueError as exc:
+            messages.error(request, f"No se guardó la grilla: {exc}")
+        else:
+            messages.success(request, f"Viajes guardados: {resultado['creados']} nuevos, "
+                                      f"{resultado['actualizados']} modificados, {resultado['eliminados']} eliminados.")
+        return redirect(f"{reverse('empresa:grilla_viajes')}?fecha={fecha.isoformat()}&turno={turno}")
+
+    grilla = cargar_grilla(fecha, turno)
+    filas = [
+        {
+            'movimiento': movimiento,
+            'celdas': [
+                {'nombre': f"viaje_{movimiento.id}_{postura.id}", 'cantidad': grilla['celdas'].get((movimiento.id, postura.id), '')}
+                for postura in grilla['posturas']
+            ],
+        }
+        for movimiento in grilla['movimientos']
+    ]
+    contexto = {
+        'titulo': f"Viajes del Turno - {turno} {fecha.strftime('%d-%m-%Y')}",
+        'fecha_seleccionada': fecha.isoformat(),
+        'turno_seleccionado': turno,
+        'opciones_turno': Movimiento.TURNOS,
+        'posturas': grilla['posturas'],
+        'filas': filas,
+    }
+    return render(request, 'empresa/grilla_viajes.html', contexto)
+
+def grilla_viajes_api(request):
+    """
+    GET devuelve la grilla del turno; POST recibe un JSON
+    {"fecha", "turno", "celdas": [{"movimiento_id", "postura_id", "cantidad"}]}.
+    """
+    if request.method == 'POST':
+        try:
+            datos = json.loads(request.body)
+            fecha, turno = _fecha_turno_parametros(datos)
+            celdas = {
+                (int(celda['movimiento_id']), int(celda['postura_id'])): int(celda.get('cantidad') or 0)
+                for celda in datos.get('celdas', [])
+            }
+            resultado = guardar_grilla(fecha, turno, celdas)
+        except (ValueError, KeyError, TypeError) as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        return JsonResponse(resultado)
+
+    try:
+        fecha, turno = _fecha_turno_parametros(request.GET)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    grilla = cargar_grilla(fecha, turno)
+    return JsonResponse({
+        'fecha': fecha.isoformat(),
+        'turno': turno,
+        # Las mismas descripciones (y la misma caché) que el formulario de captura
+        'posturas': posturas.posturas_del_turno(fecha, turno),
+        'movimientos': [
+            {
+                'id': m.id,
+                'empleado': m.empleado.nombre_completo if m.empleado_id else None,
+                'maquinaria': m.maquinaria.codigo_eq if m.maquinaria_id else None,
+            }
+            for m in grilla['movimientos']
+        ],
+        'celdas': [
+            {'movimiento_id': movimiento_id, 'postura_id': postura_id, 'cantidad': cantidad}
+            for (movimiento_id, postura_id), cantidad in grilla['celdas'].items()
+        ],
+    })
@@ -3,6 +3,14 @@ ASGI config for mysite project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+El flujo de eventos en vivo de los reportes (empresa:eventos_turno) es una
+vista asíncrona de larga duración y debe servirse con este punto de entrada,
+por ejemplo: uvicorn mysite.asgi:application
+
+Las APIs del formulario de captura tienen versiones asíncronas que se activan
+con API_CAPTURA_ASINCRONA = True (ver empresa/urls.py y el comando
+bench_api_asgi para comparar ambas).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """